@@ -1,104 +1,264 @@
-# app/archiver.py
+import hashlib
 import threading
-import time
 import logging
-import json
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime, timedelta, timezone
 
+from sqlalchemy import select
+
+from app import metrics
 from app.config import settings
 from app.cache_manager import CloudSensorCacheManager as CacheManager
-from app.db.client import SessionLocal
-from app.db.models import SensorPacket, SensorPanel
+from app.db.client import SessionLocal, engine
+from app.db.models import ArchiveBatch
+from app.db.bulk import insert_packets
+from funcs.codificacion import decodificar
 
 logger = logging.getLogger(__name__)
 
+TIPOS = ("humedad", "vibracion", "inclinacion")
+
+PENDIENTES_KEY = "archiver:pendientes"   # SET con los lotes sin confirmar (uuid)
+
+# Mueve de forma atómica la cola fría de cada lista al lote pendiente.
+# KEYS = [historico_1 .. historico_n, pendiente, archiver:pendientes]
+# ARGV = [lote, k_1, digest_1, ..., k_n, digest_n]
+# Solo recorta una lista si sus últimos k elementos siguen siendo los que
+# leyó el cliente (mismo digest); si un writer la recortó entretanto, se
+# omite y se reintenta en el próximo ciclo. Los LPUSH concurrentes entran
+# por la cabeza, así que no desplazan los índices negativos.
+MOVER_COLA_LUA = """
+local n = #KEYS - 2
+local pendiente = KEYS[n + 1]
+local movidos = {}
+local total = 0
+for i = 1, n do
+    local k = tonumber(ARGV[2 * i])
+    movidos[i] = 0
+    if k > 0 then
+        local items = redis.call('LRANGE', KEYS[i], -k, -1)
+        local partes = {}
+        for j = 1, #items do
+            partes[j] = #items[j] .. ':' .. items[j]
+        end
+        if #items == k and redis.sha1hex(table.concat(partes)) == ARGV[2 * i + 1] then
+            redis.call('LTRIM', KEYS[i], 0, -(k + 1))
+            for j = 1, #items do
+                redis.call('RPUSH', pendiente, KEYS[i], items[j])
+            end
+            movidos[i] = k
+            total = total + k
+        end
+    end
+end
+if total > 0 then
+    redis.call('SADD', KEYS[n + 2], ARGV[1])
+end
+return movidos
+"""
+
+
+def _digest(items):
+    """sha1 de los items con prefijo de longitud (igual que MOVER_COLA_LUA)."""
+    h = hashlib.sha1()
+    for item in items:
+        raw = item.encode() if isinstance(item, str) else item
+        h.update(f"{len(raw)}:".encode())
+        h.update(raw)
+    return h.hexdigest()
+
 
 class Archiver(threading.Thread):
     def __init__(self):
         super().__init__(daemon=True)
-        self._stop = threading.Event()
+        self._stopping = threading.Event()
         self.cache = CacheManager()
         self.interval = settings.ARCHIVER_RUN_EVERY_MINUTES * 60
+        self.batch_size = settings.ARCHIVER_BATCH_SIZE
+        self.chunk_size = settings.ARCHIVER_CHUNK_SIZE
+        self._mover_cola = self.cache.redis_raw.register_script(MOVER_COLA_LUA)
 
      # Método para parar el hilo
     def stop(self):
-        self._stop.set()
+        self._stopping.set()
 
     def run(self):
-        while not self._stop.wait(self.interval):
+        try:
+            n = self.cache.reconstruir_registro()
+            logger.info(f"Archiver: registro de sensores con {n} entradas")
+            n = self.cache.migrar_alertas()
+            if n:
+                logger.info(f"Archiver: {n} alertas migradas al índice por tiempo")
+        except Exception as e:
+            logger.exception("Archiver: no se pudo reconstruir el registro/índice de alertas: %s", e)
+        while not self._stopping.wait(self.interval):
             try:
-                self.archive_once()
+                with metrics.ARCHIVER_CICLO.medir():
+                    self.archive_once()
             except Exception as e:
+                metrics.ARCHIVER_ERRORES.inc()
                 logger.exception("Archiver error: %s", e)
 
     def archive_once(self):
         """
-        Lee datos desde Redis y los mueve a Postgres como históricos.
-        Mueve únicamente los datos cuya fecha < threshold (fríos).
+        Mueve a Postgres las lecturas frías (fecha < threshold) de Redis.
+
+        Las listas :historico están ordenadas de más nueva a más vieja, así
+        que lo frío siempre es la cola. Por cada bloque de sensores:
+          1. LRANGE de la cola de cada lista (un pipeline)
+          2. script Lua que recorta la cola fría y la copia a un lote
+             pendiente, de forma atómica y sin alterar el orden
+          3. inserción en bloque + checkpoint del lote en una transacción
+          4. borrado del lote pendiente
+        Si el proceso cae entre 2 y 4, el lote sigue en Redis y el
+        checkpoint indica si ya se insertó: no se duplica ni se pierde nada.
+        El lote se identifica con un uuid, no con un contador de Redis: un
+        FLUSH de Redis no puede hacer que un lote nuevo parezca ya insertado.
         """
         logger.info("Archiver: iniciando ciclo de archivado...")
 
-        threshold_days = settings.ARCHIVE_THRESHOLD_DAYS
-        threshold = datetime.utcnow() - timedelta(days=threshold_days)
+        if settings.DB_PARTITIONED and engine.dialect.name == "postgresql":
+            from app.db.migrate import init_partitioned
+            init_partitioned(engine, settings.DB_PARTITIONS_AHEAD)
+
+        self._recover_pending()
+
+        # Las lecturas llevan la hora UTC sin zona (app/paquetes.normalizar_ts)
+        ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+        threshold = ahora - timedelta(days=settings.ARCHIVE_THRESHOLD_DAYS)
+
+        chunk = []
+        for sensor_id in self._sensor_ids():
+            chunk.append(sensor_id)
+            if len(chunk) >= self.chunk_size:
+                self._archive_chunk(chunk, threshold)
+                chunk = []
+        if chunk:
+            self._archive_chunk(chunk, threshold)
+
+        if settings.COLD_STORAGE_URL:
+            # Tercer nivel: días viejos de la BD a segmentos Parquet
+            from app.db.cold import compactar
+            compactar(engine)
+
+        if settings.RETENTION_POLICIES:
+            from app.db.retention import aplicar_retencion
+            aplicar_retencion(engine, parada=self._stopping)
 
-        # Keys en Redis con historicos
-        patterns = [
-            "sensor:humedad:*:historico",
-            "sensor:vibracion:*:historico",
-            "sensor:inclinacion:*:historico"
-        ]
+    # ============
+    # CICLO POR BLOQUES
+    # ============
+    def _sensor_ids(self):
+        """
+        Ids de sensor del registro (sensores:<tipo>), en orden estable.
+        Solo ids numéricos: SensorPanel.sample_id es entero.
+        """
+        ids = set()
+        for tipo in TIPOS:
+            ids.update(s for s in self.cache.obtener_sensores(tipo) if s.isdigit())
+        return sorted(ids, key=int)
+
+    def _archive_chunk(self, sensor_ids, threshold):
+        redis = self.cache.redis_raw
+        keys = [f"sensor:{tipo}:{sid}:historico" for sid in sensor_ids for tipo in TIPOS]
 
-        redis = self.cache.redis_client
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.lrange(key, -self.batch_size, -1)
+        tails = pipe.execute()
 
-        for pattern in patterns:
-            for key in redis.scan_iter(match=pattern):
-                items = redis.lrange(key, 0, -1)
-                cold_items = []
-                keep_items = []
+        args = []
+        total = 0
+        for items in tails:
+            k = self._cold_count(items, threshold)
+            total += k
+            args.extend([k, _digest(items[len(items) - k:]) if k else ""])
 
-                for raw in items:
-                    obj = json.loads(raw)
-                    ts = datetime.fromisoformat(obj["timestamp"])
+        if not total:
+            return
 
-                    if ts < threshold:
-                        cold_items.append(obj)
-                    else:
-                        keep_items.append(raw)
+        lote = uuid.uuid4().hex
+        pendiente = f"archiver:pendiente:{lote}"
+        movidos = self._mover_cola(keys=keys + [pendiente, PENDIENTES_KEY], args=[lote] + args)
+        logger.info(f"Archiver: lote {lote} con {sum(movidos)} items fríos de {len(sensor_ids)} sensores")
 
-                if cold_items:
-                    logger.info(f"Archiver: {len(cold_items)} items fríos en {key}")
+        if sum(movidos):
+            self._commit_batch(lote)
+            metrics.ARCHIVER_ITEMS.inc(sum(movidos))
 
-                    # Guardar en BD histórica
-                    self._write_to_postgres(cold_items)
+    @staticmethod
+    def _cold_count(items, threshold):
+        """Cuántos elementos del final de la lista (los más viejos) son fríos."""
+        k = 0
+        for raw in reversed(items):
+            if datetime.fromisoformat(decodificar(raw)["timestamp"]) >= threshold:
+                break
+            k += 1
+        return k
 
-                    # Actualizar Redis con solo los calientes
-                    redis.delete(key)
-                    for item in keep_items:
-                        redis.lpush(key, item)
+    # ============
+    # LOTES PENDIENTES + CHECKPOINT
+    # ============
+    def _recover_pending(self):
+        """Termina los lotes que quedaron a medias en un ciclo anterior."""
+        for lote in self.cache.redis_client.smembers(PENDIENTES_KEY):
+            logger.warning(f"Archiver: recuperando lote pendiente {lote}")
+            self._commit_batch(lote)
+
+    def _commit_batch(self, lote):
+        redis = self.cache.redis_raw
+        pendiente = f"archiver:pendiente:{lote}"
 
-    def _write_to_postgres(self, items):
-        """Inserta lecturas frías en la BD usando tu estructura oficial."""
         with SessionLocal() as session:
-            for packet_obj in items:
-
-                pkt = SensorPacket(
-                    seq=packet_obj.get("seq"),
-                    timestamp=datetime.fromisoformat(packet_obj["timestamp"]),
-                    alerta=packet_obj.get("alerta", 0)
-                )
-                session.add(pkt)
-                session.flush()  # Obtener id
-
-                for sample in packet_obj.get("samples", []):
-                    panel = SensorPanel(
-                        sample_id=sample["id"],
-                        soil_raw=sample["soil"]["raw"],
-                        soil_pct=sample["soil"]["pct"],
-                        tilt=sample["tilt"],
-                        vib_pulse=sample["vib"]["pulse"],
-                        vib_hit=sample["vib"]["hit"],
-                        packet_id=pkt.id
-                    )
-                    session.add(panel)
-
-            session.commit()
+            hecho = session.execute(select(ArchiveBatch.id).where(ArchiveBatch.lote == lote)).first()
+            if hecho is None:
+                flat = redis.lrange(pendiente, 0, -1)
+                packets = self._build_packets(zip(flat[0::2], flat[1::2]))
+                insert_packets(session, packets)
+                session.add(ArchiveBatch(lote=lote, rows=len(packets)))
+                session.commit()
+                metrics.ARCHIVER_LOTES.inc()
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.delete(pendiente)
+        pipe.srem(PENDIENTES_KEY, lote)
+        pipe.execute()
+
+    @staticmethod
+    def _build_packets(pares):
+        """
+        Reconstruye paquetes a partir de lecturas por tipo.
+        Las lecturas de un mismo paquete comparten (device, seq, timestamp);
+        cada sensor aporta un sample con soil/tilt/vib.
+
+        Con device, el paquete lleva la misma clave que insertó el writer
+        y ON CONFLICT lo descarta: los paneles y rollups se cuentan una
+        sola vez. Las lecturas anteriores sin device se insertan sin clave.
+        """
+        packets = {}
+        for key, raw in pares:
+            _, tipo, sensor_id, _ = key.decode().split(":")
+            obj = decodificar(raw)
+
+            pkey = (obj.get("device"), obj.get("seq") or 0, obj["timestamp"])
+            packet = packets.setdefault(pkey, {
+                "device": pkey[0],
+                "seq": pkey[1],
+                "timestamp": datetime.fromisoformat(obj["timestamp"]),
+                "alerta": bool(obj.get("alerta", 0)),
+                "samples": {},
+            })
+            sample = packet["samples"].setdefault(sensor_id, {"id": int(sensor_id)})
+
+            if tipo == "humedad":
+                sample["soil"] = {"raw": obj.get("valor_raw"), "pct": obj.get("porcentaje")}
+            elif tipo == "vibracion":
+                sample["vib"] = {"pulse": obj.get("pulse"), "hit": obj.get("hit")}
+            else:
+                sample["tilt"] = obj.get("estado")
+
+        result = []
+        for packet in sorted(packets.values(), key=lambda p: p["timestamp"]):
+            packet["samples"] = list(packet["samples"].values())
+            result.append(packet)
+        return result
@@ -0,0 +1,377 @@
+# app/async_ingest.py
+"""
+Runtime de ingesta asyncio (INGEST_RUNTIME=asyncio).
+
+Sustituye a MQTTClient + PacketWriter por un único bucle asyncio en su
+propio hilo:
+
+  - MQTT: el mismo cliente paho, pero su socket lo vigila el bucle
+    (add_reader / add_writer) en lugar del hilo de loop_start.
+  - Redis: redis.asyncio. Cada paquete es un pipeline con las mismas
+    claves, reglas y alertas que guardar_paquete (_pipe_paquetes), y hay
+    hasta ASYNC_REDIS_INFLIGHT pipelines en vuelo a la vez, pero solo uno
+    por dispositivo: el de un paquete espera al del anterior del mismo
+    device, así que :actual, el dashboard y las transiciones de
+    inclinación ven sus lecturas en orden.
+  - Base de datos: SQLAlchemy asyncio (asyncpg / aiosqlite). Los lotes
+    de DB_BATCH_SIZE paquetes se insertan con insert_packets vía
+    run_sync, con hasta ASYNC_DB_INFLIGHT lotes en vuelo.
+
+on_message solo parsea, descarta duplicados y encola. Los pipelines se
+arman en orden de llegada, así que las reglas ven los paquetes en orden
+aunque las escrituras se solapen. Con INGEST_QUEUE_SIZE paquetes en cola
+se deja de leer el socket MQTT hasta que la cola baje a la mitad, y la
+contrapresión llega al broker en lugar de descartar.
+
+Las alertas por email siguen en el Notifier (pool de hilos): el SDK de
+Resend es síncrono y enqueue_alert no bloquea. Las escrituras en los
+spools (fichero + fsync) van a un hilo con asyncio.to_thread para no
+parar el bucle.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from redis.exceptions import NoScriptError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import metrics
+from app.config import settings
+from app.cache_client import create_async_redis_client
+from app.cache_manager import CloudSensorCacheManager
+from app.db.bulk import insert_packets
+from app.db.client import get_async_engine
+from app.db_writer import registrar_lote
+from app.dedup import ClavesRecientes
+from app.mqtt_client import parsear_mensaje
+from app.rules import reglas_del_proceso
+from app.spool import transitorio
+
+logger = logging.getLogger(__name__)
+
+EN_VUELO_REDIS = metrics.gauge("edge_async_redis_inflight", "Pipelines Redis en vuelo (runtime asyncio)")
+EN_VUELO_DB = metrics.gauge("edge_async_db_inflight", "Lotes de base de datos en vuelo (runtime asyncio)")
+PAUSAS = metrics.contador("edge_async_mqtt_pauses_total", "Pausas de lectura MQTT por cola llena")
+
+
+class _SocketPaho:
+    """Bucle de red de paho sobre el bucle asyncio (sin hilo loop_start)."""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.sock = None
+        self.pausado = False
+        client.on_socket_open = self._abierto
+        client.on_socket_close = self._cerrado
+        client.on_socket_register_write = lambda c, u, sock: loop.add_writer(sock, c.loop_write)
+        client.on_socket_unregister_write = lambda c, u, sock: loop.remove_writer(sock)
+
+    def _abierto(self, client, userdata, sock):
+        self.sock = sock
+        if not self.pausado:
+            self.loop.add_reader(sock, client.loop_read)
+
+    def _cerrado(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        self.sock = None
+
+    def cerrar(self):
+        if self.sock is not None:
+            self.loop.remove_reader(self.sock)
+            self.loop.remove_writer(self.sock)
+
+    def pausar(self):
+        if not self.pausado:
+            self.pausado = True
+            PAUSAS.inc()
+            if self.sock is not None:
+                self.loop.remove_reader(self.sock)
+
+    def reanudar(self):
+        if self.pausado:
+            self.pausado = False
+            if self.sock is not None:
+                self.loop.add_reader(self.sock, self.client.loop_read)
+
+    async def mantener(self, client_id):
+        """Conexión inicial, loop_misc cada segundo (keepalive, reintentos QoS) y reconexión."""
+        espera = 1
+        while True:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                try:
+                    logger.info(f"[MQTT] Conectando a {settings.MQTT_HOST}:{settings.MQTT_PORT} "
+                                f"como {client_id} (asyncio)")
+                    self.client.connect(settings.MQTT_HOST, settings.MQTT_PORT)
+                    espera = 1
+                except OSError as e:
+                    logger.warning(f"[MQTT] Conexión fallida: {e}; reintento en {espera}s")
+                    await asyncio.sleep(espera)
+                    espera = min(espera * 2, 60)
+                    continue
+            await asyncio.sleep(1)
+
+
+class IngestaAsync(threading.Thread):
+    """
+    Equivalente asyncio de MQTTClient + PacketWriter (mismos argumentos
+    que MQTTClient, con los dos spools de app.spool.Replayer por separado).
+    """
+
+    def __init__(self, notifier, gateway=None, client_id=None, topic=None,
+                 spool_db=None, spool_redis=None, riesgo=None):
+        super().__init__(daemon=True, name="async-ingest")
+        self.client_id = client_id or settings.MQTT_CLIENT_ID
+        self.topic = topic or settings.MQTT_TOPIC_PREFIX
+        self.notifier = notifier
+        self.gateway = gateway
+        self.spool_db = spool_db
+        self.spool_redis = spool_redis
+        self.riesgo = riesgo
+
+        # Solo arma pipelines (claves, codec, reglas); no ejecuta nada
+        self.cache = CloudSensorCacheManager(reglas=reglas_del_proceso())
+        self.recientes = ClavesRecientes(settings.DEDUP_CACHE_SIZE)
+
+        self.max_redis = settings.ASYNC_REDIS_INFLIGHT
+        self.max_db = settings.ASYNC_DB_INFLIGHT
+        self.max_cola = settings.INGEST_QUEUE_SIZE
+        self.batch_size = settings.DB_BATCH_SIZE
+        self.max_age = settings.DB_BATCH_MAX_AGE_MS / 1000
+
+        self._stopping = threading.Event()
+        self._en_vuelo = {"redis": 0, "db": 0}
+        self._tareas = set()
+        self._por_device = {}   # device → última tarea Redis lanzada
+        self._lote = []
+        self._lote_desde = 0.0
+        EN_VUELO_REDIS.funcion = lambda: self._en_vuelo["redis"]
+        EN_VUELO_DB.funcion = lambda: self._en_vuelo["db"]
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        asyncio.run(self._principal())
+
+    async def _principal(self):
+        loop = asyncio.get_running_loop()
+        self.redis = create_async_redis_client(max_connections=self.max_redis + 8)
+        self.engine = get_async_engine(pool_size=self.max_db)
+        self.sesiones = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.cola = asyncio.Queue()
+        self._sem = {"redis": asyncio.Semaphore(self.max_redis), "db": asyncio.Semaphore(self.max_db)}
+        metrics.COLA_INGESTA.funcion = self.cola.qsize
+
+        self.client = mqtt.Client(client_id=self.client_id, clean_session=False)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.socket = _SocketPaho(loop, self.client)
+
+        consumidor = asyncio.create_task(self._consumir())
+        temporizador = asyncio.create_task(self._vaciar_por_edad())
+        red = asyncio.create_task(self.socket.mantener(self.client_id))
+
+        await asyncio.to_thread(self._stopping.wait)
+
+        # Parada: no se lee nada más (lo no confirmado lo reentrega el broker),
+        # se vacía la cola y se esperan las escrituras en vuelo
+        red.cancel()
+        self.client.disconnect()
+        self.socket.cerrar()
+        self.cola.put_nowait(None)
+        await consumidor
+        temporizador.cancel()
+        await self._vaciar_lote()
+        if self._tareas:
+            await asyncio.gather(*self._tareas, return_exceptions=True)
+        await self.engine.dispose()
+        await self.redis.aclose()
+
+    # ============
+    # MQTT (callbacks de paho, en el bucle)
+    # ============
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            logger.info("[MQTT] Conectado correctamente a Mosquitto (asyncio)")
+            client.subscribe(self.topic, qos=1)
+        else:
+            logger.error(f"[MQTT] Error de conexión rc={rc}")
+
+    def _on_message(self, client, userdata, msg):
+        t0 = time.perf_counter()
+        paquete = parsear_mensaje(msg)
+        if paquete is None:
+            return
+        metrics.ETAPA_PARSEO.observar(time.perf_counter() - t0)
+
+        if self.recientes.visto((paquete["device"], paquete["seq"], paquete["timestamp"])):
+            metrics.DEDUP_HITS.inc()
+            return
+
+        if self.gateway is not None:
+            self.gateway.publicar_paquete(paquete["seq"], paquete["timestamp"], paquete["samples"])
+        if self.riesgo is not None:
+            self.riesgo.agregar(paquete["device"], paquete["timestamp"], paquete["samples"])
+        try:
+            if paquete["alerta"] == 1:
+                self.notifier.enqueue_alert(paquete["payload"])
+        except Exception:
+            logger.error("⚠ Error enviando alerta")
+
+        self.cola.put_nowait(paquete)
+        if self.cola.qsize() >= self.max_cola:
+            self.socket.pausar()
+
+    # ============
+    # CONSUMIDOR
+    # ============
+    async def _consumir(self):
+        while True:
+            paquete = await self.cola.get()
+            if paquete is None:
+                return
+            if self.socket.pausado and self.cola.qsize() <= self.max_cola // 2:
+                self.socket.reanudar()
+
+            await self._redis(paquete)
+
+            if not self._lote:
+                self._lote_desde = time.monotonic()
+            self._lote.append({
+                "device": paquete["device"],
+                "seq": paquete["seq"],
+                "timestamp": paquete["timestamp"],
+                "alerta": bool(paquete["alerta"]),
+                "samples": paquete["samples"],
+                "sent_ms": paquete["sent_ms"]
+            })
+            if len(self._lote) >= self.batch_size:
+                await self._vaciar_lote()
+
+    async def _vaciar_por_edad(self):
+        while True:
+            await asyncio.sleep(self.max_age / 2)
+            if self._lote and time.monotonic() - self._lote_desde >= self.max_age:
+                await self._vaciar_lote()
+
+    async def _lanzar(self, sumidero, coro_fn, *args):
+        """
+        Espera un hueco del sumidero y lanza la escritura en su propia
+        tarea. Devuelve la tarea.
+        """
+        await self._sem[sumidero].acquire()
+        self._en_vuelo[sumidero] += 1
+
+        def fin(tarea):
+            self._tareas.discard(tarea)
+            self._en_vuelo[sumidero] -= 1
+            self._sem[sumidero].release()
+
+        tarea = asyncio.create_task(coro_fn(*args))
+        self._tareas.add(tarea)
+        tarea.add_done_callback(fin)
+        return tarea
+
+    # ============
+    # REDIS
+    # ============
+    async def _redis(self, paquete):
+        entrada = {"seq": paquete["seq"], "alerta": paquete["alerta"], "samples": paquete["samples"],
+                   "timestamp": paquete["timestamp"], "device": paquete["device"]}
+        # Si hay paquetes en el spool de Redis, este va detrás de ellos
+        if self.spool_redis is not None and self.spool_redis.pendientes:
+            await asyncio.to_thread(self.spool_redis.escribir, [entrada])
+            return
+        device = paquete["device"]
+        previa = self._por_device.get(device)
+        tarea = await self._lanzar("redis", self._escribir_redis, entrada, paquete["sent_ms"], previa)
+        self._por_device[device] = tarea
+
+        def olvidar(t):
+            if self._por_device.get(device) is t:
+                del self._por_device[device]
+
+        tarea.add_done_callback(olvidar)
+
+    async def _escribir_redis(self, entrada, sent_ms, previa=None):
+        t0 = time.perf_counter()
+        # El pipeline se arma antes del primer await: orden de llegada
+        pipe = self.redis.pipeline(transaction=False)
+        self.cache._pipe_paquetes(pipe, [entrada])
+        try:
+            # Un pipeline por dispositivo: se envía cuando acaba el anterior
+            if previa is not None:
+                await asyncio.wait([previa])
+            await self._ejecutar(pipe)
+            metrics.observar_desde(metrics.LATENCIA_REDIS, sent_ms, time.time())
+        except Exception as e:
+            metrics.ERRORES_REDIS.inc()
+            logger.error(f"⚠ Error guardando paquete en Redis → {e}")
+            if self.spool_redis is not None and transitorio(e):
+                await asyncio.to_thread(self.spool_redis.escribir, [entrada])
+            elif self.spool_redis is not None:
+                await asyncio.to_thread(self.spool_redis.apartar, [entrada], e)
+        metrics.ETAPA_REDIS.observar(time.perf_counter() - t0)
+
+    async def _ejecutar(self, pipe):
+        """SensorCacheManager._ejecutar para redis.asyncio (EVAL si falta el script)."""
+        lua = getattr(pipe, 'scripts_lua', [])
+        resultados = await pipe.execute(raise_on_error=False)
+        for idx, script, keys, args in lua:
+            if isinstance(resultados[idx], NoScriptError):
+                resultados[idx] = await self.redis.eval(script, len(keys), *keys, *args)
+        for resultado in resultados:
+            if isinstance(resultado, Exception):
+                raise resultado
+        return resultados
+
+    # ============
+    # BASE DE DATOS
+    # ============
+    async def _vaciar_lote(self):
+        lote, self._lote = self._lote, []
+        if not lote:
+            return
+        if self.spool_db is not None and self.spool_db.pendientes:
+            await asyncio.to_thread(self.spool_db.escribir, lote)
+            return
+        await self._lanzar("db", self._insertar, lote)
+
+    async def _insertar(self, lote):
+        try:
+            await self._insertar_lote(lote)
+        except Exception as e:
+            metrics.DB_FALLOS.inc()
+            if not transitorio(e):
+                logger.error(f"⚠ Postgres rechazó el lote ({len(lote)} paquetes), "
+                             f"se inserta de uno en uno: {e}")
+                await self._aislar(lote)
+            elif self.spool_db is not None:
+                logger.warning(f"⚠ Postgres no disponible, {len(lote)} paquetes al spool: {e}")
+                await asyncio.to_thread(self.spool_db.escribir, lote)
+            else:
+                logger.exception(f"⚠ Error guardando lote en Postgres ({len(lote)} paquetes): {e}")
+
+    async def _insertar_lote(self, lote):
+        t0 = time.perf_counter()
+        async with self.sesiones() as db:
+            ids = await db.run_sync(insert_packets, lote)
+            await db.commit()
+        registrar_lote(lote, ids, t0)
+
+    async def _aislar(self, lote):
+        """PacketWriter._aislar: cada paquete en su transacción, los culpables aparte."""
+        for packet in lote:
+            try:
+                await self._insertar_lote([packet])
+            except Exception as e:
+                if self.spool_db is None:
+                    logger.error(f"⚠ Paquete seq={packet.get('seq')} descartado por Postgres: {e}")
+                elif transitorio(e):
+                    await asyncio.to_thread(self.spool_db.escribir, [packet])
+                else:
+                    await asyncio.to_thread(self.spool_db.apartar, [packet], e)
@@ -0,0 +1,411 @@
+"""
+Carga masiva de paquetes sin pasar por MQTT: lecturas que un dispositivo
+guardó offline o datos migrados de otro sistema.
+
+    python -m app.backfill dump.jsonl.gz
+    python -m app.backfill export.csv.gz --procesos 8 --sin-alertas
+    python -m app.backfill viejo.jsonl --device sensores/esp32-07 --errores malos.txt
+
+Formatos (por extensión, o --formato; admiten .gz y "-" para stdin):
+- jsonl: un paquete por línea, el mismo JSON que publica el ESP32
+         {"device", "seq", "alerta", "ts", "samples": [...]}
+- csv:   una fila por sample con las columnas de la exportación
+         (timestamp, device, seq, alerta, sample_id, soil_raw, soil_pct,
+         tilt, vib_pulse, vib_hit); las filas de un paquete van seguidas
+
+El fichero se parte en bloques de BACKFILL_BATCH paquetes que validan
+procesos aparte (spawn), con las mismas reglas que la ingesta MQTT
+(app/paquetes.py). En Postgres cada proceso inserta su bloque con
+insert_packets (el mismo camino que PacketWriter, rollups incluidos) en
+una sola transacción; en SQLite escribe solo el proceso principal (un
+único escritor). Los repetidos se descartan por (device, seq, ts): dentro
+del fichero con ClavesRecientes y contra lo ya cargado con el índice único
+(ON CONFLICT DO NOTHING).
+
+El índice único solo ve lo que sigue en la BD. Los paquetes de días ya
+compactados a segmentos fríos (app/db/cold.py) o anteriores al corte de
+RETENTION_POLICIES se saltan y se cuentan aparte ("fuera"): volverían a
+entrar duplicados en la BD o la retención los borraría en el siguiente
+ciclo. Con eso relanzar una carga no duplica nada.
+
+A Redis solo van los paquetes nuevos de las últimas --redis-horas (por
+defecto las 24 h del histórico reciente), en orden y por pipelines de 500
+con guardar_atrasados: cuentan en agregados y reglas, pero no van a
+:historico ni pisan un :actual o un dashboard más nuevos.
+--sin-alertas carga esos paquetes sin evaluar reglas ni umbrales. El
+Notifier no interviene: una carga nunca manda correos.
+"""
+import argparse
+import csv
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from app.config import settings
+from app.dedup import ClavesRecientes
+from app.paquetes import validar_paquete
+
+logger = logging.getLogger(__name__)
+
+# Columnas del CSV que identifican un paquete
+CLAVE_CSV = ("device", "seq", "timestamp")
+
+
+# ============
+# VALIDACIÓN
+# ============
+def _valor(fila, columna):
+    valor = fila.get(columna)
+    return None if valor in (None, "") else float(valor)
+
+
+def _fila_csv(fila):
+    """Fila de la exportación → (payload sin samples, sample)."""
+    sample = {"id": _valor(fila, "sample_id")}
+    if _valor(fila, "soil_pct") is not None:
+        sample["soil"] = {"raw": _valor(fila, "soil_raw"), "pct": _valor(fila, "soil_pct")}
+    if _valor(fila, "tilt") is not None:
+        sample["tilt"] = _valor(fila, "tilt")
+    if _valor(fila, "vib_pulse") is not None:
+        sample["vib"] = {"pulse": _valor(fila, "vib_pulse"), "hit": _valor(fila, "vib_hit") or 0}
+    alerta = (fila.get("alerta") or "0").strip().lower()
+    payload = {
+        "device": fila.get("device"),
+        "seq": _valor(fila, "seq"),
+        "alerta": alerta in ("1", "true", "t", "yes"),
+        "ts": fila.get("timestamp") or fila.get("ts"),
+    }
+    return payload, sample
+
+
+def validar_bloque(formato, cabecera, primera, lineas, device=None):
+    """
+    Líneas crudas → ([paquetes], [(número de línea, motivo)]). En CSV las
+    filas seguidas con la misma clave forman un paquete.
+    """
+    paquetes, errores = [], []
+    if formato == "jsonl":
+        for n, linea in enumerate(lineas, primera):
+            if not linea.strip():
+                continue
+            try:
+                paquetes.append(validar_paquete(json.loads(linea), device))
+            except ValueError as e:   # JSONDecodeError incluido
+                errores.append((n, str(e)))
+        return paquetes, errores
+
+    columnas = next(csv.reader([cabecera]))
+    actual, clave, inicio = None, None, primera
+    for n, fila in enumerate(csv.DictReader(lineas, fieldnames=columnas), primera):
+        try:
+            payload, sample = _fila_csv(fila)
+        except (ValueError, TypeError) as e:
+            errores.append((n, f"fila inválida: {e}"))
+            continue
+        if (payload["device"], payload["seq"], payload["ts"]) != clave:
+            if actual is not None:
+                _cerrar_csv(actual, device, inicio, paquetes, errores)
+            clave = (payload["device"], payload["seq"], payload["ts"])
+            actual, inicio = dict(payload, samples=[]), n
+        actual["samples"].append(sample)
+    if actual is not None:
+        _cerrar_csv(actual, device, inicio, paquetes, errores)
+    return paquetes, errores
+
+
+def _cerrar_csv(payload, device, linea, paquetes, errores):
+    try:
+        paquetes.append(validar_paquete(payload, device))
+    except ValueError as e:
+        errores.append((linea, str(e)))
+
+
+# ============
+# LECTURA
+# ============
+def _abrir(ruta):
+    if ruta == "-":
+        return sys.stdin
+    if ruta.endswith(".gz"):
+        return gzip.open(ruta, "rt", encoding="utf-8", newline="")
+    return open(ruta, "r", encoding="utf-8", newline="")
+
+
+def formato_de(ruta):
+    nombre = ruta[:-3] if ruta.endswith(".gz") else ruta
+    return "csv" if nombre.endswith(".csv") else "jsonl"
+
+
+def leer_bloques(fichero, formato, lote):
+    """
+    (cabecera, primera línea, [líneas]) de `lote` líneas. En CSV (una
+    línea por sample) un bloque nunca parte un paquete: se alarga hasta
+    que cambia la clave.
+    """
+    if formato == "jsonl":
+        bloque, primera = [], 1
+        for n, linea in enumerate(fichero, 1):
+            bloque.append(linea)
+            if len(bloque) >= lote:
+                yield None, primera, bloque
+                bloque, primera = [], n + 1
+        if bloque:
+            yield None, primera, bloque
+        return
+
+    cabecera = next(fichero, None)
+    if cabecera is None:
+        return
+    columnas = next(csv.reader([cabecera]))
+    posiciones = [columnas.index(c) for c in CLAVE_CSV if c in columnas]
+
+    def clave(linea):
+        fila = next(csv.reader([linea]), [])
+        return tuple(fila[i] if i < len(fila) else None for i in posiciones)
+
+    bloque, primera, claves = [], 2, 0
+    ultima = None
+    for n, linea in enumerate(fichero, 2):
+        # Las filas de un paquete (4 paneles) van seguidas: basta con mirar
+        # la clave en el borde del bloque
+        if claves >= lote:
+            nueva = clave(linea)
+            if nueva != ultima:
+                yield cabecera, primera, bloque
+                bloque, primera, claves = [], n, 0
+        bloque.append(linea)
+        if claves < lote:
+            claves += 1
+            if claves == lote:
+                ultima = clave(linea)
+    if bloque:
+        yield cabecera, primera, bloque
+
+
+# ============
+# ESCRITURA
+# ============
+_vistos = None
+
+
+def _iniciar(dedup):
+    global _vistos
+    _vistos = ClavesRecientes(dedup)
+
+
+def _escribir_db(paquetes):
+    """insert_packets en una transacción; ids con None en los repetidos."""
+    from app.db.bulk import insert_packets
+    from app.db.client import SessionLocal
+
+    with SessionLocal() as db:
+        try:
+            ids = insert_packets(db, paquetes)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return ids
+
+
+def procesar(tarea):
+    """
+    Un bloque en un worker: valida, descarta repetidos del fichero y, si
+    `escribir`, inserta. Devuelve un resumen con los paquetes que siguen
+    (todos si escribe el proceso principal; si no, los nuevos para Redis).
+    """
+    formato, cabecera, primera, lineas, device, escribir, desde_redis, fuera = tarea
+    paquetes, errores = validar_bloque(formato, cabecera, primera, lineas, device)
+    unicos = [p for p in paquetes if not _vistos.visto((p["device"], p["seq"], p["timestamp"]))]
+    dentro = [p for p in unicos if not _fuera(p, fuera)]
+    resultado = {"validos": len(paquetes), "errores": errores, "insertados": None,
+                 "fuera": len(unicos) - len(dentro), "paquetes": dentro}
+    unicos = dentro
+    if escribir and unicos:
+        ids = _escribir_db(unicos)
+        resultado["insertados"] = len(ids) - ids.count(None)
+        resultado["paquetes"] = [p for p, i in zip(unicos, ids) if i is not None and _reciente(p, desde_redis)]
+    elif escribir:
+        resultado["insertados"] = 0
+    return resultado
+
+
+def _fuera(paquete, fuera):
+    """True si el paquete cae en un día compactado o antes del corte de la retención."""
+    corte, frios = fuera
+    ts = paquete["timestamp"].replace(tzinfo=None)
+    return (corte is not None and ts < corte) or ts.replace(hour=0, minute=0, second=0, microsecond=0) in frios
+
+
+def _reciente(paquete, desde):
+    if desde is None:
+        return False
+    return paquete["timestamp"].replace(tzinfo=None) >= desde
+
+
+def _en_orden(pool, tareas, pendientes_max):
+    """Resultados en el orden del fichero sin leerlo entero a memoria."""
+    if pool is None:
+        yield from map(procesar, tareas)
+        return
+    pendientes = deque()
+    for tarea in tareas:
+        pendientes.append(pool.apply_async(procesar, (tarea,)))
+        if len(pendientes) >= pendientes_max:
+            yield pendientes.popleft().get()
+    while pendientes:
+        yield pendientes.popleft().get()
+
+
+class _SinAlertas:
+    """Motor de reglas que nunca dispara (desactiva también los umbrales fijos)."""
+
+    def evaluar(self, samples, timestamp):
+        return []
+
+
+class Backfill:
+    """
+    Carga de uno o varios ficheros. `redis_horas` = 0 no toca Redis;
+    `procesos` = 1 valida en el proceso principal.
+    """
+
+    def __init__(self, procesos=None, lote=None, device=None, redis_horas=24, alertas=True,
+                 dedup=None, errores=None, engine=None):
+        self.procesos = procesos or settings.BACKFILL_WORKERS or os.cpu_count() or 1
+        self.lote = lote or settings.BACKFILL_BATCH
+        self.device = device
+        self.redis_horas = redis_horas
+        self.alertas = alertas
+        self.dedup = dedup or settings.DEDUP_CACHE_SIZE
+        self.errores = errores
+        if engine is None:
+            from app.db.client import get_engine
+            engine = get_engine()
+        self.engine = engine
+        # SQLite admite un solo escritor: los workers solo validan
+        self.en_workers = engine.dialect.name != "sqlite"
+        self.totales = {"validos": 0, "invalidos": 0, "repetidos": 0, "fuera": 0, "insertados": 0, "redis": 0}
+        self._cache = None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            from app.cache_manager import CloudSensorCacheManager
+            from app.rules import reglas_del_proceso
+            self._cache = CloudSensorCacheManager(reglas=reglas_del_proceso() if self.alertas else _SinAlertas())
+        return self._cache
+
+    def cargar(self, rutas, formato=None):
+        # Los timestamps de los paquetes son UTC sin zona (normalizar_ts)
+        ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+        desde_redis = ahora - timedelta(hours=self.redis_horas) if self.redis_horas else None
+        fuera = self._fuera()
+        salida_errores = open(self.errores, "w", encoding="utf-8") if self.errores else None
+        pool = None
+        if self.procesos > 1:
+            pool = multiprocessing.get_context("spawn").Pool(
+                self.procesos, initializer=_iniciar, initargs=(self.dedup,)
+            )
+        else:
+            _iniciar(self.dedup)
+        inicio = aviso = time.monotonic()
+        try:
+            for ruta in rutas:
+                with _abrir(ruta) as fichero:
+                    tareas = (
+                        (formato or formato_de(ruta), cabecera, primera, lineas,
+                         self.device, self.en_workers, desde_redis, fuera)
+                        for cabecera, primera, lineas in leer_bloques(fichero, formato or formato_de(ruta), self.lote)
+                    )
+                    for resultado in _en_orden(pool, tareas, 2 * self.procesos):
+                        self._resultado(ruta, resultado, desde_redis, salida_errores)
+                        if time.monotonic() - aviso >= 5:
+                            aviso = time.monotonic()
+                            self._progreso(inicio)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if salida_errores:
+                salida_errores.close()
+        self._progreso(inicio)
+        return self.totales
+
+    def _fuera(self):
+        """(corte de la retención o None, días con segmento frío) que no se cargan."""
+        from app.db.cold import dias_compactados
+        from app.db.retention import corte_crudos
+
+        with self.engine.connect() as conexion:
+            frios = frozenset(dias_compactados(conexion))
+        return corte_crudos(), frios
+
+    def _resultado(self, ruta, resultado, desde_redis, salida_errores):
+        totales = self.totales
+        totales["validos"] += resultado["validos"]
+        totales["invalidos"] += len(resultado["errores"])
+        totales["fuera"] += resultado["fuera"]
+        if salida_errores:
+            salida_errores.writelines(f"{ruta}:{linea}: {motivo}\n" for linea, motivo in resultado["errores"])
+        elif resultado["errores"]:
+            linea, motivo = resultado["errores"][0]
+            logger.warning(f"[BACKFILL] {ruta}:{linea}: {motivo} ({len(resultado['errores'])} en el bloque)")
+
+        nuevos = resultado["paquetes"]
+        if resultado["insertados"] is None:
+            if nuevos:
+                ids = _escribir_db(nuevos)
+                nuevos = [p for p, i in zip(nuevos, ids) if i is not None and _reciente(p, desde_redis)]
+                totales["insertados"] += len(ids) - ids.count(None)
+        else:
+            totales["insertados"] += resultado["insertados"]
+        # En el fichero (ClavesRecientes) o ya en la BD (ON CONFLICT)
+        totales["repetidos"] = totales["validos"] - totales["insertados"] - totales["fuera"]
+
+        # Pipelines de tamaño moderado para no bloquear Redis con uno enorme
+        for i in range(0, len(nuevos), 500):
+            self.cache.guardar_atrasados(nuevos[i:i + 500])
+        totales["redis"] += len(nuevos)
+
+    def _progreso(self, inicio):
+        t = self.totales
+        segundos = max(time.monotonic() - inicio, 1e-9)
+        logger.info(f"[BACKFILL] {t['validos']} paquetes ({t['validos'] / segundos:.0f}/s): "
+                    f"{t['insertados']} nuevos, {t['repetidos']} repetidos, {t['invalidos']} inválidos, "
+                    f"{t['fuera']} fuera (segmentos fríos / retención), {t['redis']} a Redis")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga masiva de paquetes sin pasar por MQTT")
+    parser.add_argument("ficheros", nargs="+", help="jsonl/csv (opcionalmente .gz); - para stdin")
+    parser.add_argument("--formato", choices=("jsonl", "csv"), default=None, help="por defecto, por extensión")
+    parser.add_argument("--procesos", type=int, default=None, help="workers de validación (BACKFILL_WORKERS)")
+    parser.add_argument("--lote", type=int, default=None, help="paquetes por bloque (BACKFILL_BATCH)")
+    parser.add_argument("--device", default=None, help="device de los paquetes que no lo traen")
+    parser.add_argument("--redis-horas", type=float, default=24,
+                        help="solo los paquetes de las últimas N horas van a Redis (0 = ninguno)")
+    parser.add_argument("--sin-alertas", action="store_true", help="no generar alertas en Redis")
+    parser.add_argument("--errores", default=None, help="fichero con las líneas rechazadas y el motivo")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.db.client import init_db
+    init_db()
+
+    backfill = Backfill(args.procesos, args.lote, args.device, args.redis_horas,
+                        alertas=not args.sin_alertas, errores=args.errores)
+    totales = backfill.cargar(args.ficheros, args.formato)
+    print(f"{totales['insertados']} paquetes nuevos, {totales['repetidos']} repetidos, "
+          f"{totales['invalidos']} inválidos, {totales['fuera']} fuera (segmentos fríos / retención)")
+
+
+if __name__ == "__main__":
+    main()
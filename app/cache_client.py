@@ -1,12 +1,48 @@
 # app/cache_client.py
 import redis
+import redis.asyncio
+from redis.asyncio.retry import Retry as RetryAsync
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 from app.config import settings
 
-def create_redis_client():
-    return redis.Redis(
+
+def opciones_redis(decode_responses=True):
+    """
+    Parámetros de conexión comunes: timeouts, keepalive TCP, PING de las
+    conexiones ociosas antes de reutilizarlas y reintentos con backoff
+    ante errores de red.
+    """
+    return dict(
         host=settings.REDIS_HOST,
         port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
         username=settings.REDIS_USER,
         password=settings.REDIS_PASSWORD,
-        decode_responses=True
+        decode_responses=decode_responses,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=30,
+        retry_on_error=[redis.ConnectionError, redis.TimeoutError],
+    )
+
+
+def create_redis_client(decode_responses=True):
+    """
+    Cliente con pool propio, para scripts y herramientas. El servicio usa
+    los pools compartidos de app.resources (recursos.redis()).
+    """
+    return redis.Redis(
+        retry=Retry(ExponentialBackoff(cap=2, base=0.05), settings.REDIS_RETRIES),
+        **opciones_redis(decode_responses)
+    )
+
+
+def create_async_redis_client(decode_responses=False, max_connections=None):
+    """Cliente redis.asyncio (runtime asyncio de ingesta, ver app/async_ingest.py)"""
+    return redis.asyncio.Redis(
+        max_connections=max_connections,
+        retry=RetryAsync(ExponentialBackoff(cap=2, base=0.05), settings.REDIS_RETRIES),
+        **opciones_redis(decode_responses)
     )
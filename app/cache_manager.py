@@ -1,13 +1,21 @@
 # app/cache_manager.py
 from funcs.funciones_redis import SensorCacheManager
-from app.cache_client import create_redis_client
+from app.config import settings
+from app.resources import recursos
 
 
 class CloudSensorCacheManager(SensorCacheManager):
     """
-    Extiende SensorCacheManager para usar SIEMPRE Redis Cloud.
-    Reemplaza el redis_client interno del manager original.
+    SensorCacheManager sobre Redis Cloud con los pools compartidos del
+    proceso (app.resources); se pueden inyectar otros clientes.
+
+    reglas: app.rules.MotorReglas para las alertas por lectura (solo lo
+    necesitan los que escriben lecturas; ver reglas_del_proceso).
     """
-    def __init__(self):
-        super().__init__(host="localhost", port=6379, db=0)  # valores dummy
-        self.redis_client = create_redis_client()
+    def __init__(self, reglas=None, redis_client=None, redis_raw=None):
+        super().__init__(
+            codec=settings.REDIS_CODEC,
+            reglas=reglas,
+            redis_client=redis_client or recursos.redis(),
+            redis_raw=redis_raw or recursos.redis(decode_responses=False),
+        )
@@ -8,20 +8,125 @@ class Settings:
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_USER = os.getenv("REDIS_USER")
     REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
+    REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+    # Formato de las lecturas en Redis: json (legado), struct o msgpack
+    REDIS_CODEC = os.getenv("REDIS_CODEC", "struct")
+
+    # Pools compartidos por todo el proceso (ver app/resources.py)
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))   # por pool (texto / binario)
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))        # espera por una conexión libre
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+    REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "3"))
+    REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "3"))                    # reintentos con backoff por comando
 
     APP_ENV = os.getenv("APP_ENV", "development")  # development / production
     DATABASE_URL = os.getenv("DATABASE_URL")
+    # Layout particionado por mes (solo Postgres, ver app/db/migrate.py)
+    DB_PARTITIONED = os.getenv("DB_PARTITIONED", "false").lower() == "true"
+    DB_PARTITIONS_AHEAD = int(os.getenv("DB_PARTITIONS_AHEAD", "3"))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))   # segundos; por debajo del idle timeout del proveedor
+    DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+    # Chequeo de Redis y base de datos en segundo plano (0 = desactivado)
+    RESOURCE_HEALTH_SECONDS = int(os.getenv("RESOURCE_HEALTH_SECONDS", "15"))
 
     MQTT_HOST = os.getenv("MQTT_HOST")
     MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
     MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX")
+    MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "edge_app")
+
+    # Ingesta multi-proceso: N workers con suscripción compartida
+    # $share/<MQTT_SHARED_GROUP>/<MQTT_TOPIC_PREFIX> (1 = un solo proceso)
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+    MQTT_SHARED_GROUP = os.getenv("MQTT_SHARED_GROUP", "edge")
+
+    # Runtime de ingesta: threads (MQTTClient + PacketWriter) o asyncio
+    # (app/async_ingest.py, un bucle con escrituras solapadas)
+    INGEST_RUNTIME = os.getenv("INGEST_RUNTIME", "threads")
+    ASYNC_REDIS_INFLIGHT = int(os.getenv("ASYNC_REDIS_INFLIGHT", "256"))   # pipelines en vuelo
+    ASYNC_DB_INFLIGHT = int(os.getenv("ASYNC_DB_INFLIGHT", "4"))           # lotes en vuelo
+
+    # Claves (device, seq, ts) recientes para descartar reentregas QoS 1
+    DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", "100000"))
+
+    # Ingesta → Postgres (micro-lotes)
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+    INGEST_QUEUE_PUT_TIMEOUT_SECONDS = float(os.getenv("INGEST_QUEUE_PUT_TIMEOUT_SECONDS", "1"))
+    DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "500"))
+    DB_BATCH_MAX_AGE_MS = int(os.getenv("DB_BATCH_MAX_AGE_MS", "200"))
+
+    # Spool en disco para caídas de Postgres/Redis (vacío = desactivado, ver app/spool.py)
+    SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+    SPOOL_MAX_MB = int(os.getenv("SPOOL_MAX_MB", "1024"))
+    SPOOL_SEGMENT_MB = int(os.getenv("SPOOL_SEGMENT_MB", "64"))
+    SPOOL_FSYNC_MS = int(os.getenv("SPOOL_FSYNC_MS", "200"))
+    SPOOL_REPLAY_BATCH = int(os.getenv("SPOOL_REPLAY_BATCH", "5000"))   # paquetes por lote reinyectado
+
+    # Carga masiva sin MQTT (python -m app.backfill)
+    BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "0"))   # 0 = un proceso por CPU
+    BACKFILL_BATCH = int(os.getenv("BACKFILL_BATCH", "5000"))    # paquetes por bloque/transacción
+
+    # Puntuación de riesgo por ventanas (0 = desactivada, ver app/risk.py)
+    RISK_TICK_MS = int(os.getenv("RISK_TICK_MS", "1000"))
+    RISK_WINDOW = int(os.getenv("RISK_WINDOW", "64"))                 # lecturas por sensor
+    RISK_ALERT_THRESHOLD = float(os.getenv("RISK_ALERT_THRESHOLD", "0.8"))
+    RISK_ALERT_CLEAR = float(os.getenv("RISK_ALERT_CLEAR", "0.6"))            # rearme (histéresis)
+    RISK_ALERT_COOLDOWN_SECONDS = int(os.getenv("RISK_ALERT_COOLDOWN_SECONDS", "900"))
+    RISK_INGEST_BACKLOG = int(os.getenv("RISK_INGEST_BACKLOG", "10000"))    # paquetes sin evaluar
+
+    # Reglas de alerta por lectura (vacío = umbrales fijos, ver app/rules.py)
+    ALERT_RULES_FILE = os.getenv(
+        "ALERT_RULES_FILE", os.path.join(os.path.dirname(__file__), "configs", "config.yaml")
+    )
 
     ALERT_COOLDOWN_SECONDS = int(os.getenv("ALERT_COOLDOWN_SECONDS", "300"))
+    NOTIFIER_WORKERS = int(os.getenv("NOTIFIER_WORKERS", "2"))
+    NOTIFIER_QUEUE_SIZE = int(os.getenv("NOTIFIER_QUEUE_SIZE", "1000"))
+    NOTIFIER_MAX_RETRIES = int(os.getenv("NOTIFIER_MAX_RETRIES", "4"))
+    NOTIFIER_BACKOFF_BASE_SECONDS = float(os.getenv("NOTIFIER_BACKOFF_BASE_SECONDS", "1"))
+
     ARCHIVE_THRESHOLD_DAYS = int(os.getenv("ARCHIVE_THRESHOLD_DAYS", "1"))
     ARCHIVER_RUN_EVERY_MINUTES = int(os.getenv("ARCHIVER_RUN_EVERY_MINUTES", "60"))
+    ARCHIVER_BATCH_SIZE = int(os.getenv("ARCHIVER_BATCH_SIZE", "500"))   # items leídos por lista
+    ARCHIVER_CHUNK_SIZE = int(os.getenv("ARCHIVER_CHUNK_SIZE", "200"))   # sensores por bloque
 
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+    # Endpoint Prometheus (0 = desactivado)
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+    # API HTTP de lectura (0 = desactivada, ver app/read_api.py)
+    READ_API_PORT = int(os.getenv("READ_API_PORT", "8080"))
+    READ_API_CACHE_TTL_MS = int(os.getenv("READ_API_CACHE_TTL_MS", "1000"))
+    READ_API_DASHBOARD_TTL_MS = int(os.getenv("READ_API_DASHBOARD_TTL_MS", "2000"))
+    READ_API_CACHE_MAX_ENTRIES = int(os.getenv("READ_API_CACHE_MAX_ENTRIES", "10000"))
+
+    # Exportación del histórico (app/db/export.py y GET /export)
+    EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "20000"))      # filas por bloque
+    EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))  # exportaciones HTTP a la vez
+
+    # Almacenamiento frío (app/db/cold.py): ruta local o s3://... (vacío = desactivado)
+    COLD_STORAGE_URL = os.getenv("COLD_STORAGE_URL", "")
+    COLD_AFTER_DAYS = int(os.getenv("COLD_AFTER_DAYS", "30"))
+    COLD_SEGMENTS_PER_RUN = int(os.getenv("COLD_SEGMENTS_PER_RUN", "7"))   # días por ciclo del Archiver
+
+    # Retención (app/db/retention.py): "tabla=días,..." (vacío = guardar todo)
+    RETENTION_POLICIES = os.getenv("RETENTION_POLICIES", "")
+    RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "5000"))              # filas por DELETE
+    RETENTION_PAUSE_MS = int(os.getenv("RETENTION_PAUSE_MS", "100"))         # pausa entre lotes
+    RETENTION_MAX_SECONDS = int(os.getenv("RETENTION_MAX_SECONDS", "300"))   # por ciclo del Archiver
+
+    # Gateway SSE/WebSocket (0 = desactivado, ver app/push_gateway.py)
+    PUSH_PORT = int(os.getenv("PUSH_PORT", "8090"))
+    PUSH_CLIENT_BUFFER = int(os.getenv("PUSH_CLIENT_BUFFER", "256"))        # eventos por cliente
+    PUSH_MAX_CLIENTS = int(os.getenv("PUSH_MAX_CLIENTS", "10000"))
+    PUSH_HEARTBEAT_SECONDS = float(os.getenv("PUSH_HEARTBEAT_SECONDS", "15"))
+    PUSH_SLOW_CLIENT_SECONDS = float(os.getenv("PUSH_SLOW_CLIENT_SECONDS", "30"))
+    PUSH_INGEST_BACKLOG = int(os.getenv("PUSH_INGEST_BACKLOG", "10000"))    # paquetes sin difundir
+
     RESEND_API_KEY = os.getenv("RESEND_API_KEY")
     RESEND_FROM = os.getenv("RESEND_FROM")
     RESEND_TO = os.getenv("RESEND_TO")
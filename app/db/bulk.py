@@ -0,0 +1,131 @@
+from datetime import timezone
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.db.models import SensorPacket, SensorPanel
+from app.db.rollups import apply_rollups
+
+
+def insert_packets(session, packets):
+    """
+    Inserta un lote de paquetes con sus paneles en la sesión dada
+    (sin hacer commit).
+
+    packets = [{
+        "device": "sensors/esp32-1",      # opcional
+        "seq": 10,
+        "timestamp": datetime(...),
+        "alerta": False,
+        "samples": [{"id": 1, "soil": {...}, "tilt": 0, "vib": {...}}, ...]
+    }, ...]
+
+    Usa un INSERT multi-fila con RETURNING para obtener todos los ids de
+    una vez (en lugar de un flush() por paquete). Los paquetes con
+    "device" llevan ON CONFLICT (device, seq, timestamp) DO NOTHING: una
+    reentrega QoS 1 o un replay del spool que ya está en la BD no duplica
+    paneles ni rollups. Devuelve la lista de ids en el mismo orden que
+    `packets`, con None en los duplicados.
+
+    Los rollups horario/diario se actualizan en la misma transacción,
+    solo con los paneles realmente insertados.
+
+    Los timestamps sin zona son UTC; los que traen zona se pasan a UTC
+    antes de insertar y de comparar claves, sea cual sea la zona de la
+    sesión de Postgres.
+    """
+    if not packets:
+        return []
+
+    dialect = session.get_bind().dialect.name
+    tss = [_ts_bd(p["timestamp"], dialect) for p in packets]
+    ids = [None] * len(packets)
+    sin_clave = [i for i, p in enumerate(packets) if p.get("device") is None]
+
+    # Primera aparición de cada clave; las repetidas dentro del lote se ignoran
+    con_clave = {}
+    for i, p in enumerate(packets):
+        if p.get("device") is not None:
+            con_clave.setdefault(_clave(p["device"], p["seq"], tss[i]), i)
+
+    if sin_clave:
+        result = session.execute(
+            insert(SensorPacket).returning(SensorPacket.id, sort_by_parameter_order=True),
+            [_packet_row(packets[i], tss[i]) for i in sin_clave],
+        )
+        for i, packet_id in zip(sin_clave, result.scalars().all()):
+            ids[i] = packet_id
+
+    if con_clave:
+        upsert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        t = SensorPacket.__table__.c
+        stmt = (
+            upsert(SensorPacket)
+            .on_conflict_do_nothing(index_elements=[t.device, t.seq, t.timestamp])
+            .returning(SensorPacket.id, SensorPacket.device, SensorPacket.seq, SensorPacket.timestamp)
+        )
+        # Sin fila devuelta = ya existía; se emparejan por clave, no por posición
+        result = session.execute(stmt, [_packet_row(packets[i], tss[i]) for i in con_clave.values()])
+        for packet_id, device, seq, ts in result.all():
+            ids[con_clave[_clave(device, seq, ts)]] = packet_id
+
+    panels = [
+        _panel_row(sample, packet_id, ts)
+        for p, ts, packet_id in zip(packets, tss, ids)
+        if packet_id is not None
+        for sample in p.get("samples", [])
+    ]
+    if panels:
+        session.execute(insert(SensorPanel), panels)
+
+    apply_rollups(session, [
+        (row["sample_id"], row["timestamp"], row["soil_pct"], row["tilt"], row["vib_pulse"], row["vib_hit"])
+        for row in panels
+    ])
+
+    return ids
+
+
+def _packet_row(p, ts):
+    return {
+        "device": p.get("device"),
+        "seq": p["seq"],
+        "timestamp": ts,
+        "alerta": bool(p["alerta"]),
+    }
+
+
+def _utc(ts):
+    """UTC sin zona (los timestamps sin zona ya son UTC)."""
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _ts_bd(ts, dialect):
+    # Postgres guarda el instante (con zona explícita no depende de la zona
+    # de la sesión); SQLite guarda el texto tal cual, así que va sin zona
+    ts = _utc(ts)
+    return ts.replace(tzinfo=timezone.utc) if dialect == "postgresql" else ts
+
+
+def _clave(device, seq, ts):
+    # Postgres devuelve timestamptz con la zona de la sesión y SQLite sin
+    # zona: ambos lados se comparan en UTC sin zona
+    return device, seq, _utc(ts)
+
+
+def _panel_row(sample, packet_id, timestamp):
+    """Fila de SensorPanel; las partes ausentes del sample quedan en NULL."""
+    soil = sample.get("soil") or {}
+    vib = sample.get("vib") or {}
+    return {
+        "sample_id": sample["id"],
+        "soil_raw": soil.get("raw"),
+        "soil_pct": soil.get("pct"),
+        "tilt": sample.get("tilt"),
+        "vib_pulse": vib.get("pulse"),
+        "vib_hit": vib.get("hit"),
+        "packet_id": packet_id,
+        "timestamp": timestamp,
+    }
@@ -1,23 +1,84 @@
 # app/db/client.py
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
 from app.config import settings
-from app.db.models import Base
 import os
 
-def get_engine():
+def crear_engine():
+    """
+    Engine con el pool configurado (DB_POOL_*). Se llama una sola vez por
+    proceso desde app.resources; el resto del código usa `engine` /
+    SessionLocal, que salen del registro.
+    """
     if settings.APP_ENV == "production":
-        return create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+        url = make_url(settings.DATABASE_URL)
+        connect_args = {}
+        if url.get_backend_name() == "postgresql" and url.get_driver_name() == "psycopg2":
+            # keepalive TCP: detecta antes las conexiones cortadas por NAT/proxy
+            connect_args = {
+                "connect_timeout": settings.DB_CONNECT_TIMEOUT,
+                "keepalives": 1,
+                "keepalives_idle": 30,
+                "keepalives_interval": 10,
+                "keepalives_count": 3,
+            }
+        return create_engine(
+            url,
+            pool_pre_ping=True,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            connect_args=connect_args,
+        )
 
     # modo desarrollo → fallback a SQLite local
     sqlite_path = os.path.join(os.getcwd(), "local_dev.sqlite")
     return create_engine(f"sqlite:///{sqlite_path}", connect_args={"check_same_thread": False})
 
-engine = get_engine()
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+def get_engine():
+    from app.resources import recursos
+    return recursos.engine()
+
+def __getattr__(nombre):
+    # `engine` y `SessionLocal` se crean al primer acceso (app/resources.py)
+    if nombre == "engine":
+        return get_engine()
+    if nombre == "SessionLocal":
+        from app.resources import recursos
+        return recursos.sesiones()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 def init_db():
-    Base.metadata.create_all(engine)
+    # create_all no toca tablas ya existentes: upgrade añade además las
+    # columnas e índices que faltan en una base anterior
+    from app.db.migrate import init_partitioned, upgrade
+    engine = get_engine()
+    if settings.DB_PARTITIONED and engine.dialect.name == "postgresql":
+        init_partitioned(engine, settings.DB_PARTITIONS_AHEAD)
+    upgrade(engine)
 
 def get_session():
-    return SessionLocal()
+    return __getattr__("SessionLocal")()
+
+def get_async_engine(pool_size=5):
+    """
+    Motor asyncio sobre la misma base que `engine` (asyncpg / aiosqlite),
+    para el runtime asyncio de ingesta. Se crea bajo demanda: el modo
+    con hilos no necesita esos drivers.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = get_engine().url
+    if url.get_backend_name() == "sqlite":
+        return create_async_engine(url.set(drivername="sqlite+aiosqlite"))
+
+    # asyncpg no entiende sslmode (Render lo pone en la URL)
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    connect_args = {"ssl": True} if sslmode in ("require", "verify-ca", "verify-full") else {}
+    return create_async_engine(
+        url.set(drivername="postgresql+asyncpg", query=query),
+        pool_size=pool_size, pool_pre_ping=True, pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args=connect_args
+    )
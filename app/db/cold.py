@@ -0,0 +1,259 @@
+"""
+Almacenamiento frío del histórico: tercer nivel después de Redis y la BD.
+
+Los días cerrados (más viejos que COLD_AFTER_DAYS) se compactan de
+monitoring_sensorpanel/monitoring_sensorpacket a un fichero Parquet (zstd)
+por día, ordenado por (sample_id, timestamp) para que la lectura de un
+sensor salte row groups enteros. Los ficheros van a COLD_STORAGE_URL:
+
+    /data/cold                                     disco local
+    s3://bucket/prefijo?endpoint_override=minio:9000&scheme=http
+                                                   S3 o compatible (MinIO)
+
+El catálogo (monitoring_coldsegment + monitoring_coldsegment_sample) guarda
+el rango de cada segmento y los sensores que contiene; es lo único que se
+consulta para decidir qué ficheros abrir. Los rollups no se tocan: se
+quedan en la BD y siguen cubriendo todo el histórico.
+
+Cada día se compacta en una sola transacción (REPEATABLE READ en
+Postgres): leer, escribir el fichero, registrar el segmento y borrar por
+id los paquetes escritos. Si algo falla antes del commit el fichero queda
+huérfano y se reescribe en el siguiente intento. Lo que llegue tarde para un día ya
+compactado (replay del spool) se queda en la BD y las consultas lo
+mezclan igual.
+
+Lo lanza el Archiver tras cada ciclo (como mucho COLD_SEGMENTS_PER_RUN
+días), o a mano:
+
+    python -m app.db.cold compactar
+    python -m app.db.cold listar --desde 2025-01-01
+
+Los timestamps sin zona se tratan como UTC, igual que en la exportación.
+"""
+import argparse
+import functools
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, exists, func, insert, select
+
+from app import metrics
+from app.config import settings
+from app.db.export import TRAMO, EscritorArrow, consulta, esquema_arrow
+from app.db.models import ColdSegment, ColdSegmentSample, SensorPacket, SensorPanel
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:  # dependencia opcional
+    pa = ds = pafs = None
+
+logger = logging.getLogger(__name__)
+
+COMPACTADAS = metrics.contador("edge_cold_rows_total", "Filas movidas de la BD a segmentos fríos")
+SEGMENTOS = metrics.contador("edge_cold_segments_total", "Segmentos fríos escritos")
+LEIDAS = metrics.contador("edge_cold_rows_read_total", "Filas leídas de segmentos fríos")
+
+_LOTE_BORRADO = 500     # ids por DELETE (límite de parámetros de SQLite)
+
+
+@functools.lru_cache(maxsize=None)
+def almacen(url=None):
+    """(FileSystem de pyarrow, ruta base) de COLD_STORAGE_URL."""
+    url = url or settings.COLD_STORAGE_URL
+    if pa is None:
+        raise RuntimeError("el almacenamiento frío requiere pyarrow (pip install pyarrow)")
+    if "://" not in url:
+        return pafs.LocalFileSystem(), os.path.abspath(url)
+    return pafs.FileSystem.from_uri(url)
+
+
+def _dia(ts):
+    return ts.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+
+
+# ============
+# COMPACTACIÓN
+# ============
+def compactar(engine=None, corte=None, max_segmentos=None):
+    """
+    Compacta los días con datos anteriores a `corte` (por defecto
+    now - COLD_AFTER_DAYS), a partir del último segmento ya escrito.
+    Devuelve las filas movidas.
+    """
+    if engine is None:
+        from app.db.client import get_engine
+        engine = get_engine()
+    corte = _dia(corte or datetime.now() - timedelta(days=settings.COLD_AFTER_DAYS))
+    max_segmentos = max_segmentos or settings.COLD_SEGMENTS_PER_RUN
+    fs, base = almacen()
+
+    with engine.connect() as conexion:
+        inicio = conexion.execute(select(func.max(ColdSegment.hasta))).scalar()
+        if inicio is not None:
+            inicio = inicio.replace(tzinfo=None)
+
+    total = 0
+    for _ in range(max_segmentos):
+        with engine.connect() as conexion:
+            inicio = _siguiente_dia(conexion, inicio, corte)
+        if inicio is None:
+            break
+        total += _compactar_dia(engine, fs, base, inicio)
+        inicio += TRAMO
+    return total
+
+
+def _siguiente_dia(conexion, inicio, corte):
+    """Primer día >= inicio y < corte con paneles en la BD (None si no hay)."""
+    if inicio is not None and inicio < corte:
+        hay = conexion.execute(select(exists().where(
+            SensorPanel.timestamp >= inicio, SensorPanel.timestamp < inicio + TRAMO
+        ))).scalar()
+        if hay:
+            return inicio
+    # Hueco sin datos (o primera compactación): salta al siguiente día con datos
+    stmt = select(func.min(SensorPanel.timestamp)).where(SensorPanel.timestamp < corte)
+    if inicio is not None:
+        stmt = stmt.where(SensorPanel.timestamp >= inicio)
+    primero = conexion.execute(stmt).scalar()
+    return _dia(primero) if primero is not None else None
+
+
+def _compactar_dia(engine, fs, base, dia):
+    fin = dia + TRAMO
+    ruta = f"{dia:%Y/%m/%Y-%m-%d}.parquet"
+    completa = f"{base}/{ruta}"
+
+    with engine.connect() as conexion:
+        if conexion.dialect.name == "postgresql":
+            # Lectura de una sola instantánea aunque el día tenga varios bloques
+            conexion = conexion.execution_options(isolation_level="REPEATABLE READ")
+        with conexion.begin():
+            filas, sensores, paquetes = 0, Counter(), set()
+            fs.create_dir(completa.rsplit("/", 1)[0], recursive=True)
+            with fs.open_output_stream(completa) as salida:
+                escritor = EscritorArrow(salida, parquet=True)
+                resultado = conexion.execute(
+                    consulta(dia, fin, por_sensor=True).execution_options(yield_per=settings.EXPORT_CHUNK_ROWS)
+                )
+                for bloque in resultado.partitions():
+                    escritor.escribir(bloque)
+                    filas += len(bloque)
+                    sensores.update(f[5] for f in bloque)
+                    paquetes.update(f[3] for f in bloque)
+                escritor.cerrar()
+            tamano = fs.get_file_info(completa).size
+
+            segmento = conexion.execute(
+                insert(ColdSegment).values(desde=dia, hasta=fin, ruta=ruta, filas=filas, bytes=tamano)
+            ).inserted_primary_key[0]
+            if sensores:
+                conexion.execute(insert(ColdSegmentSample), [
+                    {"segment_id": segmento, "sample_id": sid, "filas": n} for sid, n in sensores.items()
+                ])
+            # Solo lo que se escribió en el fichero: lo que haya entrado mientras
+            # tanto (o no se viera en la lectura) se queda en la BD
+            ids = sorted(paquetes)
+            for i in range(0, len(ids), _LOTE_BORRADO):
+                parte = ids[i:i + _LOTE_BORRADO]
+                conexion.execute(delete(SensorPanel).where(SensorPanel.packet_id.in_(parte)))
+                conexion.execute(delete(SensorPacket).where(SensorPacket.id.in_(parte)))
+
+    SEGMENTOS.inc()
+    COMPACTADAS.inc(filas)
+    logger.info(f"[COLD] {dia:%Y-%m-%d}: {filas} filas → {ruta} ({tamano / 1e6:.1f} MB)")
+    return filas
+
+
+# ============
+# LECTURA
+# ============
+def dias_compactados(conexion):
+    """Días (medianoche sin zona) que ya tienen segmento frío."""
+    return {_dia(d) for d in conexion.execute(select(ColdSegment.desde)).scalars()}
+
+
+def bloques_frios(conexion, desde, hasta, sample_ids=None, alerta=None, chunk=None):
+    """
+    Filas de los segmentos que solapan [desde, hasta), en bloques de
+    `chunk` y con las mismas columnas que export.bloques. Los timestamps
+    salen sin zona en SQLite y en UTC en Postgres, como los de la BD.
+    """
+    stmt = (
+        select(ColdSegment.ruta)
+        .where(ColdSegment.desde < hasta, ColdSegment.hasta > desde)
+        .order_by(ColdSegment.desde)
+    )
+    if sample_ids:
+        stmt = stmt.where(ColdSegment.id.in_(
+            select(ColdSegmentSample.segment_id).where(ColdSegmentSample.sample_id.in_(sample_ids))
+        ))
+    rutas = conexion.execute(stmt).scalars().all()
+    if not rutas:
+        return
+
+    fs, base = almacen()
+    tipo_ts = esquema_arrow().field("timestamp").type
+    filtro = (ds.field("timestamp") >= pa.scalar(desde, type=tipo_ts)) & (
+        ds.field("timestamp") < pa.scalar(hasta, type=tipo_ts)
+    )
+    if sample_ids:
+        filtro &= ds.field("sample_id").isin(sample_ids)
+    if alerta is not None:
+        filtro &= ds.field("alerta") == alerta
+    sin_zona = conexion.dialect.name != "postgresql"
+
+    dataset = ds.dataset([f"{base}/{r}" for r in rutas], filesystem=fs, format="parquet")
+    for lote in dataset.to_batches(filter=filtro, batch_size=chunk or settings.EXPORT_CHUNK_ROWS):
+        if not lote.num_rows:
+            continue
+        columnas = [c.to_pylist() for c in lote.columns[1:]]
+        # to_pylist() con zona crea un ZoneInfo por valor (10x más lento):
+        # se lee sin zona y se añade UTC a mano
+        ts = lote.column(0).cast(pa.timestamp("us")).to_pylist()
+        if not sin_zona:
+            ts = [t.replace(tzinfo=timezone.utc) for t in ts]
+        LEIDAS.inc(lote.num_rows)
+        yield list(zip(ts, *columnas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacenamiento frío del histórico")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    comp = sub.add_parser("compactar", help="Mueve días cerrados de la BD a segmentos")
+    comp.add_argument("--hasta", type=datetime.fromisoformat, default=None,
+                      help="por defecto now - COLD_AFTER_DAYS")
+    comp.add_argument("--max", type=int, default=None, help="días como máximo (COLD_SEGMENTS_PER_RUN)")
+    lis = sub.add_parser("listar", help="Segmentos del catálogo")
+    lis.add_argument("--desde", type=datetime.fromisoformat, default=datetime.min)
+    lis.add_argument("--hasta", type=datetime.fromisoformat, default=datetime.max)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not settings.COLD_STORAGE_URL:
+        parser.error("COLD_STORAGE_URL no está configurado")
+
+    from app.db.client import engine, init_db
+    init_db()
+
+    if args.cmd == "compactar":
+        total = compactar(engine, args.hasta, args.max)
+        print(f"{total} filas compactadas")
+        return
+
+    with engine.connect() as conexion:
+        segmentos = conexion.execute(
+            select(ColdSegment)
+            .where(ColdSegment.desde < args.hasta, ColdSegment.hasta > args.desde)
+            .order_by(ColdSegment.desde)
+        ).all()
+    for s in segmentos:
+        print(f"{s.desde:%Y-%m-%d}  {s.filas:>10}  {s.bytes / 1e6:8.1f} MB  {s.ruta}")
+
+
+if __name__ == "__main__":
+    main()
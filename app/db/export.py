@@ -0,0 +1,284 @@
+"""
+Exportación del histórico (monitoring_sensorpanel + su paquete) a ficheros
+columnares o CSV comprimido, en streaming y con memoria acotada.
+
+    python -m app.db.export --desde 2025-01-01 --hasta 2026-01-01 --formato parquet
+    python -m app.db.export --desde 2025-06-01 --hasta 2025-06-02 --sample-id 3 --alerta -o junio.csv.gz
+
+Formatos:
+- csv:     CSV con cabecera comprimido con gzip (sin dependencias)
+- parquet: Parquet zstd, un row group por bloque (requiere `pyarrow`)
+- arrow:   Arrow IPC en formato stream (requiere `pyarrow`)
+
+El rango se recorre por tramos de un día (ordenar un día es barato y en
+Postgres particionado cada tramo cae en una sola partición). Dentro de
+cada tramo las filas llegan con un cursor de servidor (yield_per) en
+bloques de EXPORT_CHUNK_ROWS, así que en memoria solo hay un bloque a la
+vez, venga de un día o de un año. La API de lectura sirve lo mismo en
+GET /export (ver app/read_api.py).
+
+Con almacenamiento frío (COLD_STORAGE_URL, ver app/db/cold.py) los días
+ya compactados se leen de sus segmentos; esas filas salen ordenadas por
+sensor dentro del día.
+"""
+import argparse
+import csv
+import gzip
+import io
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import metrics
+from app.config import settings
+from app.db.models import SensorPacket, SensorPanel
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dependencia opcional
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORTADAS = metrics.contador("edge_export_rows_total", "Filas escritas por exportaciones del histórico")
+
+TRAMO = timedelta(days=1)
+
+COLUMNAS = (
+    SensorPanel.timestamp, SensorPacket.device, SensorPacket.seq, SensorPanel.packet_id,
+    SensorPacket.alerta, SensorPanel.sample_id, SensorPanel.soil_raw, SensorPanel.soil_pct,
+    SensorPanel.tilt, SensorPanel.vib_pulse, SensorPanel.vib_hit,
+)
+NOMBRES = tuple(c.key for c in COLUMNAS)
+
+# formato → (extensión, content-type)
+FORMATOS = {
+    "csv": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.stream"),
+}
+
+
+def consulta(desde, hasta, sample_ids=None, alerta=None, por_sensor=False):
+    """
+    SELECT de los paneles de [desde, hasta) con los campos del paquete,
+    por tiempo o por (sample_id, tiempo) si `por_sensor`.
+    """
+    orden = (SensorPanel.sample_id,) if por_sensor else ()
+    stmt = (
+        select(*COLUMNAS)
+        .join(SensorPacket, SensorPacket.id == SensorPanel.packet_id)
+        .where(SensorPanel.timestamp >= desde, SensorPanel.timestamp < hasta)
+        .order_by(*orden, SensorPanel.timestamp, SensorPanel.id)
+    )
+    if sample_ids:
+        stmt = stmt.where(SensorPanel.sample_id.in_(sample_ids))
+    if alerta is not None:
+        stmt = stmt.where(SensorPacket.alerta.is_(alerta))
+    return stmt
+
+
+def bloques(conexion, desde, hasta, sample_ids=None, alerta=None, chunk=None):
+    """
+    Listas de filas (tuplas en el orden de NOMBRES) de como mucho `chunk`.
+    Cada día incluye primero lo que haya en segmentos fríos y después lo
+    que siga en la base de datos.
+    """
+    chunk = chunk or settings.EXPORT_CHUNK_ROWS
+    if settings.COLD_STORAGE_URL:
+        from app.db import cold
+    inicio = desde
+    while inicio < hasta:
+        fin = min(inicio + TRAMO, hasta)
+        if settings.COLD_STORAGE_URL:
+            yield from cold.bloques_frios(conexion, inicio, fin, sample_ids, alerta, chunk)
+        # yield_per: cursor de servidor en Postgres (stream_results) y
+        # fetchmany de `chunk` filas en SQLite
+        resultado = conexion.execute(
+            consulta(inicio, fin, sample_ids, alerta).execution_options(yield_per=chunk)
+        )
+        for bloque in resultado.partitions():
+            yield bloque
+        inicio = fin
+
+
+# ============
+# ESCRITORES
+# ============
+class _Tubo:
+    """Fichero de solo escritura que acumula lo escrito hasta vaciar()."""
+
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+        self._pos = 0
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._pos += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+class EscritorCSV:
+    def __init__(self, salida):
+        self._gzip = gzip.GzipFile(fileobj=salida, mode="wb", compresslevel=6)
+        self._texto = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="", write_through=True)
+        self._csv = csv.writer(self._texto)
+        self._csv.writerow(NOMBRES)
+
+    def escribir(self, filas):
+        self._csv.writerows(filas)
+
+    def cerrar(self):
+        self._texto.close()   # cierra el GzipFile (trailer) pero no `salida`
+
+
+def esquema_arrow():
+    """Schema Arrow de NOMBRES (exportación y segmentos fríos)."""
+    return pa.schema([
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("device", pa.string()),
+        ("seq", pa.int64()),
+        ("packet_id", pa.int64()),
+        ("alerta", pa.bool_()),
+        ("sample_id", pa.int32()),
+        ("soil_raw", pa.int32()),
+        ("soil_pct", pa.int32()),
+        ("tilt", pa.int32()),
+        ("vib_pulse", pa.int64()),
+        ("vib_hit", pa.int32()),
+    ])
+
+
+class EscritorArrow:
+    def __init__(self, salida, parquet):
+        self.schema = esquema_arrow()
+        if parquet:
+            self._writer = pq.ParquetWriter(salida, self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_stream(salida, self.schema)
+
+    def escribir(self, filas):
+        columnas = [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*filas), self.schema)]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(columnas, schema=self.schema))
+
+    def cerrar(self):
+        self._writer.close()
+
+
+def _escritor(formato, salida):
+    if formato == "csv":
+        return EscritorCSV(salida)
+    return EscritorArrow(salida, parquet=formato == "parquet")
+
+
+# ============
+# EXPORTACIÓN
+# ============
+class Exportacion:
+    """
+    Exportación de [desde, hasta) en `formato`. Iterarla devuelve el
+    fichero en trozos de bytes (uno por bloque de filas); `filas` cuenta
+    lo exportado hasta el momento.
+    """
+
+    def __init__(self, desde, hasta, formato="csv", sample_ids=None, alerta=None, chunk=None, engine=None):
+        if formato not in FORMATOS:
+            raise ValueError(f"formato desconocido: {formato} (opciones: {', '.join(FORMATOS)})")
+        if formato != "csv" and pa is None:
+            raise ValueError(f"el formato {formato} requiere pyarrow (pip install pyarrow)")
+        if hasta <= desde:
+            raise ValueError("hasta debe ser posterior a desde")
+        self.desde = desde
+        self.hasta = hasta
+        self.formato = formato
+        self.sample_ids = sample_ids
+        self.alerta = alerta
+        self.chunk = chunk
+        self.engine = engine
+        self.filas = 0
+
+    @property
+    def extension(self):
+        return FORMATOS[self.formato][0]
+
+    @property
+    def content_type(self):
+        return FORMATOS[self.formato][1]
+
+    def __iter__(self):
+        if self.engine is None:
+            from app.db.client import get_engine
+            self.engine = get_engine()
+
+        tubo = _Tubo()
+        escritor = _escritor(self.formato, tubo)
+        with self.engine.connect() as conexion:
+            for bloque in bloques(conexion, self.desde, self.hasta, self.sample_ids, self.alerta, self.chunk):
+                escritor.escribir(bloque)
+                self.filas += len(bloque)
+                EXPORTADAS.inc(len(bloque))
+                datos = tubo.vaciar()
+                if datos:
+                    yield datos
+        escritor.cerrar()
+        yield tubo.vaciar()
+
+    def guardar(self, ruta):
+        """Escribe la exportación en `ruta` y devuelve las filas exportadas."""
+        with open(ruta, "wb") as f:
+            for datos in self:
+                f.write(datos)
+        return self.filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportación del histórico de lecturas")
+    parser.add_argument("--desde", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--hasta", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--formato", choices=list(FORMATOS), default="csv")
+    parser.add_argument("--sample-id", type=int, action="append", dest="sample_ids",
+                        help="repetible; por defecto todos los sensores")
+    alerta = parser.add_mutually_exclusive_group()
+    alerta.add_argument("--alerta", action="store_const", const=True, dest="alerta",
+                        help="solo paquetes con alerta")
+    alerta.add_argument("--sin-alerta", action="store_const", const=False, dest="alerta",
+                        help="solo paquetes sin alerta")
+    parser.add_argument("--chunk", type=int, default=None, help="filas por bloque (EXPORT_CHUNK_ROWS)")
+    parser.add_argument("-o", "--salida", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    hasta = args.hasta or datetime.now()
+    try:
+        exportacion = Exportacion(args.desde, hasta, args.formato, args.sample_ids, args.alerta, args.chunk)
+    except ValueError as e:
+        parser.error(str(e))
+    salida = args.salida or (
+        f"export_{args.desde:%Y%m%d%H%M}_{hasta:%Y%m%d%H%M}{exportacion.extension}"
+    )
+    total = exportacion.guardar(salida)
+    print(f"{total} filas exportadas a {salida}")
+
+
+if __name__ == "__main__":
+    main()
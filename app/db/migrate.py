@@ -0,0 +1,285 @@
+"""
+Migraciones del esquema histórico.
+
+    python -m app.db.migrate upgrade              # columnas + índices (SQLite y Postgres)
+    python -m app.db.migrate particionar          # Postgres: pasa a particiones mensuales
+    python -m app.db.migrate particiones --ahead 3
+
+`upgrade` es idempotente: añade monitoring_sensorpanel.timestamp,
+monitoring_sensorpacket.device y monitoring_archivebatch.lote, rellena el
+primero por lotes desde el paquete y crea los índices que falten
+(CONCURRENTLY en Postgres). `particionar` debe ejecutarse con el servicio
+detenido: copia las tablas a un layout PARTITION BY RANGE ("timestamp")
+por mes y deja las originales como *_legacy.
+"""
+import argparse
+import logging
+from datetime import date
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from app.db.models import ArchiveBatch, Base, SensorPacket, SensorPanel
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = (SensorPacket.__tablename__, SensorPanel.__tablename__)
+
+PARTITIONED_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS monitoring_sensorpacket (
+        id integer GENERATED BY DEFAULT AS IDENTITY,
+        device varchar(64),
+        seq integer NOT NULL,
+        "timestamp" timestamptz NOT NULL,
+        alerta boolean NOT NULL DEFAULT false,
+        created_at timestamptz DEFAULT now(),
+        updated_at timestamptz DEFAULT now(),
+        PRIMARY KEY (id, "timestamp")
+    ) PARTITION BY RANGE ("timestamp")
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS monitoring_sensorpanel (
+        id integer GENERATED BY DEFAULT AS IDENTITY,
+        sample_id integer NOT NULL,
+        soil_raw integer,
+        soil_pct integer,
+        tilt integer,
+        vib_pulse integer,
+        vib_hit integer,
+        packet_id integer NOT NULL,
+        "timestamp" timestamptz NOT NULL,
+        created_at timestamptz DEFAULT now(),
+        updated_at timestamptz DEFAULT now(),
+        PRIMARY KEY (id, "timestamp"),
+        FOREIGN KEY (packet_id, "timestamp")
+            REFERENCES monitoring_sensorpacket (id, "timestamp") ON DELETE CASCADE
+    ) PARTITION BY RANGE ("timestamp")
+    """,
+]
+
+
+# ============
+# UPGRADE (SQLite + Postgres)
+# ============
+def upgrade(engine, batch=50000):
+    Base.metadata.create_all(engine)
+
+    columnas = {c["name"] for c in inspect(engine).get_columns(SensorPanel.__tablename__)}
+    if "timestamp" not in columnas:
+        logger.info("Añadiendo monitoring_sensorpanel.timestamp")
+        with engine.begin() as conn:
+            conn.execute(text('ALTER TABLE monitoring_sensorpanel ADD COLUMN "timestamp" TIMESTAMP WITH TIME ZONE'))
+
+    columnas = {c["name"] for c in inspect(engine).get_columns(SensorPacket.__tablename__)}
+    if "device" not in columnas:
+        logger.info("Añadiendo monitoring_sensorpacket.device")
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE monitoring_sensorpacket ADD COLUMN device VARCHAR(64)"))
+
+    columnas = {c["name"] for c in inspect(engine).get_columns(ArchiveBatch.__tablename__)}
+    if "lote" not in columnas:
+        logger.info("Añadiendo monitoring_archivebatch.lote")
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE monitoring_archivebatch ADD COLUMN lote VARCHAR(32)"))
+            if conn.dialect.name == "postgresql":
+                # El id lo ponía el Archiver (contador de Redis); ahora lo genera la BD
+                conn.execute(text("ALTER TABLE monitoring_archivebatch ALTER COLUMN id "
+                                  "ADD GENERATED BY DEFAULT AS IDENTITY"))
+                conn.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('monitoring_archivebatch', 'id'), "
+                    "(SELECT COALESCE(max(id), 0) + 1 FROM monitoring_archivebatch), false)"
+                ))
+
+    backfill_panel_timestamps(engine, batch)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in (SensorPacket.__table__, SensorPanel.__table__, ArchiveBatch.__table__):
+            for idx in table.indexes:
+                create_index(conn, idx)
+
+
+def backfill_panel_timestamps(engine, batch=50000):
+    """Copia packet.timestamp a los paneles que aún no lo tienen, por lotes."""
+    stmt = text("""
+        UPDATE monitoring_sensorpanel
+        SET "timestamp" = (
+            SELECT k."timestamp" FROM monitoring_sensorpacket k
+            WHERE k.id = monitoring_sensorpanel.packet_id
+        )
+        WHERE id IN (
+            SELECT id FROM monitoring_sensorpanel WHERE "timestamp" IS NULL LIMIT :n
+        )
+    """)
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            n = conn.execute(stmt, {"n": batch}).rowcount
+        if not n:
+            break
+        total += n
+        logger.info("Paneles con timestamp rellenado: %d", total)
+    return total
+
+
+def create_index(conn, idx):
+    ddl = str(CreateIndex(idx, if_not_exists=True).compile(dialect=conn.dialect))
+    if conn.dialect.name == "postgresql" and not is_partitioned(conn, idx.table.name):
+        ddl = ddl.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+    conn.exec_driver_sql(ddl)
+
+
+# ============
+# PARTICIONES (solo Postgres)
+# ============
+def is_partitioned(conn, table):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :t AND pg_table_is_visible(c.oid)
+    """), {"t": table}).first() is not None
+
+
+def _month(d, delta=0):
+    m = d.year * 12 + d.month - 1 + delta
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def ensure_partitions(conn, ahead=3, desde=None):
+    """
+    Crea (IF NOT EXISTS) las particiones mensuales desde `desde` (por
+    defecto el mes actual) hasta `ahead` meses después.
+    """
+    inicio = _month(desde or date.today())
+    fin = _month(date.today(), ahead)
+    mes = inicio
+    while mes <= fin:
+        siguiente = _month(mes, 1)
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS {table}_y{mes.year}m{mes.month:02d} '
+                f"PARTITION OF {table} FOR VALUES FROM ('{mes.isoformat()} 00:00:00+00') "
+                f"TO ('{siguiente.isoformat()} 00:00:00+00')"
+            ))
+        mes = siguiente
+
+
+def create_partitioned_schema(conn, ahead=3, desde=None):
+    """
+    Layout particionado para una BD nueva (tablas IF NOT EXISTS).
+    La partición DEFAULT recoge timestamps fuera de rango (reloj del
+    dispositivo desajustado) en lugar de hacer fallar el lote entero.
+    """
+    for ddl in PARTITIONED_DDL:
+        conn.execute(text(ddl))
+    for table in PARTITIONED_TABLES:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+    ensure_partitions(conn, ahead, desde)
+
+
+def init_partitioned(engine, ahead=3):
+    """
+    Arranque con DB_PARTITIONED: crea el layout particionado si la BD está
+    vacía y asegura las particiones de los próximos meses. Idempotente,
+    también lo llama el Archiver en cada ciclo.
+    """
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(SensorPacket.__tablename__):
+            create_partitioned_schema(conn, ahead)
+            for table in (SensorPacket.__table__, SensorPanel.__table__):
+                for idx in table.indexes:
+                    create_index(conn, idx)
+        elif is_partitioned(conn, SensorPacket.__tablename__):
+            ensure_partitions(conn, ahead)
+        else:
+            logger.warning("DB_PARTITIONED activo pero las tablas no están particionadas: "
+                           "ejecuta python -m app.db.migrate particionar")
+
+
+def partition_existing(engine, ahead=3, drop_legacy=False):
+    """
+    Convierte las tablas existentes al layout particionado en una sola
+    transacción: renombra las originales a *_legacy, crea las nuevas,
+    copia los datos y ajusta las secuencias.
+    """
+    with engine.begin() as conn:
+        if is_partitioned(conn, SensorPacket.__tablename__):
+            logger.info("Las tablas ya están particionadas")
+            return
+
+        desde = conn.execute(text('SELECT min("timestamp") FROM monitoring_sensorpacket')).scalar()
+        conn.execute(text("ALTER TABLE monitoring_sensorpacket ADD COLUMN IF NOT EXISTS device varchar(64)"))
+
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_legacy"))
+            conn.execute(text(f"ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey"))
+        for table in (SensorPacket.__table__, SensorPanel.__table__):
+            for idx in table.indexes:
+                conn.execute(text(f"ALTER INDEX IF EXISTS {idx.name} RENAME TO {idx.name}_legacy"))
+
+        create_partitioned_schema(conn, ahead, desde.date() if desde else None)
+
+        conn.execute(text("""
+            INSERT INTO monitoring_sensorpacket (id, device, seq, "timestamp", alerta, created_at, updated_at)
+            SELECT id, device, seq, "timestamp", alerta, created_at, updated_at
+            FROM monitoring_sensorpacket_legacy
+        """))
+        conn.execute(text("""
+            INSERT INTO monitoring_sensorpanel
+                (id, sample_id, soil_raw, soil_pct, tilt, vib_pulse, vib_hit, packet_id, "timestamp", created_at, updated_at)
+            SELECT p.id, p.sample_id, p.soil_raw, p.soil_pct, p.tilt, p.vib_pulse, p.vib_hit, p.packet_id,
+                   k."timestamp", p.created_at, p.updated_at
+            FROM monitoring_sensorpanel_legacy p
+            JOIN monitoring_sensorpacket_legacy k ON k.id = p.packet_id
+        """))
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(max(id), 0) + 1 FROM {table}), false)"
+            ))
+
+        for table in (SensorPacket.__table__, SensorPanel.__table__):
+            for idx in table.indexes:
+                create_index(conn, idx)
+
+        if drop_legacy:
+            conn.execute(text("DROP TABLE monitoring_sensorpanel_legacy"))
+            conn.execute(text("DROP TABLE monitoring_sensorpacket_legacy"))
+
+    logger.info("Tablas migradas al layout particionado por mes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones del esquema histórico")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    up = sub.add_parser("upgrade", help="Columnas e índices que falten")
+    up.add_argument("--batch", type=int, default=50000)
+    part = sub.add_parser("particionar", help="Postgres: particiones mensuales")
+    part.add_argument("--ahead", type=int, default=3)
+    part.add_argument("--drop-legacy", action="store_true")
+    ens = sub.add_parser("particiones", help="Postgres: crea particiones futuras")
+    ens.add_argument("--ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.db.client import engine
+
+    if args.cmd == "upgrade":
+        upgrade(engine, args.batch)
+        return
+
+    if engine.dialect.name != "postgresql":
+        parser.error("el particionado solo está disponible en Postgres")
+
+    if args.cmd == "particionar":
+        partition_existing(engine, args.ahead, args.drop_legacy)
+    else:
+        with engine.begin() as conn:
+            ensure_partitions(conn, args.ahead)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 # app/db/models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -10,6 +10,9 @@ Base = declarative_base()
 class SensorPacket(Base):
     __tablename__ = 'monitoring_sensorpacket'
     id = Column(Integer, primary_key=True)
+    # Origen del paquete (campo "device" o topic MQTT); NULL en filas
+    # antiguas y en las que el Archiver reconstruye de lecturas sin device
+    device = Column(String(64))
     seq = Column(Integer, nullable=False)
     timestamp = Column(DateTime(timezone=True), nullable=False)
     alerta = Column(Boolean, nullable=False, default=False)
@@ -18,6 +21,14 @@ class SensorPacket(Base):
 
     panels = relationship("SensorPanel", back_populates="packet", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # BRIN en Postgres (tabla append-only por tiempo); B-tree en SQLite
+        Index('ix_sensorpacket_timestamp_brin', 'timestamp', postgresql_using='brin'),
+        # Idempotencia de la ingesta (ON CONFLICT DO NOTHING en insert_packets).
+        # Incluye "timestamp", así que también vale en el layout particionado.
+        Index('ux_sensorpacket_device_seq_ts', 'device', 'seq', 'timestamp', unique=True),
+    )
+
 class SensorPanel(Base):
     __tablename__ = 'monitoring_sensorpanel'
     id = Column(Integer, primary_key=True)
@@ -28,7 +39,78 @@ class SensorPanel(Base):
     vib_pulse = Column(Integer)
     vib_hit = Column(Integer)
     packet_id = Column(Integer, ForeignKey('monitoring_sensorpacket.id', ondelete='CASCADE'), nullable=False)
+    # Copia de packet.timestamp: las lecturas por sensor/rango no necesitan join
+    timestamp = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
     packet = relationship("SensorPacket", back_populates="panels")
+
+    __table_args__ = (
+        Index('ix_sensorpanel_sample_ts', 'sample_id', 'timestamp'),
+        Index('ix_sensorpanel_packet_id', 'packet_id'),
+        Index('ix_sensorpanel_timestamp_brin', 'timestamp', postgresql_using='brin'),
+    )
+
+class ArchiveBatch(Base):
+    """Checkpoint del Archiver: un lote movido desde Redis ya está en la BD."""
+    __tablename__ = 'monitoring_archivebatch'
+    id = Column(Integer, primary_key=True)
+    # uuid del lote (archiver:pendiente:<lote>); NULL en los checkpoints
+    # antiguos, cuyo id salía de un contador de Redis
+    lote = Column(String(32))
+    rows = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ux_archivebatch_lote', 'lote', unique=True),
+    )
+
+class ColdSegment(Base):
+    """
+    Catálogo del almacenamiento frío (app/db/cold.py): un fichero Parquet
+    por día cerrado cuyas filas ya no están en las tablas crudas. `ruta`
+    es relativa a COLD_STORAGE_URL.
+    """
+    __tablename__ = 'monitoring_coldsegment'
+    id = Column(Integer, primary_key=True)
+    desde = Column(DateTime(timezone=True), nullable=False)
+    hasta = Column(DateTime(timezone=True), nullable=False)
+    ruta = Column(String(512), nullable=False)
+    filas = Column(Integer, nullable=False, default=0)
+    bytes = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    sensores = relationship("ColdSegmentSample", back_populates="segmento", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index('ix_coldsegment_desde_hasta', 'desde', 'hasta'),
+    )
+
+class ColdSegmentSample(Base):
+    """Sensores presentes en cada segmento (poda por sample_id)."""
+    __tablename__ = 'monitoring_coldsegment_sample'
+    sample_id = Column(Integer, primary_key=True)
+    segment_id = Column(Integer, ForeignKey('monitoring_coldsegment.id', ondelete='CASCADE'), primary_key=True)
+    filas = Column(Integer, nullable=False, default=0)
+
+    segmento = relationship("ColdSegment", back_populates="sensores")
+
+class _RollupColumns:
+    """Columnas comunes de los rollups por (sample_id, bucket)."""
+    sample_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    samples = Column(Integer, nullable=False, default=0)       # paneles en el bucket
+    soil_n = Column(Integer, nullable=False, default=0)        # paneles con soil_pct
+    soil_sum = Column(BigInteger, nullable=False, default=0)
+    soil_min = Column(Integer)
+    soil_max = Column(Integer)
+    vib_pulse_sum = Column(BigInteger, nullable=False, default=0)
+    vib_hit_count = Column(Integer, nullable=False, default=0)
+    tilt_on_count = Column(Integer, nullable=False, default=0)
+
+class SensorRollupHourly(_RollupColumns, Base):
+    __tablename__ = 'monitoring_sensorrollup_hourly'
+
+class SensorRollupDaily(_RollupColumns, Base):
+    __tablename__ = 'monitoring_sensorrollup_daily'
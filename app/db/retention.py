@@ -0,0 +1,276 @@
+"""
+Retención del histórico: borra lo que haya superado los días configurados
+por tabla en RETENTION_POLICIES, por ejemplo
+
+    RETENTION_POLICIES=monitoring_sensorpacket=90,monitoring_sensorrollup_hourly=730
+
+Las tablas sin política (o con 0 días) se guardan para siempre. Borrar
+paquetes borra también sus paneles.
+
+El borrado va por lotes de RETENTION_BATCH filas paginados por clave
+primaria (keyset): cada lote es una transacción corta seguida de una
+pausa de RETENTION_PAUSE_MS, para no competir con la ingesta por locks ni
+por E/S. En Postgres particionado, los meses que quedan enteros fuera de
+la retención se eliminan con DROP TABLE de la partición (sin filas
+muertas que limpiar). Cada ejecución se corta tras RETENTION_MAX_SECONDS
+y sigue en el próximo ciclo.
+
+Lo lanza el Archiver tras cada ciclo, o a mano:
+
+    python -m app.db.retention            # políticas de RETENTION_POLICIES
+    python -m app.db.retention --politica monitoring_sensorpanel=30
+"""
+import argparse
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, text, tuple_
+
+from app import metrics
+from app.config import settings
+from app.db.migrate import _month, is_partitioned
+from app.db.models import (
+    ArchiveBatch, ColdSegment, ColdSegmentSample, SensorPacket, SensorPanel,
+    SensorRollupDaily, SensorRollupHourly,
+)
+
+logger = logging.getLogger(__name__)
+
+BORRADAS = metrics.contador("edge_retention_rows_deleted_total", "Filas borradas por la retención")
+PARTICIONES = metrics.contador("edge_retention_partitions_dropped_total", "Particiones eliminadas por la retención")
+
+# tabla → (modelo, columna de tiempo), en orden de ejecución
+TABLAS = {
+    t.__tablename__: (t, columna) for t, columna in (
+        (ColdSegment, ColdSegment.hasta),
+        (ArchiveBatch, ArchiveBatch.created_at),
+        (SensorRollupDaily, SensorRollupDaily.bucket),
+        (SensorRollupHourly, SensorRollupHourly.bucket),
+        (SensorPacket, SensorPacket.timestamp),
+        (SensorPanel, SensorPanel.timestamp),
+    )
+}
+
+
+def politicas(texto=None):
+    """{tabla: días} a partir de "tabla=días,..." (por defecto RETENTION_POLICIES)."""
+    texto = settings.RETENTION_POLICIES if texto is None else texto
+    resultado = {}
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        tabla, _, dias = parte.partition("=")
+        tabla = tabla.strip()
+        if tabla not in TABLAS:
+            raise ValueError(f"tabla sin retención posible: {tabla} (opciones: {', '.join(TABLAS)})")
+        try:
+            dias = int(dias)
+        except ValueError:
+            raise ValueError(f"días inválidos para {tabla}: {dias!r}") from None
+        if dias > 0:
+            resultado[tabla] = dias
+    return resultado
+
+
+def corte_crudos(reglas=None, ahora=None):
+    """
+    Fecha antes de la cual las políticas borran paneles o paquetes, es
+    decir, desde la que los datos crudos de la BD ya no están enteros
+    (None si se guardan para siempre).
+    """
+    reglas = politicas() if reglas is None else reglas
+    dias = [reglas[t] for t in (SensorPanel.__tablename__, SensorPacket.__tablename__) if t in reglas]
+    return (ahora or datetime.now()) - timedelta(days=min(dias)) if dias else None
+
+
+class _Presupuesto:
+    """Pausa entre lotes y límite de tiempo de una ejecución."""
+
+    def __init__(self, segundos, pausa, parada):
+        self.fin = time.monotonic() + segundos
+        self.pausa = pausa
+        self.parada = parada
+
+    def seguir(self):
+        if self.parada.wait(self.pausa):
+            return False
+        return time.monotonic() < self.fin
+
+
+def aplicar_retencion(engine=None, reglas=None, ahora=None, lote=None, parada=None):
+    """
+    Aplica las políticas `reglas` ({tabla: días}, por defecto
+    RETENTION_POLICIES). `parada` (threading.Event) corta entre lotes.
+    Devuelve {tabla: filas borradas}; las particiones eliminadas cuentan
+    sus filas.
+    """
+    if engine is None:
+        from app.db.client import get_engine
+        engine = get_engine()
+    reglas = politicas() if reglas is None else reglas
+    ahora = ahora or datetime.now()
+    lote = lote or settings.RETENTION_BATCH
+    presupuesto = _Presupuesto(settings.RETENTION_MAX_SECONDS, settings.RETENTION_PAUSE_MS / 1000,
+                               parada or threading.Event())
+
+    cortes = {tabla: ahora - timedelta(days=dias) for tabla, dias in reglas.items()}
+    borradas = {}
+    if engine.dialect.name == "postgresql":
+        borradas = _soltar_particiones(engine, cortes)
+
+    for tabla in (t for t in TABLAS if t in cortes):
+        corte = cortes[tabla]
+        modelo, columna = TABLAS[tabla]
+        inicio = time.monotonic()
+        n = _borrar_por_lotes(engine, modelo, columna, corte, lote, presupuesto)
+        borradas[tabla] = borradas.get(tabla, 0) + n
+        if n:
+            logger.info(f"[RETENCION] {tabla}: {n} filas anteriores a {corte:%Y-%m-%d} "
+                        f"en {time.monotonic() - inicio:.1f}s")
+        if time.monotonic() >= presupuesto.fin or presupuesto.parada.is_set():
+            logger.info("[RETENCION] Interrumpida; sigue en el próximo ciclo")
+            break
+    return borradas
+
+
+# ============
+# BORRADO POR LOTES
+# ============
+def _borrar_por_lotes(engine, modelo, columna, corte, lote, presupuesto):
+    """DELETE de `lote` en `lote` filas con columna < corte, por clave primaria."""
+    # id, o (sample_id, bucket) en los rollups: recorre el índice de la PK
+    clave = list(modelo.__table__.primary_key.columns)
+    extra = [ColdSegment.ruta] if modelo is ColdSegment else []
+    ultimo = None
+    total = 0
+    while True:
+        stmt = select(*clave, *extra).where(columna < corte).order_by(*clave).limit(lote)
+        if ultimo is not None:
+            stmt = stmt.where(tuple_(*clave) > tuple_(*ultimo))
+        with engine.begin() as conn:
+            filas = conn.execute(stmt).all()
+            if not filas:
+                return total
+            ultimo = tuple(filas[-1])[:len(clave)]
+            if len(clave) == 1:
+                ids = [f[0] for f in filas]
+                _antes_de_borrar(conn, modelo, ids, corte)
+                conn.execute(delete(modelo).where(clave[0].in_(ids), columna < corte))
+            else:
+                conn.execute(delete(modelo).where(tuple_(*clave).in_([tuple(f) for f in filas])))
+        if extra:
+            _borrar_ficheros([f.ruta for f in filas])
+        total += len(filas)
+        BORRADAS.inc(len(filas))
+        logger.debug(f"[RETENCION] {modelo.__tablename__}: {total} filas borradas")
+        if not presupuesto.seguir():
+            return total
+
+
+def _antes_de_borrar(conn, modelo, ids, corte):
+    """Hijos que no se borran solos (SQLite no aplica ON DELETE CASCADE)."""
+    if modelo is SensorPacket:
+        # Mismo timestamp que su paquete: poda particiones en Postgres
+        conn.execute(delete(SensorPanel).where(SensorPanel.packet_id.in_(ids), SensorPanel.timestamp < corte))
+    elif modelo is ColdSegment:
+        conn.execute(delete(ColdSegmentSample).where(ColdSegmentSample.segment_id.in_(ids)))
+
+
+def _borrar_ficheros(rutas):
+    """Ficheros de segmentos fríos ya fuera del catálogo (tras el commit)."""
+    from app.db.cold import almacen
+    fs, base = almacen()
+    for ruta in rutas:
+        try:
+            fs.delete_file(f"{base}/{ruta}")
+        except (FileNotFoundError, OSError) as e:
+            logger.warning(f"[RETENCION] No se pudo borrar el segmento {ruta}: {e}")
+
+
+# ============
+# PARTICIONES (Postgres)
+# ============
+_PARTICION = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def _soltar_particiones(engine, cortes):
+    """
+    DROP TABLE de las particiones mensuales enteras anteriores al corte.
+    Los paneles de un mes caen con su partición de paquetes (la FK apunta
+    a ella), así que se eliminan antes. {tabla: filas eliminadas}.
+    """
+    panel, paquete = SensorPanel.__tablename__, SensorPacket.__tablename__
+    corte_paquetes = cortes.get(paquete)
+    corte_paneles = max(filter(None, (cortes.get(panel), corte_paquetes)), default=None)
+    if corte_paneles is None:
+        return {}
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn, panel):
+            return {}
+        meses = {}
+        for tabla in (panel, paquete):
+            for (nombre,) in conn.execute(text("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = :t AND c.relkind = 'r'
+            """), {"t": tabla}):
+                m = _PARTICION.search(nombre)
+                if m:
+                    meses.setdefault((int(m[1]), int(m[2])), {})[tabla] = nombre
+
+    borradas = {}
+    for (anio, mes), nombres in sorted(meses.items()):
+        fin = _month(datetime(anio, mes, 1), 1)
+        objetivos = []
+        if panel in nombres and fin <= corte_paneles.date():
+            objetivos.append((panel, nombres[panel]))
+        if corte_paquetes is not None and paquete in nombres and fin <= corte_paquetes.date():
+            objetivos.append((paquete, nombres[paquete]))
+        for tabla, nombre in objetivos:
+            try:
+                with engine.begin() as conn:
+                    # DROP necesita un lock exclusivo de la tabla padre: mejor
+                    # fallar y reintentar en el próximo ciclo que bloquear la ingesta
+                    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                    # Estimación de las estadísticas: count(*) leería el mes entero
+                    filas = max(conn.execute(text(
+                        "SELECT reltuples::bigint FROM pg_class WHERE relname = :n"
+                    ), {"n": nombre}).scalar() or 0, 0)
+                    conn.execute(text(f"ALTER TABLE {tabla} DETACH PARTITION {nombre}"))
+                    conn.execute(text(f"DROP TABLE {nombre}"))
+            except Exception as e:
+                logger.warning(f"[RETENCION] No se pudo eliminar la partición {nombre}: {e}")
+                break
+            borradas[tabla] = borradas.get(tabla, 0) + filas
+            BORRADAS.inc(filas)
+            PARTICIONES.inc()
+            logger.info(f"[RETENCION] Partición {nombre} eliminada ({filas} filas)")
+    return borradas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retención del histórico")
+    parser.add_argument("--politica", action="append", default=None,
+                        help="tabla=días (repetible; por defecto RETENTION_POLICIES)")
+    parser.add_argument("--batch", type=int, default=None, help="filas por lote (RETENTION_BATCH)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        reglas = politicas(",".join(args.politica) if args.politica else None)
+    except ValueError as e:
+        parser.error(str(e))
+    if not reglas:
+        parser.error("no hay políticas de retención (RETENTION_POLICIES o --politica)")
+
+    from app.db.client import engine
+    borradas = aplicar_retencion(engine, reglas, lote=args.batch)
+    for tabla, n in borradas.items():
+        print(f"{tabla}: {n} filas borradas")
+
+
+if __name__ == "__main__":
+    main()
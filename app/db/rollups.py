@@ -0,0 +1,249 @@
+"""
+Rollups horarios y diarios de monitoring_sensorpanel.
+
+Se mantienen de forma incremental desde insert_packets, el único camino
+de escritura (writer de ingesta, spool, backfill y Archiver), y solo con
+los paneles de paquetes realmente insertados: lo que el Archiver trae de
+Redis y el writer ya guardó choca con el índice único (device, seq, ts)
+y no suma dos veces. Se pueden reconstruir con:
+
+    python -m app.db.rollups backfill --desde 2025-01-01 --hasta 2025-02-01
+
+La reconstrucción lee la BD y los segmentos fríos (app/db/cold.py), y no
+toca los días que la retención ya borró: sus rollups no se pueden
+recalcular.
+"""
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.config import settings
+from app.db.models import SensorRollupHourly, SensorRollupDaily
+from app.db.retention import corte_crudos
+
+logger = logging.getLogger(__name__)
+
+HORA = timedelta(hours=1)
+DIA = timedelta(days=1)
+
+# (nombre, tamaño del bucket, modelo) de la más fina a la más gruesa
+RESOLUCIONES = [
+    ("hour", HORA, SensorRollupHourly),
+    ("day", DIA, SensorRollupDaily),
+]
+
+
+def _bucket(ts, paso):
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if paso == DIA else ts
+
+
+def _acumular(rows, paso):
+    """
+    rows = [(sample_id, timestamp, soil_pct, tilt, vib_pulse, vib_hit), ...]
+    Devuelve {(sample_id, bucket): {columnas del rollup}}.
+    """
+    acc = {}
+    for sample_id, ts, soil_pct, tilt, vib_pulse, vib_hit in rows:
+        key = (sample_id, _bucket(ts, paso))
+        r = acc.get(key)
+        if r is None:
+            r = acc[key] = {
+                "sample_id": key[0], "bucket": key[1], "samples": 0,
+                "soil_n": 0, "soil_sum": 0, "soil_min": None, "soil_max": None,
+                "vib_pulse_sum": 0, "vib_hit_count": 0, "tilt_on_count": 0,
+            }
+        r["samples"] += 1
+        if soil_pct is not None:
+            r["soil_n"] += 1
+            r["soil_sum"] += soil_pct
+            r["soil_min"] = soil_pct if r["soil_min"] is None else min(r["soil_min"], soil_pct)
+            r["soil_max"] = soil_pct if r["soil_max"] is None else max(r["soil_max"], soil_pct)
+        r["vib_pulse_sum"] += vib_pulse or 0
+        r["vib_hit_count"] += 1 if vib_hit else 0
+        r["tilt_on_count"] += 1 if tilt else 0
+    return acc
+
+
+def _upsert(session, model, valores):
+    """INSERT ... ON CONFLICT (sample_id, bucket) DO UPDATE sumando el delta."""
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    menor = func.least if dialect == "postgresql" else func.min
+    mayor = func.greatest if dialect == "postgresql" else func.max
+
+    stmt = insert(model)
+    t, ex = model.__table__.c, stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.sample_id, t.bucket],
+        set_={
+            "samples": t.samples + ex.samples,
+            "soil_n": t.soil_n + ex.soil_n,
+            "soil_sum": t.soil_sum + ex.soil_sum,
+            "soil_min": menor(func.coalesce(t.soil_min, ex.soil_min), func.coalesce(ex.soil_min, t.soil_min)),
+            "soil_max": mayor(func.coalesce(t.soil_max, ex.soil_max), func.coalesce(ex.soil_max, t.soil_max)),
+            "vib_pulse_sum": t.vib_pulse_sum + ex.vib_pulse_sum,
+            "vib_hit_count": t.vib_hit_count + ex.vib_hit_count,
+            "tilt_on_count": t.tilt_on_count + ex.tilt_on_count,
+        },
+    )
+    session.execute(stmt, valores)
+
+
+def apply_rollups(session, rows):
+    """
+    Suma un lote de paneles a los rollups horario y diario, dentro de la
+    transacción de la sesión (sin commit). Un upsert por resolución.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    for _, paso, model in RESOLUCIONES:
+        # En orden de (sample_id, bucket): dos lotes concurrentes que tocan
+        # los mismos buckets los bloquean en el mismo orden (sin deadlocks)
+        acc = _acumular(rows, paso)
+        _upsert(session, model, [acc[k] for k in sorted(acc)])
+
+
+# ============
+# BACKFILL
+# ============
+def backfill(session, desde, hasta, chunk=10000, ahora=None):
+    """
+    Recalcula los rollups de [desde, hasta) desde los datos crudos de la
+    BD y de los segmentos fríos (export.bloques). El rango se alinea a
+    días completos; los buckets de cada día se borran antes de
+    recalcularlo, así que se puede repetir sin duplicar.
+
+    Los días cuyos crudos ya no están enteros (anteriores al corte de la
+    retención de paneles/paquetes y sin segmento frío) se saltan y
+    conservan sus rollups: son lo único que queda de ellos.
+    Devuelve los paneles procesados.
+    """
+    from app.db.export import NOMBRES, bloques
+
+    desde = _bucket(desde, DIA)
+    fin = _bucket(hasta, DIA)
+    hasta = fin if fin == hasta else fin + DIA
+    disponible = _dias_disponibles(session, ahora or datetime.now())
+    columnas = [NOMBRES.index(c) for c in ("sample_id", "timestamp", "soil_pct", "tilt", "vib_pulse", "vib_hit")]
+
+    total = 0
+    saltados = []
+    dia = desde
+    while dia < hasta:
+        if not disponible(dia):
+            saltados.append(dia)
+            dia += DIA
+            continue
+        for _, _, model in RESOLUCIONES:
+            session.execute(delete(model).where(model.bucket >= dia, model.bucket < dia + DIA))
+        for bloque in bloques(session.connection(), dia, dia + DIA, chunk=chunk):
+            apply_rollups(session, [[f[c] for c in columnas] for f in bloque])
+            total += len(bloque)
+        logger.info("Backfill rollups: %s, %d paneles procesados", f"{dia:%Y-%m-%d}", total)
+        dia += DIA
+
+    if saltados:
+        logger.warning("Backfill rollups: %d días sin datos crudos completos (retención) se conservan: "
+                       "%s .. %s", len(saltados), f"{saltados[0]:%Y-%m-%d}", f"{saltados[-1]:%Y-%m-%d}")
+    session.commit()
+    return total
+
+
+def _dias_disponibles(session, ahora):
+    """
+    Función día → True si sus paneles siguen enteros en la BD (posteriores
+    al corte de RETENTION_POLICIES) o en un segmento frío.
+    """
+    corte = corte_crudos(ahora=ahora)
+    if corte is not None:
+        corte = _bucket(corte, DIA) + DIA   # el día del corte está a medias
+    frios = set()
+    if settings.COLD_STORAGE_URL:
+        from app.db.cold import dias_compactados
+        frios = dias_compactados(session.connection())
+    return lambda dia: corte is None or dia >= corte or dia in frios
+
+
+# ============
+# CONSULTA
+# ============
+def consultar_serie(session, sample_id, desde, hasta, paso=None, max_puntos=500):
+    """
+    Serie temporal de un sensor en [desde, hasta).
+
+    Elige la resolución más gruesa cuyo bucket no supere `paso`
+    (por defecto (hasta - desde) / max_puntos): diaria, horaria o cruda.
+    Devuelve (resolucion, [{bucket, samples, soil_avg, soil_min, soil_max,
+    vib_pulse_sum, vib_hit_count, tilt_on_frac}, ...]).
+    """
+    paso = paso or (hasta - desde) / max_puntos
+
+    for nombre, tamano, model in reversed(RESOLUCIONES):
+        if paso >= tamano:
+            rows = session.execute(
+                select(model)
+                .where(model.sample_id == sample_id, model.bucket >= desde, model.bucket < hasta)
+                .order_by(model.bucket)
+            ).scalars()
+            return nombre, [_punto(r) for r in rows]
+
+    # Datos crudos: BD + segmentos fríos (app/db/cold.py) si los hay
+    from app.db.export import bloques, NOMBRES
+    ts, tilt, soil_pct, vib_pulse, vib_hit = (
+        NOMBRES.index(c) for c in ("timestamp", "tilt", "soil_pct", "vib_pulse", "vib_hit")
+    )
+    rows = [f for bloque in bloques(session.connection(), desde, hasta, [sample_id]) for f in bloque]
+    rows.sort(key=lambda f: f[ts])
+    return "raw", [
+        {
+            "bucket": f[ts],
+            "samples": 1,
+            "soil_avg": f[soil_pct],
+            "soil_min": f[soil_pct],
+            "soil_max": f[soil_pct],
+            "vib_pulse_sum": f[vib_pulse],
+            "vib_hit_count": f[vib_hit],
+            "tilt_on_frac": float(bool(f[tilt])),
+        }
+        for f in rows
+    ]
+
+
+def _punto(r):
+    return {
+        "bucket": r.bucket,
+        "samples": r.samples,
+        "soil_avg": round(r.soil_sum / r.soil_n, 2) if r.soil_n else None,
+        "soil_min": r.soil_min,
+        "soil_max": r.soil_max,
+        "vib_pulse_sum": r.vib_pulse_sum,
+        "vib_hit_count": r.vib_hit_count,
+        "tilt_on_frac": round(r.tilt_on_count / r.samples, 4) if r.samples else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de rollups")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    bf = sub.add_parser("backfill", help="Recalcula rollups desde los datos crudos")
+    bf.add_argument("--desde", type=datetime.fromisoformat, required=True)
+    bf.add_argument("--hasta", type=datetime.fromisoformat, default=None)
+    bf.add_argument("--chunk", type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from app.db.client import SessionLocal, init_db
+    init_db()
+    with SessionLocal() as session:
+        total = backfill(session, args.desde, args.hasta or datetime.now(), args.chunk)
+    print(f"Rollups recalculados a partir de {total} paneles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import queue
+import threading
+import time
+import logging
+
+from app import metrics
+from app.config import settings
+from app.db.client import SessionLocal
+from app.db.bulk import insert_packets
+from app.spool import transitorio
+
+logger = logging.getLogger(__name__)
+
+
+class PacketWriter(threading.Thread):
+    """
+    Escritor de Postgres desacoplado del hilo de red de paho.
+
+    on_message solo encola el paquete (submit); este hilo acumula paquetes
+    y los inserta en bloque en una única transacción cuando el lote llega
+    a DB_BATCH_SIZE paquetes o a DB_BATCH_MAX_AGE_MS de antigüedad.
+
+    Con `spool` (app.spool.Spool) los lotes que fallan por conexión o
+    timeout se guardan en disco en lugar de perderse, y mientras el spool
+    tenga pendientes los lotes nuevos van detrás de ellos sin intentar la
+    base de datos. Un lote rechazado por sus datos se inserta de uno en
+    uno y los paquetes culpables se apartan (Spool.apartar).
+    """
+
+    def __init__(self, spool=None):
+        super().__init__(daemon=True, name="packet-writer")
+        self._stopping = threading.Event()
+        self.queue = queue.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        self.batch_size = settings.DB_BATCH_SIZE
+        self.max_age = settings.DB_BATCH_MAX_AGE_MS / 1000
+        self.put_timeout = settings.INGEST_QUEUE_PUT_TIMEOUT_SECONDS
+        self.spool = spool
+        metrics.COLA_INGESTA.funcion = self.queue.qsize
+
+    # ============
+    # PRODUCTOR (hilo MQTT)
+    # ============
+    def submit(self, packet):
+        """
+        Encola un paquete ya parseado. Si la cola está llena espera como
+        máximo INGEST_QUEUE_PUT_TIMEOUT_SECONDS y luego lo descarta.
+        """
+        try:
+            self.queue.put(packet, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            metrics.DB_DESCARTADOS.inc()
+            logger.error("⚠ Cola de ingesta llena, paquete seq=%s descartado", packet.get("seq"))
+            return False
+
+    # ============
+    # CONSUMIDOR
+    # ============
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        batch = []
+        deadline = None
+
+        while not (self._stopping.is_set() and self.queue.empty()):
+            timeout = self.max_age if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_age
+            except queue.Empty:
+                pass
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        if self.spool is not None and self.spool.pendientes:
+            self.spool.escribir(batch)
+            return
+
+        try:
+            self._insertar(batch)
+        except Exception as e:
+            metrics.DB_FALLOS.inc()
+            if not transitorio(e):
+                logger.error(f"⚠ Postgres rechazó el lote ({len(batch)} paquetes), "
+                             f"se inserta de uno en uno: {e}")
+                self._aislar(batch)
+            elif self.spool is not None:
+                logger.warning(f"⚠ Postgres no disponible, {len(batch)} paquetes al spool: {e}")
+                self.spool.escribir(batch)
+            else:
+                logger.exception(f"⚠ Error guardando lote en Postgres ({len(batch)} paquetes): {e}")
+
+    def _insertar(self, batch):
+        t0 = time.perf_counter()
+        with SessionLocal() as db:
+            try:
+                ids = insert_packets(db, batch)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        registrar_lote(batch, ids, t0)
+
+    def _aislar(self, batch):
+        """
+        Lote rechazado por sus datos: cada paquete en su transacción. Los
+        que siguen fallando van al spool de muertos (no se reintentan).
+        """
+        for packet in batch:
+            try:
+                self._insertar([packet])
+            except Exception as e:
+                if self.spool is None:
+                    logger.error(f"⚠ Paquete seq={packet.get('seq')} descartado por Postgres: {e}")
+                elif transitorio(e):
+                    self.spool.escribir([packet])
+                else:
+                    self.spool.apartar([packet], e)
+
+
+def registrar_lote(batch, ids, t0):
+    """Métricas de un lote ya confirmado (ids de insert_packets, None = duplicado)."""
+    duplicados = ids.count(None)
+    logger.debug("Writer: %d paquetes insertados, %d duplicados", len(batch) - duplicados, duplicados)
+    metrics.DB_LOTE.observar(time.perf_counter() - t0)
+    metrics.DB_PAQUETES.inc(len(batch) - duplicados)
+    metrics.DB_DUPLICADOS.inc(duplicados)
+    ahora = time.time()
+    for packet in batch:
+        metrics.observar_desde(metrics.LATENCIA_DB, packet.get("sent_ms"), ahora)
@@ -0,0 +1,35 @@
+# app/dedup.py
+"""
+Detección de paquetes repetidos por clave (device, seq, ts).
+
+Con qos=1 y clean_session=False el broker reentrega los mensajes sin
+PUBACK tras una reconexión. ClavesRecientes es el camino rápido en
+memoria: descarta la reentrega antes de gastar Redis o la base de datos.
+Las claves que ya salieron del LRU las frena el índice único de
+monitoring_sensorpacket (ON CONFLICT DO NOTHING en insert_packets).
+"""
+import threading
+from collections import OrderedDict
+
+
+class ClavesRecientes:
+    """LRU acotado de claves ya vistas."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._claves = OrderedDict()
+
+    def visto(self, clave):
+        """True si `clave` ya estaba; si no, la registra y devuelve False."""
+        with self._lock:
+            if clave in self._claves:
+                self._claves.move_to_end(clave)
+                return True
+            self._claves[clave] = None
+            if len(self._claves) > self.maximo:
+                self._claves.popitem(last=False)
+            return False
+
+    def __len__(self):
+        return len(self._claves)
@@ -1,31 +1,222 @@
 # app/main.py
+import os
 import time
+import signal
 import logging
+import threading
+import multiprocessing
 from app.config import settings
-from app.mqtt_client import MQTTClient
+from app.mqtt_client import MQTTClient, suscripcion_compartida
 from app.archiver import Archiver
+from app.db_writer import PacketWriter
+from app.notifier import Notifier
+from app.metrics import ServidorMetricas
+from app.read_api import ServidorLectura
+from app.push_gateway import PushGateway, RelayLecturas
+from app.spool import Replayer
+from app.risk import EvaluadorRiesgo
+from app.async_ingest import IngestaAsync
+from app.resources import recursos
 from app.db.client import init_db
 
+logger = logging.getLogger(__name__)
+
+
+def _ingesta(notifier, gateway, replayer, riesgo, client_id=None, topic=None):
+    """
+    Lado de ingesta según INGEST_RUNTIME: [hilos a arrancar], en orden de
+    parada. threads = MQTTClient + PacketWriter; asyncio = IngestaAsync.
+    """
+    spool_db = replayer.db if replayer else None
+    spool_redis = replayer.redis if replayer else None
+    if settings.INGEST_RUNTIME == "asyncio":
+        return [IngestaAsync(notifier, gateway, client_id=client_id, topic=topic,
+                             spool_db=spool_db, spool_redis=spool_redis, riesgo=riesgo)]
+    writer = PacketWriter(spool=spool_db)
+    mqtt = MQTTClient(writer, notifier, gateway, client_id=client_id, topic=topic,
+                      spool=spool_redis, riesgo=riesgo)
+    return [mqtt, writer]
+
+
+def _parar(componentes):
+    for componente in componentes:
+        componente.stop()
+        if isinstance(componente, threading.Thread):
+            componente.join()
+
+
+def _esperar_parada():
+    """Bloquea hasta SIGINT/SIGTERM (docker stop)."""
+    parada = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: parada.set())
+    while not parada.wait(60):
+        pass
+
+
 def main():
     logging.basicConfig(level=settings.LOG_LEVEL)
 
     print("Inicializando Base de Datos...")
     init_db()
+    recursos.iniciar_vigilancia()
+
+    multi = settings.INGEST_WORKERS > 1
 
-    mqtt = MQTTClient()
+    servidor_metricas = ServidorMetricas(port=settings.METRICS_PORT) if settings.METRICS_PORT else None
+    servidor_lectura = ServidorLectura(port=settings.READ_API_PORT) if settings.READ_API_PORT else None
+    gateway = PushGateway(redis_client=recursos.redis()) if settings.PUSH_PORT else None
     archiver = Archiver()
 
-    mqtt.start()
+    if servidor_metricas:
+        servidor_metricas.start()
+    if servidor_lectura:
+        servidor_lectura.start()
+    if gateway:
+        gateway.start()
+
+    if multi:
+        # La ingesta corre en procesos aparte; este proceso solo supervisa
+        supervisor = Supervisor(settings.INGEST_WORKERS)
+        supervisor.start()
+    else:
+        replayer = Replayer(settings.SPOOL_DIR) if settings.SPOOL_DIR else None
+        notifier = Notifier()
+        riesgo = EvaluadorRiesgo() if settings.RISK_TICK_MS else None
+        ingesta = _ingesta(notifier, gateway, replayer, riesgo)
+        if replayer:
+            replayer.start()
+        if riesgo:
+            riesgo.start()
+        notifier.start()
+        for componente in reversed(ingesta):
+            componente.start()
+
     archiver.start()
 
     print("Servicio EDGE iniciado.")
 
-    try:
-        while True:
-            time.sleep(60)
-    except KeyboardInterrupt:
-        mqtt.stop()
-        archiver.stop()
+    _esperar_parada()
+
+    if multi:
+        supervisor.stop()
+    else:
+        _parar(ingesta)
+        notifier.stop()
+        if replayer:
+            replayer.stop()
+            replayer.join()
+        if riesgo:
+            riesgo.stop()
+    archiver.stop()
+    if servidor_metricas:
+        servidor_metricas.stop()
+    if servidor_lectura:
+        servidor_lectura.stop()
+    if gateway:
+        gateway.stop()
+    recursos.cerrar()
+
+
+# ============
+# MODO MULTI-WORKER
+# ============
+def ingest_worker(worker):
+    """
+    Proceso de ingesta: MQTT con suscripción compartida + writer de base
+    de datos + notifier. Sus métricas se exponen en METRICS_PORT + 1 + worker.
+    """
+    logging.basicConfig(level=settings.LOG_LEVEL, format=f"[worker {worker}] %(levelname)s:%(name)s:%(message)s")
+
+    client_id, topic = suscripcion_compartida(worker)
+    recursos.iniciar_vigilancia()
+    # Cada worker tiene su propio spool (los segmentos no se comparten)
+    replayer = Replayer(os.path.join(settings.SPOOL_DIR, f"worker-{worker}")) if settings.SPOOL_DIR else None
+    notifier = Notifier()
+    relay = RelayLecturas(recursos.redis()) if settings.PUSH_PORT else None
+    # Con hash por topic cada dispositivo cae siempre en el mismo worker,
+    # así que sus ventanas y el acuerdo entre paneles quedan completos
+    riesgo = EvaluadorRiesgo() if settings.RISK_TICK_MS else None
+    ingesta = _ingesta(notifier, relay, replayer, riesgo, client_id=client_id, topic=topic)
+    servidor_metricas = (
+        ServidorMetricas(port=settings.METRICS_PORT + 1 + worker) if settings.METRICS_PORT else None
+    )
+
+    if servidor_metricas:
+        servidor_metricas.start()
+    if relay:
+        relay.start()
+    if replayer:
+        replayer.start()
+    if riesgo:
+        riesgo.start()
+    notifier.start()
+    for componente in reversed(ingesta):
+        componente.start()
+
+    _esperar_parada()
+
+    _parar(ingesta)
+    notifier.stop()
+    if replayer:
+        replayer.stop()
+        replayer.join()
+    if riesgo:
+        riesgo.stop()
+    if relay:
+        relay.stop()
+    recursos.cerrar()
+
+
+class Supervisor(threading.Thread):
+    """
+    Lanza INGEST_WORKERS procesos de ingesta (spawn: sin heredar conexiones
+    abiertas del padre) y reinicia los que mueran, con backoff si caen
+    nada más arrancar.
+    """
+
+    BACKOFF_MAX = 60
+
+    def __init__(self, n):
+        super().__init__(daemon=True, name="ingest-supervisor")
+        self.n = n
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stopping = threading.Event()
+        self._procesos = {}
+        self._backoff = {i: 1 for i in range(n)}
+
+    def _lanzar(self, worker):
+        proceso = self._ctx.Process(target=ingest_worker, args=(worker,), name=f"ingest-{worker}")
+        proceso.start()
+        self._procesos[worker] = (proceso, time.monotonic())
+        logger.info(f"[SUPERVISOR] Worker {worker} iniciado (pid {proceso.pid})")
+
+    def run(self):
+        for worker in range(self.n):
+            self._lanzar(worker)
+
+        while not self._stopping.wait(2):
+            for worker, (proceso, inicio) in list(self._procesos.items()):
+                if proceso.is_alive():
+                    continue
+                vivio = time.monotonic() - inicio
+                self._backoff[worker] = 1 if vivio > 60 else min(self._backoff[worker] * 2, self.BACKOFF_MAX)
+                logger.error(f"[SUPERVISOR] Worker {worker} terminó (código {proceso.exitcode}) "
+                             f"tras {vivio:.0f}s; reinicio en {self._backoff[worker]}s")
+                if self._stopping.wait(self._backoff[worker]):
+                    break
+                self._lanzar(worker)
+
+    def stop(self, timeout=30):
+        self._stopping.set()
+        for proceso, _ in self._procesos.values():
+            if proceso.is_alive():
+                proceso.terminate()   # SIGTERM: el worker vacía su writer y sale
+        for proceso, _ in self._procesos.values():
+            proceso.join(timeout)
+            if proceso.is_alive():
+                proceso.kill()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,274 @@
+# app/metrics.py
+"""
+Métricas del servicio edge (en proceso) y endpoint /metrics.
+
+Histogramas con buckets fijos en escala logarítmica, contadores y gauges.
+observar()/inc() son un bisect o una suma bajo un lock, así que se pueden
+llamar desde el hilo de red de paho. Los percentiles son aproximados
+(límite superior del bucket).
+
+ServidorMetricas expone el registro en formato de texto de Prometheus
+(http.server de la stdlib, en un hilo daemon).
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 0.25 ms .. ~70 s, factor 1.5
+BUCKETS_LATENCIA = tuple(round(0.00025 * 1.5 ** i, 6) for i in range(32))
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)   # el último es +Inf
+            self.total = 0
+            self.suma = 0.0
+            self.maximo = 0.0
+
+    def observar(self, valor):
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += 1
+            self.suma += valor
+            if valor > self.maximo:
+                self.maximo = valor
+
+    def percentil(self, p):
+        """Límite superior del bucket que contiene el percentil p (0-100)."""
+        with self._lock:
+            counts, total, maximo = list(self.counts), self.total, self.maximo
+        if not total:
+            return None
+        objetivo = total * p / 100
+        acumulado = 0
+        for i, n in enumerate(counts):
+            acumulado += n
+            if acumulado >= objetivo:
+                return min(self.buckets[i], maximo) if i < len(self.buckets) else maximo
+        return maximo
+
+    def resumen(self):
+        return {
+            "count": self.total,
+            "avg": self.suma / self.total if self.total else None,
+            "p50": self.percentil(50),
+            "p95": self.percentil(95),
+            "p99": self.percentil(99),
+            "max": self.maximo if self.total else None,
+        }
+
+    @contextmanager
+    def medir(self):
+        """with hist.medir(): ... → observa la duración del bloque"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - t0)
+
+    def exponer(self):
+        with self._lock:
+            counts, total, suma = list(self.counts), self.total, self.suma
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        acumulado = 0
+        for limite, n in zip(self.buckets, counts):
+            acumulado += n
+            lineas.append(f'{self.nombre}_bucket{{le="{limite}"}} {acumulado}')
+        lineas.append(f'{self.nombre}_bucket{{le="+Inf"}} {total}')
+        lineas.append(f"{self.nombre}_sum {suma}")
+        lineas.append(f"{self.nombre}_count {total}")
+        return lineas
+
+
+class Contador:
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._lock = threading.Lock()
+        self.valor = 0
+
+    def reset(self):
+        with self._lock:
+            self.valor = 0
+
+    def inc(self, n=1):
+        with self._lock:
+            self.valor += n
+
+    def exponer(self):
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter",
+                f"{self.nombre} {self.valor}"]
+
+
+class Gauge:
+    """Valor instantáneo; con `funcion` se lee en cada scrape (p. ej. tamaño de cola)."""
+
+    def __init__(self, nombre, ayuda, funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.valor = 0
+
+    def reset(self):
+        self.valor = 0
+
+    def set(self, valor):
+        self.valor = valor
+
+    def exponer(self):
+        valor = self.funcion() if self.funcion else self.valor
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge",
+                f"{self.nombre} {valor}"]
+
+
+REGISTRO = {}
+_registro_lock = threading.Lock()
+
+
+def _registrar(cls, nombre, *args):
+    with _registro_lock:
+        if nombre not in REGISTRO:
+            REGISTRO[nombre] = cls(nombre, *args)
+        return REGISTRO[nombre]
+
+
+def histograma(nombre, ayuda, buckets=BUCKETS_LATENCIA):
+    """Devuelve el histograma `nombre`, creándolo si no existe."""
+    return _registrar(Histograma, nombre, ayuda, buckets)
+
+
+def contador(nombre, ayuda):
+    return _registrar(Contador, nombre, ayuda)
+
+
+def gauge(nombre, ayuda, funcion=None):
+    """Devuelve el gauge `nombre`; `funcion` reemplaza la anterior si se pasa."""
+    g = _registrar(Gauge, nombre, ayuda)
+    if funcion is not None:
+        g.funcion = funcion
+    return g
+
+
+def exponer():
+    """Todo el registro en formato de texto de Prometheus."""
+    with _registro_lock:
+        metricas = list(REGISTRO.values())
+    lineas = []
+    for metrica in metricas:
+        try:
+            lineas.extend(metrica.exponer())
+        except Exception as e:
+            logger.warning("No se pudo exponer %s: %s", metrica.nombre, e)
+    return "\n".join(lineas) + "\n"
+
+
+# ============
+# LATENCIA EXTREMO A EXTREMO
+# ============
+# Solo para paquetes con "sent_ms" (epoch ms del emisor, ver
+# scripts/sensor_data_sender.py); con relojes desajustados no son fiables.
+LATENCIA_REDIS = histograma(
+    "edge_mqtt_to_redis_seconds", "Desde el envío del paquete hasta su escritura en Redis"
+)
+LATENCIA_DB = histograma(
+    "edge_mqtt_to_db_seconds", "Desde el envío del paquete hasta el commit en la base de datos"
+)
+
+
+def observar_desde(hist, sent_ms, ahora):
+    """Registra ahora - sent_ms (ahora en epoch segundos); ignora sent_ms ausente."""
+    if sent_ms is not None:
+        hist.observar(max(0.0, ahora - sent_ms / 1000))
+
+
+# ============
+# ETAPAS DE INGESTA (MQTTClient.on_message)
+# ============
+MENSAJES = contador("edge_mqtt_messages_total", "Mensajes MQTT recibidos")
+ERRORES_PARSEO = contador("edge_parse_errors_total", "Mensajes con JSON inválido o campos ausentes")
+ERRORES_REDIS = contador("edge_redis_errors_total", "Paquetes que fallaron al escribirse en Redis")
+ETAPA_PARSEO = histograma("edge_parse_seconds", "Parseo y validación del JSON")
+ETAPA_REDIS = histograma("edge_redis_write_seconds", "Escritura del paquete en Redis (guardar_paquete)")
+ETAPA_ENCOLAR = histograma("edge_writer_submit_seconds", "Encolado del paquete para la base de datos")
+DEDUP_HITS = contador("edge_dedup_hits_total", "Mensajes duplicados (reentregas QoS 1) descartados")
+DEDUP_RATIO = gauge("edge_dedup_hit_ratio", "Fracción de mensajes MQTT descartados como duplicados",
+                    lambda: DEDUP_HITS.valor / MENSAJES.valor if MENSAJES.valor else 0.0)
+
+# ============
+# WRITER DE BASE DE DATOS (PacketWriter)
+# ============
+DB_LOTE = histograma("edge_db_flush_seconds", "Insert + commit de un lote en la base de datos")
+DB_PAQUETES = contador("edge_db_packets_total", "Paquetes confirmados en la base de datos")
+DB_FALLOS = contador("edge_db_failures_total", "Lotes que fallaron al insertarse")
+DB_DUPLICADOS = contador("edge_db_duplicates_total", "Paquetes que ya estaban en la base de datos (ON CONFLICT)")
+DB_DESCARTADOS = contador("edge_ingest_dropped_total", "Paquetes descartados por cola de ingesta llena")
+COLA_INGESTA = gauge("edge_ingest_queue_depth", "Paquetes en la cola de ingesta")
+
+# ============
+# ALERTAS (Notifier)
+# ============
+ALERTAS_ENCOLADAS = contador("edge_alerts_enqueued_total", "Alertas encoladas para notificar")
+ALERTAS_ENVIADAS = contador("edge_alerts_sent_total", "Emails de alerta enviados")
+ALERTAS_FALLIDAS = contador("edge_alerts_failed_total", "Alertas sin enviar tras agotar reintentos")
+ALERTAS_COOLDOWN = contador("edge_alert_cooldown_hits_total", "Alertas omitidas por cooldown")
+ALERTA_ENVIO = histograma("edge_alert_send_seconds", "Envío de una alerta (con reintentos)")
+
+# ============
+# ARCHIVER
+# ============
+ARCHIVER_CICLO = histograma("edge_archiver_cycle_seconds", "Duración de un ciclo del Archiver")
+ARCHIVER_ITEMS = contador("edge_archiver_items_moved_total", "Lecturas movidas de Redis a la base de datos")
+ARCHIVER_LOTES = contador("edge_archiver_batches_total", "Lotes confirmados por el Archiver")
+ARCHIVER_ERRORES = contador("edge_archiver_errors_total", "Ciclos del Archiver con error")
+
+
+# ============
+# ENDPOINT /metrics
+# ============
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = exponer().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServidorMetricas:
+    def __init__(self, host="0.0.0.0", port=9100):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics-http")
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"[METRICS] Escuchando en :{self.port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,30 +1,55 @@
 # app/mqtt_client.py
 import json
+import time
+import socket
 import logging
 import paho.mqtt.client as mqtt
-from datetime import datetime
 
+from app import metrics
 from app.config import settings
 from app.cache_manager import CloudSensorCacheManager
-from app.db.client import SessionLocal
-from app.db.models import SensorPacket, SensorPanel
+from app.dedup import ClavesRecientes
+from app.paquetes import validar_paquete
+from app.rules import reglas_del_proceso
+from app.spool import transitorio
 
 logger = logging.getLogger(__name__)
 
 
 class MQTTClient:
-    def __init__(self):
+    def __init__(self, writer, notifier, gateway=None, client_id=None, topic=None, spool=None, riesgo=None):
 
-        # Cliente sin client_id (se genera automáticamente)
+        # client_id estable (sesión persistente); en modo multi-worker cada
+        # proceso usa uno propio, ver suscripcion_compartida()
+        self.client_id = client_id or settings.MQTT_CLIENT_ID
+        self.topic = topic or settings.MQTT_TOPIC_PREFIX
         self.client = mqtt.Client(
-            client_id="edge_app",
+            client_id=self.client_id,
             clean_session=False
         )
 
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
-        self.cache = CloudSensorCacheManager()
+        self.cache = CloudSensorCacheManager(reglas=reglas_del_proceso())
+
+        # Escritor en lotes de Postgres (app.db_writer.PacketWriter)
+        self.writer = writer
+
+        # Servicio de alertas compartido (app.notifier.Notifier)
+        self.notifier = notifier
+
+        # Difusión en vivo opcional (app.push_gateway.PushGateway)
+        self.gateway = gateway
+
+        # Spool en disco para cuando Redis no responde (app.spool.Spool)
+        self.spool = spool
+
+        # Puntuación de riesgo opcional (app.risk.EvaluadorRiesgo)
+        self.riesgo = riesgo
+
+        # Reentregas QoS 1 recientes (clave device, seq, ts)
+        self.recientes = ClavesRecientes(settings.DEDUP_CACHE_SIZE)
 
     # ============
     # CONEXIÓN
@@ -35,99 +60,85 @@ class MQTTClient:
         else:
             logger.error(f"[MQTT] Error de conexión rc={rc}")
 
-        # Te suscribes al topic raíz (tus sensores publican ahí)
-        client.subscribe(settings.MQTT_TOPIC_PREFIX, qos=1)
+        # Topic raíz de los sensores, o $share/<grupo>/<topic> en multi-worker
+        client.subscribe(self.topic, qos=1)
 
     # ============
     # RECEPCIÓN
     # ============
     def on_message(self, client, userdata, msg):
-        try:
-            payload = json.loads(msg.payload.decode())
-        except Exception:
-            logger.error("⚠ Error: no se pudo parsear JSON recibido")
+        t0 = time.perf_counter()
+        paquete = parsear_mensaje(msg)
+        if paquete is None:
             return
+        payload, seq, alerta, ts, samples = (
+            paquete["payload"], paquete["seq"], paquete["alerta"], paquete["timestamp"], paquete["samples"]
+        )
 
-        try:
-            seq = payload["seq"]
-            alerta = int(payload["alerta"])
-            ts = datetime.fromisoformat(payload["ts"])
-            samples = payload["samples"]
-        except KeyError as e:
-            logger.error(f"⚠ Payload inválido, falta campo: {e}")
+        # Marca de envío opcional (generador de carga) para medir latencias
+        sent_ms = paquete["sent_ms"]
+        t1 = time.perf_counter()
+        metrics.ETAPA_PARSEO.observar(t1 - t0)
+
+        # ============
+        # DUPLICADOS
+        # ============
+        # Una reentrega no toca Redis, BD ni alertas
+        device = paquete["device"]
+        if self.recientes.visto((device, seq, ts)):
+            metrics.DEDUP_HITS.inc()
+            logger.debug(f"[MQTT] Duplicado descartado: {device} seq={seq} ts={ts}")
             return
 
         # ============
         # GUARDAR EN REDIS
         # ============
-        for sample in samples:
-            sid = str(sample["id"])
-
-            # Humedad
-            if "soil" in sample:
-                try:
-                    self.cache.guardar_humedad(
-                        sid,
-                        porcentaje=sample["soil"]["pct"],
-                        valor_raw=sample["soil"]["raw"]
-                    )
-                except Exception as e:
-                    logger.error(f"⚠ Error guardando humedad → {e}")
-
-            # Inclinación
-            try:
-                self.cache.guardar_inclinacion(sid, sample["tilt"])
-            except Exception as e:
-                logger.error(f"⚠ Error guardando inclinación → {e}")
-
-            # Vibración
+        # Un solo round trip por paquete (pipeline). Si hay paquetes en el
+        # spool de Redis, este va detrás de ellos sin esperar otro timeout.
+        entrada = {"seq": seq, "alerta": alerta, "samples": samples, "timestamp": ts, "device": device}
+        if self.spool is not None and self.spool.pendientes:
+            self.spool.escribir([entrada])
+        else:
             try:
-                self.cache.guardar_vibracion(
-                    sid,
-                    pulse=sample["vib"]["pulse"],
-                    hit=sample["vib"]["hit"]
-                )
+                self.cache.guardar_paquete(samples, seq=seq, alerta=alerta, timestamp=ts, device=device)
+                metrics.observar_desde(metrics.LATENCIA_REDIS, sent_ms, time.time())
             except Exception as e:
-                logger.error(f"⚠ Error guardando vibración → {e}")
+                metrics.ERRORES_REDIS.inc()
+                logger.error(f"⚠ Error guardando paquete en Redis → {e}")
+                if self.spool is not None and transitorio(e):
+                    self.spool.escribir([entrada])
+                elif self.spool is not None:
+                    # Rechazado por sus datos: reintentarlo no serviría
+                    self.spool.apartar([entrada], e)
+        t2 = time.perf_counter()
+        metrics.ETAPA_REDIS.observar(t2 - t1)
+
+        # Solo un append: la difusión a los clientes ocurre en el hilo del gateway
+        if self.gateway is not None:
+            self.gateway.publicar_paquete(seq, ts, samples)
+        if self.riesgo is not None:
+            self.riesgo.agregar(device, ts, samples)
 
         # ============
         # GUARDAR EN POSTGRES
         # ============
-        with SessionLocal() as db:
-            try:
-                p = SensorPacket(
-                    seq=seq,
-                    timestamp=ts,
-                    alerta=bool(alerta)
-                )
-                db.add(p)
-                db.flush()
-
-                for sample in samples:
-                    panel = SensorPanel(
-                        sample_id=sample["id"],
-                        soil_raw=sample["soil"]["raw"],
-                        soil_pct=sample["soil"]["pct"],
-                        tilt=sample["tilt"],
-                        vib_pulse=sample["vib"]["pulse"],
-                        vib_hit=sample["vib"]["hit"],
-                        packet_id=p.id
-                    )
-                    db.add(panel)
-
-                db.commit()
-
-            except Exception as e:
-                logger.exception(f"⚠ Error guardando en Postgres: {e}")
-                db.rollback()
+        # Solo se encola: el PacketWriter inserta en lotes fuera de este hilo
+        self.writer.submit({
+            "device": device,
+            "seq": seq,
+            "timestamp": ts,
+            "alerta": bool(alerta),
+            "samples": samples,
+            "sent_ms": sent_ms
+        })
+        metrics.ETAPA_ENCOLAR.observar(time.perf_counter() - t2)
 
         # ============
         # ALERTA
         # ============
         try:
             if alerta == 1:
-                from app.notifier import Notifier
-                Notifier().enqueue_alert(payload)
+                self.notifier.enqueue_alert(payload)
         except Exception:
             logger.error("⚠ Error enviando alerta")
 
@@ -135,10 +146,50 @@ class MQTTClient:
     # ARRANCAR CLIENTE
     # ============
     def start(self):
-        logger.info(f"[MQTT] Conectando a {settings.MQTT_HOST}:{settings.MQTT_PORT}")
+        logger.info(f"[MQTT] Conectando a {settings.MQTT_HOST}:{settings.MQTT_PORT} "
+                    f"como {self.client_id} → {self.topic}")
         self.client.connect(settings.MQTT_HOST, settings.MQTT_PORT)
         self.client.loop_start()
 
     def stop(self):
         self.client.loop_stop()
         self.client.disconnect()
+
+
+def parsear_mensaje(msg):
+    """
+    JSON de un mensaje MQTT → dict con payload, device, seq, alerta,
+    timestamp, samples y sent_ms, o None si no es válido (cuenta el error).
+
+    El dispositivo se identifica por el campo "device" o, si no lo envía,
+    por su topic. La estructura de los samples se valida aquí
+    (app/paquetes.py): un paquete roto no llega a Redis, la BD ni el spool.
+    """
+    metrics.MENSAJES.inc()
+    try:
+        payload = json.loads(msg.payload.decode())
+    except Exception:
+        metrics.ERRORES_PARSEO.inc()
+        logger.error("⚠ Error: no se pudo parsear JSON recibido")
+        return None
+
+    try:
+        paquete = validar_paquete(payload, msg.topic)
+    except ValueError as e:
+        metrics.ERRORES_PARSEO.inc()
+        logger.error(f"⚠ Payload inválido: {e}")
+        return None
+    paquete["payload"] = payload
+    paquete["sent_ms"] = payload.get("sent_ms")
+    return paquete
+
+
+def suscripcion_compartida(worker):
+    """
+    (client_id, topic) del worker `worker` en modo multi-worker: el broker
+    reparte los mensajes de $share/<grupo>/<topic> entre los miembros del
+    grupo. El client_id incluye el host para poder escalar también en
+    varias máquinas con el mismo grupo.
+    """
+    client_id = f"{settings.MQTT_CLIENT_ID}-{socket.gethostname()}-{worker}"
+    return client_id, f"$share/{settings.MQTT_SHARED_GROUP}/{settings.MQTT_TOPIC_PREFIX}"
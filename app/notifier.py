@@ -1,29 +1,62 @@
-# app/notifier.py
+import queue
+import random
+import threading
 import time
 import logging
 import json
 import resend
 
+from app import metrics
 from app.config import settings
-from app.cache_manager import CloudSensorCacheManager as CacheManager
+from app.resources import recursos
 
 logger = logging.getLogger(__name__)
 
 
 class Notifier:
-    def __init__(self):
-        # Redis para cooldown
-        self.redis = CacheManager().redis_client
+    """
+    Servicio de notificaciones de larga vida.
+
+    enqueue_alert() solo valida y encola el payload, así que nunca añade la
+    latencia de la API de email al hilo de ingesta. Un pool de hilos
+    consume la cola, aplica el cooldown y envía por Resend con reintentos
+    y backoff exponencial.
+    """
+
+    def __init__(self, redis_client=None):
+        # Redis para cooldown (pool compartido del proceso si no se inyecta)
+        self.redis = redis_client or recursos.redis()
 
         # Config
         self.cooldown = settings.ALERT_COOLDOWN_SECONDS
         self.api_key = settings.RESEND_API_KEY
         self.from_addr = settings.RESEND_FROM
         self.to_addrs = self._parse_recipients(settings.RESEND_TO)
+        self.max_retries = settings.NOTIFIER_MAX_RETRIES
+        self.backoff_base = settings.NOTIFIER_BACKOFF_BASE_SECONDS
 
         # Inicializar Resend API
         resend.api_key = self.api_key
 
+        # Cola + workers
+        self.queue = queue.Queue(maxsize=settings.NOTIFIER_QUEUE_SIZE)
+        self._stopping = threading.Event()
+        self._workers = [
+            threading.Thread(target=self._worker, daemon=True, name=f"notifier-{i}")
+            for i in range(settings.NOTIFIER_WORKERS)
+        ]
+
+    # ======================================================
+    # Ciclo de vida
+    # ======================================================
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        self._stopping.set()
+
     # ======================================================
     # Helpers
     # ======================================================
@@ -38,36 +71,30 @@ class Notifier:
         if isinstance(value, list):
             return value
 
+        if not value:
+            return []
+
         if "," in value:
             return [v.strip() for v in value.split(",")]
 
         return [value]
 
-    def _can_send(self, alert_key):
+    def _claim(self, alert_key):
         """
-        Devuelve True si han pasado más de N segundos desde el último envío de esta alerta.
+        Reserva el envío de esta alerta de forma atómica (SET NX EX).
+        Devuelve False si ya se envió (o se está enviando) dentro del cooldown.
         """
         redis_key = f"alert:sent:{alert_key}"
-        last_ts = self.redis.get(redis_key)
-
-        if last_ts is None:
+        if self.redis.set(redis_key, str(time.time()), nx=True, ex=self.cooldown):
             return True
 
-        try:
-            last_ts = float(last_ts)
-        except ValueError:
-            return True  # Valor corrupto → permitir envío
-
-        now = time.time()
-        if now - last_ts < self.cooldown:
-            logger.info(f"[NOTIFIER] Cooldown activo para {alert_key}")
-            return False
-
-        return True
+        metrics.ALERTAS_COOLDOWN.inc()
+        logger.info(f"[NOTIFIER] Cooldown activo para {alert_key}")
+        return False
 
-    def _mark_sent(self, alert_key):
-        redis_key = f"alert:sent:{alert_key}"
-        self.redis.setex(redis_key, self.cooldown, str(time.time()))
+    def _release(self, alert_key):
+        """Libera la reserva si el envío falló definitivamente."""
+        self.redis.delete(f"alert:sent:{alert_key}")
 
     # ======================================================
     # Email Sender
@@ -92,6 +119,24 @@ class Notifier:
             logger.exception("Error enviando email con Resend: %s", e)
             return False
 
+    def _send_with_retry(self, subject, html):
+        """
+        Reintenta send_email con backoff exponencial (base * 2^n + jitter).
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.send_email(subject, html):
+                return True
+
+            if attempt == self.max_retries:
+                break
+
+            delay = self.backoff_base * (2 ** attempt) * (1 + random.random() * 0.1)
+            logger.warning(f"[NOTIFIER] Reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s")
+            if self._stopping.wait(delay):
+                break
+
+        return False
+
     # ======================================================
     # Main alert handler
     # ======================================================
@@ -104,18 +149,39 @@ class Notifier:
             "ts": "2025-11-19 22:01:00",
             "samples": [...]
         }
-        """
 
-        seq = alert_payload.get("seq")
-        ts = alert_payload.get("ts")
-
-        if seq is None or ts is None:
+        No bloquea: devuelve True si la alerta quedó encolada.
+        """
+        if alert_payload.get("seq") is None or alert_payload.get("ts") is None:
             logger.error("[NOTIFIER] Payload de alerta inválido: falta seq o ts")
             return False
 
+        try:
+            self.queue.put_nowait(alert_payload)
+            metrics.ALERTAS_ENCOLADAS.inc()
+            return True
+        except queue.Full:
+            logger.error("[NOTIFIER] Cola de alertas llena, alerta descartada")
+            return False
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                alert_payload = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            try:
+                self._process(alert_payload)
+            except Exception as e:
+                logger.exception("[NOTIFIER] Error procesando alerta: %s", e)
+
+    def _process(self, alert_payload):
+        seq = alert_payload.get("seq")
+        ts = alert_payload.get("ts")
         alert_key = f"{seq}:{ts}"
 
-        if not self._can_send(alert_key):
+        if not self._claim(alert_key):
             return False
 
         subject = f"⚠️ Alerta detectada — paquete seq={seq}"
@@ -125,9 +191,13 @@ class Notifier:
             f"<pre>{json.dumps(alert_payload, indent=2)}</pre>"
         )
 
-        sent = self.send_email(subject, html_body)
+        with metrics.ALERTA_ENVIO.medir():
+            sent = self._send_with_retry(subject, html_body)
 
         if sent:
-            self._mark_sent(alert_key)
+            metrics.ALERTAS_ENVIADAS.inc()
+        else:
+            metrics.ALERTAS_FALLIDAS.inc()
+            self._release(alert_key)
 
         return sent
@@ -0,0 +1,107 @@
+# app/paquetes.py
+"""
+Validación de los paquetes del ESP32 antes de que toquen Redis, la base
+de datos o el spool.
+
+Un paquete con la estructura rota (sample sin "id", valores que no son
+números, tilt fuera de 0/1...) fallaría igual en cada reintento, así que
+se rechaza al parsearlo y nunca llega al spool. Los enteros se comprueban
+contra los rangos del codec struct (funcs/codificacion.py) y de las
+columnas INTEGER de la base de datos.
+
+Los timestamps con zona se pasan a UTC sin zona (sin zona = UTC en todo
+el histórico) y se truncan a milisegundos, la resolución de los codecs
+binarios de Redis: la clave (device, seq, ts) es la misma en la BD, en
+Redis y en los paquetes que reconstruye el Archiver.
+"""
+import math
+from datetime import datetime, timezone
+
+ENTERO_MAX = 2 ** 31 - 1   # INTEGER de Postgres
+DEVICE_MAX = 64            # monitoring_sensorpacket.device
+
+# Rangos admitidos (incluidos) de los campos enteros de un sample
+_RANGOS = {
+    "id": (0, ENTERO_MAX),
+    "soil.raw": (0, 0xFFFF),     # '<H' del codec struct
+    "soil.pct": (0, 100),        # entero: INTEGER en la BD, int32 en la exportación
+    "vib.pulse": (0, ENTERO_MAX),
+    "vib.hit": (0, 1),
+    "tilt": (0, 1),
+}
+
+
+def _entero(valor, campo, minimo=0, maximo=ENTERO_MAX):
+    if type(valor) is not int:
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)) \
+                or not math.isfinite(valor) or valor != int(valor):
+            raise ValueError(f"{campo} no es entero: {valor!r}")
+        valor = int(valor)
+    if not minimo <= valor <= maximo:
+        raise ValueError(f"{campo} fuera de rango: {valor}")
+    return valor
+
+
+def _sample(sample):
+    if not isinstance(sample, dict) or "id" not in sample:
+        raise ValueError("sample sin id")
+    limpio = {"id": _entero(sample["id"], "id", *_RANGOS["id"])}
+    if sample.get("soil") is not None:
+        soil = sample["soil"]
+        if not isinstance(soil, dict):
+            raise ValueError("soil no es un objeto")
+        limpio["soil"] = {"raw": _entero(soil["raw"], "soil.raw", *_RANGOS["soil.raw"]),
+                          "pct": _entero(soil["pct"], "soil.pct", *_RANGOS["soil.pct"])}
+    if sample.get("tilt") is not None:
+        limpio["tilt"] = _entero(sample["tilt"], "tilt", *_RANGOS["tilt"])
+    if sample.get("vib") is not None:
+        vib = sample["vib"]
+        if not isinstance(vib, dict):
+            raise ValueError("vib no es un objeto")
+        limpio["vib"] = {"pulse": _entero(vib["pulse"], "vib.pulse", *_RANGOS["vib.pulse"]),
+                         "hit": _entero(vib["hit"], "vib.hit", *_RANGOS["vib.hit"])}
+    return limpio
+
+
+def normalizar_ts(ts):
+    """datetime → UTC sin zona (los que vienen sin zona ya lo son), a ms."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.replace(microsecond=ts.microsecond // 1000 * 1000)
+
+
+def validar_paquete(payload, device=None):
+    """
+    JSON del ESP32 → {device, seq, alerta, timestamp, samples} con los
+    samples limpios. `device` es el de reserva (topic MQTT, --device del
+    backfill) para los que no lo traen. ValueError con el motivo si el
+    paquete no es válido.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("no es un objeto JSON")
+    try:
+        device = payload.get("device") or device
+        if not device:
+            raise ValueError("falta device")
+        device = str(device)
+        if len(device) > DEVICE_MAX:
+            raise ValueError(f"device de más de {DEVICE_MAX} caracteres")
+        samples = payload["samples"]
+        if not isinstance(samples, list) or not samples:
+            raise ValueError("samples vacío")
+        alerta = payload["alerta"]
+        if alerta not in (0, 1):   # True/False incluidos
+            raise ValueError(f"alerta no es 0/1: {alerta!r}")
+        if not isinstance(payload["ts"], str):
+            raise ValueError(f"ts no es una fecha ISO: {payload['ts']!r}")
+        return {
+            "device": device,
+            "seq": _entero(payload["seq"], "seq"),
+            "alerta": int(alerta),
+            "timestamp": normalizar_ts(datetime.fromisoformat(payload["ts"])),
+            "samples": [_sample(s) for s in samples],
+        }
+    except KeyError as e:
+        raise ValueError(f"falta campo: {e}") from None
+    except TypeError as e:
+        raise ValueError(str(e)) from None
@@ -0,0 +1,419 @@
+# app/push_gateway.py
+"""
+Gateway de difusión en vivo (SSE y WebSocket) de lecturas y alertas.
+
+    GET /stream?tipo=humedad,vibracion&sensor=1,2&evento=alerta   (SSE)
+    GET /ws?...mismos filtros...                                    (WebSocket)
+    GET /health
+
+Fuentes:
+  - publicar_paquete(): gancho en proceso desde MQTTClient.on_message
+    (solo un append a una deque: nunca bloquea la ingesta)
+  - una única suscripción Redis a canal:alertas para todo el proceso
+  - canal:lecturas, donde los workers de ingesta en otros procesos
+    (INGEST_WORKERS > 1) reenvían sus paquetes con RelayLecturas
+
+El bucle asyncio corre en su propio hilo. Cada evento se serializa una
+vez y se reparte a los clientes cuyos filtros lo aceptan; cada cliente
+tiene un buffer acotado que descarta lo más viejo si el navegador no
+lee a tiempo, así que un cliente lento solo se pierde eventos propios.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+import threading
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CANAL_ALERTAS = "canal:alertas"
+CANAL_LECTURAS = "canal:lecturas"
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+CLIENTES = metrics.gauge("edge_push_clients", "Clientes SSE/WebSocket conectados")
+EVENTOS = metrics.contador("edge_push_events_total", "Eventos difundidos por el gateway")
+DESCARTADOS = metrics.contador(
+    "edge_push_dropped_total", "Eventos descartados por buffers de cliente llenos (drop-oldest)"
+)
+
+
+def _lista(query, nombre):
+    valor = query.get(nombre)
+    return frozenset(v for v in valor[-1].split(",") if v) if valor else None
+
+
+def _frame_ws(payload, opcode=0x1):
+    n = len(payload)
+    if n < 126:
+        cabecera = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 65536:
+        cabecera = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        cabecera = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return cabecera + payload
+
+
+class _Evento:
+    """Evento serializado una sola vez (y solo si algún cliente lo envía)."""
+    __slots__ = ("evento", "tipo", "sensor_id", "datos", "_cuerpo", "_sse", "_ws")
+
+    def __init__(self, evento, tipo, sensor_id, datos):
+        self.evento = evento
+        self.tipo = tipo
+        self.sensor_id = sensor_id
+        self.datos = datos
+        self._cuerpo = self._sse = self._ws = None
+
+    @property
+    def cuerpo(self):
+        if self._cuerpo is None:
+            self._cuerpo = json.dumps(self.datos, ensure_ascii=False, default=str).encode()
+        return self._cuerpo
+
+    @property
+    def sse(self):
+        if self._sse is None:
+            self._sse = b"event: " + self.evento.encode() + b"\ndata: " + self.cuerpo + b"\n\n"
+        return self._sse
+
+    @property
+    def ws(self):
+        if self._ws is None:
+            self._ws = _frame_ws(self.cuerpo)
+        return self._ws
+
+
+class _Cliente:
+    def __init__(self, tipos, sensores, eventos, buffer):
+        self.tipos = tipos
+        self.sensores = sensores
+        self.eventos = eventos
+        self.cola = deque(maxlen=buffer)
+        self.despertar = asyncio.Event()
+        self.descartados = 0
+
+    def acepta(self, ev):
+        return ((self.tipos is None or ev.tipo in self.tipos)
+                and (self.eventos is None or ev.evento in self.eventos))
+
+    def encolar(self, ev):
+        if len(self.cola) == self.cola.maxlen:
+            self.descartados += 1
+            DESCARTADOS.inc()
+        self.cola.append(ev)
+        self.despertar.set()
+
+
+class RelayLecturas:
+    """
+    Sustituto del gateway en los workers de ingesta: agrupa los paquetes
+    y los publica en canal:lecturas cada `intervalo` segundos (un PUBLISH
+    por lote) para el gateway del proceso supervisor. Mismo gancho
+    publicar_paquete(), igual de barato para on_message.
+    """
+
+    def __init__(self, redis_client, intervalo=0.05, max_pendientes=10000):
+        self.redis = redis_client
+        self.intervalo = intervalo
+        self._pendientes = deque(maxlen=max_pendientes)
+        self._stopping = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name="push-relay").start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def publicar_paquete(self, seq, timestamp, samples):
+        ts = timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp
+        self._pendientes.append((seq, ts, samples))
+
+    def _run(self):
+        while not self._stopping.wait(self.intervalo):
+            if not self._pendientes:
+                continue
+            lote = [self._pendientes.popleft() for _ in range(len(self._pendientes))]
+            try:
+                self.redis.publish(CANAL_LECTURAS, json.dumps(lote))
+            except Exception as e:
+                logger.warning(f"[PUSH] No se pudo reenviar {len(lote)} paquetes: {e}")
+
+
+class PushGateway:
+    def __init__(self, host="0.0.0.0", port=None, redis_client=None):
+        self.host = host
+        self.port = settings.PUSH_PORT if port is None else port
+        self.buffer = settings.PUSH_CLIENT_BUFFER
+        self.max_clientes = settings.PUSH_MAX_CLIENTS
+        self.heartbeat = settings.PUSH_HEARTBEAT_SECONDS
+        self.redis = redis_client
+
+        self._entrantes = deque(maxlen=settings.PUSH_INGEST_BACKLOG)
+        self._programado = False
+        self._loop = None
+        self._server = None
+        self._listo = threading.Event()
+        self._stopping = threading.Event()
+
+        # Índice de clientes: por sensor_id, y los que no filtran por sensor
+        self._por_sensor = {}
+        self._todos = set()
+        self._n_clientes = 0
+        CLIENTES.funcion = lambda: self._n_clientes
+
+    # ============
+    # CICLO DE VIDA
+    # ============
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name="push-gateway").start()
+        self._listo.wait(10)
+        if self.redis is not None:
+            threading.Thread(target=self._escuchar_alertas, daemon=True, name="push-redis").start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._conexion, self.host, self.port, backlog=1024)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"[PUSH] Escuchando en :{self.port} (SSE /stream, WebSocket /ws)")
+        self._listo.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+
+    # ============
+    # FUENTES (cualquier hilo)
+    # ============
+    def publicar_paquete(self, seq, timestamp, samples):
+        """Gancho de ingesta: O(1) y sin bloqueo; la expansión ocurre en el bucle."""
+        self._publicar(("paquete", seq, timestamp, samples))
+
+    def publicar_alerta(self, alerta):
+        self._publicar(("alerta", alerta))
+
+    def _publicar(self, item):
+        self._entrantes.append(item)
+        if not self._programado and self._loop is not None:
+            self._programado = True
+            self._loop.call_soon_threadsafe(self._drenar)
+
+    def _escuchar_alertas(self):
+        """Una sola suscripción Redis para todo el proceso, con reconexión."""
+        while not self._stopping.is_set():
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CANAL_ALERTAS, CANAL_LECTURAS)
+                while not self._stopping.is_set():
+                    mensaje = pubsub.get_message(timeout=1.0)
+                    if not mensaje or mensaje["type"] != "message":
+                        continue
+                    if mensaje["channel"] == CANAL_ALERTAS:
+                        self.publicar_alerta(json.loads(mensaje["data"]))
+                    else:
+                        for seq, ts, samples in json.loads(mensaje["data"]):
+                            self.publicar_paquete(seq, ts, samples)
+            except Exception as e:
+                logger.warning(f"[PUSH] Suscripción a {CANAL_ALERTAS}/{CANAL_LECTURAS} perdida: {e}")
+                self._stopping.wait(2)
+
+    # ============
+    # DIFUSIÓN (hilo del bucle)
+    # ============
+    def _drenar(self):
+        self._programado = False
+        if not self._n_clientes:
+            self._entrantes.clear()
+            return
+        while self._entrantes:
+            item = self._entrantes.popleft()
+            for ev in self._expandir(item):
+                self._difundir(ev)
+
+    @staticmethod
+    def _expandir(item):
+        if item[0] == "alerta":
+            alerta = item[1]
+            yield _Evento("alerta", alerta.get("tipo_sensor"), str(alerta.get("sensor_id")), alerta)
+            return
+
+        _, seq, timestamp, samples = item
+        ts = timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp
+        for sample in samples:
+            sid = str(sample["id"])
+            base = {"sensor_id": sid, "seq": seq, "timestamp": ts}
+            if "soil" in sample:
+                yield _Evento("lectura", "humedad", sid, {
+                    **base, "tipo": "humedad",
+                    "porcentaje": sample["soil"].get("pct"), "valor_raw": sample["soil"].get("raw"),
+                })
+            if "tilt" in sample:
+                yield _Evento("lectura", "inclinacion", sid, {**base, "tipo": "inclinacion", "estado": sample["tilt"]})
+            if "vib" in sample:
+                yield _Evento("lectura", "vibracion", sid, {
+                    **base, "tipo": "vibracion",
+                    "pulse": sample["vib"].get("pulse"), "hit": sample["vib"].get("hit"),
+                })
+
+    def _difundir(self, ev):
+        EVENTOS.inc()
+        for cliente in self._todos:
+            if cliente.acepta(ev):
+                cliente.encolar(ev)
+        for cliente in self._por_sensor.get(ev.sensor_id, ()):
+            if cliente.acepta(ev):
+                cliente.encolar(ev)
+
+    def _registrar(self, cliente):
+        self._n_clientes += 1
+        if cliente.sensores is None:
+            self._todos.add(cliente)
+        else:
+            for sid in cliente.sensores:
+                self._por_sensor.setdefault(sid, set()).add(cliente)
+
+    def _quitar(self, cliente):
+        self._n_clientes -= 1
+        if cliente.sensores is None:
+            self._todos.discard(cliente)
+        else:
+            for sid in cliente.sensores:
+                grupo = self._por_sensor.get(sid)
+                if grupo is not None:
+                    grupo.discard(cliente)
+                    if not grupo:
+                        del self._por_sensor[sid]
+
+    # ============
+    # HTTP / SSE / WEBSOCKET
+    # ============
+    async def _conexion(self, reader, writer):
+        try:
+            linea = await asyncio.wait_for(reader.readline(), 10)
+            cabeceras = {}
+            while True:
+                h = await asyncio.wait_for(reader.readline(), 10)
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                nombre, _, valor = h.decode("latin-1").partition(":")
+                cabeceras[nombre.strip().lower()] = valor.strip()
+
+            partes = linea.decode("latin-1").split()
+            if len(partes) < 2 or partes[0] != "GET":
+                return await self._responder(writer, 405, {"error": "solo GET"})
+            url = urlsplit(partes[1])
+            query = parse_qs(url.query)
+
+            if url.path == "/health":
+                return await self._responder(writer, 200, {"clientes": self._n_clientes})
+            if url.path not in ("/stream", "/ws"):
+                return await self._responder(writer, 404, {"error": "ruta desconocida"})
+            if self._n_clientes >= self.max_clientes:
+                return await self._responder(writer, 503, {"error": "demasiados clientes"})
+
+            cliente = _Cliente(_lista(query, "tipo"), _lista(query, "sensor"), _lista(query, "evento"), self.buffer)
+            self._registrar(cliente)
+            try:
+                if url.path == "/ws":
+                    await self._websocket(reader, writer, cabeceras, cliente)
+                else:
+                    await self._sse(writer, cliente)
+            finally:
+                self._quitar(cliente)
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.warning(f"[PUSH] Error en conexión: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _responder(writer, status, datos):
+        cuerpo = json.dumps(datos).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n"
+            "Connection: close\r\n\r\n".encode() + cuerpo
+        )
+        await writer.drain()
+
+    async def _sse(self, writer, cliente):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n"
+            b"Access-Control-Allow-Origin: *\r\n\r\n: conectado\n\n"
+        )
+        await writer.drain()
+        await self._bombear(writer, cliente, lambda ev: ev.sse, b": ping\n\n")
+
+    async def _websocket(self, reader, writer, cabeceras, cliente):
+        clave = cabeceras.get("sec-websocket-key")
+        if cabeceras.get("upgrade", "").lower() != "websocket" or not clave:
+            return await self._responder(writer, 400, {"error": "se esperaba un upgrade a websocket"})
+        aceptar = base64.b64encode(hashlib.sha1((clave + _WS_GUID).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {aceptar}\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+        # Termina cuando el cliente cierra o cuando el envío falla / se atasca
+        tareas = {
+            asyncio.ensure_future(self._bombear(writer, cliente, lambda ev: ev.ws, _frame_ws(b"", 0x9))),
+            asyncio.ensure_future(self._leer_ws(reader, writer)),
+        }
+        hechas, pendientes = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+        for tarea in pendientes:
+            tarea.cancel()
+        for tarea in hechas:
+            tarea.exception()
+
+    @staticmethod
+    async def _leer_ws(reader, writer):
+        """Atiende ping/close del cliente; los datos entrantes se ignoran."""
+        while True:
+            b0, b1 = await reader.readexactly(2)
+            opcode, n = b0 & 0x0F, b1 & 0x7F
+            if n == 126:
+                n = struct.unpack("!H", await reader.readexactly(2))[0]
+            elif n == 127:
+                n = struct.unpack("!Q", await reader.readexactly(8))[0]
+            mascara = await reader.readexactly(4) if b1 & 0x80 else b"\0\0\0\0"
+            datos = bytes(b ^ mascara[i % 4] for i, b in enumerate(await reader.readexactly(n)))
+            if opcode == 0x8:
+                writer.write(_frame_ws(datos[:2], 0x8))
+                return
+            if opcode == 0x9:
+                writer.write(_frame_ws(datos, 0xA))
+
+    async def _bombear(self, writer, cliente, formato, latido):
+        """
+        Vacía el buffer del cliente hacia el socket. Mientras drain()
+        espera a un cliente lento, la difusión sigue encolando en su deque
+        (que descarta lo más viejo); si no avanza en PUSH_SLOW_CLIENT_SECONDS
+        se le desconecta.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(cliente.despertar.wait(), self.heartbeat)
+            except asyncio.TimeoutError:
+                writer.write(latido)
+            cliente.despertar.clear()
+            if cliente.cola:
+                lote = [formato(cliente.cola.popleft()) for _ in range(len(cliente.cola))]
+                writer.write(b"".join(lote))
+            await asyncio.wait_for(writer.drain(), settings.PUSH_SLOW_CLIENT_SECONDS)
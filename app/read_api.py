@@ -0,0 +1,350 @@
+# app/read_api.py
+"""
+API HTTP de solo lectura sobre la caché Redis (stdlib, sin framework).
+
+    GET /health
+    GET /dashboard
+    GET /alertas?tipo=humedad&limite=50&cursor=...
+    GET /riesgo?limite=50                     sensores con más riesgo
+    GET /sensores/<tipo>/<id>                 estado actual
+    GET /sensores/<tipo>/<id>/historico?limite=50
+    GET /sensores/<tipo>/<id>/agregados       ventanas 1m/10m/1h por medida
+    GET /export?desde=...&hasta=...&formato=csv&sample_id=1,2&alerta=1
+
+Las respuestas se guardan ya serializadas en una caché TTL en proceso con
+coalescencia de peticiones (single-flight): N lectores simultáneos de la
+misma URL con la entrada vencida hacen una sola llamada a Redis. Cada
+respuesta lleva ETag; If-None-Match devuelve 304 sin cuerpo.
+
+/export no pasa por la caché: lee el histórico de la base de datos y lo
+envía con Transfer-Encoding: chunked a medida que sale del cursor (ver
+app/db/export.py). Como mucho EXPORT_MAX_CONCURRENT a la vez; el resto
+recibe 429.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+from app import metrics
+from app.config import settings
+from app.paquetes import normalizar_ts
+from app.resources import recursos
+from funcs.funciones_redis import MEDIDAS_AGREGADOS
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ("vibracion", "inclinacion", "humedad")
+TIPOS_ALERTA = TIPOS + ("riesgo",)   # app/risk.py
+
+CACHE_HITS = metrics.contador("edge_read_cache_hits_total", "Lecturas servidas desde la caché de la API")
+CACHE_MISSES = metrics.contador("edge_read_cache_misses_total", "Lecturas que consultaron Redis")
+CACHE_COALESCIDAS = metrics.contador(
+    "edge_read_cache_coalesced_total", "Lecturas que esperaron a otra petición en vuelo"
+)
+PETICION = metrics.histograma("edge_read_request_seconds", "Duración de una petición de la API de lectura")
+
+
+class NoEncontrado(Exception):
+    pass
+
+
+# ============
+# CACHÉ TTL + SINGLE-FLIGHT
+# ============
+class _Vuelo:
+    __slots__ = ("evento", "valor", "error")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.error = None
+
+
+class CacheLectura:
+    """
+    Caché clave → valor con TTL y LRU acotado. obtener() ejecuta `cargar`
+    una sola vez por clave vencida aunque lleguen muchas peticiones a la
+    vez: la primera carga y el resto espera su resultado (o su error).
+    """
+
+    def __init__(self, max_entradas=10000):
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()   # clave → (expira, valor)
+        self._vuelos = {}             # clave → _Vuelo
+
+    def obtener(self, clave, ttl, cargar):
+        if ttl <= 0:
+            return cargar()
+
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._datos.move_to_end(clave)
+                CACHE_HITS.inc()
+                return entrada[1]
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+
+        if not lider:
+            CACHE_COALESCIDAS.inc()
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.valor
+
+        CACHE_MISSES.inc()
+        try:
+            vuelo.valor = cargar()
+            with self._lock:
+                self._datos[clave] = (time.monotonic() + ttl, vuelo.valor)
+                self._datos.move_to_end(clave)
+                while len(self._datos) > self.max_entradas:
+                    self._datos.popitem(last=False)
+            return vuelo.valor
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+            vuelo.evento.set()
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+# ============
+# RUTAS
+# ============
+class ReadAPI:
+    def __init__(self, cache=None, ttl=None, ttl_dashboard=None, max_entradas=None):
+        if cache is None:
+            from app.cache_manager import CloudSensorCacheManager
+            cache = CloudSensorCacheManager()
+        self.cache = cache
+        self.ttl = settings.READ_API_CACHE_TTL_MS / 1000 if ttl is None else ttl
+        self.ttl_dashboard = settings.READ_API_DASHBOARD_TTL_MS / 1000 if ttl_dashboard is None else ttl_dashboard
+        self.respuestas = CacheLectura(max_entradas or settings.READ_API_CACHE_MAX_ENTRIES)
+
+    def responder(self, path):
+        """
+        Devuelve (status, cuerpo, etag) para GET `path`. La clave de caché
+        es la ruta con la query normalizada.
+        """
+        url = urlsplit(path)
+        partes = [p for p in url.path.split("/") if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        clave = "/".join(partes) + "?" + "&".join(f"{k}={query[k]}" for k in sorted(query))
+
+        try:
+            ttl, consulta = self._ruta(partes, query)
+        except NoEncontrado as e:
+            return self._render(404, {"error": str(e)})
+        except ValueError as e:
+            return self._render(400, {"error": str(e)})
+
+        return self.respuestas.obtener(clave, ttl, lambda: self._cargar(consulta))
+
+    def exportacion(self, path):
+        """Exportacion para GET /export?... (ValueError si la query es inválida)."""
+        from app.db.export import Exportacion
+
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(path).query).items()}
+        if "desde" not in query:
+            raise ValueError("falta desde")
+        desde = _fecha(query, "desde")
+        hasta = _fecha(query, "hasta") if "hasta" in query else datetime.now(timezone.utc).replace(tzinfo=None)
+        sample_ids = None
+        if query.get("sample_id"):
+            try:
+                sample_ids = [int(x) for x in query["sample_id"].split(",")]
+            except ValueError:
+                raise ValueError("sample_id debe ser una lista de enteros") from None
+        alerta = None
+        if "alerta" in query:
+            if query["alerta"].lower() not in ("1", "0", "true", "false"):
+                raise ValueError("alerta debe ser 1/0 o true/false")
+            alerta = query["alerta"].lower() in ("1", "true")
+        return Exportacion(desde, hasta, query.get("formato", "csv"), sample_ids, alerta)
+
+    def _cargar(self, consulta):
+        datos = consulta()
+        if datos is None:
+            return self._render(404, {"error": "sin datos"})
+        return self._render(200, datos)
+
+    @staticmethod
+    def _render(status, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode()
+        etag = 'W/"' + hashlib.sha1(cuerpo).hexdigest()[:20] + '"'
+        return status, cuerpo, etag
+
+    def _ruta(self, partes, query):
+        """(ttl, función sin argumentos que consulta Redis) para la ruta."""
+        c = self.cache
+
+        if partes == ["health"]:
+            # `recursos`: último chequeo en segundo plano (app/resources.py)
+            return 0, lambda: {"status": "ok", "redis": c.redis_client.ping(), "recursos": recursos.estado}
+
+        if partes == ["dashboard"]:
+            limite = _entero(query, "limite_alertas", None)
+            return self.ttl_dashboard, lambda: c.obtener_dashboard(limite_alertas=limite)
+
+        if partes == ["alertas"]:
+            tipo = query.get("tipo")
+            if tipo is not None and tipo not in TIPOS_ALERTA:
+                raise NoEncontrado(f"tipo desconocido: {tipo}")
+            limite = _entero(query, "limite", 50)
+            cursor = query.get("cursor")
+            return self.ttl, lambda: c.listar_alertas(tipo, limite, cursor)
+
+        if partes == ["riesgo"]:
+            limite = _entero(query, "limite", 50)
+            return self.ttl, lambda: c.obtener_riesgo(limite)
+
+        if len(partes) in (3, 4) and partes[0] == "sensores":
+            tipo, sensor_id = partes[1], partes[2]
+            if tipo not in TIPOS:
+                raise NoEncontrado(f"tipo desconocido: {tipo}")
+
+            if len(partes) == 3:
+                return self.ttl, lambda: c.obtener_estado_actual(sensor_id, tipo)
+
+            if partes[3] == "historico":
+                limite = _entero(query, "limite", 50)
+                return self.ttl, lambda: c.obtener_historico_reciente(sensor_id, tipo, limite)
+
+            if partes[3] == "agregados":
+                medidas = [m for m, t in MEDIDAS_AGREGADOS.items() if t == tipo]
+                return self.ttl, lambda: {m: c.obtener_agregados(sensor_id, m) for m in medidas}
+
+        raise NoEncontrado("ruta desconocida")
+
+
+def _entero(query, nombre, defecto):
+    if nombre not in query:
+        return defecto
+    try:
+        valor = int(query[nombre])
+    except ValueError:
+        raise ValueError(f"{nombre} debe ser un entero") from None
+    if valor <= 0:
+        raise ValueError(f"{nombre} debe ser positivo")
+    return valor
+
+
+def _fecha(query, nombre):
+    """Fecha ISO 8601 de la query → UTC sin zona, como los timestamps de la BD."""
+    try:
+        return normalizar_ts(datetime.fromisoformat(query[nombre]))
+    except ValueError:
+        raise ValueError(f"{nombre} debe ser una fecha ISO 8601") from None
+
+
+# ============
+# SERVIDOR HTTP
+# ============
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip("/") == "/export":
+            return self._exportar()
+
+        t0 = time.perf_counter()
+        try:
+            status, cuerpo, etag = self.server.api.responder(self.path)
+        except Exception as e:
+            logger.exception("[READ API] Error en %s: %s", self.path, e)
+            status, cuerpo, etag = ReadAPI._render(503, {"error": "redis no disponible"})
+
+        previos = [e.strip() for e in self.headers.get("If-None-Match", "").split(",")]
+        if status == 200 and (etag in previos or "*" in previos):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            if status == 200:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", f"max-age={int(self.server.api.ttl)}")
+            self.end_headers()
+            self.wfile.write(cuerpo)
+        PETICION.observar(time.perf_counter() - t0)
+
+    def _exportar(self):
+        try:
+            exportacion = self.server.api.exportacion(self.path)
+        except ValueError as e:
+            return self._enviar_json(400, {"error": str(e)})
+        if not self.server.exportaciones.acquire(blocking=False):
+            return self._enviar_json(429, {"error": "demasiadas exportaciones en curso"})
+
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", exportacion.content_type)
+            self.send_header("Content-Disposition", f'attachment; filename="export{exportacion.extension}"')
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for datos in exportacion:
+                if datos:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(datos), datos))
+            self.wfile.write(b"0\r\n\r\n")
+            logger.info(f"[READ API] Exportadas {exportacion.filas} filas ({exportacion.formato})")
+        except (ConnectionError, OSError):
+            # El cliente cortó la descarga
+            self.close_connection = True
+        except Exception as e:
+            # Ya se enviaron las cabeceras: se corta sin el trozo final
+            # para que el cliente vea la respuesta incompleta
+            logger.exception(f"[READ API] Error exportando {self.path}: {e}")
+            self.close_connection = True
+        finally:
+            self.server.exportaciones.release()
+
+    def _enviar_json(self, status, datos):
+        _, cuerpo, _ = ReadAPI._render(status, datos)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServidorLectura:
+    def __init__(self, api=None, host="0.0.0.0", port=8080):
+        self.api = api or ReadAPI()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.api = self.api
+        self.server.exportaciones = threading.BoundedSemaphore(settings.EXPORT_MAX_CONCURRENT)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="read-api-http")
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"[READ API] Escuchando en :{self.port}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,180 @@
+# app/resources.py
+"""
+Registro de recursos compartidos del proceso: dos pools de Redis (texto y
+binario) y el engine de SQLAlchemy.
+
+Cada recurso se crea al primer uso y una sola vez. Los gestores (cache
+manager, Notifier, Archiver, ReadAPI, gateway...) reciben clientes de
+estos pools en lugar de abrir los suyos. Un redis.Redis sobre un pool es
+thread-safe, así que todos los hilos comparten el mismo cliente. Con
+INGEST_WORKERS > 1 cada proceso tiene su propio registro (spawn no
+hereda sockets).
+
+VigilanteRecursos comprueba cada RESOURCE_HEALTH_SECONDS los recursos ya
+creados (PING / SELECT 1). Si un chequeo falla, descarta las conexiones
+del pool para que el siguiente uso reconecte desde cero, y vuelve a
+comprobar con backoff de 1 s a 60 s hasta que se recupere.
+"""
+import logging
+import threading
+
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import metrics
+from app.config import settings
+from app.cache_client import opciones_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_UP = metrics.gauge("edge_redis_up", "1 si el último chequeo de Redis fue bien")
+DB_UP = metrics.gauge("edge_db_up", "1 si el último chequeo de la base de datos fue bien")
+DESCARTES = metrics.contador("edge_resource_resets_total", "Pools descartados tras un chequeo fallido")
+
+
+class Recursos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._redis = {}          # decode_responses → redis.Redis
+        self._engine = None
+        self._sesiones = None
+        self.vigilante = None
+        # Resultado del último chequeo por recurso (ver comprobar)
+        self.estado = {}
+
+    # ============
+    # REDIS
+    # ============
+    def redis(self, decode_responses=True):
+        """Cliente compartido (decode_responses=False para lecturas binarias)."""
+        cliente = self._redis.get(decode_responses)
+        if cliente is None:
+            with self._lock:
+                cliente = self._redis.get(decode_responses)
+                if cliente is None:
+                    # Bloqueante: con el pool lleno se espera una conexión libre
+                    # en lugar de abrir más
+                    pool = redis.BlockingConnectionPool(
+                        max_connections=settings.REDIS_MAX_CONNECTIONS,
+                        timeout=settings.REDIS_POOL_TIMEOUT,
+                        retry=Retry(ExponentialBackoff(cap=2, base=0.05), settings.REDIS_RETRIES),
+                        **opciones_redis(decode_responses)
+                    )
+                    cliente = self._redis[decode_responses] = redis.Redis(connection_pool=pool)
+        return cliente
+
+    # ============
+    # BASE DE DATOS
+    # ============
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    from app.db.client import crear_engine
+                    self._engine = crear_engine()
+        return self._engine
+
+    def sesiones(self):
+        """sessionmaker ligado al engine compartido."""
+        if self._sesiones is None:
+            engine = self.engine()
+            with self._lock:
+                if self._sesiones is None:
+                    self._sesiones = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        return self._sesiones
+
+    # ============
+    # SALUD
+    # ============
+    def comprobar(self):
+        """
+        PING / SELECT 1 de los recursos ya creados (no crea ninguno).
+        Los que fallan pierden sus conexiones. Devuelve {nombre: ok}.
+        """
+        estado = {}
+        for decode, cliente in list(self._redis.items()):
+            nombre = "redis" if decode else "redis_raw"
+            try:
+                cliente.ping()
+                estado[nombre] = True
+            except redis.RedisError as e:
+                estado[nombre] = False
+                self._descartar(nombre, e, cliente.connection_pool.disconnect)
+
+        if self._engine is not None:
+            try:
+                with self._engine.connect() as conexion:
+                    conexion.execute(text("SELECT 1"))
+                estado["db"] = True
+            except Exception as e:
+                estado["db"] = False
+                self._descartar("db", e, self._engine.dispose)
+
+        for nombre, ok in estado.items():
+            if ok and self.estado.get(nombre) is False:
+                logger.info(f"[RECURSOS] {nombre} recuperado")
+        redis_ok = [ok for nombre, ok in estado.items() if nombre.startswith("redis")]
+        if redis_ok:
+            REDIS_UP.set(int(all(redis_ok)))
+        if "db" in estado:
+            DB_UP.set(int(estado["db"]))
+        self.estado = estado
+        return estado
+
+    def _descartar(self, nombre, error, descartar):
+        if self.estado.get(nombre) is not False:
+            logger.warning(f"[RECURSOS] {nombre} no responde, se descartan sus conexiones: {error}")
+        DESCARTES.inc()
+        try:
+            descartar()
+        except Exception:
+            logger.debug(f"[RECURSOS] Error cerrando conexiones de {nombre}", exc_info=True)
+
+    def iniciar_vigilancia(self):
+        if settings.RESOURCE_HEALTH_SECONDS and self.vigilante is None:
+            self.vigilante = VigilanteRecursos(self, settings.RESOURCE_HEALTH_SECONDS)
+            self.vigilante.start()
+
+    def cerrar(self):
+        """Para la vigilancia y cierra pools y engine (al salir del proceso)."""
+        if self.vigilante is not None:
+            self.vigilante.stop()
+            self.vigilante = None
+        with self._lock:
+            for cliente in self._redis.values():
+                cliente.connection_pool.disconnect()
+            self._redis.clear()
+            if self._engine is not None:
+                self._engine.dispose()
+            self._engine = self._sesiones = None
+
+
+class VigilanteRecursos(threading.Thread):
+    BACKOFF_MAX = 60
+
+    def __init__(self, recursos, intervalo):
+        super().__init__(daemon=True, name="resource-health")
+        self.recursos = recursos
+        self.intervalo = intervalo
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        espera, fallos = self.intervalo, 0
+        while not self._stopping.wait(espera):
+            try:
+                sano = all(self.recursos.comprobar().values())
+            except Exception as e:
+                logger.exception(f"[RECURSOS] Error en el chequeo: {e}")
+                sano = False
+            fallos = 0 if sano else fallos + 1
+            espera = self.intervalo if sano else min(2 ** (fallos - 1), self.BACKOFF_MAX)
+
+
+# Registro del proceso
+recursos = Recursos()
@@ -0,0 +1,300 @@
+# app/risk.py
+"""
+Puntuación de riesgo de deslizamiento sobre ventanas deslizantes.
+
+MotorRiesgo guarda por sensor (sample id) un buffer circular de las
+últimas RISK_WINDOW lecturas en arrays NumPy (una fila por sensor):
+soil_pct, vib pulse/hit, tilt y timestamp. evaluar() calcula para todos
+los sensores a la vez, sin bucles Python por muestra:
+
+    pendiente     pendiente de soil_pct (mínimos cuadrados, %/hora)
+    golpes        fracción de lecturas con vib hit
+    pulso         vib pulse medio (informativo, sin peso)
+    transiciones  cambios de tilt dentro de la ventana
+    acuerdo       fracción de los otros paneles del mismo dispositivo que
+                  también están elevados
+
+y los combina en una puntuación logística 0..1 (PESOS).
+
+EvaluadorRiesgo es el hilo que lo alimenta desde la ingesta: agregar()
+solo hace un append; cada RISK_TICK_MS ingiere lo acumulado, evalúa,
+escribe en Redis las puntuaciones que cambiaron y genera una alerta
+'riesgo' cuando un sensor cruza RISK_ALERT_THRESHOLD. Como en las reglas
+(app/rules.py), el sensor sigue alto hasta bajar a RISK_ALERT_CLEAR
+(histéresis) y no vuelve a alertar antes de RISK_ALERT_COOLDOWN_SECONDS:
+una puntuación que oscila alrededor del umbral genera una alerta, no una
+por tick.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+EVALUACION = metrics.histograma("edge_risk_eval_seconds", "Ingesta + evaluación de riesgo de un tick")
+ALTOS = metrics.gauge("edge_risk_high_sensors", "Sensores con riesgo por encima del umbral")
+SUPRIMIDAS = metrics.contador("edge_risk_alerts_suppressed_total", "Alertas de riesgo silenciadas por cooldown")
+DESCARTADOS = metrics.contador(
+    "edge_risk_dropped_total", "Paquetes descartados por la cola de riesgo llena (drop-oldest)"
+)
+
+# z = sesgo + Σ peso · feature normalizada; riesgo = 1 / (1 + e^-z)
+PESOS = {
+    "sesgo": -4.0,
+    "pendiente": 1.5,      # por cada PENDIENTE_REF %/hora de subida de humedad
+    "golpes": 4.0,         # fracción de lecturas con golpe (0..1)
+    "transiciones": 0.8,   # por cambio de inclinación en la ventana
+    "acuerdo": 2.0,        # fracción de paneles vecinos elevados (0..1)
+}
+PENDIENTE_REF = 5.0
+PENDIENTE_MAX = 3.0        # tope de la pendiente normalizada
+TRANSICIONES_MAX = 5
+ELEVADO = 0.5              # riesgo parcial a partir del cual un panel cuenta como elevado
+
+
+def _num(valor):
+    return np.nan if valor is None else valor
+
+
+def _sigmoide(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+class MotorRiesgo:
+    CAMPOS = ("soil", "pulse", "hit", "tilt")
+
+    def __init__(self, ventana=None, capacidad=1024):
+        self.ventana = ventana or settings.RISK_WINDOW
+        self.n = 0
+        self.indice = {}      # sample id → fila
+        self.ids = []         # fila → sample id
+        self._grupos = {}     # device → número de grupo
+        self._reservar(capacidad)
+
+    def _reservar(self, capacidad):
+        """Crea o agranda los arrays conservando las filas existentes."""
+        def ampliar(viejo, dtype, relleno, forma):
+            nuevo = np.full(forma, relleno, dtype)
+            if viejo is not None:
+                nuevo[:self.n] = viejo[:self.n]
+            return nuevo
+
+        forma = (capacidad, self.ventana)
+        for campo in self.CAMPOS:
+            setattr(self, campo, ampliar(getattr(self, campo, None), np.float32, np.nan, forma))
+        self.ts = ampliar(getattr(self, "ts", None), np.float64, np.nan, forma)
+        # Próxima posición de escritura y dispositivo (acuerdo) de cada fila
+        self.cabeza = ampliar(getattr(self, "cabeza", None), np.int64, 0, capacidad)
+        self.grupo = ampliar(getattr(self, "grupo", None), np.int64, 0, capacidad)
+        self.capacidad = capacidad
+
+    def _fila(self, sample_id, grupo):
+        fila = self.indice.get(sample_id)
+        if fila is None:
+            if self.n == self.capacidad:
+                self._reservar(self.capacidad * 2)
+            fila = self.indice[sample_id] = self.n
+            self.ids.append(sample_id)
+            self.n += 1
+        self.grupo[fila] = grupo
+        return fila
+
+    # ============
+    # INGESTA
+    # ============
+    def ingerir(self, paquetes):
+        """
+        paquetes = [(device, timestamp, samples), ...] en orden de llegada.
+        Escribe todas las muestras en los buffers circulares con una
+        asignación vectorizada por campo.
+        """
+        filas, ts, cols = [], [], {c: [] for c in self.CAMPOS}
+        for device, timestamp, samples in paquetes:
+            grupo = self._grupos.setdefault(device, len(self._grupos))
+            t = timestamp.timestamp()
+            for s in samples:
+                soil = s.get("soil") or {}
+                vib = s.get("vib") or {}
+                filas.append(self._fila(s["id"], grupo))
+                ts.append(t)
+                cols["soil"].append(_num(soil.get("pct")))
+                cols["pulse"].append(_num(vib.get("pulse")))
+                cols["hit"].append(_num(vib.get("hit")))
+                cols["tilt"].append(_num(s.get("tilt")))
+        if not filas:
+            return
+
+        # Posición de cada muestra: cabeza de su fila + orden dentro del lote
+        filas = np.asarray(filas)
+        orden = np.argsort(filas, kind="stable")
+        ordenadas = filas[orden]
+        inicio = np.flatnonzero(np.r_[True, ordenadas[1:] != ordenadas[:-1]])
+        cuenta = np.diff(np.r_[inicio, len(ordenadas)])
+        rango = np.arange(len(ordenadas)) - np.repeat(inicio, cuenta)
+        # Si una fila recibe más muestras que la ventana, solo cuentan las últimas
+        util = rango >= np.repeat(cuenta, cuenta) - self.ventana
+        f = ordenadas[util]
+        pos = (self.cabeza[f] + rango[util]) % self.ventana
+        orden = orden[util]
+
+        self.ts[f, pos] = np.asarray(ts)[orden]
+        for campo, valores in cols.items():
+            getattr(self, campo)[f, pos] = np.asarray(valores, np.float32)[orden]
+        self.cabeza[ordenadas[inicio]] += cuenta
+
+    # ============
+    # EVALUACIÓN
+    # ============
+    def evaluar(self):
+        """
+        Features y riesgo de todos los sensores. Devuelve un dict de arrays
+        alineados con self.ids[:n].
+        """
+        n, w = self.n, self.ventana
+        if not n:
+            vacio = np.zeros(0)
+            return {"riesgo": vacio, "pendiente": vacio, "golpes": vacio, "pulso": vacio,
+                    "transiciones": vacio, "acuerdo": vacio}
+
+        # Columnas en orden cronológico (la última es la lectura más nueva)
+        idx = (self.cabeza[:n, None] + np.arange(w)) % w
+        ts = np.take_along_axis(self.ts[:n], idx, 1)
+        soil = np.take_along_axis(self.soil[:n], idx, 1).astype(np.float64)
+        hit = self.hit[:n]
+        pulse = self.pulse[:n]
+        tilt = np.take_along_axis(self.tilt[:n], idx, 1)
+
+        # Pendiente de humedad (%/hora) por mínimos cuadrados, ignorando huecos
+        valido = ~np.isnan(soil) & ~np.isnan(ts)
+        k = valido.sum(1)
+        t = np.where(valido, (ts - ts[:, -1:]) / 3600.0, 0.0)
+        y = np.where(valido, soil, 0.0)
+        kk = np.maximum(k, 1)
+        dt = np.where(valido, t - (t.sum(1) / kk)[:, None], 0.0)
+        dy = np.where(valido, y - (y.sum(1) / kk)[:, None], 0.0)
+        var = (dt * dt).sum(1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pendiente = np.where((k >= 3) & (var > 0), (dt * dy).sum(1) / var, 0.0)
+
+        # Fracción de lecturas con golpe
+        hits_validos = ~np.isnan(hit)
+        golpes = np.nan_to_num(hit, nan=0.0).sum(1) / np.maximum(hits_validos.sum(1), 1)
+        pulso = np.nan_to_num(pulse, nan=0.0).sum(1) / np.maximum((~np.isnan(pulse)).sum(1), 1)
+
+        # Transiciones de inclinación entre lecturas consecutivas
+        transiciones = ((tilt[:, 1:] != tilt[:, :-1]) & ~np.isnan(tilt[:, 1:]) & ~np.isnan(tilt[:, :-1])).sum(1)
+
+        z = (PESOS["sesgo"]
+             + PESOS["pendiente"] * np.clip(pendiente / PENDIENTE_REF, 0, PENDIENTE_MAX)
+             + PESOS["golpes"] * golpes
+             + PESOS["transiciones"] * np.minimum(transiciones, TRANSICIONES_MAX))
+
+        # Acuerdo: fracción de los OTROS paneles del dispositivo que están elevados
+        grupo = self.grupo[:n]
+        elevado = (_sigmoide(z) > ELEVADO).astype(np.float64)
+        por_grupo = np.bincount(grupo, weights=elevado)
+        tam = np.bincount(grupo)
+        otros = tam[grupo] - 1
+        acuerdo = np.where(otros > 0, (por_grupo[grupo] - elevado) / np.maximum(otros, 1), 0.0)
+
+        riesgo = _sigmoide(z + PESOS["acuerdo"] * acuerdo)
+        riesgo = np.where(np.isnan(ts[:, -1]), 0.0, riesgo)   # filas sin lecturas
+        return {"riesgo": riesgo, "pendiente": pendiente, "golpes": golpes, "pulso": pulso,
+                "transiciones": transiciones, "acuerdo": acuerdo}
+
+
+# ============
+# HILO DE EVALUACIÓN
+# ============
+class EvaluadorRiesgo(threading.Thread):
+    """
+    Alimenta un MotorRiesgo desde la ingesta y publica el resultado.
+    Solo escribe en Redis las puntuaciones que cambiaron más de 0.01.
+    """
+
+    def __init__(self, cache=None, motor=None, intervalo_ms=None, umbral=None, clear=None, cooldown=None,
+                 backlog=None):
+        super().__init__(daemon=True, name="risk-evaluator")
+        if cache is None:
+            from app.cache_manager import CloudSensorCacheManager
+            cache = CloudSensorCacheManager()
+        self.cache = cache
+        self.motor = motor or MotorRiesgo()
+        self.intervalo = (intervalo_ms or settings.RISK_TICK_MS) / 1000
+        self.umbral = settings.RISK_ALERT_THRESHOLD if umbral is None else umbral
+        self.clear = settings.RISK_ALERT_CLEAR if clear is None else clear
+        if self.clear > self.umbral:
+            raise ValueError(f"RISK_ALERT_CLEAR ({self.clear}) por encima del umbral ({self.umbral})")
+        self.cooldown = settings.RISK_ALERT_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self._pendientes = deque(maxlen=backlog or settings.RISK_INGEST_BACKLOG)
+        self._publicado = np.zeros(0)
+        self._alto = np.zeros(0, bool)
+        self._ultima = np.zeros(0)     # monotonic de la última alerta por fila
+        self._stopping = threading.Event()
+
+    def agregar(self, device, timestamp, samples):
+        """Llamado desde on_message: solo un append (deque es thread-safe)."""
+        if len(self._pendientes) == self._pendientes.maxlen:
+            DESCARTADOS.inc()
+        self._pendientes.append((device, timestamp, samples))
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        while not self._stopping.wait(self.intervalo):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.exception(f"[RIESGO] Error evaluando: {e}")
+
+    def tick(self):
+        lote = []
+        while self._pendientes:
+            lote.append(self._pendientes.popleft())
+        if not lote:
+            return None
+
+        t0 = time.perf_counter()
+        self.motor.ingerir(lote)
+        resultado = self.motor.evaluar()
+        EVALUACION.observar(time.perf_counter() - t0)
+
+        riesgo = resultado["riesgo"]
+        n = len(riesgo)
+        publicado = np.full(n, -1.0)
+        publicado[:len(self._publicado)] = self._publicado
+        alto = np.zeros(n, bool)
+        alto[:len(self._alto)] = self._alto
+        ultima = np.full(n, -np.inf)
+        ultima[:len(self._ultima)] = self._ultima
+
+        ids = self.motor.ids
+        cambios = np.flatnonzero(np.abs(riesgo - publicado) > 0.01)
+        if len(cambios):
+            self.cache.guardar_riesgo({str(ids[i]): round(float(riesgo[i]), 3) for i in cambios})
+            publicado[cambios] = riesgo[cambios]
+
+        # Los altos siguen altos hasta bajar de clear; el resto sube con el umbral
+        ahora_alto = np.where(alto, riesgo > self.clear, riesgo >= self.umbral)
+        t = time.monotonic()
+        for i in np.flatnonzero(ahora_alto & ~alto):
+            if t - ultima[i] < self.cooldown:
+                SUPRIMIDAS.inc()
+                continue
+            ultima[i] = t
+            self.cache._generar_alerta(str(ids[i]), 'riesgo',
+                                       f'Riesgo de deslizamiento {riesgo[i]:.2f} '
+                                       f'(pendiente {resultado["pendiente"][i]:+.1f} %/h, '
+                                       f'golpes {resultado["golpes"][i]:.0%}, '
+                                       f'transiciones {int(resultado["transiciones"][i])})')
+
+        self._publicado, self._alto, self._ultima = publicado, ahora_alto, ultima
+        ALTOS.set(int(ahora_alto.sum()))
+        return resultado
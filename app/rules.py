@@ -0,0 +1,206 @@
+# app/rules.py
+"""
+Reglas de alerta por lectura, declaradas en app/configs/config.yaml
+(clave `rules`) y compiladas una sola vez al arrancar.
+
+Cada regla mira un campo del sample (soil.pct, vib.hit, tilt...) y pasa
+por tres fases por sensor, guardadas en memoria:
+
+    inactiva  → pendiente   el valor cruza el umbral (above / below)
+    pendiente → activa      sigue sin rearmar durante for_seconds
+    activa    → inactiva    el valor vuelve al nivel clear (histéresis)
+
+Solo la entrada en activa escribe una alerta, y no si la misma regla ya
+alertó para ese sensor hace menos de cooldown_seconds. Una ladera que
+vibra en cada paquete genera una alerta, no una por paquete.
+
+El estado no se comparte entre procesos: con INGEST_WORKERS > 1 el hash
+por topic mantiene cada dispositivo en el mismo worker. Tras un reinicio,
+el primer paquete de cada sensor siembra las reglas con su última lectura
+(:actual en Redis, ver sembrar): lo que ya estaba disparado arranca activo
+y no vuelve a alertar.
+"""
+import functools
+import logging
+import threading
+
+import yaml
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+DISPARADAS = metrics.contador("edge_rule_alerts_total", "Alertas generadas por las reglas")
+SUPRIMIDAS = metrics.contador("edge_rule_suppressed_total", "Activaciones de regla silenciadas por cooldown")
+
+INACTIVA, PENDIENTE, ACTIVA = 0, 1, 2
+
+
+class Regla:
+    """Una regla compilada: ruta del campo y comparaciones ya resueltas."""
+
+    __slots__ = ("nombre", "tipo", "ruta", "dispara", "rearma", "duracion", "cooldown", "mensaje")
+
+    def __init__(self, spec, cooldown_defecto=0):
+        self.nombre = spec["name"]
+        self.tipo = spec["type"]
+        self.ruta = tuple(spec["field"].split("."))
+        self.duracion = float(spec.get("for_seconds", 0))
+        self.cooldown = float(spec.get("cooldown_seconds", cooldown_defecto))
+        self.mensaje = spec.get("message", self.nombre + ": {valor}")
+
+        if ("above" in spec) == ("below" in spec):
+            raise ValueError(f"Regla {self.nombre}: hace falta exactamente uno de above / below")
+        if "above" in spec:
+            umbral = float(spec["above"])
+            clear = float(spec.get("clear", umbral))
+            if clear > umbral:
+                raise ValueError(f"Regla {self.nombre}: clear ({clear}) por encima de above ({umbral})")
+            self.dispara = lambda v: v > umbral
+            self.rearma = lambda v: v <= clear
+        else:
+            umbral = float(spec["below"])
+            clear = float(spec.get("clear", umbral))
+            if clear < umbral:
+                raise ValueError(f"Regla {self.nombre}: clear ({clear}) por debajo de below ({umbral})")
+            self.dispara = lambda v: v < umbral
+            self.rearma = lambda v: v >= clear
+
+    def valor(self, sample):
+        v = sample
+        for clave in self.ruta:
+            if not isinstance(v, dict):
+                return None
+            v = v.get(clave)
+        return v
+
+
+class MotorReglas:
+    """
+    Evalúa las reglas sobre los samples de cada paquete. Las reglas se
+    agrupan por la primera clave de su campo, así que un sample solo
+    recorre las reglas de los campos que trae.
+    """
+
+    def __init__(self, reglas):
+        self.reglas = reglas
+        self._por_campo = {}
+        for i, regla in enumerate(reglas):
+            self._por_campo.setdefault(regla.ruta[0], []).append((i, regla))
+        # (índice de regla, sensor_id) → [fase, inicio de la fase, última alerta]
+        self._estado = {}
+        self._vistos = set()    # sensor_ids ya sembrados o evaluados
+        self._lock = threading.Lock()
+
+    def sin_estado(self, samples):
+        """sensor_ids de `samples` que el motor no ha visto desde que arrancó."""
+        return [str(s["id"]) for s in samples if str(s["id"]) not in self._vistos]
+
+    def sembrar(self, previos):
+        """
+        Estado inicial de sensores no vistos a partir de su última lectura
+        anterior al arranque ({sensor_id: sample}). Las reglas que esa
+        lectura ya disparaba empiezan activas y sin alerta: se escribió
+        antes del reinicio. Los sensores sin lectura previa empiezan
+        inactivos, como hasta ahora.
+        """
+        with self._lock:
+            for sid, sample in previos.items():
+                if sid in self._vistos:
+                    continue
+                self._vistos.add(sid)
+                for campo, reglas in self._por_campo.items():
+                    if campo not in sample:
+                        continue
+                    for i, regla in reglas:
+                        v = regla.valor(sample)
+                        if v is not None and regla.dispara(v):
+                            self._estado[(i, sid)] = [ACTIVA, float("-inf"), float("-inf")]
+
+    def evaluar(self, samples, timestamp):
+        """
+        Aplica las reglas a los samples de un paquete recibido en
+        `timestamp` y devuelve las alertas a escribir:
+        [(sensor_id, tipo_sensor, mensaje), ...]
+        """
+        t = timestamp.timestamp()
+        alertas = []
+        with self._lock:
+            for sample in samples:
+                sid = str(sample["id"])
+                self._vistos.add(sid)
+                for campo, reglas in self._por_campo.items():
+                    if campo not in sample:
+                        continue
+                    for i, regla in reglas:
+                        v = regla.valor(sample)
+                        if v is None:
+                            continue
+                        if self._transicion(i, regla, sid, v, t):
+                            alertas.append((sid, regla.tipo,
+                                            regla.mensaje.format(valor=v, sensor_id=sid, s=sample)))
+        if alertas:
+            DISPARADAS.inc(len(alertas))
+        return alertas
+
+    def _transicion(self, i, regla, sid, v, t):
+        """Avanza la máquina de estados; True si hay que escribir la alerta."""
+        estado = self._estado.get((i, sid))
+        if estado is None or estado[0] == INACTIVA:
+            if not regla.dispara(v):
+                return False
+            if estado is None:
+                estado = self._estado[(i, sid)] = [INACTIVA, t, float("-inf")]
+            estado[0], estado[1] = PENDIENTE, t
+
+        if estado[0] == ACTIVA:
+            if regla.rearma(v):
+                estado[0], estado[1] = INACTIVA, t
+            return False
+
+        # PENDIENTE
+        if regla.rearma(v):
+            estado[0], estado[1] = INACTIVA, t
+            return False
+        if t - estado[1] < regla.duracion:
+            return False
+        estado[0] = ACTIVA
+        if t - estado[2] < regla.cooldown:
+            SUPRIMIDAS.inc()
+            return False
+        estado[2] = t
+        return True
+
+    def __len__(self):
+        return len(self.reglas)
+
+
+def cargar_reglas(ruta=None):
+    """
+    Compila las reglas de `ruta` (por defecto ALERT_RULES_FILE). Devuelve
+    None si no hay fichero configurado o no declara reglas: el cache
+    manager vuelve entonces a los umbrales fijos de siempre.
+    """
+    ruta = settings.ALERT_RULES_FILE if ruta is None else ruta
+    if not ruta:
+        return None
+    with open(ruta, "r") as f:
+        data = yaml.safe_load(f) or {}
+    specs = data.get("rules") or []
+    if not specs:
+        return None
+    cooldown = (data.get("alerts") or {}).get("cooldown_seconds", 0)
+    motor = MotorReglas([Regla(spec, cooldown) for spec in specs])
+    logger.info(f"[REGLAS] {len(motor)} reglas de alerta cargadas de {ruta}")
+    return motor
+
+
+@functools.lru_cache(maxsize=None)
+def reglas_del_proceso():
+    """
+    Motor compartido por todo lo que escribe lecturas en este proceso
+    (MQTTClient y el replayer del spool), para que el estado de
+    histéresis y cooldown sea uno solo.
+    """
+    return cargar_reglas()
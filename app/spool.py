@@ -0,0 +1,453 @@
+# app/spool.py
+"""
+Spool local en disco para paquetes que Postgres o Redis no aceptaron.
+
+Cada sumidero (db, redis) tiene su propio log append-only segmentado en
+SPOOL_DIR/<sumidero>/seg-<n>.log. Los registros se escriben con buffer y
+se sincronizan con fsync como mucho cada SPOOL_FSYNC_MS (o al rotar de
+segmento), así que una ráfaga de fallos cuesta un fsync y no uno por
+paquete.
+
+    registro = [longitud u32][crc32 u32][ts escritura f64][paquete JSON]
+
+El Replayer vacía los spools en lotes de SPOOL_REPLAY_BATCH paquetes
+(un INSERT multi-fila, un pipeline de Redis) cuando el sumidero vuelve, y
+guarda la posición confirmada en `cursor`. Mientras un spool tiene
+pendientes, la ingesta escribe directamente detrás (sin intentar el
+sumidero) para no pagar un timeout por mensaje y conservar el orden.
+
+Solo los errores de conexión o timeout (transitorio) llevan un paquete
+al spool o hacen reintentar. Si el sumidero rechaza un lote por sus
+datos, el Replayer lo relee de uno en uno y aparta los paquetes que
+siguen fallando a SPOOL_DIR/<sumidero>/dead (otro spool, con el motivo
+en cada registro) en lugar de bloquear el cursor para siempre.
+
+En memoria se lleva el estado de cada spool (segmentos, bytes, registros
+pendientes, antigüedad del más viejo) para limitar el tamaño: por encima
+de SPOOL_MAX_MB se descarta el segmento más antiguo.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+
+import redis
+from sqlalchemy import exc
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CABECERA = struct.Struct("<IId")
+REPLAY = metrics.histograma("edge_spool_replay_seconds", "Reinyección de un lote del spool")
+
+
+def _codificar(paquete):
+    datos = dict(paquete)
+    if isinstance(datos.get("timestamp"), datetime):
+        datos["timestamp"] = datos["timestamp"].isoformat()
+    return json.dumps(datos, separators=(",", ":")).encode()
+
+
+def _decodificar(datos):
+    paquete = json.loads(datos)
+    if paquete.get("timestamp"):
+        paquete["timestamp"] = datetime.fromisoformat(paquete["timestamp"])
+    return paquete
+
+
+def transitorio(error):
+    """
+    True si `error` es de conexión o timeout: el sumidero puede volver y
+    el paquete merece el spool. Lo demás (datos que la BD o Redis
+    rechazan, bugs) fallaría igual en cada reintento.
+    """
+    if isinstance(error, (redis.ConnectionError, redis.TimeoutError, exc.TimeoutError, OSError)):
+        return True
+    if isinstance(error, exc.DBAPIError):
+        return error.connection_invalidated or isinstance(error, (exc.OperationalError, exc.InterfaceError))
+    return False
+
+
+# ============
+# LOG SEGMENTADO
+# ============
+class Spool:
+    def __init__(self, directorio, nombre, max_bytes=None, segmento_bytes=None, fsync_ms=None,
+                 muertos=True):
+        self.directorio = directorio
+        self.nombre = nombre
+        self.max_bytes = max_bytes or settings.SPOOL_MAX_MB * 1024 * 1024
+        self.segmento_bytes = segmento_bytes or settings.SPOOL_SEGMENT_MB * 1024 * 1024
+        self.fsync_intervalo = (settings.SPOOL_FSYNC_MS if fsync_ms is None else fsync_ms) / 1000
+
+        self._lock = threading.Lock()
+        self._segmentos = deque()   # [numero, bytes, registros], el último es el de escritura
+        self._cursor = (0, 0, 0)    # (segmento, offset, registros ya leídos en él)
+        self._archivo = None
+        self._sucio = False
+        self._ultimo_fsync = time.monotonic()
+        self._ts_pendiente = None   # ts de escritura del registro pendiente más viejo
+        self.pendientes = 0
+        self.bytes = 0
+
+        self.escritos = metrics.contador(f"edge_spool_{nombre}_written_total",
+                                         f"Paquetes escritos en el spool de {nombre}")
+        self.reinyectados = metrics.contador(f"edge_spool_{nombre}_replayed_total",
+                                             f"Paquetes del spool de {nombre} reinyectados")
+        self.descartados = metrics.contador(f"edge_spool_{nombre}_dropped_total",
+                                            f"Paquetes del spool de {nombre} perdidos (límite o corrupción)")
+        metrics.gauge(f"edge_spool_{nombre}_records", f"Paquetes pendientes en el spool de {nombre}",
+                      lambda: self.pendientes)
+        metrics.gauge(f"edge_spool_{nombre}_bytes", f"Tamaño en disco del spool de {nombre}",
+                      lambda: self.bytes)
+        metrics.gauge(f"edge_spool_{nombre}_lag_seconds",
+                      f"Antigüedad del paquete pendiente más viejo del spool de {nombre}",
+                      self.lag_segundos)
+
+        os.makedirs(directorio, exist_ok=True)
+        self._abrir()
+
+        # Paquetes que el sumidero rechaza por sus datos (ver apartar)
+        self.muertos = Spool(
+            os.path.join(directorio, "dead"), f"{nombre}_dead", self.max_bytes, self.segmento_bytes,
+            fsync_ms, muertos=False,
+        ) if muertos else None
+
+    def _ruta(self, numero):
+        return os.path.join(self.directorio, f"seg-{numero:010d}.log")
+
+    def _abrir(self):
+        """Carga los segmentos existentes, recorta colas incompletas y lee el cursor."""
+        numeros = sorted(
+            int(f[4:-4]) for f in os.listdir(self.directorio)
+            if f.startswith("seg-") and f.endswith(".log")
+        )
+        cursor = (numeros[0] if numeros else 0, 0, 0)
+        try:
+            with open(os.path.join(self.directorio, "cursor")) as f:
+                cursor = tuple(int(x) for x in f.read().split())
+        except (OSError, ValueError):
+            pass
+
+        for numero in numeros:
+            if numero < cursor[0]:
+                os.remove(self._ruta(numero))   # ya reinyectado
+                continue
+            validos, registros = self._escanear(numero)
+            self._segmentos.append([numero, validos, registros])
+
+        if not self._segmentos or cursor[0] != self._segmentos[0][0] or cursor[1] > self._segmentos[0][1]:
+            cursor = (self._segmentos[0][0], 0, 0) if self._segmentos else (0, 0, 0)
+        self._cursor = cursor
+        self._recontar()
+        self._ts_pendiente = self._leer_ts()
+        if self.pendientes:
+            logger.warning(f"[SPOOL] {self.nombre}: {self.pendientes} paquetes pendientes "
+                           f"({self.bytes / 1e6:.1f} MB) de una ejecución anterior")
+
+    def _escanear(self, numero):
+        """(bytes válidos, registros) del segmento; trunca lo que haya tras un registro roto."""
+        ruta = self._ruta(numero)
+        validos, registros = 0, 0
+        with open(ruta, "rb") as f:
+            while True:
+                cabecera = f.read(CABECERA.size)
+                if len(cabecera) < CABECERA.size:
+                    break
+                longitud, crc, _ = CABECERA.unpack(cabecera)
+                datos = f.read(longitud)
+                if len(datos) < longitud or zlib.crc32(datos) != crc:
+                    break
+                validos += CABECERA.size + longitud
+                registros += 1
+        if validos < os.path.getsize(ruta):
+            logger.warning(f"[SPOOL] {self.nombre}: segmento {numero} truncado a {validos} bytes")
+            os.truncate(ruta, validos)
+        return validos, registros
+
+    def _recontar(self):
+        self.bytes = sum(s[1] for s in self._segmentos)
+        self.pendientes = sum(s[2] for s in self._segmentos) - self._cursor[2]
+
+    def _leer_ts(self):
+        """ts de escritura del registro en el cursor (None si no hay pendientes)."""
+        numero, offset, _ = self._cursor
+        if self._archivo is not None:
+            self._archivo.flush()
+        for seg in self._segmentos:
+            if seg[0] < numero or (seg[0] == numero and offset >= seg[1]):
+                continue
+            with open(self._ruta(seg[0]), "rb") as f:
+                f.seek(offset if seg[0] == numero else 0)
+                return CABECERA.unpack(f.read(CABECERA.size))[2]
+        return None
+
+    # ============
+    # ESCRITURA
+    # ============
+    def escribir(self, paquetes):
+        """Añade los paquetes al final del spool. Devuelve cuántos se guardaron."""
+        ahora = time.time()
+        partes = []
+        for paquete in paquetes:
+            datos = _codificar(paquete)
+            partes.append(CABECERA.pack(len(datos), zlib.crc32(datos), ahora))
+            partes.append(datos)
+        bloque = b"".join(partes)
+
+        with self._lock:
+            if not self._hacer_sitio(len(bloque)):
+                self.descartados.inc(len(paquetes))
+                logger.error(f"[SPOOL] {self.nombre}: lleno, {len(paquetes)} paquetes descartados")
+                return 0
+            if self._archivo is None or self._segmentos[-1][1] >= self.segmento_bytes:
+                self._rotar()
+            self._archivo.write(bloque)
+            seg = self._segmentos[-1]
+            seg[1] += len(bloque)
+            seg[2] += len(paquetes)
+            self.bytes += len(bloque)
+            self.pendientes += len(paquetes)
+            if self._ts_pendiente is None:
+                self._ts_pendiente = ahora
+            self._sucio = True
+            if time.monotonic() - self._ultimo_fsync >= self.fsync_intervalo:
+                self._fsync()
+
+        self.escritos.inc(len(paquetes))
+        return len(paquetes)
+
+    def apartar(self, paquetes, error):
+        """
+        Guarda en el spool de muertos los paquetes que el sumidero rechazó
+        por sus datos, con el motivo en el campo "error". No se reinyectan
+        solos: quedan para inspección manual.
+        """
+        self.muertos.escribir([{**p, "error": f"{type(error).__name__}: {error}"} for p in paquetes])
+        self.muertos.sincronizar()
+        logger.error(f"[SPOOL] {self.nombre}: {len(paquetes)} paquetes rechazados apartados a "
+                     f"{self.muertos.directorio}: {error}")
+
+    def _hacer_sitio(self, n):
+        """Descarta segmentos antiguos hasta que quepan `n` bytes más."""
+        while self.bytes + n > self.max_bytes and len(self._segmentos) > 1:
+            numero, tam, registros = self._segmentos.popleft()
+            perdidos = registros - (self._cursor[2] if self._cursor[0] == numero else 0)
+            os.remove(self._ruta(numero))
+            self._cursor = (self._segmentos[0][0], 0, 0)
+            self._recontar()
+            self._ts_pendiente = self._leer_ts()
+            self.descartados.inc(perdidos)
+            logger.error(f"[SPOOL] {self.nombre}: límite de {self.max_bytes / 1e6:.0f} MB, "
+                         f"segmento {numero} descartado ({perdidos} paquetes)")
+        return self.bytes + n <= self.max_bytes
+
+    def _rotar(self):
+        if self._archivo is not None:
+            self._fsync()
+            self._archivo.close()
+        numero = self._segmentos[-1][0] + 1 if self._segmentos else self._cursor[0] + 1
+        self._archivo = open(self._ruta(numero), "ab")
+        self._segmentos.append([numero, 0, 0])
+        if len(self._segmentos) == 1:
+            self._cursor = (numero, 0, 0)
+        # La entrada del directorio también debe sobrevivir a un corte de luz
+        fd = os.open(self.directorio, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _fsync(self):
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self._sucio = False
+        self._ultimo_fsync = time.monotonic()
+
+    def sincronizar(self):
+        """fsync de lo escrito desde el último (lo llama el Replayer cada SPOOL_FSYNC_MS)."""
+        with self._lock:
+            if self._sucio:
+                self._fsync()
+
+    def cerrar(self):
+        with self._lock:
+            if self._archivo is not None:
+                self._fsync()
+                self._archivo.close()
+                self._archivo = None
+        if self.muertos is not None:
+            self.muertos.cerrar()
+
+    # ============
+    # LECTURA
+    # ============
+    def leer(self, max_paquetes):
+        """
+        Hasta `max_paquetes` paquetes desde el cursor, sin avanzarlo.
+        Devuelve (paquetes, posición) para pasar a confirmar() cuando el
+        sumidero los haya aceptado.
+        """
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.flush()
+            segmentos = [tuple(s) for s in self._segmentos]
+            escritura = self._segmentos[-1][0] if self._archivo is not None else None
+            numero, offset, leidos = self._cursor
+
+        paquetes = []
+        for seg, tam, registros in segmentos:
+            if seg < numero:
+                continue
+            if seg > numero:
+                numero, offset, leidos = seg, 0, 0
+            with open(self._ruta(seg), "rb") as f:
+                f.seek(offset)
+                while offset < tam and len(paquetes) < max_paquetes:
+                    longitud, crc, _ = CABECERA.unpack(f.read(CABECERA.size))
+                    datos = f.read(longitud)
+                    if zlib.crc32(datos) != crc:
+                        logger.error(f"[SPOOL] {self.nombre}: registro corrupto en segmento {seg}, "
+                                     f"se salta el resto del segmento")
+                        self.descartados.inc(registros - leidos)
+                        offset, leidos = tam, registros
+                        break
+                    paquetes.append(_decodificar(datos))
+                    offset += CABECERA.size + longitud
+                    leidos += 1
+            if len(paquetes) >= max_paquetes or seg == escritura:
+                break
+        return paquetes, (numero, offset, leidos)
+
+    def confirmar(self, posicion):
+        """Avanza el cursor a `posicion` y borra los segmentos ya consumidos."""
+        with self._lock:
+            if posicion[:2] <= self._cursor[:2]:
+                return   # el límite de tamaño ya descartó esos segmentos
+            reinyectados = self.pendientes
+            while self._segmentos and self._segmentos[0][0] < posicion[0]:
+                numero = self._segmentos.popleft()[0]
+                os.remove(self._ruta(numero))
+            self._cursor = posicion
+            self._recontar()
+            reinyectados -= self.pendientes
+            self._ts_pendiente = self._leer_ts()
+
+            tmp = os.path.join(self.directorio, "cursor.tmp")
+            with open(tmp, "w") as f:
+                f.write(" ".join(str(x) for x in posicion))
+            os.replace(tmp, os.path.join(self.directorio, "cursor"))
+        self.reinyectados.inc(reinyectados)
+
+    def lag_segundos(self):
+        ts = self._ts_pendiente
+        return max(0.0, time.time() - ts) if ts is not None and self.pendientes else 0.0
+
+
+# ============
+# REINYECCIÓN
+# ============
+class Replayer(threading.Thread):
+    """
+    Dueño de los spools de db y redis. Cada SPOOL_FSYNC_MS sincroniza los
+    spools y, si tienen pendientes, los vacía en lotes contra el sumidero.
+    Si el sumidero no responde, reintenta con backoff exponencial
+    (1 s .. 60 s); si rechaza el lote, lo aísla de uno en uno y aparta
+    los paquetes culpables (Spool.apartar).
+    """
+
+    BACKOFF_MAX = 60
+
+    def __init__(self, directorio=None, cache=None, lote=None):
+        super().__init__(daemon=True, name="spool-replayer")
+        directorio = directorio or settings.SPOOL_DIR
+        self.db = Spool(os.path.join(directorio, "db"), "db")
+        self.redis = Spool(os.path.join(directorio, "redis"), "redis")
+        self._cache = cache
+        self.lote = lote or settings.SPOOL_REPLAY_BATCH
+        self.intervalo = settings.SPOOL_FSYNC_MS / 1000
+        self._stopping = threading.Event()
+        self._backoff = {"db": 0, "redis": 0}
+        self._reintento = {"db": 0.0, "redis": 0.0}
+        # Paquetes que quedan por releer de uno en uno tras un lote rechazado
+        self._aislar = {"db": 0, "redis": 0}
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            from app.cache_manager import CloudSensorCacheManager
+            from app.rules import reglas_del_proceso
+            self._cache = CloudSensorCacheManager(reglas=reglas_del_proceso())
+        return self._cache
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        while not self._stopping.wait(self.intervalo):
+            self.drenar(self.db, self._reinyectar_db, self.lote)
+            # Pipelines de tamaño moderado para no bloquear Redis con uno enorme
+            self.drenar(self.redis, self._reinyectar_redis, min(self.lote, 500))
+        self.db.cerrar()
+        self.redis.cerrar()
+
+    def drenar(self, spool, reinyectar, lote):
+        spool.sincronizar()
+        nombre = spool.nombre
+        while spool.pendientes and not self._stopping.is_set():
+            if time.monotonic() < self._reintento[nombre]:
+                return
+            t0 = time.perf_counter()
+            paquetes = []
+            try:
+                paquetes, posicion = spool.leer(1 if self._aislar[nombre] else lote)
+                if paquetes:
+                    reinyectar(paquetes)
+            except Exception as e:
+                if transitorio(e) or not paquetes:
+                    backoff = min(max(self._backoff[nombre] * 2, 1), self.BACKOFF_MAX)
+                    self._backoff[nombre] = backoff
+                    self._reintento[nombre] = time.monotonic() + backoff
+                    logger.warning(f"[SPOOL] {nombre} sigue sin aceptar escrituras "
+                                   f"({spool.pendientes} pendientes), reintento en {backoff}s: {e}")
+                    return
+                if len(paquetes) > 1:
+                    # Error por los datos: se relee el lote de uno en uno
+                    logger.warning(f"[SPOOL] {nombre}: lote de {len(paquetes)} paquetes rechazado, "
+                                   f"se reinyecta de uno en uno: {e}")
+                    self._aislar[nombre] = len(paquetes)
+                    continue
+                spool.apartar(paquetes, e)
+            REPLAY.observar(time.perf_counter() - t0)
+            spool.confirmar(posicion)
+            self._aislar[nombre] = max(self._aislar[nombre] - len(paquetes), 0)
+            if self._backoff[nombre]:
+                logger.info(f"[SPOOL] {nombre} disponible de nuevo, reinyectando")
+                self._backoff[nombre] = 0
+            if not spool.pendientes:
+                logger.info(f"[SPOOL] {nombre} vaciado")
+
+    def _reinyectar_db(self, paquetes):
+        from app.db.bulk import insert_packets
+        from app.db.client import SessionLocal
+
+        with SessionLocal() as db:
+            try:
+                ids = insert_packets(db, paquetes)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        duplicados = ids.count(None)
+        metrics.DB_PAQUETES.inc(len(paquetes) - duplicados)
+        metrics.DB_DUPLICADOS.inc(duplicados)
+
+    def _reinyectar_redis(self, paquetes):
+        self.cache.guardar_paquetes(paquetes)
@@ -0,0 +1,160 @@
+"""
+Codecs versionados para las lecturas guardadas en Redis (:actual / :historico).
+
+- json:    formato original, un dict JSON con timestamp ISO (legado)
+- struct:  layout fijo little-endian con timestamp en epoch-ms (v1)
+- msgpack: array msgpack con timestamp en epoch-ms (v2, requiere `msgpack`)
+
+Las entradas binarias empiezan con un byte de versión; JSON siempre
+empieza con '{'. decodificar() detecta el formato, así que los lectores
+aceptan ambos mientras conviven datos viejos y nuevos.
+
+Las lecturas de un paquete llevan además el device de origen (campo
+"device"): en struct, los bytes UTF-8 que siguen al cuerpo; en msgpack,
+un elemento más al final del array. Las entradas sin device (anteriores,
+o sin seq) se leen igual.
+"""
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+try:
+    import msgpack
+except ImportError:  # dependencia opcional
+    msgpack = None
+
+VERSION_STRUCT = 1
+VERSION_MSGPACK = 2
+
+TIPOS = ('humedad', 'vibracion', 'inclinacion')
+_TIPO_ID = {tipo: i for i, tipo in enumerate(TIPOS)}
+
+# versión, tipo, ts_ms, seq, alerta
+_CABECERA = struct.Struct('<BBqIB')
+# cuerpo por tipo
+_CUERPOS = {
+    'humedad': struct.Struct('<fH'),      # porcentaje, valor_raw
+    'vibracion': struct.Struct('<IB'),    # pulse, hit
+    'inclinacion': struct.Struct('<B'),   # estado
+}
+_CAMPOS = {
+    'humedad': ('porcentaje', 'valor_raw'),
+    'vibracion': ('pulse', 'hit'),
+    'inclinacion': ('estado',),
+}
+_SIN_SEQ = 0xFFFFFFFF
+
+
+def _ms(ts: datetime) -> int:
+    # Sin pasar los µs por float: el ms tiene que ser exacto para que el
+    # timestamp decodificado coincida con el de la BD. Sin zona es UTC
+    # (app/paquetes.normalizar_ts), no la hora local del proceso
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.replace(microsecond=0).timestamp()) * 1000 + ts.microsecond // 1000
+
+
+def _iso(ms: int) -> str:
+    ts = datetime.fromtimestamp(ms // 1000, timezone.utc).replace(tzinfo=None)
+    return (ts + timedelta(milliseconds=ms % 1000)).isoformat()
+
+
+def _numero(v):
+    """float32 → valor legible (45.5 y no 45.500000..., 40 y no 40.0)"""
+    v = round(v, 3)
+    return int(v) if v.is_integer() else v
+
+
+class JsonCodec:
+    nombre = 'json'
+
+    def codificar(self, data: Dict) -> bytes:
+        return json.dumps({**data, 'timestamp': data['timestamp'].isoformat()}).encode()
+
+    def decodificar(self, raw) -> Dict:
+        return json.loads(raw)
+
+
+class StructCodec:
+    """~15-20 bytes por lectura frente a ~110 del JSON."""
+    nombre = 'struct'
+
+    def codificar(self, data: Dict) -> bytes:
+        tipo = data['tipo']
+        seq = data.get('seq')
+        cabecera = _CABECERA.pack(
+            VERSION_STRUCT, _TIPO_ID[tipo], _ms(data['timestamp']),
+            _SIN_SEQ if seq is None else seq, data.get('alerta', 0) or 0,
+        )
+        cuerpo = _CUERPOS[tipo].pack(*(data[c] for c in _CAMPOS[tipo]))
+        return cabecera + cuerpo + (data.get('device') or '').encode()
+
+    def decodificar(self, raw: bytes) -> Dict:
+        _, tipo_id, ms, seq, alerta = _CABECERA.unpack_from(raw)
+        tipo = TIPOS[tipo_id]
+        valores = _CUERPOS[tipo].unpack_from(raw, _CABECERA.size)
+        data = {c: _numero(v) if isinstance(v, float) else v for c, v in zip(_CAMPOS[tipo], valores)}
+        data['timestamp'] = _iso(ms)
+        data['tipo'] = tipo
+        if seq != _SIN_SEQ:
+            data['seq'] = seq
+            data['alerta'] = alerta
+        device = raw[_CABECERA.size + _CUERPOS[tipo].size:]
+        if device:
+            data['device'] = bytes(device).decode()
+        return data
+
+
+class MsgpackCodec:
+    nombre = 'msgpack'
+
+    def codificar(self, data: Dict) -> bytes:
+        tipo = data['tipo']
+        device = [data['device']] if data.get('device') else []
+        return bytes([VERSION_MSGPACK]) + msgpack.packb([
+            _TIPO_ID[tipo], _ms(data['timestamp']), data.get('seq'), data.get('alerta', 0),
+            *(data[c] for c in _CAMPOS[tipo]), *device,
+        ])
+
+    def decodificar(self, raw: bytes) -> Dict:
+        tipo_id, ms, seq, alerta, *resto = msgpack.unpackb(raw[1:])
+        tipo = TIPOS[tipo_id]
+        n = len(_CAMPOS[tipo])
+        data = dict(zip(_CAMPOS[tipo], resto[:n]))
+        if resto[n:]:
+            data['device'] = resto[n]
+        data['timestamp'] = _iso(ms)
+        data['tipo'] = tipo
+        if seq is not None:
+            data['seq'] = seq
+            data['alerta'] = alerta
+        return data
+
+
+CODECS = {'json': JsonCodec(), 'struct': StructCodec()}
+if msgpack is not None:
+    CODECS['msgpack'] = MsgpackCodec()
+
+_POR_VERSION = {VERSION_STRUCT: CODECS['struct']}
+if msgpack is not None:
+    _POR_VERSION[VERSION_MSGPACK] = CODECS['msgpack']
+
+
+def obtener_codec(nombre: str):
+    try:
+        return CODECS[nombre]
+    except KeyError:
+        raise ValueError(f"Codec desconocido o no disponible: {nombre}") from None
+
+
+def decodificar(raw) -> Dict:
+    """Decodifica una lectura en cualquiera de los formatos conocidos."""
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if raw[:1] == b'{':
+        return json.loads(raw)
+    try:
+        return _POR_VERSION[raw[0]].decodificar(raw)
+    except KeyError:
+        raise ValueError(f"Versión de codec desconocida: {raw[0]}") from None
@@ -3,22 +3,229 @@ Sensor Cache Manager - Gestor de Caché Redis optimizado para datos de sensores
 """
 import time
 import json
-from datetime import datetime, timedelta
+import hashlib
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional
 import redis
+from redis.exceptions import NoScriptError
+
+from funcs.codificacion import obtener_codec, decodificar
+
+# ============ AGREGADOS MÓVILES ============
+
+# ventana → (resolución del bucket en segundos, número de buckets)
+VENTANAS_AGREGADOS = {
+    '1m': (5, 12),
+    '10m': (60, 10),
+    '1h': (300, 12),
+}
+
+# medida → tipo de sensor (prefijo de la clave)
+MEDIDAS_AGREGADOS = {
+    'soil_pct': 'humedad',
+    'soil_raw': 'humedad',
+    'vib_pulse': 'vibracion',
+    'tilt_trans': 'inclinacion',   # número de cambios de estado
+}
+
+# Actualiza count/sum/min/max por bucket para cada ventana, más 'last'.
+# KEYS = [sensor:<tipo>:<id>:agg:<medida>, ...]
+# ARGV = [now, ttl, nv, (nombre, res, nb) * nv, (valor, modo) * #KEYS]
+# modo 't' registra 1 si el valor cambió respecto a 'last' (transiciones).
+# Una muestra más vieja que 'last_ts' (spool, backfill) no toca 'last' ni
+# cuenta transiciones, y si su bucket ya salió de la ventana se descarta:
+# el hash nunca guarda más de nb buckets por ventana.
+AGREGADOS_LUA = """
+local now = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local nv = tonumber(ARGV[3])
+local ventanas = {}
+for i = 0, nv - 1 do
+    ventanas[i + 1] = {ARGV[4 + 3 * i], tonumber(ARGV[5 + 3 * i]), tonumber(ARGV[6 + 3 * i])}
+end
+local base = 4 + 3 * nv
+for k = 1, #KEYS do
+    local key = KEYS[k]
+    local valor = tonumber(ARGV[base + 2 * (k - 1)])
+    local last_ts = tonumber(redis.call('HGET', key, 'last_ts'))
+    local atrasado = last_ts ~= nil and now < last_ts
+    if ARGV[base + 2 * (k - 1) + 1] == 't' then
+        if atrasado then
+            valor = 0
+        else
+            local last = redis.call('HGET', key, 'last')
+            redis.call('HSET', key, 'last', valor, 'last_ts', now)
+            if last and tonumber(last) ~= valor then valor = 1 else valor = 0 end
+        end
+    elseif not atrasado then
+        redis.call('HSET', key, 'last', valor, 'last_ts', now)
+    end
+    for _, v in ipairs(ventanas) do
+        local nombre, res, nb = v[1], v[2], v[3]
+        local b = math.floor(now / res)
+        local head = tonumber(redis.call('HGET', key, nombre .. ':head'))
+        if head == nil or b > head - nb then
+            if head == nil or b > head then
+                if head ~= nil then
+                    for viejo = math.max(head - nb + 1, b - 2 * nb + 1), b - nb do
+                        local q = nombre .. ':' .. viejo .. ':'
+                        redis.call('HDEL', key, q .. 'c', q .. 's', q .. 'n', q .. 'x')
+                    end
+                end
+                redis.call('HSET', key, nombre .. ':head', b)
+            end
+            local p = nombre .. ':' .. b .. ':'
+            redis.call('HINCRBY', key, p .. 'c', 1)
+            redis.call('HINCRBYFLOAT', key, p .. 's', valor)
+            local mn = redis.call('HGET', key, p .. 'n')
+            if not mn or valor < tonumber(mn) then redis.call('HSET', key, p .. 'n', valor) end
+            local mx = redis.call('HGET', key, p .. 'x')
+            if not mx or valor > tonumber(mx) then redis.call('HSET', key, p .. 'x', valor) end
+        end
+    end
+    redis.call('EXPIRE', key, ttl)
+end
+return #KEYS
+"""
+
+
+RIESGO_KEY = "riesgo:sensores"  # ZSET sensor → riesgo 0..1 (app/risk.py)
+
+# ============ ALERTAS ============
+
+ALERTAS_SEQ_KEY = "alertas:seq"        # contador de ids de alerta
+ALERTAS_INDICE_KEY = "alertas:indice"  # ZSET id → score temporal (µs), alertas activas
+ALERTAS_LEGADO_KEY = "alertas:activas"  # SET del formato anterior (ver migrar_alertas)
+
+# Crea una alerta con id único (INCR) y la indexa por tiempo.
+# El score es estrictamente creciente aunque coincidan los µs, así que
+# sirve de cursor de paginación. De paso poda las entradas más viejas
+# que el TTL de la alerta en ambos índices. Función compartida por
+# CREAR_ALERTA_LUA e INCLINACION_LUA.
+_CREAR_ALERTA_FN = """
+local function crear_alerta(k_seq, k_indice, k_indice_tipo, sensor, tipo, mensaje, ts, ahora, ttl)
+    ahora = tonumber(ahora)
+    ttl = tonumber(ttl)
+    local id = sensor .. ':' .. tipo .. ':' .. redis.call('INCR', k_seq)
+    local score = ahora
+    local ultimo = redis.call('ZREVRANGE', k_indice, 0, 0, 'WITHSCORES')
+    if ultimo[2] and tonumber(ultimo[2]) >= score then score = tonumber(ultimo[2]) + 1 end
+    local alerta = cjson.encode({
+        id = id, sensor_id = sensor, tipo_sensor = tipo, mensaje = mensaje,
+        timestamp = ts, activa = true, resuelta = false
+    })
+    redis.call('SETEX', 'alerta:' .. id, ttl, alerta)
+    local limite = '(' .. (ahora - ttl * 1000000)
+    redis.call('ZREMRANGEBYSCORE', k_indice, '-inf', limite)
+    redis.call('ZREMRANGEBYSCORE', k_indice_tipo, '-inf', limite)
+    redis.call('ZADD', k_indice, score, id)
+    redis.call('ZADD', k_indice_tipo, score, id)
+    redis.call('PUBLISH', 'canal:alertas', alerta)
+    return id
+end
+"""
+
+# KEYS = [alertas:seq, alertas:indice, alertas:indice:<tipo>]
+# ARGV = [sensor_id, tipo, mensaje, timestamp_iso, ahora_us, ttl]
+CREAR_ALERTA_LUA = _CREAR_ALERTA_FN + """
+return crear_alerta(KEYS[1], KEYS[2], KEYS[3], ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5], ARGV[6])
+"""
+
+# Escribe el :actual de una inclinación y, si `alertar` es '1' y el
+# estado pasa de 0 a 1, crea la alerta en el mismo script: el estado
+# previo se lee en Redis, sin un segundo envío. Lee los tres codecs
+# (funcs/codificacion.py): JSON, struct v1 (estado en el byte 16, tras
+# la cabecera de 15) y msgpack v2 (quinto elemento del array).
+# KEYS = [sensor:inclinacion:<id>:actual, alertas:seq, alertas:indice,
+#         alertas:indice:inclinacion]
+# ARGV = [valor, ttl, estado, alertar, sensor_id, mensaje, timestamp_iso,
+#         ahora_us, ttl_alerta]
+INCLINACION_LUA = _CREAR_ALERTA_FN + """
+local function estado_de(v)
+    local version = string.byte(v, 1)
+    if version == 123 then return tonumber(cjson.decode(v).estado) end
+    if version == 1 then return string.byte(v, 16) end
+    if version == 2 then return tonumber(cmsgpack.unpack(string.sub(v, 2))[5]) end
+    return nil
+end
+local previo = redis.call('GET', KEYS[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+if ARGV[4] == '1' and ARGV[3] == '1' and previo and estado_de(previo) == 0 then
+    return crear_alerta(KEYS[2], KEYS[3], KEYS[4], ARGV[5], 'inclinacion', ARGV[6], ARGV[7], ARGV[8], ARGV[9])
+end
+return false
+"""
+
+
+# SET de :actual y HSET del dashboard solo si :actual sigue valiendo lo
+# que se leyó antes ('' = no existía). Devuelve 1 si escribió.
+# KEYS = [sensor:<tipo>:<id>:actual, dashboard:sensores:<tipo>]
+# ARGV = [valor_leído, valor, ttl, sensor_id]
+ACTUAL_SI_IGUAL_LUA = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('HSET', KEYS[2], ARGV[4], ARGV[2])
+return 1
+"""
+
+
+def _indice_alertas(tipo_sensor: Optional[str] = None) -> str:
+    return f"{ALERTAS_INDICE_KEY}:{tipo_sensor}" if tipo_sensor else ALERTAS_INDICE_KEY
+
+
+# Las horas de las lecturas son UTC sin zona (app/paquetes.normalizar_ts),
+# sea cual sea la TZ del proceso
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _hora_utc(iso: str) -> datetime:
+    """ISO de una lectura → datetime UTC sin zona (las que traen zona se convierten)"""
+    ts = datetime.fromisoformat(iso)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _epoch(ts: datetime) -> float:
+    """datetime UTC sin zona (o con zona) → segundos desde epoch"""
+    return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _us(ts: float) -> int:
+    return int(ts * 1000000)
+
+
+def _sha(script: str) -> str:
+    return hashlib.sha1(script.encode()).hexdigest()
+
 
 class SensorCacheManager:
     """
     Gestor de caché Redis optimizado para datos de sensores en tiempo real
     """
 
-    def __init__(self, host='localhost', port=6379, db=0):
-        self.redis_client = redis.Redis(
+    def __init__(self, host='localhost', port=6379, db=0, codec='json', reglas=None,
+                 redis_client=None, redis_raw=None):
+        # Clientes inyectados (pools compartidos) o, si no, propios
+        self.redis_client = redis_client or redis.Redis(
             host=host,
             port=port,
             db=db,
             decode_responses=True
         )
+        # Cliente sin decode: lecturas de sensores (pueden ser binarias)
+        self.redis_raw = redis_raw or redis.Redis(host=host, port=port, db=db)
+
+        # Formato de :actual / :historico (ver funcs/codificacion.py)
+        self.codec = obtener_codec(codec)
+
+        # Motor de reglas de alerta con histéresis y cooldown (objeto con
+        # evaluar(samples, timestamp) → [(sensor_id, tipo, mensaje)] y,
+        # opcionales, sin_estado / sembrar para arrancar desde :actual).
+        # Sin él se usan los umbrales fijos: humedad > 80 / < 20, cada golpe
+        # y el paso de inclinación 0 → 1.
+        self.reglas = reglas
 
         # Configuración de TTL (en segundos)
         self.TTL_ESTADO_ACTUAL = 3600  # 1 hora - estado más reciente
@@ -33,44 +240,63 @@ class SensorCacheManager:
         pulse: número de pulsos
         hit: 0 o 1 (detección de golpe)
         """
-        timestamp = datetime.now().isoformat()
+        now = _ahora()
+        pipe = self.redis_raw.pipeline(transaction=False)
+        self._pipe_vibracion(pipe, sensor_id, pulse, hit, now)
+        self._pipe_reglas(pipe, [{'id': sensor_id, 'vib': {'pulse': pulse, 'hit': hit}}], now)
+        self._pipe_agregados(pipe, [(sensor_id, 'vib_pulse', pulse)], now)
+        self._ejecutar(pipe)
+        return True
+
+    def _pipe_vibracion(self, pipe, sensor_id: str, pulse: int, hit: int, now: datetime,
+                        paquete: Optional[Dict] = None, atrasadas: Optional[Dict] = None):
+        """
+        Encola en `pipe` todas las escrituras de una lectura de vibración
+        (con `atrasadas`, ver guardar_atrasados)
+        """
 
         # 1. Estado actual del sensor (clave simple, se sobrescribe)
         estado_key = f"sensor:vibracion:{sensor_id}:actual"
         estado = {
             'pulse': pulse,
             'hit': hit,
-            'timestamp': timestamp,
-            'tipo': 'vibracion'
+            'timestamp': now,
+            'tipo': 'vibracion',
+            **(paquete or {})
         }
-        self.redis_client.setex(
-            estado_key,
-            self.TTL_ESTADO_ACTUAL,
-            json.dumps(estado)
-        )
-
-        # 2. Agregar a histórico reciente (lista con las últimas 100 lecturas)
-        historico_key = f"sensor:vibracion:{sensor_id}:historico"
-        self.redis_client.lpush(historico_key, json.dumps(estado))
-        self.redis_client.ltrim(historico_key, 0, 99)  # Mantener solo 100
-        self.redis_client.expire(historico_key, self.TTL_HISTORICO_RECIENTE)
-
-        # 3. Si hay hit, generar alerta
-        if hit == 1:
-            self._generar_alerta(sensor_id, 'vibracion', f'Golpe detectado (pulse: {pulse})')
+        valor = self.codec.codificar(estado)
+        if atrasadas is not None:
+            self._anotar_atrasada(pipe, atrasadas, 'vibracion', sensor_id, now, valor)
+        else:
+            pipe.setex(
+                estado_key,
+                self.TTL_ESTADO_ACTUAL,
+                valor
+            )
+
+            self._pipe_registro(pipe, 'vibracion', sensor_id, valor)
+
+            # 2. Agregar a histórico reciente (lista con las últimas 100 lecturas)
+            historico_key = f"sensor:vibracion:{sensor_id}:historico"
+            pipe.lpush(historico_key, valor)
+            pipe.ltrim(historico_key, 0, 99)  # Mantener solo 100
+            pipe.expire(historico_key, self.TTL_HISTORICO_RECIENTE)
+
+        # 3. Si hay hit, generar alerta (con reglas, ver _pipe_reglas)
+        if hit == 1 and self.reglas is None:
+            self._generar_alerta(sensor_id, 'vibracion', f'Golpe detectado (pulse: {pulse})', pipe=pipe)
 
         # 4. Estadísticas en tiempo real (usando Sorted Set)
         stats_key = f"sensor:vibracion:{sensor_id}:stats"
-        self.redis_client.zadd(
+        pipe.zadd(
             stats_key,
-            {timestamp: pulse},
+            {now.isoformat(): pulse},
             nx=False
         )
         # Mantener solo últimos 1000 registros
-        self.redis_client.zremrangebyrank(stats_key, 0, -1001)
-        self.redis_client.expire(stats_key, self.TTL_HISTORICO_RECIENTE)
+        pipe.zremrangebyrank(stats_key, 0, -1001)
+        pipe.expire(stats_key, self.TTL_HISTORICO_RECIENTE)
 
-        return True
     # ============ SENSOR DE INCLINACIÓN ============
 
     def guardar_inclinacion(self, sensor_id: str, estado: int):
@@ -78,33 +304,51 @@ class SensorCacheManager:
         Guarda estado de sensor de inclinación
         estado: 0 (normal) o 1 (inclinado)
         """
-        timestamp = datetime.now().isoformat()
+        now = _ahora()
+        pipe = self.redis_raw.pipeline(transaction=False)
+        self._pipe_inclinacion(pipe, sensor_id, estado, now)
+        self._pipe_reglas(pipe, [{'id': sensor_id, 'tilt': estado}], now)
+        self._pipe_agregados(pipe, [(sensor_id, 'tilt_trans', estado)], now)
+        self._ejecutar(pipe)
+        return True
+
+    def _pipe_inclinacion(self, pipe, sensor_id: str, estado: int, now: datetime,
+                          paquete: Optional[Dict] = None, atrasadas: Optional[Dict] = None):
+        """
+        Encola en `pipe` las escrituras de una lectura de inclinación.
+        Sin motor de reglas, INCLINACION_LUA crea además la alerta del
+        paso de normal a inclinado con el estado previo que lee en Redis
+        (no con `atrasadas`: el estado previo no es el de antes de la
+        lectura).
+        """
 
         estado_key = f"sensor:inclinacion:{sensor_id}:actual"
         data = {
             'estado': estado,
-            'timestamp': timestamp,
-            'tipo': 'inclinacion'
+            'timestamp': now,
+            'tipo': 'inclinacion',
+            **(paquete or {})
         }
-        self.redis_client.setex(
-            estado_key,
-            self.TTL_ESTADO_ACTUAL,
-            json.dumps(data)
+        valor = self.codec.codificar(data)
+        if atrasadas is not None:
+            self._anotar_atrasada(pipe, atrasadas, 'inclinacion', sensor_id, now, valor)
+            return
+
+        self._pipe_lua(
+            pipe, INCLINACION_LUA,
+            [estado_key, ALERTAS_SEQ_KEY, ALERTAS_INDICE_KEY, _indice_alertas('inclinacion')],
+            [valor, self.TTL_ESTADO_ACTUAL, estado, 1 if self.reglas is None else 0,
+             sensor_id, 'Cambio de posición detectado', _ahora().isoformat(),
+             _us(time.time()), self.TTL_ALERTAS_ACTIVAS],
         )
 
+        self._pipe_registro(pipe, 'inclinacion', sensor_id, valor)
+
         # Histórico
         historico_key = f"sensor:inclinacion:{sensor_id}:historico"
-        self.redis_client.lpush(historico_key, json.dumps(data))
-        self.redis_client.ltrim(historico_key, 0, 99)
-        self.redis_client.expire(historico_key, self.TTL_HISTORICO_RECIENTE)
-
-        # Alerta si cambió a inclinado
-        if estado == 1:
-            estado_previo = self.obtener_estado_actual(sensor_id, 'inclinacion')
-            if estado_previo and estado_previo.get('estado') == 0:
-                self._generar_alerta(sensor_id, 'inclinacion', 'Cambio de posición detectado')
-
-        return True
+        pipe.lpush(historico_key, valor)
+        pipe.ltrim(historico_key, 0, 99)
+        pipe.expire(historico_key, self.TTL_HISTORICO_RECIENTE)
 
     # ============ SENSOR DE HUMEDAD ============
 
@@ -114,90 +358,375 @@ class SensorCacheManager:
         porcentaje: valor de humedad en %
         valor_raw: valor bruto del sensor (0-1024)
         """
-        now = datetime.now()
-        timestamp = now.isoformat()
-        score = now.timestamp()
+        now = _ahora()
+        pipe = self.redis_raw.pipeline(transaction=False)
+        self._pipe_humedad(pipe, sensor_id, porcentaje, valor_raw, now)
+        self._pipe_reglas(pipe, [{'id': sensor_id, 'soil': {'pct': porcentaje, 'raw': valor_raw}}], now)
+        self._pipe_agregados(
+            pipe, [(sensor_id, 'soil_pct', porcentaje), (sensor_id, 'soil_raw', valor_raw)], now
+        )
+        self._ejecutar(pipe)
+        return True
+
+    def _pipe_humedad(self, pipe, sensor_id: str, porcentaje: float, valor_raw: int, now: datetime,
+                      paquete: Optional[Dict] = None, atrasadas: Optional[Dict] = None):
+        """
+        Encola en `pipe` todas las escrituras de una lectura de humedad
+        (con `atrasadas`, ver guardar_atrasados)
+        """
 
         estado_key = f"sensor:humedad:{sensor_id}:actual"
         data = {
             'porcentaje': porcentaje,
             'valor_raw': valor_raw,
-            'timestamp': timestamp,
-            'tipo': 'humedad'
+            'timestamp': now,
+            'tipo': 'humedad',
+            **(paquete or {})
         }
-        self.redis_client.setex(
-            estado_key,
-            self.TTL_ESTADO_ACTUAL,
-            json.dumps(data)
-        )
+        valor = self.codec.codificar(data)
+        if atrasadas is not None:
+            self._anotar_atrasada(pipe, atrasadas, 'humedad', sensor_id, now, valor)
+        else:
+            pipe.setex(
+                estado_key,
+                self.TTL_ESTADO_ACTUAL,
+                valor
+            )
+
+            self._pipe_registro(pipe, 'humedad', sensor_id, valor)
+
+            # Histórico
+            historico_key = f"sensor:humedad:{sensor_id}:historico"
+            pipe.lpush(historico_key, valor)
+            pipe.ltrim(historico_key, 0, 99)
+            pipe.expire(historico_key, self.TTL_HISTORICO_RECIENTE)
+
+        # Alertas por umbrales (con reglas, ver _pipe_reglas)
+        if self.reglas is None:
+            if porcentaje > 80:
+                self._generar_alerta(sensor_id, 'humedad', f'Humedad alta: {porcentaje}%', pipe=pipe)
+            elif porcentaje < 20:
+                self._generar_alerta(sensor_id, 'humedad', f'Humedad baja: {porcentaje}%', pipe=pipe)
+
+    # ============ REGISTRO + DASHBOARD ============
+
+    def _pipe_registro(self, pipe, tipo: str, sensor_id: str, valor):
+        """
+        Mantiene en escritura el registro de sensores conocidos por tipo
+        (SET sensores:<tipo>) y el snapshot del dashboard
+        (HASH dashboard:sensores:<tipo>, sensor_id → estado actual).
+        """
+        pipe.sadd(f"sensores:{tipo}", sensor_id)
+        pipe.hset(f"dashboard:sensores:{tipo}", sensor_id, valor)
 
-        # Histórico
-        historico_key = f"sensor:humedad:{sensor_id}:historico"
-        self.redis_client.lpush(historico_key, json.dumps(data))
-        self.redis_client.ltrim(historico_key, 0, 99)
-        self.redis_client.expire(historico_key, self.TTL_HISTORICO_RECIENTE)
+    @staticmethod
+    def _anotar_atrasada(pipe, atrasadas: Dict, tipo: str, sensor_id: str, now: datetime, valor):
+        """
+        Registra el sensor y guarda en `atrasadas` su lectura más nueva
+        ({(tipo, sensor_id): (timestamp, valor)}) en lugar de escribirla.
+        """
+        pipe.sadd(f"sensores:{tipo}", sensor_id)
+        previa = atrasadas.get((tipo, sensor_id))
+        if previa is None or now >= previa[0]:
+            atrasadas[(tipo, sensor_id)] = (now, valor)
 
-        # Promedios móviles (últimos 10 minutos)
-        promedio_key = f"sensor:humedad:{sensor_id}:promedio"
+    def obtener_sensores(self, tipo_sensor: str) -> List[str]:
+        """Ids de sensores conocidos de un tipo (sin SCAN del keyspace)"""
+        return sorted(self.redis_client.smembers(f"sensores:{tipo_sensor}"))
 
-        self.redis_client.zadd(
-            promedio_key,
-            {timestamp: score},   # score es float UNIX time
-            nx=False
-        )
+    def reconstruir_registro(self) -> int:
+        """
+        Rellena el registro y el snapshot del dashboard a partir de las
+        claves existentes (datos escritos antes del registro): un SCAN de
+        las listas :historico y un MGET de los :actual. Idempotente.
+        """
+        total = 0
+        for tipo in ['vibracion', 'inclinacion', 'humedad']:
+            ids = [key.decode().split(':')[2] for key in
+                   self.redis_raw.scan_iter(match=f"sensor:{tipo}:*:historico", count=1000)]
+            if not ids:
+                continue
+            actuales = self.redis_raw.mget([f"sensor:{tipo}:{sensor_id}:actual" for sensor_id in ids])
+            pipe = self.redis_raw.pipeline(transaction=False)
+            pipe.sadd(f"sensores:{tipo}", *ids)
+            for sensor_id, valor in zip(ids, actuales):
+                if valor is not None:
+                    pipe.hsetnx(f"dashboard:sensores:{tipo}", sensor_id, valor)
+            pipe.execute()
+            total += len(ids)
+        return total
+
+    # ============ PAQUETE COMPLETO ============
+
+    def guardar_paquete(self, samples: List[Dict], seq: Optional[int] = None, alerta: int = 0,
+                        timestamp: Optional[datetime] = None, device: Optional[str] = None) -> bool:
+        """
+        Guarda todas las lecturas de un paquete ESP32 en un único round trip.
 
-        # Eliminar registros más antiguos de 10 minutos
-        hace_10_min = (datetime.now() - timedelta(minutes=10)).timestamp()
+        samples: lista en el formato del paquete MQTT
+            [{"id": 1, "soil": {"raw": 612, "pct": 40}, "tilt": 0,
+              "vib": {"pulse": 900, "hit": 0}}, ...]
 
-        self.redis_client.zremrangebyscore(promedio_key, '-inf', hace_10_min)
-        self.redis_client.expire(promedio_key, self.TTL_HISTORICO_RECIENTE)
+        Mantiene las mismas claves, TTLs y alertas que guardar_humedad,
+        guardar_inclinacion y guardar_vibracion, incluida la alerta de
+        inclinación 0 → 1 (se decide en Redis, ver INCLINACION_LUA).
 
-        # Alertas por umbrales
-        if porcentaje > 80:
-            self._generar_alerta(sensor_id, 'humedad', f'Humedad alta: {porcentaje}%')
-        elif porcentaje < 20:
-            self._generar_alerta(sensor_id, 'humedad', f'Humedad baja: {porcentaje}%')
+        seq/alerta/device se guardan en cada lectura para que el Archiver
+        pueda reconstruir el paquete al moverlo a Postgres con la misma
+        clave (device, seq, timestamp) que usó el writer. `timestamp` es la
+        hora del paquete (por defecto, ahora).
+        """
+        return self.guardar_paquetes([
+            {'samples': samples, 'seq': seq, 'alerta': alerta, 'timestamp': timestamp, 'device': device}
+        ])
 
-        return True
+    def guardar_paquetes(self, paquetes: List[Dict]) -> bool:
+        """
+        Como guardar_paquete pero para varios paquetes en el mismo pipeline
+        (reinyección del spool tras una caída de Redis).
 
-    # ============ GESTIÓN DE ALERTAS ============
+        paquetes = [{"samples": [...], "seq": 10, "alerta": 0,
+                     "timestamp": datetime(...), "device": "..."}, ...]
 
-    def _generar_alerta(self, sensor_id: str, tipo_sensor: str, mensaje: str):
-        """
-        Genera una alerta y la almacena en caché
+        "timestamp" es la hora del paquete (por defecto, ahora) y "device"
+        su origen (opcional).
+        Los paquetes se aplican en orden, así que los cambios de
+        inclinación entre paquetes consecutivos se detectan igual.
         """
-        timestamp = datetime.now().isoformat()
-        alerta_id = f"{sensor_id}:{tipo_sensor}:{int(time.time())}"
+        pipe = self.redis_raw.pipeline(transaction=False)
+        self._pipe_paquetes(pipe, paquetes)
+        self._ejecutar(pipe)
+        return True
 
-        alerta = {
-            'id': alerta_id,
-            'sensor_id': sensor_id,
-            'tipo_sensor': tipo_sensor,
-            'mensaje': mensaje,
-            'timestamp': timestamp,
-            'activa': True,
-            'resuelta': False
-        }
+    def guardar_atrasados(self, paquetes: List[Dict]) -> int:
+        """
+        guardar_paquetes para lecturas que pueden ser más viejas que las
+        de Redis (backfill): agregados, reglas y registro igual, pero sin
+        LPUSH a :historico (quedarían por delante de lecturas más nuevas).
+        :actual y el dashboard solo toman la lectura más nueva de cada
+        sensor, y solo si es más nueva que la guardada (o, sin lectura
+        guardada, si no ha superado TTL_ESTADO_ACTUAL). La escritura es
+        condicional (ACTUAL_SI_IGUAL_LUA): si la ingesta escribió entre
+        medias, gana la ingesta.
+        Devuelve cuántos :actual se actualizaron.
+        """
+        atrasadas = {}
+        pipe = self.redis_raw.pipeline(transaction=False)
+        self._pipe_paquetes(pipe, paquetes, atrasadas)
+        self._ejecutar(pipe)
+        if not atrasadas:
+            return 0
+
+        claves = list(atrasadas)
+        guardadas = self.redis_raw.mget([f"sensor:{tipo}:{sid}:actual" for tipo, sid in claves])
+        limite = _ahora() - timedelta(seconds=self.TTL_ESTADO_ACTUAL)
+        pipe = self.redis_raw.pipeline(transaction=False)
+        for (tipo, sid), guardada in zip(claves, guardadas):
+            ts, valor = atrasadas[(tipo, sid)]
+            referencia = _hora_utc(decodificar(guardada)['timestamp']) if guardada else limite
+            if ts <= referencia:
+                continue
+            self._pipe_lua(
+                pipe, ACTUAL_SI_IGUAL_LUA,
+                [f"sensor:{tipo}:{sid}:actual", f"dashboard:sensores:{tipo}"],
+                [guardada or b'', valor, self.TTL_ESTADO_ACTUAL, sid],
+            )
+        return sum(self._ejecutar(pipe))
+
+    def _pipe_paquetes(self, pipe, paquetes: List[Dict], atrasadas: Optional[Dict] = None):
+        """
+        Encola en `pipe` todas las escrituras de `paquetes` (ver
+        guardar_paquetes). Solo encola, no ejecuta: sirve igual para un
+        pipeline de redis.asyncio (app/async_ingest.py). Con `atrasadas`
+        no escribe :actual, dashboard ni :historico (ver guardar_atrasados).
+        """
+        for p in paquetes:
+            now = p.get('timestamp') or _ahora()
+            seq = p.get('seq')
+            paquete = None
+            if seq is not None:
+                paquete = {'seq': seq, 'alerta': p.get('alerta', 0)}
+                if p.get('device'):
+                    paquete['device'] = p['device']
+            medidas = []
+
+            for sample in p['samples']:
+                sid = str(sample["id"])
+
+                if "soil" in sample:
+                    self._pipe_humedad(pipe, sid, sample["soil"]["pct"], sample["soil"]["raw"], now, paquete,
+                                       atrasadas)
+                    medidas.append((sid, 'soil_pct', sample["soil"]["pct"]))
+                    medidas.append((sid, 'soil_raw', sample["soil"]["raw"]))
+
+                if "tilt" in sample:
+                    self._pipe_inclinacion(pipe, sid, sample["tilt"], now, paquete, atrasadas)
+                    medidas.append((sid, 'tilt_trans', sample["tilt"]))
+
+                if "vib" in sample:
+                    self._pipe_vibracion(pipe, sid, sample["vib"]["pulse"], sample["vib"]["hit"], now, paquete,
+                                         atrasadas)
+                    medidas.append((sid, 'vib_pulse', sample["vib"]["pulse"]))
+
+            self._pipe_reglas(pipe, p['samples'], now)
+            self._pipe_agregados(pipe, medidas, now)
+
+    # ============ REGLAS DE ALERTA ============
+
+    def _pipe_reglas(self, pipe, samples: List[Dict], now: datetime):
+        """
+        Encola en `pipe` las alertas de las reglas que cambian a activas
+        con estos samples. Sin transición no hay ninguna escritura.
+        """
+        if self.reglas is None:
+            return
+        if hasattr(self.reglas, 'sin_estado'):
+            nuevos = self.reglas.sin_estado(samples)
+            if nuevos:
+                self.reglas.sembrar(self._lecturas_previas(nuevos))
+        for sensor_id, tipo_sensor, mensaje in self.reglas.evaluar(samples, now):
+            self._generar_alerta(sensor_id, tipo_sensor, mensaje, pipe=pipe)
+
+    def _lecturas_previas(self, sensor_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Última lectura de cada sensor (:actual) con la forma de un sample
+        del ESP32, para sembrar el motor de reglas tras un reinicio. Se
+        lee antes de ejecutar el pipeline, así que es la anterior al
+        paquete actual. Un MGET por sensor nuevo, solo la primera vez.
+        """
+        claves = [(sid, tipo) for sid in sensor_ids for tipo in ('humedad', 'inclinacion', 'vibracion')]
+        previos = {sid: {'id': sid} for sid in sensor_ids}
+        guardadas = self.redis_raw.mget([f"sensor:{tipo}:{sid}:actual" for sid, tipo in claves])
+        for (sid, tipo), raw in zip(claves, guardadas):
+            if raw is None:
+                continue
+            data = decodificar(raw)
+            if tipo == 'humedad':
+                previos[sid]['soil'] = {'pct': data['porcentaje'], 'raw': data['valor_raw']}
+            elif tipo == 'inclinacion':
+                previos[sid]['tilt'] = data['estado']
+            else:
+                previos[sid]['vib'] = {'pulse': data['pulse'], 'hit': data['hit']}
+        return previos
+
+    # ============ AGREGADOS MÓVILES ============
+
+    def _pipe_agregados(self, pipe, medidas, now: datetime):
+        """
+        Encola en `pipe` un único EVALSHA que actualiza los agregados
+        (1m/10m/1h) de todas las medidas [(sensor_id, medida, valor), ...].
+        """
+        if not medidas:
+            return
+
+        keys = [
+            f"sensor:{MEDIDAS_AGREGADOS[medida]}:{sensor_id}:agg:{medida}"
+            for sensor_id, medida, _ in medidas
+        ]
+        args = [_epoch(now), self.TTL_HISTORICO_RECIENTE, len(VENTANAS_AGREGADOS)]
+        for nombre, (res, nb) in VENTANAS_AGREGADOS.items():
+            args.extend([nombre, res, nb])
+        for _, medida, valor in medidas:
+            args.extend([valor, 't' if medida == 'tilt_trans' else 'v'])
+
+        self._pipe_lua(pipe, AGREGADOS_LUA, keys, args)
+
+    def _pipe_lua(self, pipe, script: str, keys: List, args: List) -> int:
+        """
+        Encola EVALSHA en `pipe` y lo anota en el propio pipeline para que
+        _ejecutar haga EVAL si el script no estaba cargado.
+        Devuelve el índice del resultado.
+        """
+        idx = len(pipe)
+        pipe.evalsha(_sha(script), len(keys), *keys, *args)
+        if not hasattr(pipe, 'scripts_lua'):
+            pipe.scripts_lua = []
+        pipe.scripts_lua.append((idx, script, keys, args))
+        return idx
+
+    def _ejecutar(self, pipe) -> List:
+        """
+        Ejecuta `pipe` y reintenta con EVAL solo los scripts que Redis no
+        tenía en caché (primer uso o reinicio del servidor).
+        """
+        lua = getattr(pipe, 'scripts_lua', [])
+        resultados = pipe.execute(raise_on_error=False)
+        pipe.scripts_lua = []
+        for idx, script, keys, args in lua:
+            if isinstance(resultados[idx], NoScriptError):
+                resultados[idx] = self.redis_raw.eval(script, len(keys), *keys, *args)
+        for resultado in resultados:
+            if isinstance(resultado, Exception):
+                raise resultado
+        return resultados
+
+    def obtener_agregados(self, sensor_id: str, medida: str) -> Dict:
+        """
+        Agregados móviles de una medida: soil_pct, soil_raw, vib_pulse o
+        tilt_trans. Coste O(1): un HGETALL de un hash con tamaño acotado
+        por el número de buckets, sin importar la tasa de ingesta.
 
-        # Guardar alerta individual
-        alerta_key = f"alerta:{alerta_id}"
-        self.redis_client.setex(
-            alerta_key,
-            self.TTL_ALERTAS_ACTIVAS,
-            json.dumps(alerta)
-        )
+        {'1m': {'count', 'sum', 'min', 'max', 'avg'}, '10m': {...},
+         '1h': {...}, 'last': valor, 'last_ts': iso}
+        """
+        key = f"sensor:{MEDIDAS_AGREGADOS[medida]}:{sensor_id}:agg:{medida}"
+        campos = self.redis_client.hgetall(key)
+        return self._resumir_agregados(campos, time.time())
+
+    @staticmethod
+    def _resumir_agregados(campos: Dict, now: float) -> Dict:
+        resumen = {}
+        for nombre, (res, nb) in VENTANAS_AGREGADOS.items():
+            desde = int(now // res) - nb + 1
+            count, total, minimo, maximo = 0, 0.0, None, None
+            for bucket in range(desde, desde + nb):
+                p = f"{nombre}:{bucket}:"
+                c = campos.get(p + 'c')
+                if c is None:
+                    continue
+                count += int(c)
+                total += float(campos[p + 's'])
+                mn, mx = float(campos[p + 'n']), float(campos[p + 'x'])
+                minimo = mn if minimo is None else min(minimo, mn)
+                maximo = mx if maximo is None else max(maximo, mx)
+            resumen[nombre] = {
+                'count': count,
+                'sum': total,
+                'min': minimo,
+                'max': maximo,
+                'avg': round(total / count, 2) if count else None,
+            }
+
+        last_ts = campos.get('last_ts')
+        resumen['last'] = float(campos['last']) if 'last' in campos else None
+        resumen['last_ts'] = datetime.fromtimestamp(float(last_ts), timezone.utc).replace(tzinfo=None).isoformat() if last_ts else None
+        return resumen
 
-        # Agregar a set de alertas activas
-        alertas_activas_key = "alertas:activas"
-        self.redis_client.sadd(alertas_activas_key, alerta_id)
+    # ============ GESTIÓN DE ALERTAS ============
 
-        # Publicar en canal Pub/Sub para notificaciones en tiempo real
-        self.redis_client.publish('canal:alertas', json.dumps(alerta))
+    def _generar_alerta(self, sensor_id: str, tipo_sensor: str, mensaje: str, pipe=None):
+        """
+        Genera una alerta y la almacena en caché (script CREAR_ALERTA_LUA).
+        Si se pasa `pipe`, se encola en ese pipeline y devuelve None;
+        si no, la envía y devuelve el id de la alerta.
+        """
+        propio = pipe is None
+        if propio:
+            pipe = self.redis_raw.pipeline(transaction=False)
+
+        idx = self._pipe_lua(
+            pipe, CREAR_ALERTA_LUA,
+            [ALERTAS_SEQ_KEY, ALERTAS_INDICE_KEY, _indice_alertas(tipo_sensor)],
+            [sensor_id, tipo_sensor, mensaje, _ahora().isoformat(),
+             _us(time.time()), self.TTL_ALERTAS_ACTIVAS],
+        )
 
-        return alerta_id
+        if propio:
+            return self._ejecutar(pipe)[idx].decode()
+        return None
 
     def resolver_alerta(self, alerta_id: str):
-        """Marca una alerta como resuelta"""
+        """Marca una alerta como resuelta y la quita de los índices"""
         alerta_key = f"alerta:{alerta_id}"
         alerta_data = self.redis_client.get(alerta_key)
 
@@ -205,98 +734,211 @@ class SensorCacheManager:
             alerta = json.loads(alerta_data)
             alerta['resuelta'] = True
             alerta['activa'] = False
-            alerta['timestamp_resolucion'] = datetime.now().isoformat()
+            alerta['timestamp_resolucion'] = _ahora().isoformat()
 
-            self.redis_client.setex(alerta_key, self.TTL_ALERTAS_ACTIVAS, json.dumps(alerta))
-            self.redis_client.srem("alertas:activas", alerta_id)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.setex(alerta_key, self.TTL_ALERTAS_ACTIVAS, json.dumps(alerta))
+            pipe.zrem(ALERTAS_INDICE_KEY, alerta_id)
+            pipe.zrem(_indice_alertas(alerta['tipo_sensor']), alerta_id)
+            pipe.execute()
 
             return True
         return False
 
-    def obtener_alertas_activas(self) -> List[Dict]:
-        """Obtiene todas las alertas activas"""
-        alertas_ids = self.redis_client.smembers("alertas:activas")
-        alertas = []
+    def obtener_alertas_activas(self, tipo_sensor: Optional[str] = None) -> List[Dict]:
+        """Obtiene todas las alertas activas, de la más nueva a la más vieja"""
+        return self.listar_alertas(tipo_sensor, limite=None)['alertas']
+
+    def listar_alertas(self, tipo_sensor: Optional[str] = None, limite: Optional[int] = 50,
+                       cursor: Optional[str] = None) -> Dict:
+        """
+        Página de alertas activas, de la más nueva a la más vieja.
+
+        tipo_sensor: filtra por 'vibracion', 'inclinacion' o 'humedad'
+        limite: tamaño de página (None = todas)
+        cursor: valor 'siguiente' de la página anterior
+
+        Devuelve {'alertas': [...], 'siguiente': cursor o None}.
+        Coste: un pipeline (poda + ZREVRANGEBYSCORE) y un MGET del tamaño
+        de la página, independiente del histórico acumulado.
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        idx = self._pipe_alertas(pipe, tipo_sensor, limite, cursor)
+        return self._pagina_alertas(pipe.execute()[idx], limite)
 
+    def _pipe_alertas(self, pipe, tipo_sensor: Optional[str], limite: Optional[int],
+                      cursor: Optional[str] = None) -> int:
+        """
+        Encola en `pipe` la poda por TTL del índice y la lectura de una
+        página. Devuelve el índice del resultado con [(id, score), ...].
+        """
+        indice = _indice_alertas(tipo_sensor)
+        pipe.zremrangebyscore(indice, '-inf', f"({_us(time.time() - self.TTL_ALERTAS_ACTIVAS)}")
+        idx = len(pipe)
+        pipe.zrevrangebyscore(
+            indice, f"({cursor}" if cursor else '+inf', '-inf',
+            start=0 if limite else None, num=limite, withscores=True
+        )
+        return idx
+
+    def _pagina_alertas(self, entradas, limite: Optional[int]) -> Dict:
+        """
+        Trae en un MGET las alertas de una página [(id, score), ...].
+        Los ids cuya clave ya expiró se quitan de los índices.
+        """
+        ids = [a.decode() if isinstance(a, bytes) else a for a, _ in entradas]
+        alertas = []
+        huerfanas = []
+        if ids:
+            for alerta_id, data in zip(ids, self.redis_client.mget([f"alerta:{a}" for a in ids])):
+                if data:
+                    alertas.append(json.loads(data))
+                else:
+                    huerfanas.append(alerta_id)
+        if huerfanas:
+            self._quitar_de_indices(huerfanas)
+
+        siguiente = None
+        if limite and len(entradas) == limite:
+            siguiente = str(int(entradas[-1][1]))
+        return {'alertas': alertas, 'siguiente': siguiente}
+
+    def _quitar_de_indices(self, alertas_ids: List[str]):
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zrem(ALERTAS_INDICE_KEY, *alertas_ids)
         for alerta_id in alertas_ids:
-            alerta_key = f"alerta:{alerta_id}"
-            alerta_data = self.redis_client.get(alerta_key)
-            if alerta_data:
-                alertas.append(json.loads(alerta_data))
+            pipe.zrem(_indice_alertas(alerta_id.rsplit(':', 2)[1]), alerta_id)
+        pipe.execute()
 
-        return alertas
+    def migrar_alertas(self) -> int:
+        """
+        Pasa las alertas del SET alertas:activas (formato anterior) a los
+        índices ordenados por tiempo y borra el SET. Idempotente.
+        """
+        if self.redis_client.type(ALERTAS_LEGADO_KEY) != 'set':
+            return 0
+        ids = list(self.redis_client.smembers(ALERTAS_LEGADO_KEY))
+        datos = self.redis_client.mget([f"alerta:{a}" for a in ids]) if ids else []
+        pipe = self.redis_client.pipeline(transaction=False)
+        migradas = 0
+        for alerta_id, data in zip(ids, datos):
+            if not data:
+                continue
+            alerta = json.loads(data)
+            # El formato anterior guardaba la hora local del proceso
+            score = _us(datetime.fromisoformat(alerta['timestamp']).timestamp())
+            pipe.zadd(ALERTAS_INDICE_KEY, {alerta_id: score})
+            pipe.zadd(_indice_alertas(alerta['tipo_sensor']), {alerta_id: score})
+            migradas += 1
+        pipe.delete(ALERTAS_LEGADO_KEY)
+        pipe.execute()
+        return migradas
 
     # ============ CONSULTAS ============
 
     def obtener_estado_actual(self, sensor_id: str, tipo_sensor: str) -> Optional[Dict]:
         """Obtiene el estado actual de un sensor"""
         key = f"sensor:{tipo_sensor}:{sensor_id}:actual"
-        data = self.redis_client.get(key)
-        return json.loads(data) if data else None
+        data = self.redis_raw.get(key)
+        return decodificar(data) if data else None
 
     def obtener_historico_reciente(self, sensor_id: str, tipo_sensor: str, limite: int = 50) -> List[Dict]:
         """Obtiene el histórico reciente de un sensor"""
         key = f"sensor:{tipo_sensor}:{sensor_id}:historico"
-        datos = self.redis_client.lrange(key, 0, limite - 1)
-        return [json.loads(d) for d in datos]
+        datos = self.redis_raw.lrange(key, 0, limite - 1)
+        return [decodificar(d) for d in datos]
 
     def obtener_promedio_humedad(self, sensor_id: str) -> Optional[float]:
-        """Calcula el promedio de humedad de los últimos 10 minutos"""
-        key = f"sensor:humedad:{sensor_id}:promedio"
-        valores = self.redis_client.zrange(key, 0, -1, withscores=True)
+        """Promedio de humedad (%) de los últimos 10 minutos"""
+        return self.obtener_agregados(sensor_id, 'soil_pct')['10m']['avg']
 
-        if not valores:
-            return None
+    # ============ RIESGO ============
 
-        total = sum(float(score) for _, score in valores)
-        return round(total / len(valores), 2)
+    def guardar_riesgo(self, puntuaciones: Dict[str, float]):
+        """Actualiza el riesgo de los sensores dados (un solo ZADD)"""
+        if puntuaciones:
+            self.redis_client.zadd(RIESGO_KEY, puntuaciones)
 
-    def obtener_dashboard(self) -> Dict:
+    def obtener_riesgo(self, limite: int = 50) -> List[Dict]:
+        """Los `limite` sensores con más riesgo, de mayor a menor"""
+        return [
+            {'sensor_id': sensor_id, 'riesgo': riesgo}
+            for sensor_id, riesgo in self.redis_client.zrevrange(RIESGO_KEY, 0, limite - 1, withscores=True)
+        ]
+
+    def obtener_dashboard(self, limite_alertas: Optional[int] = None) -> Dict:
         """
-        Obtiene un resumen general de todos los sensores para dashboard
+        Obtiene un resumen general de todos los sensores para dashboard.
+
+        Lee el snapshot mantenido en escritura (HGETALL por tipo) y la
+        página de alertas activas en un pipeline, más un MGET de las
+        alertas (las `limite_alertas` más recientes; None = todas).
+        Las entradas más viejas que TTL_ESTADO_ACTUAL (sensor caído) se
+        omiten y se eliminan del snapshot.
         """
+        tipos = ['vibracion', 'inclinacion', 'humedad']
+        pipe = self.redis_raw.pipeline(transaction=False)
+        for tipo in tipos:
+            pipe.hgetall(f"dashboard:sensores:{tipo}")
+        idx = self._pipe_alertas(pipe, None, limite_alertas)
+        pipe.zcard(ALERTAS_INDICE_KEY)
+        resultados = pipe.execute()
+        snapshots = resultados[:len(tipos)]
+
+        alertas = self._pagina_alertas(resultados[idx], limite_alertas)['alertas']
         dashboard = {
-            'timestamp': datetime.now().isoformat(),
-            'sensores': {
-                'vibracion': [],
-                'inclinacion': [],
-                'humedad': []
-            },
-            'alertas_activas': self.obtener_alertas_activas(),
-            'total_alertas': len(self.obtener_alertas_activas())
+            'timestamp': _ahora().isoformat(),
+            'sensores': {tipo: [] for tipo in tipos},
+            'alertas_activas': alertas,
+            'total_alertas': resultados[idx + 1] if limite_alertas else len(alertas)
         }
 
-        # Buscar todos los sensores activos
-        for tipo in ['vibracion', 'inclinacion', 'humedad']:
-            pattern = f"sensor:{tipo}:*:actual"
-            for key in self.redis_client.scan_iter(match=pattern):
-                data = self.redis_client.get(key)
-                if data:
-                    sensor_info = json.loads(data)
-                    sensor_id = key.split(':')[2]
-                    sensor_info['sensor_id'] = sensor_id
-                    dashboard['sensores'][tipo].append(sensor_info)
+        limite = _ahora() - timedelta(seconds=self.TTL_ESTADO_ACTUAL)
+        viejos = []
+        for tipo, snapshot in zip(tipos, snapshots):
+            for sensor_id, data in snapshot.items():
+                sensor_info = decodificar(data)
+                if _hora_utc(sensor_info['timestamp']) < limite:
+                    viejos.append((tipo, sensor_id))
+                    continue
+                sensor_info['sensor_id'] = sensor_id.decode()
+                dashboard['sensores'][tipo].append(sensor_info)
+
+        if viejos:
+            pipe = self.redis_raw.pipeline(transaction=False)
+            for tipo, sensor_id in viejos:
+                pipe.hdel(f"dashboard:sensores:{tipo}", sensor_id)
+            pipe.execute()
 
         return dashboard
 
     # ============ MANTENIMIENTO ============
 
-    def limpiar_datos_expirados(self):
-        """Limpieza manual de datos expirados (Redis lo hace automáticamente, pero esto es un respaldo)"""
-        # Esta función es más para limpieza específica si es necesario
-        alertas_resueltas = []
-        for alerta_id in self.redis_client.smembers("alertas:activas"):
-            alerta_key = f"alerta:{alerta_id}"
-            alerta_data = self.redis_client.get(alerta_key)
-            if alerta_data:
-                alerta = json.loads(alerta_data)
-                if alerta.get('resuelta'):
-                    alertas_resueltas.append(alerta_id)
-        
-        if alertas_resueltas:
-            self.redis_client.srem("alertas:activas", *alertas_resueltas)
-        
-        return len(alertas_resueltas)
+    def limpiar_datos_expirados(self, lote: int = 1000):
+        """
+        Limpieza manual de los índices de alertas (las lecturas y escrituras
+        ya podan por TTL; esto es un respaldo). Recorre cada índice por
+        páginas y quita ids vencidos o cuya clave ya no existe.
+        """
+        eliminadas = 0
+        limite = f"({_us(time.time() - self.TTL_ALERTAS_ACTIVAS)}"
+        for indice in [ALERTAS_INDICE_KEY] + [_indice_alertas(t) for t in ('vibracion', 'inclinacion', 'humedad', 'riesgo')]:
+            eliminadas += self.redis_client.zremrangebyscore(indice, '-inf', limite)
+            cursor = '+inf'
+            while True:
+                entradas = self.redis_client.zrevrangebyscore(
+                    indice, cursor, '-inf', start=0, num=lote, withscores=True
+                )
+                if not entradas:
+                    break
+                ids = [a for a, _ in entradas]
+                existe = self.redis_client.mget([f"alerta:{a}" for a in ids])
+                huerfanas = [a for a, data in zip(ids, existe) if not data]
+                if huerfanas:
+                    eliminadas += self.redis_client.zrem(indice, *huerfanas)
+                cursor = f"({int(entradas[-1][1])}"
+
+        return eliminadas
 
 
 # ============ EJEMPLO DE USO ============
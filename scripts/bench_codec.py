@@ -0,0 +1,54 @@
+# scripts/bench_codec.py
+"""
+Compara los codecs de funcs/codificacion.py: bytes por lectura y tiempo
+de codificación/decodificación.
+
+    python scripts/bench_codec.py --n 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+from funcs.codificacion import CODECS, decodificar
+
+
+def gen_lecturas(n):
+    lecturas = []
+    for i in range(n):
+        now = datetime.now()
+        lecturas.append(random.choice([
+            {'porcentaje': random.randint(10, 80), 'valor_raw': random.randint(400, 900),
+             'timestamp': now, 'tipo': 'humedad', 'seq': i, 'alerta': 0},
+            {'pulse': random.randint(50, 1000), 'hit': random.choice([0, 1]),
+             'timestamp': now, 'tipo': 'vibracion', 'seq': i, 'alerta': 0},
+            {'estado': random.choice([0, 1]),
+             'timestamp': now, 'tipo': 'inclinacion', 'seq': i, 'alerta': 0},
+        ]))
+    return lecturas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    args = parser.parse_args()
+
+    lecturas = gen_lecturas(args.n)
+
+    print(f"{'codec':<10}{'bytes/lectura':>15}{'encode µs':>12}{'decode µs':>12}")
+    for nombre, codec in CODECS.items():
+        t0 = time.perf_counter()
+        codificadas = [codec.codificar(d) for d in lecturas]
+        t1 = time.perf_counter()
+        for raw in codificadas:
+            decodificar(raw)
+        t2 = time.perf_counter()
+
+        tamano = sum(len(c) for c in codificadas) / args.n
+        enc = (t1 - t0) / args.n * 1e6
+        dec = (t2 - t1) / args.n * 1e6
+        print(f"{nombre:<10}{tamano:>15.1f}{enc:>12.2f}{dec:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# scripts/bench_dashboard.py
+"""
+Compara obtener_dashboard() (snapshot materializado: HGETALL + MGET) con
+el recorrido anterior (SCAN sensor:*:*:actual + un GET por sensor + un
+GET por alerta, dos veces). También mide una página de listar_alertas.
+
+Usa la base de Redis indicada y la VACÍA (FLUSHDB) antes de poblarla.
+
+    python scripts/bench_dashboard.py --sensores 10000 --alertas 10000 --db 15
+"""
+import argparse
+import json
+import random
+import time
+
+import redis
+
+from funcs.funciones_redis import SensorCacheManager
+
+
+def poblar(cache, sensores, alertas):
+    samples = [
+        {"id": i, "soil": {"raw": random.randint(400, 900), "pct": random.randint(20, 80)},
+         "tilt": 0, "vib": {"pulse": random.randint(50, 1000), "hit": 0}}
+        for i in range(sensores)
+    ]
+    for i in range(0, sensores, 500):
+        cache.guardar_paquete(samples[i:i + 500], seq=i, alerta=0)
+
+    for i in range(0, alertas, 500):
+        pipe = cache.redis_raw.pipeline(transaction=False)
+        for j in range(i, min(i + 500, alertas)):
+            cache._generar_alerta(str(j % sensores), "humedad", "Humedad crítica", pipe=pipe)
+        cache._ejecutar(pipe)
+
+
+def dashboard_legado(cache):
+    """Implementación anterior, para comparar."""
+    r = cache.redis_client
+    dashboard = {
+        "sensores": {"vibracion": [], "inclinacion": [], "humedad": []},
+        "alertas_activas": alertas_legado(cache),
+        "total_alertas": len(alertas_legado(cache)),
+    }
+    for tipo in dashboard["sensores"]:
+        for key in r.scan_iter(match=f"sensor:{tipo}:*:actual"):
+            data = cache.redis_raw.get(key)
+            if data:
+                dashboard["sensores"][tipo].append(data)
+    return dashboard
+
+
+def alertas_legado(cache):
+    alertas = []
+    for alerta_id in cache.redis_client.zrange("alertas:indice", 0, -1):
+        data = cache.redis_client.get(f"alerta:{alerta_id}")
+        if data:
+            alertas.append(json.loads(data))
+    return alertas
+
+
+def medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2] * 1000, tiempos[-1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--sensores", type=int, default=10000)
+    parser.add_argument("--alertas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--codec", default="struct")
+    args = parser.parse_args()
+
+    cache = SensorCacheManager(args.host, args.port, args.db, codec=args.codec)
+    cache.redis_client.flushdb()
+    poblar(cache, args.sensores, args.alertas)
+
+    nuevo = cache.obtener_dashboard()
+    legado = dashboard_legado(cache)
+    for tipo in nuevo["sensores"]:
+        assert len(nuevo["sensores"][tipo]) == len(legado["sensores"][tipo]), tipo
+    assert nuevo["total_alertas"] == legado["total_alertas"]
+
+    print(f"{args.sensores} sensores x 3 tipos, {args.alertas} alertas activas")
+    print(f"{'versión':<14}{'p50 ms':>10}{'max ms':>10}")
+    for nombre, fn in (("legado", lambda: dashboard_legado(cache)),
+                       ("snapshot", cache.obtener_dashboard)):
+        p50, pmax = medir(fn, args.repeticiones)
+        print(f"{nombre:<14}{p50:>10.1f}{pmax:>10.1f}")
+
+    p50, pmax = medir(lambda: cache.listar_alertas(limite=50), args.repeticiones)
+    print(f"{'alertas/50':<14}{p50:>10.1f}{pmax:>10.1f}")
+
+    cache.redis_client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# scripts/bench_push.py
+"""
+Fan-out de app/push_gateway.py: --clientes conexiones SSE (asyncio, en
+este proceso) reciben los paquetes publicados por el gancho de ingesta a
+--rate paquetes/s. Reporta eventos entregados, descartados y la latencia
+publicación → recepción. También mide el coste del gancho en el hilo de
+ingesta, que no debe depender del número de clientes. Los clientes
+comparten proceso (y GIL) con el gateway, así que la latencia medida es
+una cota superior.
+
+    PYTHONPATH=. python scripts/bench_push.py --clientes 2000 --rate 200 --segundos 5
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+
+from app.push_gateway import DESCARTADOS, PushGateway
+
+
+async def cliente_sse(port, query, recibidos, latencias, muestrear):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+    writer.write(f"GET /stream?{query} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await writer.drain()
+    n = 0
+    try:
+        while True:
+            linea = await reader.readline()
+            if not linea:
+                break
+            if linea.startswith(b"data: "):
+                n += 1
+                recibidos[0] += 1
+                if muestrear and n % 50 == 0:
+                    ts = json.loads(linea[6:])["timestamp"]
+                    latencias.append((datetime.now() - datetime.fromisoformat(ts)).total_seconds())
+    finally:
+        writer.close()
+
+
+async def clientes(port, n, query, recibidos, latencias, listo, fin):
+    tareas = [
+        asyncio.ensure_future(cliente_sse(port, query, recibidos, latencias, i % 20 == 0))
+        for i in range(n)
+    ]
+    await asyncio.sleep(1 + n / 1000)
+    listo.set()
+    while not fin.is_set():
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(0.5)
+    for t in tareas:
+        t.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="paquetes por segundo")
+    parser.add_argument("--samples", type=int, default=2)
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--query", default="tipo=humedad", help="filtros de cada cliente")
+    args = parser.parse_args()
+
+    gateway = PushGateway(host="127.0.0.1", port=0)
+    gateway.max_clientes = max(gateway.max_clientes, args.clientes)
+    gateway.start()
+
+    recibidos, latencias = [0], []
+    listo, fin = threading.Event(), threading.Event()
+    hilo = threading.Thread(target=lambda: asyncio.run(
+        clientes(gateway.port, args.clientes, args.query, recibidos, latencias, listo, fin)
+    ))
+    hilo.start()
+    listo.wait()
+
+    samples = [{"id": i + 1, "soil": {"raw": 600, "pct": 40}, "tilt": 0, "vib": {"pulse": 100, "hit": 0}}
+               for i in range(args.samples)]
+    enviados, gancho = 0, 0.0
+    inicio = time.monotonic()
+    while time.monotonic() - inicio < args.segundos:
+        t0 = time.perf_counter()
+        gateway.publicar_paquete(enviados, datetime.now(), samples)
+        gancho += time.perf_counter() - t0
+        enviados += 1
+        espera = inicio + enviados / args.rate - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+    fin.set()
+    hilo.join()
+    gateway.stop()
+
+    esperados = enviados * args.samples * args.clientes
+    latencias.sort()
+    print(f"{args.clientes} clientes SSE ({args.query}), {enviados} paquetes x {args.samples} muestras")
+    print(f"gancho de ingesta: {gancho / enviados * 1e6:.1f} µs/paquete")
+    print(f"entregados: {recibidos[0]} de {esperados} ({recibidos[0] / esperados:.1%}), "
+          f"descartados por buffer: {DESCARTADOS.valor}")
+    print(f"eventos/s entregados: {recibidos[0] / args.segundos:.0f}")
+    if latencias:
+        print(f"latencia p50 {latencias[len(latencias) // 2] * 1000:.1f} ms, "
+              f"p99 {latencias[int(len(latencias) * 0.99)] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# scripts/bench_read_api.py
+"""
+Peticiones/s de app/read_api.py con y sin la caché TTL + single-flight.
+
+Levanta el servidor en este proceso contra un Redis local, escribe unos
+sensores de prueba y lanza --clientes hilos (conexiones keep-alive) que
+piden la misma URL durante --segundos. Reporta peticiones/s, latencia y
+comandos Redis ejecutados (INFO stats).
+
+    PYTHONPATH=. python scripts/bench_read_api.py --clientes 100 --segundos 5 --db 15
+"""
+import argparse
+import http.client
+import threading
+import time
+
+from app.read_api import ReadAPI, ServidorLectura
+from funcs.funciones_redis import SensorCacheManager
+
+
+def poblar(cache):
+    for i in range(50):
+        cache.guardar_paquete([
+            {"id": sid, "soil": {"raw": 500 + i, "pct": 40 + i % 10}, "tilt": 0,
+             "vib": {"pulse": 100 + i, "hit": 0}}
+            for sid in range(1, 11)
+        ], seq=i, alerta=0)
+
+
+def carga(port, path, clientes, segundos):
+    fin = time.monotonic() + segundos
+    latencias = []
+    lock = threading.Lock()
+
+    def cliente():
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        propias = []
+        while time.monotonic() < fin:
+            t0 = time.perf_counter()
+            conn.request("GET", path)
+            respuesta = conn.getresponse()
+            respuesta.read()
+            propias.append(time.perf_counter() - t0)
+        conn.close()
+        with lock:
+            latencias.extend(propias)
+
+    hilos = [threading.Thread(target=cliente) for _ in range(clientes)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    latencias.sort()
+    return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--clientes", type=int, default=100)
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--ttl-ms", type=int, default=1000)
+    parser.add_argument("--path", default="/sensores/humedad/1/historico")
+    args = parser.parse_args()
+
+    cache = SensorCacheManager(args.host, args.port, args.db, codec="struct")
+    poblar(cache)
+
+    print(f"GET {args.path}, {args.clientes} clientes, {args.segundos:.0f}s")
+    print(f"{'modo':<14}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'cmds Redis':>12}")
+    for nombre, ttl in (("sin caché", 0), (f"ttl {args.ttl_ms}ms", args.ttl_ms / 1000)):
+        servidor = ServidorLectura(ReadAPI(cache, ttl=ttl, ttl_dashboard=ttl), host="127.0.0.1", port=0)
+        servidor.start()
+        comandos = cache.redis_client.info("stats")["total_commands_processed"]
+
+        latencias = carga(servidor.port, args.path, args.clientes, args.segundos)
+
+        comandos = cache.redis_client.info("stats")["total_commands_processed"] - comandos - 1
+        servidor.stop()
+        n = len(latencias)
+        print(f"{nombre:<14}{n / args.segundos:>10.0f}{latencias[n // 2] * 1000:>9.2f}"
+              f"{latencias[int(n * 0.99)] * 1000:>9.2f}{comandos:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# scripts/bench_resources.py
+"""
+Conexiones y descriptores que abre un proceso del servicio. Construye los
+mismos componentes que app/main.py en modo de un proceso (MQTTClient,
+Notifier, PacketWriter, Archiver, ReadAPI, EvaluadorRiesgo y el cache del
+Replayer, sin arrancar hilos ni red MQTT). Después, --hilos hilos hacen
+--ops operaciones repartidas entre todos ellos (Redis y un SELECT 1 en la
+base de datos).
+
+Reporta el tiempo de construcción, las conexiones Redis nuevas (INFO
+total_connections_received), las que quedan abiertas (CLIENT LIST) y los
+descriptores del proceso antes y después.
+
+    PYTHONPATH=. REDIS_DB=14 python scripts/bench_resources.py --hilos 8 --ops 4000
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import redis
+from sqlalchemy import text
+
+
+def descriptores():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=4000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="edge_bench_res_"))
+    from app.config import settings
+    monitor = redis.Redis(host=settings.REDIS_HOST or "localhost", port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+    def conexiones():
+        return monitor.info("stats")["total_connections_received"], len(monitor.client_list()) - 1
+
+    from app.archiver import Archiver
+    from app.db.client import SessionLocal
+    from app.db_writer import PacketWriter
+    from app.mqtt_client import MQTTClient
+    from app.notifier import Notifier
+    from app.read_api import ReadAPI
+    from app.risk import EvaluadorRiesgo
+    from app.spool import Replayer
+
+    fd0 = descriptores()
+    recibidas0, abiertas0 = conexiones()
+    t0 = time.perf_counter()
+    notifier = Notifier()
+    writer = PacketWriter()
+    mqtt = MQTTClient(writer, notifier)
+    archiver = Archiver()
+    api = ReadAPI()
+    riesgo = EvaluadorRiesgo()
+    replayer = Replayer(os.path.join(os.getcwd(), "spool"))
+    construccion = time.perf_counter() - t0
+
+    clientes = [mqtt.cache.redis_raw, mqtt.cache.redis_client, notifier.redis, archiver.cache.redis_raw,
+                archiver.cache.redis_client, api.cache.redis_client, riesgo.cache.redis_client,
+                replayer.cache.redis_raw]
+
+    def trabajo(semilla):
+        rnd = random.Random(semilla)
+        for _ in range(args.ops // args.hilos):
+            if rnd.random() < 0.1:
+                with SessionLocal() as db:
+                    db.execute(text("SELECT 1"))
+            else:
+                rnd.choice(clientes).ping()
+
+    t1 = time.perf_counter()
+    hilos = [threading.Thread(target=trabajo, args=(i,)) for i in range(args.hilos)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    carga = time.perf_counter() - t1
+
+    recibidas1, abiertas1 = conexiones()
+    print(f"construcción de componentes: {construccion * 1000:.0f} ms")
+    print(f"{args.ops} operaciones en {args.hilos} hilos: {carga:.2f} s")
+    print(f"conexiones Redis abiertas por el proceso: {abiertas1 - abiertas0} "
+          f"(nuevas durante la prueba: {recibidas1 - recibidas0})")
+    print(f"descriptores: {fd0} → {descriptores()}")
+
+
+if __name__ == "__main__":
+    main()
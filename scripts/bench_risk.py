@@ -0,0 +1,117 @@
+# scripts/bench_risk.py
+"""
+Coste de app/risk.py: --sensores sensores (--paneles por dispositivo) con
+la ventana llena. Mide un tick de ingesta (un paquete por dispositivo) y
+la evaluación vectorizada de todos los sensores, y la compara con un bucle
+Python por sensor que calcula las mismas features. Comprueba además que
+ambos dan el mismo riesgo.
+
+    PYTHONPATH=. python scripts/bench_risk.py --sensores 10000 --ventana 64
+"""
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.risk import ELEVADO, PENDIENTE_MAX, PENDIENTE_REF, PESOS, TRANSICIONES_MAX, MotorRiesgo
+
+
+def paquetes(dispositivos, paneles, t, rnd):
+    lote = []
+    for d in range(dispositivos):
+        samples = [{"id": d * paneles + p, "soil": {"pct": 40 + d % 40 + rnd.gauss(0, 0.5)}, "tilt": rnd.random() < 0.005,
+                    "vib": {"pulse": rnd.randint(0, 400), "hit": rnd.random() < 0.02}}
+                   for p in range(paneles)]
+        lote.append((f"dev-{d}", t, samples))
+    return lote
+
+
+def _sig(z):
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def riesgo_python(motor):
+    """Referencia: mismas features con un bucle por sensor sobre listas."""
+    w, parcial, z = motor.ventana, [], []
+    for fila in range(motor.n):
+        orden = [(motor.cabeza[fila] + j) % w for j in range(w)]
+        ts = [float(motor.ts[fila, j]) for j in orden]
+        soil = [float(motor.soil[fila, j]) for j in orden]
+        tilt = [float(motor.tilt[fila, j]) for j in orden]
+        hit = [float(h) for h in motor.hit[fila] if not math.isnan(h)]
+
+        puntos = [((t - ts[-1]) / 3600.0, s) for t, s in zip(ts, soil) if not (math.isnan(t) or math.isnan(s))]
+        pendiente = 0.0
+        if len(puntos) >= 3:
+            mt = sum(p[0] for p in puntos) / len(puntos)
+            ms = sum(p[1] for p in puntos) / len(puntos)
+            var = sum((p[0] - mt) ** 2 for p in puntos)
+            if var > 0:
+                pendiente = sum((p[0] - mt) * (p[1] - ms) for p in puntos) / var
+        golpes = sum(hit) / max(len(hit), 1)
+        transiciones = sum(1 for a, b in zip(tilt, tilt[1:]) if a != b and not (math.isnan(a) or math.isnan(b)))
+        zi = (PESOS["sesgo"] + PESOS["pendiente"] * min(max(pendiente / PENDIENTE_REF, 0), PENDIENTE_MAX)
+              + PESOS["golpes"] * golpes + PESOS["transiciones"] * min(transiciones, TRANSICIONES_MAX))
+        z.append(zi)
+        parcial.append(_sig(zi) > ELEVADO)
+
+    elevados, tam = {}, {}
+    for fila in range(motor.n):
+        g = int(motor.grupo[fila])
+        elevados[g] = elevados.get(g, 0) + parcial[fila]
+        tam[g] = tam.get(g, 0) + 1
+    riesgo = []
+    for fila in range(motor.n):
+        g = int(motor.grupo[fila])
+        otros = tam[g] - 1
+        acuerdo = (elevados[g] - parcial[fila]) / otros if otros else 0.0
+        riesgo.append(_sig(z[fila] + PESOS["acuerdo"] * acuerdo))
+    return riesgo
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sensores", type=int, default=10000)
+    parser.add_argument("--paneles", type=int, default=4, help="sensores por dispositivo")
+    parser.add_argument("--ventana", type=int, default=64)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    dispositivos = args.sensores // args.paneles
+    motor = MotorRiesgo(ventana=args.ventana)
+    t = datetime.now() - timedelta(seconds=args.ventana * 10)
+    for _ in range(args.ventana):
+        motor.ingerir(paquetes(dispositivos, args.paneles, t, rnd))
+        t += timedelta(seconds=10)
+
+    ingesta, evaluacion = [], []
+    for _ in range(args.repeticiones):
+        lote = paquetes(dispositivos, args.paneles, t, rnd)
+        t += timedelta(seconds=10)
+        t0 = time.perf_counter()
+        motor.ingerir(lote)
+        t1 = time.perf_counter()
+        resultado = motor.evaluar()
+        t2 = time.perf_counter()
+        ingesta.append(t1 - t0)
+        evaluacion.append(t2 - t1)
+
+    t0 = time.perf_counter()
+    referencia = riesgo_python(motor)
+    python = time.perf_counter() - t0
+
+    diferencia = np.max(np.abs(resultado["riesgo"] - np.asarray(referencia)))
+    print(f"{motor.n} sensores ({dispositivos} dispositivos), ventana {args.ventana}")
+    print(f"ingesta de un tick ({motor.n} muestras): {min(ingesta) * 1000:.1f} ms")
+    print(f"evaluación vectorizada: {min(evaluacion) * 1000:.1f} ms")
+    print(f"bucle Python por sensor: {python * 1000:.0f} ms ({python / min(evaluacion):.0f}x)")
+    print(f"diferencia máxima de riesgo: {diferencia:.2e}, "
+          f"sensores >= 0.8: {int((resultado['riesgo'] >= 0.8).sum())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# scripts/bench_rules.py
+"""
+Tormenta de alertas: --sensores sensores en una ladera que vibra (hit=1 en
+cada paquete) con la humedad oscilando alrededor de 80 %. Guarda
+--paquetes paquetes con guardar_paquetes, primero con los umbrales fijos
+y luego con las reglas de app/configs/config.yaml, y compara las alertas
+escritas en Redis y el tiempo total. También mide el coste de
+MotorReglas.evaluar por sample.
+
+    PYTHONPATH=. REDIS_DB=15 python scripts/bench_rules.py --paquetes 500
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.cache_manager import CloudSensorCacheManager
+from app.rules import cargar_reglas
+
+
+def paquetes(n, sensores, rnd):
+    t = datetime.now()
+    for i in range(n):
+        samples = [{"id": s + 1, "soil": {"raw": 300, "pct": round(80 + rnd.uniform(-3, 3), 1)},
+                    "tilt": 0, "vib": {"pulse": rnd.randint(500, 900), "hit": 1}}
+                   for s in range(sensores)]
+        yield {"samples": samples, "seq": i, "alerta": 0, "timestamp": t + timedelta(seconds=i)}
+
+
+def correr(cache, lote, n, sensores):
+    cache.redis_client.flushdb()
+    rnd = random.Random(7)
+    inicio = time.perf_counter()
+    pendientes = []
+    for p in paquetes(n, sensores, rnd):
+        pendientes.append(p)
+        if len(pendientes) == lote:
+            cache.guardar_paquetes(pendientes)
+            pendientes = []
+    if pendientes:
+        cache.guardar_paquetes(pendientes)
+    return time.perf_counter() - inicio, int(cache.redis_client.get("alertas:seq") or 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paquetes", type=int, default=500)
+    parser.add_argument("--sensores", type=int, default=4)
+    parser.add_argument("--lote", type=int, default=1, help="paquetes por guardar_paquetes")
+    args = parser.parse_args()
+
+    fijo = correr(CloudSensorCacheManager(), args.lote, args.paquetes, args.sensores)
+    reglas = correr(CloudSensorCacheManager(reglas=cargar_reglas()), args.lote, args.paquetes, args.sensores)
+    lecturas = args.paquetes * args.sensores
+    print(f"{args.paquetes} paquetes x {args.sensores} sensores (hit=1, humedad 77-83 %)")
+    for nombre, (segundos, alertas) in (("umbrales fijos", fijo), ("reglas", reglas)):
+        print(f"{nombre:>15}: {alertas} alertas escritas, {segundos:.2f} s ({lecturas / segundos:.0f} lecturas/s)")
+
+    motor = cargar_reglas()
+    samples = [p["samples"] for p in paquetes(2000, args.sensores, random.Random(1))]
+    ahora = datetime.now()
+    inicio = time.perf_counter()
+    for s in samples:
+        motor.evaluar(s, ahora)
+    coste = (time.perf_counter() - inicio) / (len(samples) * args.sensores)
+    print(f"evaluar: {coste * 1e6:.1f} µs por sample ({len(motor)} reglas)")
+
+
+if __name__ == "__main__":
+    main()
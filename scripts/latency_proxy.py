@@ -0,0 +1,99 @@
+# scripts/latency_proxy.py
+"""
+Proxy TCP que añade una latencia fija por sentido, para simular un enlace
+WAN hacia Redis Cloud o Postgres gestionado en pruebas locales.
+
+Cada bloque leído se reenvía `retardo` segundos después, en orden y sin
+esperar al anterior: la latencia crece pero el ancho de banda no, como en
+un enlace real. El destino puede ser host:puerto o la ruta de un socket
+unix (Postgres local). NO usar en producción.
+
+    python scripts/latency_proxy.py --destino 127.0.0.1:6379 --port 16379 --ms 20
+"""
+import argparse
+import asyncio
+import threading
+
+
+class ProxyLatencia:
+    def __init__(self, destino, retardo, host="127.0.0.1", port=0):
+        self.destino = destino
+        self.retardo = retardo
+        self.host = host
+        self.port = port
+        self._listo = threading.Event()
+
+    async def _abrir_destino(self):
+        if isinstance(self.destino, str):
+            return await asyncio.open_unix_connection(self.destino)
+        return await asyncio.open_connection(*self.destino)
+
+    async def _tubo(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        cola = asyncio.Queue()
+
+        async def leer():
+            while True:
+                datos = await reader.read(65536)
+                await cola.put((loop.time() + self.retardo, datos))
+                if not datos:
+                    return
+
+        async def escribir():
+            while True:
+                cuando, datos = await cola.get()
+                espera = cuando - loop.time()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                if not datos:
+                    writer.close()
+                    return
+                writer.write(datos)
+                await writer.drain()
+
+        try:
+            await asyncio.gather(leer(), escribir())
+        except (ConnectionError, OSError):
+            writer.close()
+
+    async def _conexion(self, cliente_r, cliente_w):
+        try:
+            destino_r, destino_w = await self._abrir_destino()
+        except OSError:
+            cliente_w.close()
+            return
+        await asyncio.gather(self._tubo(cliente_r, destino_w), self._tubo(destino_r, cliente_w))
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        servidor = loop.run_until_complete(asyncio.start_server(self._conexion, self.host, self.port))
+        self.port = servidor.sockets[0].getsockname()[1]
+        self._listo.set()
+        loop.run_forever()
+
+    def start(self):
+        """Arranca en un hilo daemon y devuelve el propio proxy."""
+        threading.Thread(target=self._run, daemon=True, name="latency-proxy").start()
+        self._listo.wait(10)
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy TCP con latencia añadida")
+    parser.add_argument("--destino", required=True, help="host:puerto o ruta de socket unix")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--ms", type=float, default=20, help="latencia por sentido")
+    args = parser.parse_args()
+
+    destino = args.destino
+    if not destino.startswith("/"):
+        host, port = destino.rsplit(":", 1)
+        destino = (host, int(port))
+    proxy = ProxyLatencia(destino, args.ms / 1000, args.host, args.port).start()
+    print(f"[PROXY] {args.host}:{proxy.port} → {args.destino} (+{args.ms:.0f} ms por sentido)")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
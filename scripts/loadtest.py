@@ -0,0 +1,230 @@
+# scripts/loadtest.py
+"""
+Prueba de carga extremo a extremo del servicio edge contra dependencias
+locales: broker MQTT (scripts/mini_broker.py embebido, o --broker para
+un mosquitto), Redis local y SQLite en un directorio temporal (o
+--db-url para Postgres).
+
+Arranca en este proceso el mismo pipeline que app/main.py (MQTTClient +
+PacketWriter, o IngestaAsync con --runtime asyncio; el Notifier no envía
+emails), publica con run_load() de sensor_data_sender y reporta
+throughput y latencias MQTT → Redis y MQTT → DB a partir de app/metrics.py.
+
+--wan-ms pone un proxy con esa latencia por sentido (scripts/latency_proxy.py)
+delante de Redis y de Postgres, para comparar los runtimes como si
+estuvieran en Redis Cloud / una base gestionada. Con SQLite solo afecta
+a Redis.
+
+    PYTHONPATH=. python scripts/loadtest.py --rate 1000 --devices 100 \\
+        --samples 2 --alert-ratio 0.01 --duration 30 --redis-db 15 --flush
+    PYTHONPATH=. python scripts/loadtest.py --runtime asyncio --wan-ms 20 ...
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TOPIC = "sensors/load"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio edge")
+    parser.add_argument("--rate", type=float, default=500, help="paquetes por segundo")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=2)
+    parser.add_argument("--alert-ratio", type=float, default=0.01)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1])
+    parser.add_argument("--broker", default=None, help="host:puerto de un broker externo")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--flush", action="store_true", help="FLUSHDB de --redis-db antes de empezar")
+    parser.add_argument("--db-url", default=None, help="Postgres; por defecto SQLite temporal")
+    parser.add_argument("--runtime", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--wan-ms", type=float, default=0, help="latencia añadida por sentido hacia Redis/DB")
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    parser.add_argument("--json", action="store_true", help="imprimir el reporte en JSON")
+    return parser.parse_args()
+
+
+def configurar_entorno(args, broker_host, broker_port):
+    """Variables de app.config: deben fijarse antes de importar app.*"""
+    os.environ.update({
+        "MQTT_HOST": broker_host,
+        "MQTT_PORT": str(broker_port),
+        "MQTT_TOPIC_PREFIX": "sensors/#",
+        "REDIS_HOST": args.redis_host,
+        "REDIS_PORT": str(args.redis_port),
+        "REDIS_DB": str(args.redis_db),
+        "REDIS_USER": "",
+        "REDIS_PASSWORD": "",
+        "RESEND_API_KEY": "",
+        "DB_PARTITIONED": "false",
+        "INGEST_RUNTIME": args.runtime,
+    })
+    if args.db_url:
+        os.environ.update({"APP_ENV": "production", "DATABASE_URL": args.db_url})
+    else:
+        # app.db.client crea local_dev.sqlite en el cwd
+        os.environ["APP_ENV"] = "development"
+        os.chdir(tempfile.mkdtemp(prefix="edge_loadtest_"))
+
+
+def simular_wan(args):
+    """Redirige Redis y Postgres a través de proxies con args.wan_ms de latencia."""
+    from latency_proxy import ProxyLatencia
+
+    retardo = args.wan_ms / 1000
+    proxy = ProxyLatencia((args.redis_host, args.redis_port), retardo).start()
+    args.redis_host, args.redis_port = "127.0.0.1", proxy.port
+
+    if args.db_url:
+        from sqlalchemy.engine import make_url
+        url = make_url(args.db_url)
+        query = dict(url.query)
+        socket_dir = query.pop("host", None)
+        if socket_dir and socket_dir.startswith("/"):
+            destino = f"{socket_dir}/.s.PGSQL.{url.port or 5432}"
+        else:
+            destino = (url.host or "127.0.0.1", url.port or 5432)
+        proxy = ProxyLatencia(destino, retardo).start()
+        args.db_url = url.set(host="127.0.0.1", port=proxy.port, query=query).render_as_string(hide_password=False)
+
+
+def main():
+    args = parse_args()
+    if args.wan_ms:
+        simular_wan(args)
+
+    broker = None
+    if args.broker:
+        broker_host, broker_port = args.broker.rsplit(":", 1)
+        broker_port = int(broker_port)
+    else:
+        from mini_broker import MiniBroker
+        broker = MiniBroker(port=0).start()
+        broker_host, broker_port = "127.0.0.1", broker.port
+
+    configurar_entorno(args, broker_host, broker_port)
+
+    import paho.mqtt.client as mqtt
+    from sensor_data_sender import run_load
+    from app import metrics
+    from app.db.client import SessionLocal, init_db
+    from app.db.models import SensorPacket
+    from app.db_writer import PacketWriter
+    from app.mqtt_client import MQTTClient
+    from app.async_ingest import IngestaAsync
+    from app.notifier import Notifier
+    from sqlalchemy import func, select
+
+    class NotifierLocal(Notifier):
+        """Mismo flujo (cola, cooldown) pero sin llamar a Resend."""
+        enviados = 0
+
+        def send_email(self, subject, html):
+            NotifierLocal.enviados += 1
+            return True
+
+    init_db()
+    with SessionLocal() as db:
+        filas_inicio = db.scalar(select(func.count()).select_from(SensorPacket))
+
+    notifier = NotifierLocal()
+    if args.flush:
+        notifier.redis.flushdb()
+    if args.runtime == "asyncio":
+        componentes = [IngestaAsync(notifier)]
+    else:
+        writer = PacketWriter()
+        componentes = [MQTTClient(writer, notifier), writer]
+    for metrica in metrics.REGISTRO.values():
+        metrica.reset()
+
+    notifier.start()
+    for componente in reversed(componentes):
+        componente.start()
+    time.sleep(0.5)   # suscripción hecha antes de publicar
+
+    emisor = mqtt.Client()
+    emisor.connect(broker_host, broker_port)
+    emisor.loop_start()
+    inicio = time.monotonic()
+    envio = run_load(
+        emisor, args.rate, args.devices, args.samples, args.alert_ratio,
+        duration=args.duration, qos=args.qos, topic=TOPIC, verbose=False,
+    )
+
+    # Drenaje: esperar a que todo lo enviado llegue a la base de datos
+    limite = time.monotonic() + args.drain_timeout
+    while time.monotonic() < limite and metrics.LATENCIA_DB.total < envio["sent"]:
+        time.sleep(0.1)
+    fin = time.monotonic()
+
+    emisor.loop_stop()
+    emisor.disconnect()
+    for componente in componentes:
+        componente.stop()
+        if hasattr(componente, "join"):
+            componente.join()
+    notifier.stop()
+    if broker:
+        broker.shutdown()
+
+    with SessionLocal() as db:
+        filas = db.scalar(select(func.count()).select_from(SensorPacket)) - filas_inicio
+
+    reporte = {
+        "config": {
+            "rate": args.rate, "devices": args.devices, "samples": args.samples,
+            "alert_ratio": args.alert_ratio, "duration": args.duration, "qos": args.qos,
+            "broker": args.broker or "mini_broker", "db": args.db_url or "sqlite",
+            "runtime": args.runtime, "wan_ms": args.wan_ms,
+        },
+        "sent": envio["sent"],
+        "publish_rate": envio["sent"] / envio["elapsed"],
+        "redis_written": metrics.LATENCIA_REDIS.total,
+        "db_rows": filas,
+        "db_throughput": filas / (fin - inicio),
+        "emails": NotifierLocal.enviados,
+        "mqtt_to_redis": metrics.LATENCIA_REDIS.resumen(),
+        "mqtt_to_db": metrics.LATENCIA_DB.resumen(),
+        "etapas": {
+            hist.nombre: hist.resumen()
+            for hist in (metrics.ETAPA_PARSEO, metrics.ETAPA_REDIS, metrics.ETAPA_ENCOLAR, metrics.DB_LOTE)
+        },
+    }
+    imprimir(reporte, args.json)
+
+
+def imprimir(reporte, como_json):
+    if como_json:
+        print(json.dumps(reporte, indent=2))
+        return
+
+    c = reporte["config"]
+    print(f"\nCarga: {c['rate']:.0f} paquetes/s, {c['devices']} dispositivos, "
+          f"{c['samples']} muestras/paquete, alertas {c['alert_ratio']:.1%}, "
+          f"{c['duration']:.0f}s, QoS {c['qos']} ({c['broker']}, {c['db']})")
+    print(f"Runtime: {c['runtime']}, WAN simulada: +{c['wan_ms']:.0f} ms por sentido")
+    print(f"Enviados: {reporte['sent']} ({reporte['publish_rate']:.0f}/s)  "
+          f"Redis: {reporte['redis_written']}  DB: {reporte['db_rows']}  "
+          f"Emails: {reporte['emails']}")
+    print(f"Throughput DB: {reporte['db_throughput']:.0f} paquetes/s\n")
+
+    print(f"{'latencia (ms)':<20}{'n':>8}{'avg':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    filas = [("mqtt_to_redis", reporte["mqtt_to_redis"]), ("mqtt_to_db", reporte["mqtt_to_db"])]
+    filas += [(nombre.replace("edge_", "").replace("_seconds", ""), r) for nombre, r in reporte["etapas"].items()]
+    for nombre, r in filas:
+        valores = [r[k] * 1000 if r[k] is not None else float("nan")
+                   for k in ("avg", "p50", "p95", "p99", "max")]
+        print(f"{nombre:<20}{r['count']:>8}" + "".join(f"{v:>9.1f}" for v in valores))
+
+
+if __name__ == "__main__":
+    main()
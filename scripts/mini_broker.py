@@ -0,0 +1,200 @@
+# scripts/mini_broker.py
+"""
+Broker MQTT 3.1.1 mínimo, en memoria, para pruebas de carga locales
+cuando no hay mosquitto disponible.
+
+Soporta CONNECT, SUBSCRIBE/UNSUBSCRIBE con comodines + y #, PUBLISH con
+QoS 0/1 de entrada (PUBACK) y PINGREQ. Reenvía siempre con QoS 0 y no
+guarda sesiones, mensajes retenidos ni will. NO usar en producción.
+
+Las suscripciones compartidas ($share/<grupo>/<filtro>) entregan cada
+mensaje a un solo miembro del grupo, elegido por hash del topic: el mismo
+topic va siempre al mismo miembro mientras el grupo no cambie (como la
+estrategia hash_topic de EMQX).
+
+    python scripts/mini_broker.py --port 1883
+"""
+import argparse
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+
+
+def _leer_exacto(sock, n):
+    datos = b""
+    while len(datos) < n:
+        parte = sock.recv(n - len(datos))
+        if not parte:
+            raise ConnectionError("conexión cerrada")
+        datos += parte
+    return datos
+
+
+def _leer_paquete(sock):
+    cabecera = _leer_exacto(sock, 1)[0]
+    longitud, mult = 0, 1
+    while True:
+        b = _leer_exacto(sock, 1)[0]
+        longitud += (b & 0x7F) * mult
+        if not b & 0x80:
+            break
+        mult *= 128
+    return cabecera, _leer_exacto(sock, longitud) if longitud else b""
+
+
+def _paquete(cabecera, cuerpo):
+    n = len(cuerpo)
+    longitud = bytearray()
+    while True:
+        b = n % 128
+        n //= 128
+        longitud.append(b | 0x80 if n else b)
+        if not n:
+            break
+    return bytes([cabecera]) + bytes(longitud) + cuerpo
+
+
+def _cadena(datos, pos):
+    n = struct.unpack_from("!H", datos, pos)[0]
+    return datos[pos + 2:pos + 2 + n].decode(), pos + 2 + n
+
+
+def coincide(filtro, topic):
+    """True si `topic` encaja con el filtro MQTT (comodines + y #)."""
+    partes_f = filtro.split("/")
+    partes_t = topic.split("/")
+    for i, f in enumerate(partes_f):
+        if f == "#":
+            return True
+        if i >= len(partes_t) or (f != "+" and f != partes_t[i]):
+            return False
+    return len(partes_f) == len(partes_t)
+
+
+def _compartido(filtro):
+    """(grupo, filtro) si es $share/<grupo>/<filtro>, si no (None, filtro)."""
+    if filtro.startswith("$share/"):
+        _, grupo, resto = filtro.split("/", 2)
+        return grupo, resto
+    return None, filtro
+
+
+class _Conexion(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.lock = threading.Lock()
+        self.filtros = set()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def enviar(self, datos):
+        with self.lock:
+            self.request.sendall(datos)
+
+    def handle(self):
+        broker = self.server
+        try:
+            while True:
+                cabecera, cuerpo = _leer_paquete(self.request)
+                tipo = cabecera >> 4
+
+                if tipo == 1:      # CONNECT
+                    self.enviar(_paquete(0x20, b"\x00\x00"))
+                elif tipo == 3:    # PUBLISH
+                    qos = (cabecera >> 1) & 0x03
+                    topic, pos = _cadena(cuerpo, 0)
+                    if qos:
+                        pid = cuerpo[pos:pos + 2]
+                        pos += 2
+                        self.enviar(_paquete(0x40, pid))
+                    broker.publicar(topic, cuerpo[pos:])
+                elif tipo == 8:    # SUBSCRIBE
+                    pid, pos, concedidos = cuerpo[:2], 2, bytearray()
+                    while pos < len(cuerpo):
+                        filtro, pos = _cadena(cuerpo, pos)
+                        concedidos.append(min(cuerpo[pos], 1))
+                        pos += 1
+                        self.filtros.add(filtro)
+                    broker.suscribir(self)
+                    self.enviar(_paquete(0x90, pid + bytes(concedidos)))
+                elif tipo == 10:   # UNSUBSCRIBE
+                    pid, pos = cuerpo[:2], 2
+                    while pos < len(cuerpo):
+                        filtro, pos = _cadena(cuerpo, pos)
+                        self.filtros.discard(filtro)
+                    self.enviar(_paquete(0xB0, pid))
+                elif tipo == 12:   # PINGREQ
+                    self.enviar(_paquete(0xD0, b""))
+                elif tipo == 14:   # DISCONNECT
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker.desuscribir(self)
+
+
+class MiniBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=1883):
+        super().__init__((host, port), _Conexion)
+        self._lock = threading.Lock()
+        self._conexiones = set()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def suscribir(self, conexion):
+        with self._lock:
+            self._conexiones.add(conexion)
+
+    def desuscribir(self, conexion):
+        with self._lock:
+            self._conexiones.discard(conexion)
+
+    def publicar(self, topic, payload):
+        destinos, grupos = set(), {}
+        with self._lock:
+            for c in self._conexiones:
+                for f in c.filtros:
+                    grupo, filtro = _compartido(f)
+                    if not coincide(filtro, topic):
+                        continue
+                    if grupo is None:
+                        destinos.add(c)
+                    else:
+                        grupos.setdefault((grupo, filtro), []).append(c)
+        for miembros in grupos.values():
+            miembros.sort(key=id)
+            destinos.add(miembros[zlib.crc32(topic.encode()) % len(miembros)])
+        if not destinos:
+            return
+        topic_b = topic.encode()
+        datos = _paquete(0x30, struct.pack("!H", len(topic_b)) + topic_b + payload)
+        for conexion in destinos:
+            try:
+                conexion.enviar(datos)
+            except OSError:
+                self.desuscribir(conexion)
+
+    def start(self):
+        """Arranca en un hilo daemon y devuelve el propio broker."""
+        threading.Thread(target=self.serve_forever, daemon=True, name="mini-broker").start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broker MQTT mínimo para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    broker = MiniBroker(args.host, args.port)
+    print(f"[BROKER] Escuchando en {args.host}:{broker.port}")
+    broker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
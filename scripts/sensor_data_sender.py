@@ -1,4 +1,17 @@
 # scripts/sensor_data_sender.py
+"""
+Simulador de sensores ESP32.
+
+Sin argumentos publica un paquete aleatorio de 2 muestras cada 2 segundos
+(modo del contenedor sensor_simulator). Para generar carga:
+
+    python scripts/sensor_data_sender.py --rate 500 --devices 50 --samples 4 \\
+        --alert-ratio 0.01 --duration 60 --quiet
+
+Cada paquete lleva "sent_ms" (epoch ms del envío) para que el backend
+mida la latencia MQTT → Redis y MQTT → DB (ver app/metrics.py).
+"""
+import argparse
 import json
 import time
 import random
@@ -15,40 +28,102 @@ MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 TOPIC = os.getenv("TOPIC", "sensors/data")
 
 
-def gen_random_packet():
+def gen_sample(sample_id):
     return {
-        "seq": random.randint(1, 99999),
-        "alerta": random.choice([0, 0, 0, 1]),
+        "id": sample_id,
+        "soil": {"raw": random.randint(400, 900), "pct": random.randint(10, 80)},
+        "tilt": random.choice([0, 1]),
+        "vib": {"pulse": random.randint(50, 1000), "hit": random.choice([0, 1])}
+    }
+
+
+def gen_random_packet(seq=None, device=0, samples=2, alert_ratio=0.25):
+    """
+    Paquete con `samples` muestras del dispositivo `device`.
+    Los ids de muestra no se repiten entre dispositivos.
+    """
+    return {
+        "device": f"sim-{device}",
+        "seq": seq if seq is not None else random.randint(1, 99999),
+        "alerta": 1 if random.random() < alert_ratio else 0,
         "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "samples": [
-            {
-                "id": 1,
-                "soil": {"raw": random.randint(400, 900), "pct": random.randint(10, 80)},
-                "tilt": random.choice([0, 1]),
-                "vib": {"pulse": random.randint(50, 1000), "hit": random.choice([0, 1])}
-            },
-            {
-                "id": 2,
-                "soil": {"raw": random.randint(400, 900), "pct": random.randint(10, 80)},
-                "tilt": random.choice([0, 1]),
-                "vib": {"pulse": random.randint(50, 1000), "hit": random.choice([0, 1])}
-            }
-        ]
+        "sent_ms": int(time.time() * 1000),
+        "samples": [gen_sample(device * samples + i + 1) for i in range(samples)]
     }
 
 
+def run_load(client, rate, devices=1, samples=2, alert_ratio=0.25, duration=None,
+             count=None, qos=0, topic=TOPIC, verbose=True):
+    """
+    Publica paquetes a `rate` paquetes/s repartidos en round-robin entre
+    `devices` dispositivos (seq propio por dispositivo), hasta `duration`
+    segundos o `count` paquetes. Devuelve {"sent", "elapsed"}. Si `topic`
+    contiene {device}, cada dispositivo publica en su propio topic (así un
+    broker con reparto por hash de topic mantiene el orden por dispositivo).
+    """
+    seqs = [0] * devices
+    intervalo = 1 / rate
+    inicio = time.monotonic()
+    enviados = 0
+    ultimo = None
+
+    while True:
+        if count is not None and enviados >= count:
+            break
+        if duration is not None and time.monotonic() - inicio >= duration:
+            break
+
+        device = enviados % devices
+        seqs[device] += 1
+        data = gen_random_packet(seqs[device], device, samples, alert_ratio)
+        ultimo = client.publish(topic.format(device=device), json.dumps(data), qos=qos)
+        enviados += 1
+        if verbose:
+            print("[MQTT] Enviado:", data)
+
+        # Ritmo fijo respecto al inicio (no acumula el retraso de cada envío)
+        espera = inicio + enviados * intervalo - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+
+    if ultimo is not None:
+        ultimo.wait_for_publish(timeout=30)
+    return {"sent": enviados, "elapsed": time.monotonic() - inicio}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador de sensores / generador de carga MQTT")
+    parser.add_argument("--host", default=MQTT_HOST)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--topic", default=TOPIC, help="admite {device}, p.ej. sensores/dev{device}")
+    parser.add_argument("--rate", type=float, default=0.5, help="paquetes por segundo (total)")
+    parser.add_argument("--devices", type=int, default=1, help="dispositivos simulados")
+    parser.add_argument("--samples", type=int, default=2, help="muestras por paquete")
+    parser.add_argument("--alert-ratio", type=float, default=0.25, help="fracción de paquetes con alerta=1")
+    parser.add_argument("--duration", type=float, default=None, help="segundos (por defecto, sin fin)")
+    parser.add_argument("--count", type=int, default=None, help="número de paquetes")
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1])
+    parser.add_argument("--quiet", action="store_true", help="no imprimir cada paquete")
+    return parser.parse_args(argv)
+
+
 def main():
+    args = parse_args()
     client = mqtt.Client()
 
-    print(f"[MQTT] Conectando a {MQTT_HOST}:{MQTT_PORT} ...")
-    client.connect(MQTT_HOST, MQTT_PORT)
+    print(f"[MQTT] Conectando a {args.host}:{args.port} ...")
+    client.connect(args.host, args.port)
     client.loop_start()
 
-    while True:
-        data = gen_random_packet()
-        client.publish(TOPIC, json.dumps(data))
-        print("[MQTT] Enviado:", data)
-        time.sleep(2)
+    resultado = run_load(
+        client, args.rate, args.devices, args.samples, args.alert_ratio,
+        args.duration, args.count, args.qos, args.topic, verbose=not args.quiet,
+    )
+    print(f"[MQTT] {resultado['sent']} paquetes en {resultado['elapsed']:.1f}s "
+          f"({resultado['sent'] / resultado['elapsed']:.0f} paquetes/s)")
+
+    client.loop_stop()
+    client.disconnect()
 
 
 if __name__ == "__main__":
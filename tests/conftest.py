@@ -0,0 +1,105 @@
+"""
+Fixtures comunes de las pruebas.
+
+Redis es un servidor real (los scripts Lua usan redis.sha1hex, cjson y
+cmsgpack): TEST_REDIS_URL, por defecto la base 15 del Redis local, que
+se vacía antes y después de cada prueba. Sin Redis esas pruebas se
+saltan. La base de datos es un SQLite temporal, o TEST_DATABASE_URL
+(Postgres) para probar el dialecto de producción.
+
+El registro de recursos (app.resources) apunta a ambos antes de que se
+importe nada más, así que los módulos que toman engine / SessionLocal al
+importarse usan los de prueba.
+"""
+import os
+import tempfile
+import time
+
+import pytest
+import redis
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.resources import recursos
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/15")
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL") or \
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='edge-tests-'), 'test.sqlite')}"
+
+_engine = create_engine(
+    TEST_DATABASE_URL,
+    connect_args={"check_same_thread": False} if TEST_DATABASE_URL.startswith("sqlite") else {},
+)
+recursos._engine = _engine
+recursos._sesiones = sessionmaker(bind=_engine, autocommit=False, autoflush=False)
+recursos._redis = {
+    True: redis.Redis.from_url(TEST_REDIS_URL, decode_responses=True, socket_connect_timeout=1),
+    False: redis.Redis.from_url(TEST_REDIS_URL, socket_connect_timeout=1),
+}
+
+
+@pytest.fixture
+def engine():
+    """Esquema recién creado (migrate.upgrade) en la base de pruebas."""
+    from app.db.migrate import upgrade
+    from app.db.models import Base
+
+    Base.metadata.drop_all(_engine)
+    upgrade(_engine)
+    yield _engine
+    _engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with recursos.sesiones()() as s:
+        yield s
+
+
+@pytest.fixture
+def redis_raw():
+    cliente = recursos.redis(decode_responses=False)
+    try:
+        cliente.ping()
+    except redis.ConnectionError:
+        pytest.skip(f"sin Redis de pruebas en {TEST_REDIS_URL}")
+    cliente.flushdb()
+    yield cliente
+    cliente.flushdb()
+
+
+@pytest.fixture
+def redis_client(redis_raw):
+    return recursos.redis()
+
+
+@pytest.fixture
+def cache(redis_raw):
+    """Gestor de caché sin motor de reglas (umbrales fijos)."""
+    from app.cache_manager import CloudSensorCacheManager
+    return CloudSensorCacheManager()
+
+
+@pytest.fixture
+def zona_horaria(monkeypatch):
+    """Cambia la TZ local del proceso; se restaura al terminar la prueba."""
+    def cambiar(tz):
+        monkeypatch.setenv("TZ", tz)
+        time.tzset()
+    yield cambiar
+    monkeypatch.undo()
+    time.tzset()
+
+
+def paquete(seq=1, ts="2025-01-01T10:00:00", device="sensors/esp32-1", samples=None, alerta=0):
+    """Payload JSON del ESP32 con dos sensores completos."""
+    return {
+        "device": device,
+        "seq": seq,
+        "alerta": alerta,
+        "ts": ts,
+        "samples": samples if samples is not None else [
+            {"id": 1, "soil": {"raw": 612, "pct": 40}, "tilt": 0, "vib": {"pulse": 900, "hit": 0}},
+            {"id": 2, "soil": {"raw": 500, "pct": 30}, "tilt": 1, "vib": {"pulse": 100, "hit": 1}},
+        ],
+    }
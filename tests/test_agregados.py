@@ -0,0 +1,52 @@
+"""Agregados móviles 1m/10m/1h (AGREGADOS_LUA) con muestras atrasadas."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+def _guardar(cache, ts, pct, tilt):
+    cache.guardar_paquete([{"id": 1, "soil": {"raw": 600, "pct": pct}, "tilt": tilt}], timestamp=ts)
+
+
+def test_muestras_viejas_no_crecen_el_hash_ni_cambian_los_agregados(cache, redis_client):
+    ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+    _guardar(cache, ahora - timedelta(seconds=1), 40, 0)
+    _guardar(cache, ahora, 50, 1)
+    antes = {m: cache.obtener_agregados("1", m) for m in ("soil_pct", "tilt_trans")}
+    campos = redis_client.hlen("sensor:humedad:1:agg:soil_pct")
+
+    # Reinyección de un spool viejo: un paquete por minuto de hace dos días
+    for minuto in range(300):
+        _guardar(cache, ahora - timedelta(days=2, minutes=minuto), 99, minuto % 2)
+
+    assert redis_client.hlen("sensor:humedad:1:agg:soil_pct") == campos
+    despues = {m: cache.obtener_agregados("1", m) for m in ("soil_pct", "tilt_trans")}
+    assert despues == antes
+    assert despues["soil_pct"]["last"] == 50
+    assert despues["tilt_trans"]["1m"]["sum"] == 1
+
+
+def test_muestra_atrasada_dentro_de_la_ventana_cuenta(cache):
+    ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+    _guardar(cache, ahora, 50, 0)
+    _guardar(cache, ahora - timedelta(minutes=30), 10, 1)
+
+    agregados = cache.obtener_agregados("1", "soil_pct")
+    assert agregados["1h"]["count"] == 2
+    assert agregados["1h"]["min"] == 10
+    assert agregados["1m"]["count"] == 1
+    assert agregados["last"] == 50
+    assert cache.obtener_agregados("1", "tilt_trans")["1h"]["sum"] == 0
+
+
+@pytest.mark.parametrize("tz", ["America/Lima", "Asia/Tokyo"])
+def test_horas_utc_con_otra_zona_local(cache, zona_horaria, tz):
+    zona_horaria(tz)
+    ahora = datetime.now(timezone.utc).replace(tzinfo=None)   # como normalizar_ts
+    _guardar(cache, ahora, 50, 1)
+
+    agregados = cache.obtener_agregados("1", "soil_pct")
+    assert agregados["1m"]["count"] == 1
+    assert abs(datetime.fromisoformat(agregados["last_ts"]) - ahora) < timedelta(seconds=1)
+    # Ni caducada (Tokio, UTC+9) ni en el futuro (Lima, UTC-5) en el dashboard
+    assert [s["sensor_id"] for s in cache.obtener_dashboard()["sensores"]["humedad"]] == ["1"]
@@ -0,0 +1,55 @@
+"""Índice de alertas activas ordenado por tiempo (funcs/funciones_redis.py)."""
+import json
+import time
+from datetime import datetime, timedelta
+
+from funcs.funciones_redis import ALERTAS_INDICE_KEY, ALERTAS_LEGADO_KEY, _indice_alertas, _us
+
+
+def _alertas(cache, n, tipo="vibracion"):
+    return [cache._generar_alerta(str(i), tipo, f"alerta {i}") for i in range(n)]
+
+
+def test_paginas_de_la_mas_nueva_a_la_mas_vieja(cache):
+    ids = _alertas(cache, 5)
+    _alertas(cache, 2, "humedad")
+
+    paginas, cursor = [], None
+    while True:
+        pagina = cache.listar_alertas("vibracion", limite=2, cursor=cursor)
+        paginas.append([a["id"] for a in pagina["alertas"]])
+        cursor = pagina["siguiente"]
+        if cursor is None:
+            break
+
+    assert paginas == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+    assert len(cache.listar_alertas(limite=None)["alertas"]) == 7
+
+
+def test_poda_vencidas_y_huerfanas(cache, redis_client):
+    vigente, huerfana = _alertas(cache, 2)
+    redis_client.delete(f"alerta:{huerfana}")
+    vieja = _us(time.time() - cache.TTL_ALERTAS_ACTIVAS - 60)
+    redis_client.zadd(ALERTAS_INDICE_KEY, {"9:vibracion:99": vieja})
+
+    assert [a["id"] for a in cache.listar_alertas()["alertas"]] == [vigente]
+    assert redis_client.zrange(ALERTAS_INDICE_KEY, 0, -1) == [vigente]
+    assert redis_client.zrange(_indice_alertas("vibracion"), 0, -1) == [vigente]
+
+
+def test_migrar_alertas_del_set_anterior(cache, redis_client):
+    for i, tipo in enumerate(["humedad", "inclinacion"]):
+        alerta_id = f"{i}:{tipo}:{i}"
+        ts = (datetime.now() - timedelta(minutes=10 - i)).isoformat()
+        redis_client.set(f"alerta:{alerta_id}", json.dumps(
+            {"id": alerta_id, "sensor_id": str(i), "tipo_sensor": tipo, "mensaje": "m",
+             "timestamp": ts, "activa": True, "resuelta": False}))
+        redis_client.sadd(ALERTAS_LEGADO_KEY, alerta_id)
+    redis_client.sadd(ALERTAS_LEGADO_KEY, "5:humedad:5")   # clave ya expirada
+
+    assert cache.migrar_alertas() == 2
+    assert cache.migrar_alertas() == 0
+
+    assert not redis_client.exists(ALERTAS_LEGADO_KEY)
+    assert [a["id"] for a in cache.obtener_alertas_activas()] == ["1:inclinacion:1", "0:humedad:0"]
+    assert [a["id"] for a in cache.obtener_alertas_activas("humedad")] == ["0:humedad:0"]
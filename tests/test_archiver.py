@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.db.bulk import insert_packets
+from app.db.models import SensorPacket, SensorPanel, SensorRollupHourly
+from app.paquetes import validar_paquete
+from funcs.codificacion import CODECS, decodificar
+from tests.conftest import paquete
+
+
+def _ingestar(cache, session, n=5):
+    """Lo que hacen on_message + PacketWriter con `n` paquetes."""
+    lote = [validar_paquete(paquete(seq=s, ts=f"2025-01-01T10:{s:02d}:00.250+02:00")) for s in range(n)]
+    for p in lote:
+        cache.guardar_paquete(p["samples"], seq=p["seq"], alerta=p["alerta"],
+                              timestamp=p["timestamp"], device=p["device"])
+    insert_packets(session, lote)
+    session.commit()
+    return lote
+
+
+def _totales(session):
+    return (
+        session.scalar(select(func.count()).select_from(SensorPacket)),
+        session.scalar(select(func.count()).select_from(SensorPanel)),
+        session.scalar(select(func.sum(SensorRollupHourly.samples))),
+        session.scalar(select(func.sum(SensorRollupHourly.soil_sum))),
+    )
+
+
+def test_codecs_guardan_el_device():
+    lectura = {"tipo": "inclinacion", "estado": 1, "timestamp": datetime(2025, 1, 1, 10, 0, 0, 250000),
+               "seq": 3, "alerta": 0, "device": "sensors/esp32-ñ"}
+    for codec in CODECS.values():
+        data = decodificar(codec.codificar(lectura))
+        assert data["device"] == "sensors/esp32-ñ"
+        assert data["timestamp"] == "2025-01-01T10:00:00.250000"
+        sin_device = {k: v for k, v in lectura.items() if k != "device"}
+        assert "device" not in decodificar(codec.codificar(sin_device))
+
+
+def test_archiver_no_duplica_lo_que_inserto_el_writer(cache, session, monkeypatch):
+    from app.archiver import Archiver
+
+    _ingestar(cache, session)
+    antes = _totales(session)
+    assert antes == (5, 10, 10, 350)
+
+    monkeypatch.setattr(settings, "ARCHIVE_THRESHOLD_DAYS", 0)
+    Archiver().archive_once()
+    session.expire_all()
+
+    assert _totales(session) == antes
+    assert cache.redis_raw.llen("sensor:humedad:1:historico") == 0
+
+
+def test_archiver_inserta_lo_que_solo_estaba_en_redis(cache, session, monkeypatch):
+    from app.archiver import Archiver
+
+    for s in range(3):
+        p = validar_paquete(paquete(seq=s, ts=f"2025-01-01T10:{s:02d}:00"))
+        cache.guardar_paquete(p["samples"], seq=p["seq"], alerta=p["alerta"],
+                              timestamp=p["timestamp"], device=p["device"])
+
+    monkeypatch.setattr(settings, "ARCHIVE_THRESHOLD_DAYS", 0)
+    Archiver().archive_once()
+
+    filas = session.execute(select(SensorPacket.device, SensorPacket.seq).order_by(SensorPacket.seq)).all()
+    assert filas == [("sensors/esp32-1", 0), ("sensors/esp32-1", 1), ("sensors/esp32-1", 2)]
+    assert _totales(session)[:3] == (3, 6, 6)
+
+
+def test_umbral_en_utc_con_otra_zona_local(cache, session, monkeypatch, zona_horaria):
+    from app.archiver import Archiver
+
+    zona_horaria("America/Lima")
+    hace_dos_horas = datetime.now(timezone.utc) - timedelta(hours=2)
+    p = validar_paquete(paquete(ts=hace_dos_horas.isoformat()))
+    cache.guardar_paquete(p["samples"], seq=p["seq"], alerta=p["alerta"],
+                          timestamp=p["timestamp"], device=p["device"])
+
+    monkeypatch.setattr(settings, "ARCHIVE_THRESHOLD_DAYS", 0)
+    Archiver().archive_once()
+
+    assert _totales(session)[:2] == (1, 2)
+
+
+def test_lote_pendiente_se_recupera_tras_una_caida(cache, session, monkeypatch):
+    from app.archiver import PENDIENTES_KEY, Archiver
+
+    _ingestar(cache, session, n=0)
+    for s in range(2):
+        p = validar_paquete(paquete(seq=s))
+        cache.guardar_paquete(p["samples"], seq=p["seq"], alerta=p["alerta"],
+                              timestamp=p["timestamp"], device=p["device"])
+    monkeypatch.setattr(settings, "ARCHIVE_THRESHOLD_DAYS", 0)
+
+    def caida(self, lote):
+        raise RuntimeError("caída entre el movimiento y el commit")
+
+    archiver = Archiver()
+    monkeypatch.setattr(Archiver, "_commit_batch", caida)
+    try:
+        archiver.archive_once()
+    except RuntimeError:
+        pass
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, "ARCHIVE_THRESHOLD_DAYS", 0)
+    assert cache.redis_client.scard(PENDIENTES_KEY) == 1
+
+    Archiver().archive_once()
+    assert cache.redis_client.scard(PENDIENTES_KEY) == 0
+    assert _totales(session)[:2] == (2, 4)
+
+
+def test_flush_de_redis_no_hace_pasar_un_lote_por_insertado(cache, session, monkeypatch):
+    from app.archiver import Archiver
+
+    monkeypatch.setattr(settings, "ARCHIVE_THRESHOLD_DAYS", 0)
+    for ronda in range(2):
+        p = validar_paquete(paquete(seq=ronda, ts=f"2025-01-0{ronda + 1}T10:00:00"))
+        cache.guardar_paquete(p["samples"], seq=p["seq"], alerta=p["alerta"],
+                              timestamp=p["timestamp"], device=p["device"])
+        Archiver().archive_once()
+        cache.redis_raw.flushdb()   # Redis vacío: cualquier contador vuelve a empezar
+
+    assert _totales(session)[:2] == (2, 4)
+
+
+def test_upgrade_de_archivebatch_con_ids_de_redis(engine):
+    from sqlalchemy import text
+
+    from app.db.migrate import upgrade
+    from app.db.models import ArchiveBatch
+    from app.resources import recursos
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE monitoring_archivebatch"))
+        conn.execute(text("CREATE TABLE monitoring_archivebatch "
+                          "(id INTEGER NOT NULL PRIMARY KEY, rows INTEGER NOT NULL, created_at TIMESTAMP)"))
+        conn.execute(text("INSERT INTO monitoring_archivebatch (id, rows) VALUES (7, 10)"))
+    upgrade(engine)
+
+    with recursos.sesiones()() as session:
+        session.add(ArchiveBatch(lote="a" * 32, rows=1))
+        session.commit()
+        assert session.execute(select(ArchiveBatch.id, ArchiveBatch.lote).order_by(ArchiveBatch.id)).all() == [
+            (7, None), (8, "a" * 32),
+        ]
@@ -0,0 +1,65 @@
+"""Runtime asyncio (app/async_ingest.py): escrituras Redis por dispositivo."""
+import asyncio
+import time
+
+import redis.asyncio
+
+from app.async_ingest import IngestaAsync
+from app.paquetes import validar_paquete
+from tests.conftest import TEST_REDIS_URL, paquete
+
+
+def _paquete(seq, tilt, device="sensors/esp32-1"):
+    p = validar_paquete(paquete(seq=seq, device=device, ts=f"2025-01-01T10:00:0{seq}",
+                                samples=[{"id": 1, "tilt": tilt}]))
+    return {**p, "sent_ms": time.time() * 1000}
+
+
+def _ingesta():
+    ingesta = IngestaAsync(notifier=None)
+    ingesta.cache.reglas = None   # umbrales fijos: alerta de inclinación 0 → 1
+    return ingesta
+
+
+async def _escribir(ingesta, paquetes, retardos):
+    """_redis de cada paquete con el pipeline n-ésimo retrasado retardos[n] s."""
+    ingesta.redis = redis.asyncio.Redis.from_url(TEST_REDIS_URL)
+    ingesta._sem = {"redis": asyncio.Semaphore(ingesta.max_redis)}
+    ejecutar = ingesta._ejecutar
+    orden, en_vuelo = [], [0, 0]
+
+    async def lento(pipe):
+        n = len(orden)
+        orden.append(n)
+        en_vuelo[0] += 1
+        en_vuelo[1] = max(en_vuelo)
+        await asyncio.sleep(retardos[n])
+        try:
+            return await ejecutar(pipe)
+        finally:
+            en_vuelo[0] -= 1
+
+    ingesta._ejecutar = lento
+    for p in paquetes:
+        await ingesta._redis(p)
+    await asyncio.gather(*ingesta._tareas)
+    await ingesta.redis.aclose()
+    return en_vuelo[1]
+
+
+def test_pipelines_del_mismo_device_en_orden(cache):
+    ingesta = _ingesta()
+    # Sin serializar, el segundo pipeline llega antes que el primero
+    asyncio.run(_escribir(ingesta, [_paquete(1, 0), _paquete(2, 1)], [0.05, 0]))
+
+    actual = cache.obtener_estado_actual("1", "inclinacion")
+    assert (actual["seq"], actual["estado"]) == (2, 1)
+    assert len(cache.obtener_alertas_activas("inclinacion")) == 1
+    assert ingesta._por_device == {}
+
+
+def test_devices_distintos_siguen_en_paralelo(cache):
+    ingesta = _ingesta()
+    paquetes = [_paquete(1, 0, device=f"sensors/esp32-{n}") for n in range(4)]
+
+    assert asyncio.run(_escribir(ingesta, paquetes, [0.02] * 4)) == 4
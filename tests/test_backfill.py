@@ -0,0 +1,76 @@
+"""Carga masiva (app/backfill.py): Redis, segmentos fríos y retención."""
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.backfill import Backfill
+from app.config import settings
+from app.db.bulk import insert_packets
+from app.db.models import SensorPacket
+from app.paquetes import validar_paquete
+from tests.conftest import paquete
+
+
+def _fichero(tmp_path, paquetes):
+    ruta = tmp_path / "carga.jsonl"
+    ruta.write_text("".join(json.dumps(p) + "\n" for p in paquetes))
+    return str(ruta)
+
+
+def _hace(**delta):
+    return (datetime.now(timezone.utc) - timedelta(**delta)).isoformat()
+
+
+def test_backfill_no_pisa_lecturas_mas_nuevas_de_redis(engine, cache, redis_raw, tmp_path):
+    vivo = validar_paquete(paquete(seq=100, ts=_hace(minutes=1)))
+    cache.guardar_paquete(vivo["samples"], seq=vivo["seq"], alerta=0, timestamp=vivo["timestamp"],
+                          device=vivo["device"])
+    actual = redis_raw.get("sensor:humedad:1:actual")
+    solo_carga = [{"id": 5, "soil": {"raw": 600, "pct": 50}}]
+    ruta = _fichero(tmp_path, [
+        paquete(seq=1, ts=_hace(minutes=30)),
+        paquete(seq=2, ts=_hace(minutes=20), samples=solo_carga),
+        paquete(seq=3, ts=_hace(minutes=10), samples=solo_carga),
+    ])
+
+    totales = Backfill(procesos=1, engine=engine, alertas=False).cargar([ruta])
+
+    assert (totales["insertados"], totales["redis"]) == (3, 3)
+    assert redis_raw.get("sensor:humedad:1:actual") == actual
+    assert redis_raw.hget("dashboard:sensores:humedad", "1") == actual
+    assert redis_raw.llen("sensor:humedad:1:historico") == 1
+    # Sensor sin lectura en Redis: toma la más nueva de la carga, sin :historico
+    assert cache.obtener_estado_actual("5", "humedad")["seq"] == 3
+    assert redis_raw.llen("sensor:humedad:5:historico") == 0
+    assert cache.obtener_agregados("5", "soil_pct")["1h"]["count"] == 2
+
+
+def test_backfill_salta_lo_anterior_a_la_retencion(engine, session, redis_raw, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RETENTION_POLICIES", "monitoring_sensorpacket=30")
+    ruta = _fichero(tmp_path, [paquete(seq=1, ts=_hace(days=40)), paquete(seq=2, ts=_hace(days=2))])
+
+    totales = Backfill(procesos=1, engine=engine, redis_horas=0).cargar([ruta])
+
+    assert (totales["insertados"], totales["fuera"], totales["repetidos"]) == (1, 1, 0)
+
+
+def test_relanzar_tras_compactar_no_duplica(engine, session, redis_raw, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from app.db import cold
+
+    monkeypatch.setattr(settings, "COLD_STORAGE_URL", str(tmp_path / "frio"))
+    cold.almacen.cache_clear()
+    try:
+        paquetes = [paquete(seq=s, ts=f"2025-01-01T10:0{s}:00") for s in range(3)]
+        insert_packets(session, [validar_paquete(p) for p in paquetes])
+        session.commit()
+        cold.compactar(engine, corte=datetime(2025, 1, 2))
+
+        totales = Backfill(procesos=1, engine=engine, redis_horas=0).cargar([_fichero(tmp_path, paquetes)])
+
+        assert (totales["insertados"], totales["fuera"]) == (0, 3)
+        assert session.scalar(select(func.count()).select_from(SensorPacket)) == 0
+    finally:
+        cold.almacen.cache_clear()
@@ -0,0 +1,111 @@
+"""Escrituras de lecturas en Redis (funcs/funciones_redis.py)."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from redis.client import Pipeline
+
+from funcs.codificacion import CODECS, obtener_codec
+from tests.conftest import paquete
+
+
+@pytest.fixture
+def envios(monkeypatch):
+    """Cuenta los pipelines enviados a Redis."""
+    llamadas = []
+    original = Pipeline.execute
+
+    def execute(self, *args, **kwargs):
+        llamadas.append(len(self))
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(Pipeline, "execute", execute)
+    return llamadas
+
+
+def _tilt(cache, estado, sensor=1):
+    cache.guardar_paquete([{"id": sensor, "tilt": estado}], seq=estado, timestamp=datetime.now(),
+                          device="sensors/esp32-1")
+
+
+@pytest.mark.parametrize("codec", sorted(CODECS))
+def test_inclinacion_0_a_1_alerta_en_un_solo_envio(cache, envios, codec):
+    cache.codec = obtener_codec(codec)
+    _tilt(cache, 0)
+    _tilt(cache, 1)
+    _tilt(cache, 1)
+
+    assert len(envios) == 3
+    alertas = cache.obtener_alertas_activas("inclinacion")
+    assert [(a["sensor_id"], a["mensaje"]) for a in alertas] == [("1", "Cambio de posición detectado")]
+    assert cache.obtener_estado_actual("1", "inclinacion")["estado"] == 1
+
+
+def test_inclinacion_sin_estado_previo_ni_con_reglas_no_alerta(cache):
+    _tilt(cache, 1)
+    cache.reglas = type("SinAlertas", (), {"evaluar": lambda self, samples, now: []})()
+    _tilt(cache, 0, sensor=2)
+    _tilt(cache, 1, sensor=2)
+
+    assert cache.obtener_alertas_activas("inclinacion") == []
+
+
+def test_dashboard_compara_horas_y_no_cadenas(cache, redis_raw):
+    # Una lectura reciente con zona que, como cadena, parece de hace horas
+    reciente = datetime.now(timezone(timedelta(hours=-12))).isoformat()
+    vieja = (datetime.now(timezone.utc) - timedelta(hours=3)).isoformat()
+    redis_raw.hset("dashboard:sensores:humedad", mapping={
+        "1": f'{{"porcentaje": 40, "valor_raw": 600, "tipo": "humedad", "timestamp": "{reciente}"}}',
+        "2": f'{{"porcentaje": 40, "valor_raw": 600, "tipo": "humedad", "timestamp": "{vieja}"}}',
+    })
+
+    sensores = cache.obtener_dashboard()["sensores"]["humedad"]
+
+    assert [s["sensor_id"] for s in sensores] == ["1"]
+    assert redis_raw.hkeys("dashboard:sensores:humedad") == [b"1"]
+
+
+def test_guardar_paquete_escribe_lo_mismo_que_por_sensor_en_un_envio(cache, redis_raw, envios):
+    samples = paquete()["samples"]
+    cache.guardar_paquete(samples)
+    assert len(envios) == 1
+    por_paquete = {k: redis_raw.type(k) for k in redis_raw.keys()}
+
+    redis_raw.flushdb()
+    for s in samples:
+        sid = str(s["id"])
+        cache.guardar_humedad(sid, s["soil"]["pct"], s["soil"]["raw"])
+        cache.guardar_inclinacion(sid, s["tilt"])
+        cache.guardar_vibracion(sid, s["vib"]["pulse"], s["vib"]["hit"])
+
+    assert por_paquete == {k: redis_raw.type(k) for k in redis_raw.keys()}
+    assert cache.obtener_estado_actual("2", "humedad")["porcentaje"] == 30
+    assert len(cache.obtener_alertas_activas("vibracion")) == 1
+
+
+def test_dashboard_lee_el_snapshot_y_el_registro(cache, redis_raw, envios):
+    cache.guardar_humedad("1", 40, 600)
+    cache.guardar_humedad("1", 55, 700)
+    cache.guardar_humedad("2", 30, 500)
+    envios.clear()
+
+    dashboard = cache.obtener_dashboard()
+
+    assert len(envios) == 1
+    assert {s["sensor_id"]: s["porcentaje"] for s in dashboard["sensores"]["humedad"]} == {"1": 55, "2": 30}
+    assert cache.obtener_sensores("humedad") == ["1", "2"]
+
+
+def test_reconstruir_registro_desde_claves_anteriores(cache, redis_raw):
+    cache.guardar_humedad("1", 40, 600)
+    cache.guardar_inclinacion("7", 0)
+    redis_raw.delete("sensores:humedad", "sensores:inclinacion",
+                     "dashboard:sensores:humedad", "dashboard:sensores:inclinacion")
+    assert cache.obtener_dashboard()["sensores"]["humedad"] == []
+
+    assert cache.reconstruir_registro() == 2
+    assert cache.reconstruir_registro() == 2
+
+    sensores = cache.obtener_dashboard()["sensores"]
+    assert [s["sensor_id"] for s in sensores["humedad"]] == ["1"]
+    assert [s["sensor_id"] for s in sensores["inclinacion"]] == ["7"]
+    assert cache.obtener_sensores("inclinacion") == ["7"]
@@ -0,0 +1,118 @@
+"""Métricas de latencia y generador de carga (app/metrics.py, scripts/)."""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from app import metrics
+from app.config import settings
+from app.mqtt_client import suscripcion_compartida
+from app.paquetes import validar_paquete
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from mini_broker import MiniBroker  # noqa: E402
+from sensor_data_sender import run_load  # noqa: E402
+
+
+def test_histograma_percentiles_por_bucket():
+    hist = metrics.Histograma("prueba_seconds", "prueba", buckets=(0.01, 0.1, 1))
+    for valor in [0.005] * 90 + [0.05] * 9 + [3]:
+        hist.observar(valor)
+
+    resumen = hist.resumen()
+    assert (resumen["count"], resumen["p50"], resumen["p95"], resumen["max"]) == (100, 0.01, 0.1, 3)
+    assert resumen["p99"] == 0.1 and hist.percentil(100) == 3
+    lineas = hist.exponer()
+    assert 'prueba_seconds_bucket{le="0.1"} 99' in lineas
+    assert 'prueba_seconds_bucket{le="+Inf"} 100' in lineas
+
+    metrics.observar_desde(hist, None, 10)
+    metrics.observar_desde(hist, 9000, 10)
+    assert hist.total == 101
+
+
+def test_run_load_reparte_entre_dispositivos_con_seq_propio():
+    broker = MiniBroker(port=0).start()
+    recibidos, suscrito, completo = [], threading.Event(), threading.Event()
+
+    def on_message(client, userdata, msg):
+        recibidos.append((msg.topic, json.loads(msg.payload)))
+        if len(recibidos) == 12:
+            completo.set()
+
+    receptor = mqtt.Client()
+    receptor.on_message = on_message
+    receptor.on_subscribe = lambda *a: suscrito.set()
+    receptor.connect("127.0.0.1", broker.port)
+    receptor.subscribe("carga/#")
+    receptor.loop_start()
+    emisor = mqtt.Client()
+    emisor.connect("127.0.0.1", broker.port)
+    emisor.loop_start()
+    try:
+        assert suscrito.wait(5)
+        envio = run_load(emisor, rate=1000, devices=3, samples=2, alert_ratio=0,
+                         count=12, topic="carga/dev{device}", verbose=False)
+        assert completo.wait(5)
+    finally:
+        for cliente in (emisor, receptor):
+            cliente.disconnect()
+            cliente.loop_stop()
+        broker.shutdown()
+
+    assert envio["sent"] == 12
+    por_device = {}
+    for topic, data in recibidos:
+        p = validar_paquete(data)
+        assert topic == f"carga/dev{p['device'].split('-')[1]}" and p["alerta"] == 0
+        assert "sent_ms" in data
+        por_device.setdefault(p["device"], []).append(p["seq"])
+    assert por_device == {f"sim-{d}": [1, 2, 3, 4] for d in range(3)}
+
+
+def _suscriptor(broker, filtro, recibidos):
+    suscrito = threading.Event()
+    cliente = mqtt.Client()
+    cliente.on_message = lambda c, u, msg: recibidos.append(msg.topic)
+    cliente.on_subscribe = lambda *a: suscrito.set()
+    cliente.connect("127.0.0.1", broker.port)
+    cliente.subscribe(filtro)
+    cliente.loop_start()
+    assert suscrito.wait(5)
+    return cliente
+
+
+def test_suscripcion_compartida_reparte_por_topic(monkeypatch):
+    monkeypatch.setattr(settings, "MQTT_TOPIC_PREFIX", "carga/#")
+    client_ids, topics = zip(*(suscripcion_compartida(w) for w in range(2)))
+    assert client_ids == (f"{settings.MQTT_CLIENT_ID}-{socket.gethostname()}-0",
+                          f"{settings.MQTT_CLIENT_ID}-{socket.gethostname()}-1")
+    assert set(topics) == {f"$share/{settings.MQTT_SHARED_GROUP}/carga/#"}
+
+    broker = MiniBroker(port=0).start()
+    workers, todos = [[], []], []
+    clientes = [_suscriptor(broker, topics[w], workers[w]) for w in range(2)]
+    clientes.append(_suscriptor(broker, "carga/#", todos))
+    emisor = mqtt.Client()
+    emisor.connect("127.0.0.1", broker.port)
+    emisor.loop_start()
+    try:
+        run_load(emisor, rate=1000, devices=8, alert_ratio=0, count=80,
+                 topic="carga/dev{device}", verbose=False)
+        limite = time.monotonic() + 5
+        while len(todos) + len(workers[0]) + len(workers[1]) < 160 and time.monotonic() < limite:
+            time.sleep(0.05)
+    finally:
+        for cliente in clientes + [emisor]:
+            cliente.disconnect()
+            cliente.loop_stop()
+        broker.shutdown()
+
+    # Cada mensaje a un solo miembro del grupo, y cada topic siempre al mismo
+    assert len(todos) == 80 and len(workers[0]) + len(workers[1]) == 80
+    assert not set(workers[0]) & set(workers[1])
+    assert workers[0] and workers[1]
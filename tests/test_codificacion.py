@@ -0,0 +1,47 @@
+"""Codecs de las lecturas en Redis (funcs/codificacion.py)."""
+from datetime import datetime
+
+import pytest
+
+from funcs.codificacion import CODECS, decodificar, obtener_codec
+
+TS = datetime(2025, 1, 1, 10, 0, 0, 250000)
+LECTURAS = [
+    {"tipo": "humedad", "porcentaje": 45.5, "valor_raw": 612},
+    {"tipo": "vibracion", "pulse": 900, "hit": 1},
+    {"tipo": "inclinacion", "estado": 1},
+]
+
+
+@pytest.mark.parametrize("codec", sorted(CODECS))
+@pytest.mark.parametrize("lectura", LECTURAS, ids=lambda l: l["tipo"])
+def test_ida_y_vuelta(codec, lectura):
+    raw = obtener_codec(codec).codificar({**lectura, "timestamp": TS, "seq": 7, "alerta": 1})
+
+    assert decodificar(raw) == {**lectura, "timestamp": TS.isoformat(), "seq": 7, "alerta": 1}
+
+
+@pytest.mark.parametrize("codec", sorted(set(CODECS) - {"json"}))
+def test_binarios_mas_pequenos_que_json(codec):
+    data = {**LECTURAS[0], "timestamp": TS, "seq": 7, "alerta": 0}
+    assert len(obtener_codec(codec).codificar(data)) < len(CODECS["json"].codificar(data)) / 3
+
+
+@pytest.mark.parametrize("codec", sorted(CODECS))
+def test_timestamp_no_depende_de_la_zona_local(codec, zona_horaria):
+    zona_horaria("America/Lima")
+    raw = obtener_codec(codec).codificar({**LECTURAS[0], "timestamp": TS})
+    zona_horaria("Asia/Tokyo")
+
+    assert decodificar(raw)["timestamp"] == TS.isoformat()
+
+
+def test_lectura_sin_seq_y_formatos_desconocidos():
+    raw = obtener_codec("struct").codificar({**LECTURAS[2], "timestamp": TS})
+    assert "seq" not in decodificar(raw)
+    # JSON legado como str (cliente con decode_responses)
+    assert decodificar('{"estado": 0, "timestamp": "2025-01-01T10:00:00"}')["estado"] == 0
+    with pytest.raises(ValueError):
+        decodificar(b"\x09resto")
+    with pytest.raises(ValueError):
+        obtener_codec("xml")
@@ -0,0 +1,95 @@
+"""Almacenamiento frío (app/db/cold.py): compactación y lectura mezclada con la BD."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.db import cold
+from app.db.bulk import insert_packets
+from app.db.export import bloques, pa
+from app.db.models import ColdSegment, SensorPacket
+from app.paquetes import validar_paquete
+from tests.conftest import paquete
+
+pytestmark = pytest.mark.skipif(pa is None, reason="requiere pyarrow")
+
+DIA, SIGUIENTE = datetime(2025, 1, 1), datetime(2025, 1, 2)
+
+
+@pytest.fixture
+def frio(engine, session, monkeypatch, tmp_path):
+    """Tres paquetes del 1 de enero en la BD y COLD_STORAGE_URL en tmp_path."""
+    monkeypatch.setattr(settings, "COLD_STORAGE_URL", str(tmp_path))
+    cold.almacen.cache_clear()
+    _insertar(session, *[(s, f"2025-01-01T10:0{s}:00") for s in range(3)])
+    yield engine
+    cold.almacen.cache_clear()
+
+
+def _insertar(session, *paquetes):
+    insert_packets(session, [validar_paquete(paquete(seq=s, ts=ts)) for s, ts in paquetes])
+    session.commit()
+
+
+def _exportar(engine):
+    """(timestamp, seq, sample_id) de lo que exporta /export para dos días."""
+    with engine.connect() as conexion:
+        return [(f[0].replace(tzinfo=None), f[2], f[5])
+                for bloque in bloques(conexion, DIA, datetime(2025, 1, 3)) for f in bloque]
+
+
+def _paquetes(session):
+    session.expire_all()
+    return session.scalar(select(func.count()).select_from(SensorPacket))
+
+
+def test_exportacion_mezcla_segmento_y_filas_vivas(frio, session):
+    antes = _exportar(frio)
+    assert cold.compactar(frio, corte=SIGUIENTE) == 6
+    assert _paquetes(session) == 0
+
+    # Replay tardío del día ya compactado y un día que sigue en la BD
+    _insertar(session, (9, "2025-01-01T23:00:00"), (10, "2025-01-02T08:00:00"))
+
+    # Cada día, primero el segmento (por sensor) y después la BD
+    filas = _exportar(frio)
+    assert sorted(filas[:6]) == sorted(antes)
+    assert filas[6:] == [(datetime(2025, 1, 1, 23), 9, 1), (datetime(2025, 1, 1, 23), 9, 2),
+                         (datetime(2025, 1, 2, 8), 10, 1), (datetime(2025, 1, 2, 8), 10, 2)]
+
+
+def test_recompactar_no_hace_nada(frio, session):
+    assert cold.compactar(frio, corte=SIGUIENTE) == 6
+    segmentos = session.execute(select(ColdSegment.ruta, ColdSegment.filas)).all()
+
+    assert cold.compactar(frio, corte=SIGUIENTE) == 0
+    assert session.execute(select(ColdSegment.ruta, ColdSegment.filas)).all() == segmentos
+
+
+def test_solo_borra_los_paquetes_escritos(frio, session, monkeypatch):
+    # Lo que no entra en la lectura (llegó después) no se borra con el día
+    consulta = cold.consulta
+    monkeypatch.setattr(cold, "consulta", lambda *a, **k: consulta(*a, **k).where(SensorPacket.seq != 2))
+
+    assert cold.compactar(frio, corte=SIGUIENTE) == 4
+    assert session.execute(select(SensorPacket.seq)).scalars().all() == [2]
+
+
+def test_fallo_tras_escribir_el_fichero_no_pierde_filas(frio, session, monkeypatch):
+    antes = _exportar(frio)
+
+    def caida(*args, **kwargs):
+        raise RuntimeError("caída entre el fichero y el catálogo")
+
+    with monkeypatch.context() as m:
+        m.setattr(cold, "insert", caida)
+        with pytest.raises(RuntimeError):
+            cold.compactar(frio, corte=SIGUIENTE)
+    assert session.scalar(select(func.count()).select_from(ColdSegment)) == 0
+    assert _paquetes(session) == 3
+
+    # El siguiente intento reescribe el fichero huérfano
+    assert cold.compactar(frio, corte=SIGUIENTE) == 6
+    assert _paquetes(session) == 0
+    assert sorted(_exportar(frio)) == sorted(antes)
@@ -0,0 +1,45 @@
+"""PacketWriter (app/db_writer.py): lotes fuera del hilo de MQTT."""
+import time
+
+from sqlalchemy import func, select
+
+import app.db_writer as db_writer
+from app.config import settings
+from app.db.models import SensorPacket
+from app.paquetes import validar_paquete
+from tests.conftest import paquete
+
+
+def _paquetes(n):
+    return [{**validar_paquete(paquete(seq=s)), "sent_ms": time.time() * 1000} for s in range(n)]
+
+
+def test_agrupa_por_tamano_y_por_edad(session, monkeypatch):
+    monkeypatch.setattr(settings, "DB_BATCH_SIZE", 3)
+    monkeypatch.setattr(settings, "DB_BATCH_MAX_AGE_MS", 50)
+    lotes = []
+    insertar = db_writer.insert_packets
+    monkeypatch.setattr(db_writer, "insert_packets", lambda db, batch: lotes.append(len(batch)) or insertar(db, batch))
+
+    writer = db_writer.PacketWriter()
+    writer.start()
+    for p in _paquetes(7):
+        assert writer.submit(p)
+    time.sleep(0.3)   # el último lote sale por edad, sin llegar a 3
+    writer.stop()
+    writer.join(timeout=5)
+
+    assert lotes == [3, 3, 1]
+    assert session.scalar(select(func.count()).select_from(SensorPacket)) == 7
+
+
+def test_cola_llena_descarta_sin_bloquear(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_QUEUE_SIZE", 1)
+    monkeypatch.setattr(settings, "INGEST_QUEUE_PUT_TIMEOUT_SECONDS", 0.01)
+    writer = db_writer.PacketWriter()   # sin arrancar: nadie consume
+
+    primero, segundo = _paquetes(2)
+    assert writer.submit(primero)
+    t0 = time.monotonic()
+    assert not writer.submit(segundo)
+    assert time.monotonic() - t0 < 1
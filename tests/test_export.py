@@ -0,0 +1,102 @@
+"""Exportación del histórico en streaming (app/db/export.py, GET /export)."""
+import csv
+import gzip
+import http.client
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.db.bulk import insert_packets
+from app.db.export import NOMBRES, Exportacion, pa, pq
+from app.paquetes import validar_paquete
+from app.read_api import ReadAPI, ServidorLectura
+from tests.conftest import paquete
+
+DESDE, HASTA = datetime(2025, 1, 1), datetime(2025, 1, 3)
+
+
+@pytest.fixture
+def historico(session):
+    # 4 paquetes de 2 samples en dos días; el de las 23:00 con alerta
+    horas = ["2025-01-01T10:00:00", "2025-01-01T23:00:00", "2025-01-02T08:00:00", "2025-01-02T09:00:00"]
+    insert_packets(session, [
+        validar_paquete(paquete(seq=i, ts=ts, alerta=int(i == 1))) for i, ts in enumerate(horas)
+    ])
+    session.commit()
+    return horas
+
+
+def _csv(datos):
+    return list(csv.reader(io.StringIO(gzip.decompress(datos).decode())))
+
+
+def test_csv_por_bloques_y_en_orden(engine, historico):
+    exportacion = Exportacion(DESDE, HASTA, "csv", chunk=3, engine=engine)
+    filas = _csv(b"".join(exportacion))
+
+    assert exportacion.filas == 8
+    assert tuple(filas[0]) == NOMBRES
+    horas = [datetime.fromisoformat(f[0]).replace(tzinfo=None) for f in filas[1::2]]
+    assert horas == [datetime.fromisoformat(h) for h in historico]
+    assert [f[5] for f in filas[1:3]] == ["1", "2"]
+
+
+def test_filtros_de_sensor_y_alerta(engine, historico):
+    filas = _csv(b"".join(Exportacion(DESDE, HASTA, sample_ids=[2], alerta=True, engine=engine)))
+    assert [(f[2], f[5]) for f in filas[1:]] == [("1", "2")]
+
+    filas = _csv(b"".join(Exportacion(DESDE, datetime(2025, 1, 2), alerta=False, engine=engine)))
+    assert len(filas) == 1 + 2
+
+
+@pytest.mark.skipif(pa is None, reason="requiere pyarrow")
+def test_parquet(engine, historico, tmp_path):
+    ruta = tmp_path / "export.parquet"
+    assert Exportacion(DESDE, HASTA, "parquet", chunk=3, engine=engine).guardar(ruta) == 8
+
+    # un row group por bloque: tramos de un día en bloques de 3 filas
+    assert pq.ParquetFile(ruta).num_row_groups == 4
+    tabla = pq.read_table(ruta)
+    assert tabla.num_rows == 8 and tuple(tabla.schema.names) == NOMBRES
+    assert tabla.column("alerta").to_pylist().count(True) == 2
+
+
+def test_parametros_invalidos():
+    with pytest.raises(ValueError):
+        Exportacion(DESDE, HASTA, "xlsx")
+    with pytest.raises(ValueError):
+        Exportacion(HASTA, DESDE)
+
+
+def test_get_export_chunked(cache, historico):
+    servidor = ServidorLectura(ReadAPI(cache), host="127.0.0.1", port=0)
+    servidor.start()
+    try:
+        conexion = http.client.HTTPConnection("127.0.0.1", servidor.port, timeout=5)
+        conexion.request("GET", "/export?desde=2025-01-01&hasta=2025-01-03&sample_id=1")
+        respuesta = conexion.getresponse()
+        assert respuesta.status == 200
+        assert respuesta.getheader("Transfer-Encoding") == "chunked"
+        assert len(_csv(respuesta.read())) == 1 + 4
+
+        conexion.request("GET", "/export?desde=ayer")
+        respuesta = conexion.getresponse()
+        assert respuesta.status == 400
+        respuesta.read()
+        conexion.close()
+    finally:
+        servidor.stop()
+
+
+def test_get_export_normaliza_los_limites_a_utc(cache, zona_horaria):
+    zona_horaria("America/Lima")
+    api = ReadAPI(cache)
+
+    exportacion = api.exportacion("/export?desde=2025-01-01T05:00:00%2B05:00&hasta=2025-01-02T00:00:00Z")
+    assert (exportacion.desde, exportacion.hasta) == (datetime(2025, 1, 1), datetime(2025, 1, 2))
+
+    # Sin hasta: ahora en UTC, no en la hora local del proceso
+    hasta = api.exportacion("/export?desde=2025-01-01").hasta
+    assert hasta.tzinfo is None
+    assert abs(hasta - datetime.now(timezone.utc).replace(tzinfo=None)) < timedelta(seconds=5)
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+
+from app.db.bulk import insert_packets
+from app.db.models import SensorPacket, SensorPanel, SensorRollupHourly
+from app.dedup import ClavesRecientes
+from app.paquetes import validar_paquete
+from tests.conftest import paquete
+
+
+def _contar(session, modelo):
+    return session.scalar(select(func.count()).select_from(modelo))
+
+
+def test_claves_recientes_lru():
+    vistos = ClavesRecientes(2)
+    assert not vistos.visto(("d", 1, "t"))
+    assert vistos.visto(("d", 1, "t"))
+    vistos.visto(("d", 2, "t"))
+    vistos.visto(("d", 3, "t"))
+    assert not vistos.visto(("d", 1, "t"))   # ya salió del LRU
+
+
+def test_replay_no_duplica_paneles_ni_rollups(session):
+    lote = [validar_paquete(paquete(seq=s)) for s in (1, 2)]
+    assert None not in insert_packets(session, lote)
+    session.commit()
+
+    assert insert_packets(session, lote + [validar_paquete(paquete(seq=3))])[:2] == [None, None]
+    session.commit()
+
+    assert _contar(session, SensorPacket) == 3
+    assert _contar(session, SensorPanel) == 6
+    assert session.scalar(select(func.sum(SensorRollupHourly.samples))) == 6
+
+
+def test_timestamp_con_zona_en_otra_zona_de_sesion(session):
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SET TIME ZONE 'Asia/Tokyo'"))
+    ts = datetime(2025, 1, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    packet = {"device": "d", "seq": 7, "timestamp": ts, "alerta": False,
+              "samples": [{"id": 1, "soil": {"raw": 1, "pct": 50}}]}
+
+    primero = insert_packets(session, [packet])
+    session.commit()
+    # El mismo instante sin zona (UTC) es el mismo paquete
+    repetido = insert_packets(session, [dict(packet, timestamp=datetime(2025, 1, 1, 10, 0))])
+    session.commit()
+
+    assert primero[0] is not None and repetido == [None]
+    guardado = session.scalar(select(SensorPacket.timestamp))
+    assert guardado.replace(tzinfo=guardado.tzinfo or timezone.utc) == ts
@@ -0,0 +1,65 @@
+"""Migraciones (app/db/migrate.py): timestamp de paneles, índices y particiones."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect, select, text, update
+
+from app.db.bulk import insert_packets
+from app.db.migrate import init_partitioned, upgrade
+from app.db.models import Base, SensorPacket, SensorPanel
+from app.paquetes import validar_paquete
+from tests.conftest import paquete
+
+
+def _cargar(session):
+    insert_packets(session, [validar_paquete(paquete(seq=s, ts=f"2025-0{s}-15T10:00:00")) for s in (1, 2)])
+    session.commit()
+
+
+def test_upgrade_rellena_el_timestamp_de_los_paneles(engine, session):
+    _cargar(session)
+    session.execute(update(SensorPanel).values(timestamp=None))
+    session.commit()
+
+    upgrade(engine, batch=1)
+
+    filas = session.execute(
+        select(SensorPanel.timestamp, SensorPacket.timestamp).join(SensorPacket, SensorPacket.id == SensorPanel.packet_id)
+    ).all()
+    assert len(filas) == 4 and all(panel == packet for panel, packet in filas)
+
+
+def test_upgrade_crea_los_indices_de_consulta(engine):
+    indices = {i["name"] for t in (SensorPacket, SensorPanel) for i in inspect(engine).get_indexes(t.__tablename__)}
+    assert {"ix_sensorpanel_sample_ts", "ux_sensorpacket_device_seq_ts"} <= indices
+
+
+def test_layout_particionado_por_mes(engine, session):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("particiones solo en Postgres (TEST_DATABASE_URL)")
+    Base.metadata.drop_all(engine, tables=[SensorPanel.__table__, SensorPacket.__table__])
+    init_partitioned(engine)
+    ahora = datetime.now().replace(microsecond=0)
+    lote = [validar_paquete(paquete(seq=1, ts=ahora.isoformat())),
+            validar_paquete(paquete(seq=2, ts="2001-01-01T10:00:00"))]   # fuera de rango
+    insert_packets(session, lote)
+    session.commit()
+
+    particiones = session.execute(text(
+        "SELECT DISTINCT tableoid::regclass::text FROM monitoring_sensorpanel ORDER BY 1"
+    )).scalars().all()
+    assert particiones == ["monitoring_sensorpanel_default", f"monitoring_sensorpanel_y{ahora:%Y}m{ahora:%m}"]
+    # El índice único (device, seq, ts) sigue descartando repetidos
+    assert insert_packets(session, lote) == [None, None]
+
+
+def test_init_db_migra_una_base_anterior(engine):
+    from app.db.client import init_db
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE monitoring_archivebatch"))
+        conn.execute(text("CREATE TABLE monitoring_archivebatch "
+                          "(id INTEGER NOT NULL PRIMARY KEY, rows INTEGER NOT NULL, created_at TIMESTAMP)"))
+    init_db()
+
+    assert "lote" in {c["name"] for c in inspect(engine).get_columns("monitoring_archivebatch")}
@@ -0,0 +1,53 @@
+"""Notifier (app/notifier.py): cola, cooldown y reintentos."""
+import threading
+
+import pytest
+
+from app.config import settings
+from app.notifier import Notifier
+
+ALERTA = {"seq": 10, "alerta": 1, "ts": "2025-11-19T22:01:00", "samples": []}
+
+
+@pytest.fixture
+def notifier(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFIER_BACKOFF_BASE_SECONDS", 0)
+    monkeypatch.setattr(settings, "NOTIFIER_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "NOTIFIER_QUEUE_SIZE", 2)
+    n = Notifier(redis_client)
+    n.envios = []
+    n.respuestas = []
+    n.send_email = lambda subject, html: n.envios.append(subject) or (n.respuestas.pop(0) if n.respuestas else True)
+    yield n
+    n.stop()
+
+
+def test_reintenta_y_aplica_el_cooldown(notifier):
+    notifier.respuestas = [False, False, True]
+    assert notifier._process(ALERTA)
+    assert len(notifier.envios) == 3
+
+    assert not notifier._process(ALERTA)   # mismo seq/ts dentro del cooldown
+    assert len(notifier.envios) == 3
+
+
+def test_fallo_definitivo_libera_el_cooldown(notifier, redis_client):
+    notifier.respuestas = [False] * 3
+    assert not notifier._process(ALERTA)
+    assert len(notifier.envios) == 3
+    assert redis_client.keys("alert:sent:*") == []
+
+
+def test_encolar_no_bloquea(notifier):
+    assert not notifier.enqueue_alert({"alerta": 1})
+    assert notifier.enqueue_alert(ALERTA)
+    assert notifier.enqueue_alert({**ALERTA, "seq": 11})
+    assert not notifier.enqueue_alert({**ALERTA, "seq": 12})   # cola llena
+
+
+def test_el_pool_envia_lo_encolado(notifier):
+    enviado = threading.Event()
+    notifier.send_email = lambda subject, html: enviado.set() or True
+    notifier.start()
+    notifier.enqueue_alert(ALERTA)
+    assert enviado.wait(5)
@@ -0,0 +1,89 @@
+"""Difusión en vivo por SSE (app/push_gateway.py)."""
+import json
+import socket
+import time
+
+from app.push_gateway import CANAL_ALERTAS, PushGateway, _Cliente
+from tests.conftest import paquete
+
+
+def _recibidos(cliente):
+    return [(ev.evento, ev.tipo, ev.sensor_id) for ev in cliente.cola]
+
+
+def test_filtros_por_tipo_sensor_y_evento():
+    gw = PushGateway(port=0)
+    humedad_1 = _Cliente(frozenset({"humedad"}), frozenset({"1"}), None, 100)
+    alertas = _Cliente(None, None, frozenset({"alerta"}), 100)
+    todo = _Cliente(None, None, None, 100)
+    for cliente in (humedad_1, alertas, todo):
+        gw._registrar(cliente)
+
+    gw._publicar(("paquete", 3, "2025-01-01T10:00:00", paquete()["samples"]))
+    gw._publicar(("alerta", {"tipo_sensor": "vibracion", "sensor_id": 2, "mensaje": "golpe"}))
+    gw._drenar()
+
+    assert _recibidos(humedad_1) == [("lectura", "humedad", "1")]
+    assert _recibidos(alertas) == [("alerta", "vibracion", "2")]
+    assert len(todo.cola) == 7
+    assert json.loads(humedad_1.cola[0].cuerpo)["porcentaje"] == 40
+
+    gw._quitar(humedad_1)
+    assert gw._por_sensor == {} and gw._n_clientes == 2
+
+
+def test_buffer_lleno_descarta_lo_mas_viejo():
+    gw = PushGateway(port=0)
+    lento = _Cliente(frozenset({"inclinacion"}), None, None, 2)
+    gw._registrar(lento)
+
+    for seq in range(1, 5):
+        gw._publicar(("paquete", seq, "2025-01-01T10:00:00", [{"id": 1, "tilt": 0}]))
+    gw._drenar()
+
+    assert lento.descartados == 2
+    assert [ev.datos["seq"] for ev in lento.cola] == [3, 4]
+
+
+def test_sin_clientes_no_acumula():
+    gw = PushGateway(port=0)
+    gw._publicar(("paquete", 1, "2025-01-01T10:00:00", [{"id": 1, "tilt": 0}]))
+    gw._drenar()
+    assert not gw._entrantes
+
+
+def _leer_hasta(sock, marca, timeout=5):
+    datos, limite = b"", time.monotonic() + timeout
+    while marca not in datos and time.monotonic() < limite:
+        datos += sock.recv(65536)
+    return datos
+
+
+def test_sse_recibe_lecturas_y_alertas_de_redis(redis_client):
+    gw = PushGateway(host="127.0.0.1", port=0, redis_client=redis_client)
+    gw.heartbeat = 0.05   # detecta pronto el cierre del cliente
+    gw.start()
+    try:
+        sock = socket.create_connection(("127.0.0.1", gw.port), timeout=5)
+        sock.sendall(b"GET /stream?sensor=2&tipo=vibracion HTTP/1.1\r\nHost: x\r\n\r\n")
+        assert b"text/event-stream" in _leer_hasta(sock, b": conectado")
+
+        gw.publicar_paquete(5, "2025-01-01T10:00:00", paquete()["samples"])
+        lectura = _leer_hasta(sock, b"\n\n")
+        assert lectura.startswith(b"event: lectura\ndata: ")
+        assert json.loads(lectura.split(b"data: ")[1])["pulse"] == 100
+
+        # La suscripción a Redis se hace en otro hilo: se publica hasta que llegue
+        for _ in range(50):
+            if redis_client.publish(CANAL_ALERTAS, json.dumps(
+                    {"tipo_sensor": "vibracion", "sensor_id": "2", "mensaje": "golpe"})):
+                break
+            time.sleep(0.1)
+        assert b"golpe" in _leer_hasta(sock, b"golpe")
+        sock.close()
+        limite = time.monotonic() + 5
+        while gw._n_clientes and time.monotonic() < limite:
+            time.sleep(0.05)
+        assert gw._n_clientes == 0
+    finally:
+        gw.stop()
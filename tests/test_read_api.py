@@ -0,0 +1,87 @@
+"""API HTTP de lectura: caché, coalescencia y ETag (app/read_api.py)."""
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from app.read_api import CacheLectura, ReadAPI, ServidorLectura
+
+
+def test_coalescencia_una_carga_para_lectores_simultaneos():
+    cache = CacheLectura()
+    cargas = []
+    entrar = threading.Event()
+
+    def cargar():
+        cargas.append(1)
+        entrar.wait(2)
+        return "valor"
+
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(cache.obtener("k", 60, cargar)))
+             for _ in range(8)]
+    for h in hilos:
+        h.start()
+    time.sleep(0.1)
+    entrar.set()
+    for h in hilos:
+        h.join()
+
+    assert cargas == [1] and resultados == ["valor"] * 8
+    assert cache.obtener("k", 60, lambda: "otro") == "valor"
+
+
+def test_errores_se_propagan_y_no_se_guardan():
+    cache = CacheLectura(max_entradas=1)
+
+    def falla():
+        raise ConnectionError("redis caído")
+
+    with pytest.raises(ConnectionError):
+        cache.obtener("k", 60, falla)
+    assert cache.obtener("k", 0.05, lambda: 1) == 1
+    time.sleep(0.06)
+    assert cache.obtener("k", 60, lambda: 2) == 2
+    cache.obtener("otra", 60, lambda: 3)
+    assert cache.obtener("k", 60, lambda: 4) == 4   # LRU de una entrada
+
+
+@pytest.fixture
+def servidor(cache):
+    srv = ServidorLectura(ReadAPI(cache, ttl=60, ttl_dashboard=60), host="127.0.0.1", port=0)
+    srv.start()
+    yield srv
+    srv.stop()
+
+
+def _get(srv, path, etag=None):
+    conexion = http.client.HTTPConnection("127.0.0.1", srv.port, timeout=5)
+    conexion.request("GET", path, headers={"If-None-Match": etag} if etag else {})
+    respuesta = conexion.getresponse()
+    cuerpo = respuesta.read()
+    conexion.close()
+    return respuesta.status, respuesta.getheader("ETag"), cuerpo
+
+
+def test_etag_y_304_con_respuestas_cacheadas(servidor, cache):
+    cache.guardar_humedad("1", 40, 600)
+
+    status, etag, cuerpo = _get(servidor, "/sensores/humedad/1")
+    assert status == 200 and json.loads(cuerpo)["porcentaje"] == 40
+
+    cache.guardar_humedad("1", 70, 800)   # dentro del TTL sigue la respuesta cacheada
+    assert _get(servidor, "/sensores/humedad/1", etag) == (304, etag, b"")
+    assert _get(servidor, "/sensores/humedad/1", 'W/"otro"')[2] == cuerpo
+
+    servidor.api.respuestas.limpiar()
+    status, nuevo, cuerpo = _get(servidor, "/sensores/humedad/1", etag)
+    assert status == 200 and nuevo != etag and json.loads(cuerpo)["porcentaje"] == 70
+
+
+def test_errores_de_ruta(servidor):
+    assert _get(servidor, "/sensores/presion/1")[0] == 404
+    assert _get(servidor, "/sensores/humedad/9")[0] == 404
+    assert _get(servidor, "/alertas?limite=0")[0] == 400
+    assert _get(servidor, "/alertas?tipo=riesgo")[0] == 200
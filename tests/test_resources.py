@@ -0,0 +1,83 @@
+"""Registro de recursos compartidos y chequeos de salud (app/resources.py)."""
+import socket
+import threading
+
+import redis
+from sqlalchemy import create_engine
+
+from app import resources
+from app.config import settings
+from app.resources import Recursos, VigilanteRecursos
+
+
+def _puerto_cerrado():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    puerto = s.getsockname()[1]
+    s.close()
+    return puerto
+
+
+def test_un_cliente_por_tipo_compartido_entre_hilos(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_MAX_CONNECTIONS", 7)
+    r = Recursos()
+    clientes = []
+    hilos = [threading.Thread(target=lambda: clientes.append(r.redis())) for _ in range(16)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert len({id(c) for c in clientes}) == 1
+    assert r.redis(decode_responses=False) is not clientes[0]
+    pool = clientes[0].connection_pool
+    assert isinstance(pool, redis.BlockingConnectionPool) and pool.max_connections == 7
+    r.cerrar()
+    assert r._redis == {}
+
+
+def test_comprobar_descarta_el_pool_caido(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "REDIS_PORT", _puerto_cerrado())
+    monkeypatch.setattr(settings, "REDIS_RETRIES", 0)
+    r = Recursos()
+    r._engine = create_engine("sqlite://")
+    r.redis()
+    descartes = resources.DESCARTES.valor
+
+    assert r.comprobar() == {"redis": False, "db": True}
+    assert resources.REDIS_UP.valor == 0 and resources.DB_UP.valor == 1
+    assert resources.DESCARTES.valor == descartes + 1
+    r.cerrar()
+    assert r._engine is None
+
+
+def test_comprobar_avisa_de_la_recuperacion(redis_raw, caplog):
+    r = Recursos()
+    r._redis = {False: redis_raw}
+    r.estado = {"redis_raw": False}
+
+    with caplog.at_level("INFO", logger="app.resources"):
+        assert r.comprobar() == {"redis_raw": True}
+    assert "redis_raw recuperado" in caplog.text
+    assert resources.REDIS_UP.valor == 1
+
+
+def test_vigilante_reintenta_con_backoff():
+    class Falla:
+        def __init__(self):
+            self.resultados = [{"redis": False}] * 8 + [{"redis": True}]
+
+        def comprobar(self):
+            return self.resultados.pop(0)
+
+    vigilante = VigilanteRecursos(Falla(), 15)
+    esperas = []
+
+    def wait(segundos):
+        esperas.append(segundos)
+        return len(esperas) > 9
+
+    vigilante._stopping.wait = wait
+    vigilante.run()
+    assert esperas == [15, 1, 2, 4, 8, 16, 32, 60, 60, 15]
@@ -0,0 +1,91 @@
+"""Retención del histórico por lotes y por particiones (app/db/retention.py)."""
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, text
+
+from app.config import settings
+from app.db.bulk import insert_packets
+from app.db.migrate import _month, ensure_partitions, init_partitioned
+from app.db.models import Base, SensorPacket, SensorPanel, SensorRollupDaily
+from app.db.retention import aplicar_retencion, corte_crudos, politicas
+from app.paquetes import validar_paquete
+from tests.conftest import paquete
+
+AHORA = datetime(2025, 6, 1, 12, 0, 0)
+
+
+@pytest.fixture(autouse=True)
+def sin_pausas(monkeypatch):
+    monkeypatch.setattr(settings, "RETENTION_PAUSE_MS", 0)
+
+
+def _cargar(session, edades_dias, ahora=AHORA):
+    insert_packets(session, [
+        validar_paquete(paquete(seq=i, ts=(ahora - timedelta(days=d)).isoformat()))
+        for i, d in enumerate(edades_dias)
+    ])
+    session.commit()
+
+
+def _contar(session, modelo):
+    return session.scalar(select(func.count()).select_from(modelo))
+
+
+def test_politicas_y_corte_de_crudos():
+    assert politicas("monitoring_sensorpacket=90, monitoring_sensorpanel=30,monitoring_archivebatch=0") == {
+        "monitoring_sensorpacket": 90, "monitoring_sensorpanel": 30,
+    }
+    assert politicas("") == {}
+    with pytest.raises(ValueError):
+        politicas("usuarios=10")
+    with pytest.raises(ValueError):
+        politicas("monitoring_sensorpacket=noventa")
+
+    assert corte_crudos({"monitoring_sensorpacket": 90, "monitoring_sensorpanel": 30}, AHORA) == \
+        AHORA - timedelta(days=30)
+    assert corte_crudos({"monitoring_sensorrollup_daily": 30}, AHORA) is None
+
+
+def test_borra_por_lotes_paquetes_y_sus_paneles(session, engine):
+    _cargar(session, [200, 150, 120, 100, 10, 1])
+
+    borradas = aplicar_retencion(engine, {"monitoring_sensorpacket": 90}, ahora=AHORA, lote=3)
+
+    assert borradas == {"monitoring_sensorpacket": 4}
+    assert _contar(session, SensorPacket) == 2 and _contar(session, SensorPanel) == 4
+    mas_viejo = session.scalar(select(func.min(SensorPanel.timestamp))).replace(tzinfo=None)
+    assert mas_viejo == AHORA - timedelta(days=10)
+    # Sin política, los rollups se guardan para siempre
+    assert _contar(session, SensorRollupDaily) == 12
+
+
+def test_parada_corta_entre_lotes(session, engine):
+    _cargar(session, [200, 150, 120, 100])
+    parada = threading.Event()
+    parada.set()
+
+    borradas = aplicar_retencion(engine, {"monitoring_sensorpanel": 90}, ahora=AHORA, lote=3, parada=parada)
+
+    assert borradas == {"monitoring_sensorpanel": 3}
+    assert _contar(session, SensorPanel) == 5 and _contar(session, SensorPacket) == 4
+
+
+def test_meses_enteros_fuera_de_retencion_se_eliminan_por_particion(engine, session):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("particiones solo en Postgres (TEST_DATABASE_URL)")
+    Base.metadata.drop_all(engine, tables=[SensorPanel.__table__, SensorPacket.__table__])
+    init_partitioned(engine)
+    hace_tres = _month(date.today(), -3)
+    with engine.begin() as conn:
+        ensure_partitions(conn, ahead=0, desde=hace_tres)
+    ahora = datetime.now().replace(microsecond=0)
+    _cargar(session, [(ahora.date() - hace_tres).days - 10, 0], ahora=ahora)
+
+    aplicar_retencion(engine, {"monitoring_sensorpacket": 31}, ahora=ahora)
+
+    nombre = f"_y{hace_tres:%Y}m{hace_tres:%m}"
+    assert not session.execute(text("SELECT to_regclass(:t)"), {"t": "monitoring_sensorpacket" + nombre}).scalar()
+    assert not session.execute(text("SELECT to_regclass(:t)"), {"t": "monitoring_sensorpanel" + nombre}).scalar()
+    assert _contar(session, SensorPacket) == 1 and _contar(session, SensorPanel) == 2
@@ -0,0 +1,71 @@
+"""Alertas de riesgo de deslizamiento (app/risk.py)."""
+import json
+from datetime import datetime
+
+import numpy as np
+
+from app.read_api import ReadAPI
+from app import risk
+from app.risk import EvaluadorRiesgo
+
+
+class _Motor:
+    """Motor con puntuaciones dictadas por la prueba."""
+    ids = [1]
+
+    def __init__(self):
+        self.riesgo = 0.0
+
+    def ingerir(self, lote):
+        pass
+
+    def evaluar(self):
+        uno = np.array([self.riesgo])
+        return {"riesgo": uno, "pendiente": uno, "golpes": uno, "pulso": uno,
+                "transiciones": np.zeros(1), "acuerdo": uno}
+
+
+def _ticks(evaluador, puntuaciones):
+    for riesgo in puntuaciones:
+        evaluador.motor.riesgo = riesgo
+        evaluador.agregar("sensors/esp32-1", datetime.now(), [])
+        evaluador.tick()
+    return evaluador.cache.obtener_alertas_activas("riesgo")
+
+
+def test_riesgo_que_oscila_en_el_umbral_alerta_una_vez(cache):
+    evaluador = EvaluadorRiesgo(cache, motor=_Motor(), umbral=0.8, clear=0.6, cooldown=0)
+
+    assert len(_ticks(evaluador, [0.85, 0.79, 0.81, 0.7, 0.9])) == 1
+    # Rearmado al bajar de clear: la siguiente subida sí alerta
+    assert len(_ticks(evaluador, [0.5, 0.85])) == 2
+
+
+def test_cooldown_silencia_la_realerta(cache):
+    evaluador = EvaluadorRiesgo(cache, motor=_Motor(), umbral=0.8, clear=0.6, cooldown=3600)
+
+    assert len(_ticks(evaluador, [0.9, 0.1, 0.9, 0.1, 0.9])) == 1
+
+
+def test_cola_llena_descarta_los_mas_viejos(cache):
+    evaluador = EvaluadorRiesgo(cache, motor=_Motor(), backlog=2)
+    descartados = risk.DESCARTADOS.valor
+    for seq in range(3):
+        evaluador.agregar("sensors/esp32-1", datetime.now(), [{"id": seq}])
+
+    assert risk.DESCARTADOS.valor == descartados + 1
+    assert [samples[0]["id"] for _, _, samples in evaluador._pendientes] == [1, 2]
+
+
+def test_alertas_de_riesgo_en_la_api_y_la_limpieza(cache, redis_client):
+    evaluador = EvaluadorRiesgo(cache, motor=_Motor(), umbral=0.8, clear=0.6, cooldown=0)
+    _ticks(evaluador, [0.9])
+
+    status, cuerpo, _ = ReadAPI(cache, ttl=0).responder("/alertas?tipo=riesgo")
+    assert status == 200
+    assert [a["tipo_sensor"] for a in json.loads(cuerpo)["alertas"]] == ["riesgo"]
+
+    # Una alerta cuya clave expiró sale también del índice de riesgo
+    redis_client.delete(*redis_client.keys("alerta:*"))
+    cache.limpiar_datos_expirados()
+    assert redis_client.zcard("alertas:indice:riesgo") == 0
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.db.bulk import insert_packets
+from app.db.models import SensorRollupDaily, SensorRollupHourly
+from app.db.retention import aplicar_retencion
+from app.db.rollups import backfill, consultar_serie
+from app.paquetes import validar_paquete
+from tests.conftest import paquete
+
+
+def _cargar(session, horas=((10, 0), (10, 30), (11, 15))):
+    lote = [
+        validar_paquete(paquete(seq=i, ts=f"2025-01-01T{h:02d}:{m:02d}:00"))
+        for i, (h, m) in enumerate(horas)
+    ]
+    insert_packets(session, lote)
+    session.commit()
+    return lote
+
+
+def test_rollups_por_hora_y_dia(session):
+    _cargar(session)
+
+    horas = session.scalars(
+        select(SensorRollupHourly).where(SensorRollupHourly.sample_id == 2).order_by(SensorRollupHourly.bucket)
+    ).all()
+    assert [(r.bucket.hour, r.samples, r.soil_sum, r.vib_hit_count, r.tilt_on_count) for r in horas] == [
+        (10, 2, 60, 2, 2), (11, 1, 30, 1, 1),
+    ]
+    dia = session.scalars(select(SensorRollupDaily).where(SensorRollupDaily.sample_id == 1)).one()
+    assert (dia.samples, dia.soil_min, dia.soil_max, dia.vib_pulse_sum) == (3, 40, 40, 2700)
+
+
+def test_reinsertar_los_mismos_paquetes_no_suma(session):
+    lote = _cargar(session)
+    assert insert_packets(session, lote) == [None, None, None]
+    session.commit()
+
+    dia = session.scalars(select(SensorRollupDaily).where(SensorRollupDaily.sample_id == 1)).one()
+    assert dia.samples == 3
+
+
+def test_upserts_en_orden_de_sample_y_bucket(session, monkeypatch):
+    from app.db import rollups
+
+    llamadas = []
+    monkeypatch.setattr(rollups, "_upsert", lambda s, model, valores: llamadas.append(valores))
+    rollups.apply_rollups(session, [
+        (2, datetime(2025, 1, 1, 11), 40, 0, 0, 0),
+        (1, datetime(2025, 1, 2, 9), 40, 0, 0, 0),
+        (2, datetime(2025, 1, 1, 10), 40, 0, 0, 0),
+        (1, datetime(2025, 1, 1, 10), 40, 0, 0, 0),
+    ])
+
+    assert len(llamadas) == 2
+    for valores in llamadas:
+        claves = [(v["sample_id"], v["bucket"]) for v in valores]
+        assert claves == sorted(claves)
+
+
+def test_consultar_serie_elige_resolucion(session):
+    _cargar(session)
+    desde, hasta = datetime(2025, 1, 1), datetime(2025, 1, 2)
+
+    resolucion, puntos = consultar_serie(session, 1, desde, hasta, max_puntos=24)
+    assert resolucion == "hour" and [p["samples"] for p in puntos] == [2, 1]
+    resolucion, puntos = consultar_serie(session, 1, desde, hasta, max_puntos=1)
+    assert resolucion == "day" and puntos[0]["soil_avg"] == 40
+    resolucion, puntos = consultar_serie(session, 1, desde, hasta, max_puntos=1000)
+    assert resolucion == "raw" and len(puntos) == 3
+
+
+def _rollups(session):
+    return sorted(
+        (m.__tablename__, r.sample_id, r.bucket.replace(tzinfo=None), r.samples, r.soil_sum,
+         r.vib_pulse_sum, r.vib_hit_count, r.tilt_on_count)
+        for m in (SensorRollupHourly, SensorRollupDaily) for r in session.scalars(select(m))
+    )
+
+
+def test_backfill_conserva_los_dias_borrados_por_la_retencion(session, monkeypatch):
+    _cargar(session)
+    ayer = datetime.now() - timedelta(days=1)
+    insert_packets(session, [validar_paquete(paquete(seq=9, ts=f"{ayer:%Y-%m-%d}T10:00:00"))])
+    session.commit()
+    antes = _rollups(session)
+
+    monkeypatch.setattr(settings, "RETENTION_POLICIES", "monitoring_sensorpacket=30")
+    aplicar_retencion(session.get_bind())
+
+    assert backfill(session, datetime(2024, 12, 1), datetime.now()) == 2
+    assert _rollups(session) == antes
+
+
+def test_backfill_lee_los_segmentos_frios(session, engine, monkeypatch, tmp_path):
+    pytest.importorskip("pyarrow")
+    from app.db import cold
+
+    monkeypatch.setattr(settings, "COLD_STORAGE_URL", str(tmp_path))
+    monkeypatch.setattr(settings, "RETENTION_POLICIES", "monitoring_sensorpacket=30")
+    cold.almacen.cache_clear()
+    try:
+        _cargar(session)
+        antes = _rollups(session)
+        assert cold.compactar(engine, corte=datetime(2025, 1, 2)) == 6
+
+        assert backfill(session, datetime(2025, 1, 1), datetime(2025, 1, 2)) == 6
+        assert _rollups(session) == antes
+    finally:
+        cold.almacen.cache_clear()
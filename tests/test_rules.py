@@ -0,0 +1,98 @@
+"""Reglas de alerta con histéresis, duración mínima y cooldown (app/rules.py)."""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.cache_manager import CloudSensorCacheManager
+from app.rules import MotorReglas, Regla, cargar_reglas
+
+T0 = datetime(2025, 1, 1, 10, 0, 0)
+HUMEDAD = {"name": "humedad_alta", "type": "humedad", "field": "soil.pct",
+           "above": 80, "clear": 75, "message": "Humedad alta: {valor}%"}
+
+
+def _serie(motor, valores, paso=10, sensor=1):
+    """Evalúa un sample por valor cada `paso` segundos; devuelve los segundos en que alertó."""
+    disparos = []
+    for n, pct in enumerate(valores):
+        if motor.evaluar([{"id": sensor, "soil": {"raw": 600, "pct": pct}}], T0 + timedelta(seconds=n * paso)):
+            disparos.append(n * paso)
+    return disparos
+
+
+def test_histeresis_una_alerta_hasta_bajar_de_clear():
+    motor = MotorReglas([Regla(HUMEDAD)])
+    assert _serie(motor, [85, 90, 78, 82, 74, 81]) == [0, 50]
+    assert motor.evaluar([{"id": 1, "soil": {"raw": 600, "pct": 90}}], T0) == []   # sigue activa
+
+
+def test_for_seconds_exige_que_el_valor_se_mantenga():
+    motor = MotorReglas([Regla({**HUMEDAD, "for_seconds": 30})])
+    # 85 durante 20 s y rearme: nada; luego 30 s seguidos por encima
+    assert _serie(motor, [85, 85, 85, 70, 85, 79, 85, 85]) == [70]
+
+
+def test_cooldown_silencia_reactivaciones_por_sensor():
+    motor = MotorReglas([Regla(HUMEDAD, cooldown_defecto=60)])
+    assert _serie(motor, [85, 70, 85, 70, 85, 70, 85]) == [0, 60]
+    assert _serie(MotorReglas([Regla(HUMEDAD, 60)]), [85], sensor=2) == [0]
+
+
+def test_below_y_especificaciones_invalidas():
+    motor = MotorReglas([Regla({"name": "seca", "type": "humedad", "field": "soil.pct",
+                                "below": 20, "clear": 25})])
+    assert _serie(motor, [15, 22, 26, 10]) == [0, 30]
+    assert motor.evaluar([{"id": 1, "tilt": 1}], T0) == []   # sin el campo no evalúa
+
+    with pytest.raises(ValueError):
+        Regla({**HUMEDAD, "clear": 85})
+    with pytest.raises(ValueError):
+        Regla({**HUMEDAD, "below": 10})
+
+
+def test_cargar_reglas(tmp_path):
+    assert cargar_reglas("") is None
+    vacio = tmp_path / "vacio.yaml"
+    vacio.write_text("alerts:\n  cooldown_seconds: 10\n")
+    assert cargar_reglas(str(vacio)) is None
+
+    motor = cargar_reglas(os.path.join(os.path.dirname(__file__), "..", "app", "configs", "config.yaml"))
+    humedad_alta = next(r for r in motor.reglas if r.nombre == "humedad_alta")
+    # cooldown heredado de alerts.cooldown_seconds
+    assert (humedad_alta.duracion, humedad_alta.cooldown) == (30, 300)
+
+
+def test_reglas_escriben_alertas_en_redis(redis_raw):
+    cache = CloudSensorCacheManager(reglas=MotorReglas([Regla(HUMEDAD)]))
+    for seq, pct in enumerate([85, 90, 70, 86], 1):
+        cache.guardar_paquete([{"id": 4, "soil": {"raw": 600, "pct": pct}}], seq=seq,
+                              timestamp=datetime.now(), device="sensors/esp32-1")
+
+    mensajes = [a["mensaje"] for a in cache.obtener_alertas_activas("humedad")]
+    assert mensajes == ["Humedad alta: 86%", "Humedad alta: 85%"]
+
+
+def test_reinicio_no_repite_las_alertas_ya_activas(redis_raw):
+    inclinacion = {"name": "inclinacion", "type": "inclinacion", "field": "tilt", "above": 0, "clear": 0,
+                   "message": "Cambio de posición detectado"}
+    cache = CloudSensorCacheManager(reglas=MotorReglas([Regla(HUMEDAD), Regla(inclinacion)]))
+
+    def guardar(seq, pct, tilt):
+        cache.guardar_paquete([{"id": 4, "soil": {"raw": 600, "pct": pct}, "tilt": tilt}], seq=seq,
+                              timestamp=datetime.now(), device="sensors/esp32-1")
+
+    def alertas():
+        return [a["tipo_sensor"] for a in cache.obtener_alertas_activas()]
+
+    guardar(1, 85, 1)
+    assert sorted(alertas()) == ["humedad", "inclinacion"]
+
+    # Reinicio: motor nuevo, mismo Redis. Lo que ya estaba disparado no realerta
+    cache.reglas = MotorReglas([Regla(HUMEDAD), Regla(inclinacion)])
+    guardar(2, 90, 1)
+    assert len(alertas()) == 2
+
+    guardar(3, 70, 0)
+    guardar(4, 86, 1)
+    assert len(alertas()) == 4
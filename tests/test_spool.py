@@ -0,0 +1,112 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import redis
+from sqlalchemy import select
+
+from app.mqtt_client import parsear_mensaje
+from app.spool import Replayer, Spool, transitorio
+from tests.conftest import paquete
+
+
+def _mensaje(payload, topic="sensors/esp32-1"):
+    return SimpleNamespace(payload=json.dumps(payload).encode(), topic=topic)
+
+
+def _spool(tmp_path, nombre="db"):
+    return Spool(str(tmp_path / nombre), nombre, fsync_ms=0)
+
+
+def test_spool_sobrevive_a_un_reinicio(tmp_path):
+    spool = _spool(tmp_path)
+    spool.escribir([{"seq": i, "timestamp": datetime(2025, 1, 1, 10, 0, i)} for i in range(5)])
+    paquetes, posicion = spool.leer(2)
+    spool.confirmar(posicion)
+    spool.cerrar()
+
+    spool = _spool(tmp_path)
+    assert spool.pendientes == 3
+    paquetes, _ = spool.leer(10)
+    assert [p["seq"] for p in paquetes] == [2, 3, 4]
+    assert paquetes[0]["timestamp"] == datetime(2025, 1, 1, 10, 0, 2)
+
+
+def test_lote_envenenado_no_bloquea_el_spool(tmp_path):
+    spool = _spool(tmp_path)
+    spool.escribir([{"seq": 1, "samples": [{"id": 1}]}, {"seq": 2, "samples": [{}]}, {"seq": 3, "samples": [{"id": 3}]}])
+    reinyectados = []
+
+    def reinyectar(paquetes):
+        for p in paquetes:
+            p["samples"][0]["id"]   # KeyError: 'id' en el segundo
+        reinyectados.extend(p["seq"] for p in paquetes)
+
+    replayer = Replayer(str(tmp_path / "replayer"))
+    replayer.drenar(spool, reinyectar, 100)
+
+    assert spool.pendientes == 0
+    assert reinyectados == [1, 3]
+    muertos, _ = spool.muertos.leer(10)
+    assert [p["seq"] for p in muertos] == [2]
+    assert "KeyError" in muertos[0]["error"]
+
+
+def test_error_de_conexion_reintenta_sin_apartar(tmp_path):
+    spool = _spool(tmp_path)
+    spool.escribir([{"seq": 1, "samples": []}])
+
+    def caido(paquetes):
+        raise redis.ConnectionError("sin conexión")
+
+    replayer = Replayer(str(tmp_path / "replayer"))
+    replayer.drenar(spool, caido, 100)
+
+    assert spool.pendientes == 1
+    assert spool.muertos.pendientes == 0
+    assert replayer._backoff["db"] == 1
+
+
+def test_transitorio():
+    assert transitorio(redis.TimeoutError())
+    assert transitorio(ConnectionRefusedError())
+    assert not transitorio(KeyError("id"))
+    assert not transitorio(ValueError("struct"))
+
+
+@pytest.mark.parametrize("samples", [
+    [{"soil": {"raw": 1, "pct": 2}}],                  # sin id
+    [{"id": "uno"}],
+    [{"id": 1, "tilt": 2}],
+    [{"id": 1, "vib": {"pulse": -1, "hit": 0}}],
+    [{"id": 1, "soil": {"raw": 70000, "pct": 40}}],   # no cabe en el codec struct
+    [{"id": 1, "soil": {"raw": 600, "pct": 45.5}}],   # soil_pct es INTEGER
+    [{"id": 1, "soil": {"raw": 600, "pct": 101}}],
+    [{"id": 1, "soil": "seco"}],
+    [],
+])
+def test_parsear_mensaje_rechaza_samples_rotos(samples):
+    assert parsear_mensaje(_mensaje(paquete(samples=samples))) is None
+
+
+def test_parsear_mensaje_normaliza_timestamp_y_device():
+    p = parsear_mensaje(_mensaje(paquete(ts="2025-01-01T12:00:00.123456+02:00", device=None)))
+    assert p["device"] == "sensors/esp32-1"
+    assert p["timestamp"] == datetime(2025, 1, 1, 10, 0, 0, 123000)
+    assert p["samples"][1] == {"id": 2, "soil": {"raw": 500, "pct": 30}, "tilt": 1, "vib": {"pulse": 100, "hit": 1}}
+
+
+def test_writer_aparta_solo_el_paquete_rechazado(tmp_path, session):
+    from app.db.models import SensorPacket
+    from app.db_writer import PacketWriter
+
+    spool = _spool(tmp_path)
+    writer = PacketWriter(spool=spool)
+    lote = [{**parsear_mensaje(_mensaje(paquete(seq=s))), "alerta": False} for s in (1, 2, 3)]
+    lote[1]["seq"] = None   # NOT NULL: error de datos, no de conexión
+    writer._flush(lote)
+
+    assert sorted(session.scalars(select(SensorPacket.seq))) == [1, 3]
+    assert spool.pendientes == 0
+    assert [p["timestamp"] for p in spool.muertos.leer(10)[0]] == [lote[1]["timestamp"]]